@@ -0,0 +1,61 @@
+"""Static assets under fingerprinted URLs.
+
+`StaticAssets` reads web/static once, when the controller is built, and serves each file from
+memory, precompressed. Templates link to assets with `static_url("css/style.css")`, which returns
+`/static/css/style.<hash>.css`: that URL changes whenever the file does, so browsers and CDNs can
+cache it forever. The plain `/static/css/style.css` still works for links the templates don't
+control, like `/favicon.ico` lookups, but is revalidated with its ETag.
+"""
+
+import hashlib
+import mimetypes
+import os
+import posixpath
+
+from core.responses import EncodedBody, encoded_response
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+HASH_LENGTH = 12
+
+
+def fingerprinted_path(path: str, digest: str) -> str:
+    root, ext = posixpath.splitext(path)
+    return f"{root}.{digest[:HASH_LENGTH]}{ext}"
+
+
+class StaticAssets:
+    def __init__(self, directory: str, prefix: str = "/static"):
+        self.directory = directory
+        self.prefix = prefix
+        self._bodies: dict[str, EncodedBody] = {}
+        # Fingerprinted path of each asset, and the other way around.
+        self._fingerprinted: dict[str, str] = {}
+        self._by_fingerprint: dict[str, str] = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, directory).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    data = f.read()
+                media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                self._bodies[path] = EncodedBody(data, media_type)
+                fingerprinted = fingerprinted_path(path, hashlib.sha256(data).hexdigest())
+                self._fingerprinted[path] = fingerprinted
+                self._by_fingerprint[fingerprinted] = path
+
+    def __len__(self) -> int:
+        return len(self._bodies)
+
+    def url(self, path: str) -> str:
+        """The cache-forever URL of an asset, e.g. `static_url("css/style.css")` in a template."""
+        return f"{self.prefix}/{self._fingerprinted.get(path, path)}"
+
+    def response(self, request, path: str):
+        from starlette.responses import Response
+
+        if path in self._by_fingerprint:
+            return encoded_response(request, self._bodies[self._by_fingerprint[path]], {"Cache-Control": IMMUTABLE})
+        if path in self._bodies:
+            return encoded_response(request, self._bodies[path], {"Cache-Control": REVALIDATE})
+        return Response(status_code=404, headers={"Cache-Control": "no-store"})
@@ -0,0 +1,368 @@
+"""A budget on live sandboxes, kept by evicting the apps worth the least.
+
+Every create used to add a sandbox that lives until its 24h timeout, so the number of sandboxes
+only went down when one died or an admin terminated it. With a budget of `max_sandboxes`, each
+create job first makes room (`CapacityManager.make_room`): if the new sandbox would exceed the
+budget, the lowest-value apps are terminated and removed from the catalogue, and if not enough of
+them can be evicted the create fails with `CapacityExceeded` instead of going over.
+
+What an app is worth is up to its `EvictionPolicy`, from how often and how recently it was viewed
+(`/app/{id}`) and edited (`/write`). Controllers count those hits in memory with a `UsageTracker`
+and add them to the app's own `app_usage_{id}` entry in the Modal Dict every few seconds, so a flush
+only touches the apps it counted hits for. Some apps are
+never evicted: featured apps, apps created within the last `grace` and apps somebody had open at
+the last resource scrape (see core/resources.py).
+
+Creates racing each other can each see room for one more and overshoot the budget by the number
+in flight; the next create evicts back down to it.
+"""
+
+import abc
+import asyncio
+import math
+import typing as t
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import modal
+
+from core.models import AppMetadata, AppResources, AppStatus, AppUsage
+from core.resources import ResourceStore, load_per_app
+from core.terminate import terminate_sandbox
+from core.tracing import Span, tracer
+
+if t.TYPE_CHECKING:
+    from core.sandbox import AppDirectory
+
+USAGE_PREFIX = "app_usage_"
+MAKE_ROOM_SPAN = "capacity.make_room"
+USAGE_FLUSH_INTERVAL = 5.0
+# An edit says more about an app being wanted than a page view does.
+EDIT_WEIGHT = 5
+DEFAULT_GRACE = timedelta(minutes=10)
+
+
+class CapacityExceeded(Exception):
+    pass
+
+
+class UsageStore:
+    def __init__(self, apps_dict: modal.Dict):
+        self.apps_dict = apps_dict
+
+    async def load(self, app_ids: t.Iterable[str]) -> dict[str, AppUsage]:
+        """The stored usage of `app_ids`; apps nobody has used yet are left out."""
+        return await load_per_app(self.apps_dict, USAGE_PREFIX, app_ids, AppUsage)
+
+    async def record(self, deltas: t.Iterable[AppUsage]) -> None:
+        """Add counted hits to the stored totals.
+
+        Removed apps' usage goes with the rest of their data (see `AppDirectory.remove_apps`).
+        """
+        deltas = list(deltas)
+        if not deltas:
+            return
+        with tracer.span("dict.record_usage", apps=len(deltas)):
+            usage = await self.load(delta.app_id for delta in deltas)
+            for delta in deltas:
+                usage[delta.app_id] = merge_usage(usage.get(delta.app_id), delta)
+            await self.apps_dict.update.aio({f"{USAGE_PREFIX}{app_id}": entry.model_dump() for app_id, entry in usage.items()})
+
+
+def merge_usage(total: t.Optional[AppUsage], delta: AppUsage) -> AppUsage:
+    if total is None:
+        return delta.model_copy()
+
+    def latest(a: t.Optional[datetime], b: t.Optional[datetime]) -> t.Optional[datetime]:
+        return max(a, b) if a and b else a or b
+
+    return AppUsage(
+        app_id=total.app_id,
+        views=total.views + delta.views,
+        edits=total.edits + delta.edits,
+        first_seen_at=min(total.first_seen_at, delta.first_seen_at),
+        last_viewed_at=latest(total.last_viewed_at, delta.last_viewed_at),
+        last_edited_at=latest(total.last_edited_at, delta.last_edited_at),
+    )
+
+
+class UsageTracker:
+    """Counts views and edits in memory and adds them to the `UsageStore` every `flush_interval` seconds.
+
+    A crash loses at most one interval of hits, which only makes the apps involved look a little
+    less used than they were.
+    """
+
+    def __init__(
+        self,
+        store: UsageStore,
+        flush_interval: float = USAGE_FLUSH_INTERVAL,
+        clock: t.Callable[[], datetime] = datetime.now,
+    ):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.pending: dict[str, AppUsage] = {}
+        self._task: t.Optional[asyncio.Task] = None
+
+    def view(self, app_id: str) -> None:
+        usage = self._pending(app_id)
+        usage.views += 1
+        usage.last_viewed_at = self.clock()
+
+    def edit(self, app_id: str) -> None:
+        usage = self._pending(app_id)
+        usage.edits += 1
+        usage.last_edited_at = self.clock()
+
+    def _pending(self, app_id: str) -> AppUsage:
+        if app_id not in self.pending:
+            self.pending[app_id] = AppUsage(app_id=app_id, first_seen_at=self.clock())
+        return self.pending[app_id]
+
+    async def flush(self) -> int:
+        """Write the hits counted so far. Returns how many apps they were for."""
+        batch, self.pending = self.pending, {}
+        try:
+            await self.store.record(batch.values())
+        except Exception as e:
+            print(f"[UsageTracker] Failed to record usage of {len(batch)} apps, retrying next flush: {e}")
+            for delta in batch.values():
+                self.pending[delta.app_id] = merge_usage(self.pending.get(delta.app_id), delta)
+            return 0
+        return len(batch)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+@dataclass
+class Candidate:
+    """A live app that could be evicted, with everything known about how it is used."""
+
+    metadata: AppMetadata
+    usage: t.Optional[AppUsage] = None
+    resources: t.Optional[AppResources] = None
+
+    @property
+    def app_id(self) -> str:
+        return self.metadata.id
+
+    @property
+    def hits(self) -> int:
+        return self.usage.views + EDIT_WEIGHT * self.usage.edits if self.usage else 0
+
+    @property
+    def last_used_at(self) -> datetime:
+        """When the app was last viewed or edited, or created if it never was."""
+        if self.usage is None:
+            return self.metadata.created_at
+        return max(self.metadata.created_at, self.usage.last_used_at)
+
+
+class EvictionPolicy(abc.ABC):
+    """Decides which apps go first: the ones with the lowest `value`."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def value(self, candidate: Candidate, now: datetime) -> float:
+        ...
+
+    def rank(self, candidates: t.Iterable[Candidate], now: datetime) -> list[Candidate]:
+        """Candidates in eviction order; ties go to the least recently used."""
+        return sorted(candidates, key=lambda candidate: (self.value(candidate, now), candidate.last_used_at))
+
+
+class LRUPolicy(EvictionPolicy):
+    """Evicts the app that went longest without a view or edit."""
+
+    name = "lru"
+
+    def value(self, candidate: Candidate, now: datetime) -> float:
+        return -(now - candidate.last_used_at).total_seconds()
+
+
+class LFUPolicy(EvictionPolicy):
+    """Evicts the app with the fewest views and edits, however long ago they were."""
+
+    name = "lfu"
+
+    def value(self, candidate: Candidate, now: datetime) -> float:
+        return candidate.hits
+
+
+class CostAwarePolicy(EvictionPolicy):
+    """Evicts the app with the least recent use per byte of memory and core of CPU it holds.
+
+    An app's value halves every `half_life` it goes unused, so an app that was popular last week
+    doesn't outrank one people are using now; hits only count logarithmically on top of that.
+    Apps the cleanup sweep hasn't scraped yet are assumed to cost `default_rss_bytes`.
+    """
+
+    name = "cost"
+
+    def __init__(
+        self,
+        half_life: timedelta = timedelta(minutes=30),
+        default_rss_bytes: float = 512 * 1024 ** 2,
+        cpu_core_bytes: float = 1024 ** 3,  # A busy core costs as much as this much memory.
+    ):
+        self.half_life = half_life
+        self.default_rss_bytes = default_rss_bytes
+        self.cpu_core_bytes = cpu_core_bytes
+
+    def cost(self, candidate: Candidate) -> float:
+        resources = candidate.resources
+        if resources is None or not resources.samples:
+            return self.default_rss_bytes
+        return max(resources.rss_bytes_avg, 1.0) + self.cpu_core_bytes * resources.cpu_cores_avg
+
+    def value(self, candidate: Candidate, now: datetime) -> float:
+        idle = max((now - candidate.last_used_at).total_seconds(), 0.0)
+        recency = math.pow(0.5, idle / self.half_life.total_seconds())
+        return (1 + math.log1p(candidate.hits)) * recency / self.cost(candidate)
+
+
+POLICIES: dict[str, type[EvictionPolicy]] = {policy.name: policy for policy in (LRUPolicy, LFUPolicy, CostAwarePolicy)}
+
+
+def get_policy(name: str) -> EvictionPolicy:
+    if name not in POLICIES:
+        raise ValueError(f"Unknown eviction policy {name!r}, expected one of {', '.join(POLICIES)}")
+    return POLICIES[name]()
+
+
+class CapacityManager:
+    def __init__(
+        self,
+        max_sandboxes: int,
+        policy: EvictionPolicy,
+        usage: UsageStore,
+        resources: t.Optional[ResourceStore] = None,
+        stop_sandbox: t.Callable[[str], t.Awaitable[bool]] = terminate_sandbox,
+        grace: timedelta = DEFAULT_GRACE,
+        clock: t.Callable[[], datetime] = datetime.now,
+    ):
+        self.max_sandboxes = max_sandboxes
+        self.policy = policy
+        self.usage = usage
+        self.resources = resources
+        self.stop_sandbox = stop_sandbox
+        self.grace = grace
+        self.clock = clock
+
+    def is_pinned(self, candidate: Candidate, now: datetime) -> bool:
+        if candidate.metadata.is_featured or now - candidate.metadata.created_at < self.grace:
+            return True
+        return candidate.resources is not None and candidate.resources.viewers > 0
+
+    async def candidates(self, app_directory: "AppDirectory") -> list[Candidate]:
+        """Every live app in the catalogue."""
+        usage = await self.usage.load(app_directory.apps)
+        resources = await self.resources.load(app_directory.apps) if self.resources is not None else {}
+        candidates = []
+        for app_id in app_directory.apps:
+            metadata = app_directory.apps[app_id]
+            if metadata.status != AppStatus.TERMINATED:
+                candidates.append(Candidate(metadata, usage.get(app_id), resources.get(app_id)))
+        return candidates
+
+    async def make_room(self, app_directory: "AppDirectory", needed: int = 1) -> list[str]:
+        """Evict apps until `needed` more sandboxes fit in the budget. Returns the evicted app ids.
+
+        Raises `CapacityExceeded`, without evicting anything, if there aren't enough unpinned apps.
+        """
+        with tracer.span(MAKE_ROOM_SPAN, policy=self.policy.name, max_sandboxes=self.max_sandboxes) as span:
+            await app_directory.load()
+            now = self.clock()
+            candidates = await self.candidates(app_directory)
+            over = len(candidates) + needed - self.max_sandboxes
+            span.set_attribute("live", len(candidates))
+            if over <= 0:
+                span.set_attribute("evicted", 0)
+                return []
+
+            ranked = self.policy.rank([c for c in candidates if not self.is_pinned(c, now)], now)
+            if len(ranked) < over:
+                span.set_attribute("rejected", True)
+                raise CapacityExceeded(
+                    f"{len(candidates)} of {self.max_sandboxes} sandboxes are live and only {len(ranked)} can be evicted"
+                )
+
+            evicted: list[str] = []
+            while len(evicted) < over and ranked:
+                batch, ranked = ranked[:over - len(evicted)], ranked[over - len(evicted):]
+                stopped = await asyncio.gather(*[self.stop_sandbox(candidate.app_id) for candidate in batch])
+                evicted.extend(candidate.app_id for candidate, ok in zip(batch, stopped) if ok)
+            for app_id in evicted:
+                print(f"[CapacityManager] Evicting app {app_id} ({self.policy.name})")
+            if evicted:
+                await app_directory.remove_apps(evicted)
+            span.set_attribute("evicted", len(evicted))
+            span.set_attribute("live", len(candidates) - len(evicted))
+            if len(evicted) < over:
+                span.set_attribute("rejected", True)
+                raise CapacityExceeded(f"Evicted {len(evicted)} of the {over} apps needed to stay within {self.max_sandboxes} sandboxes")
+            return evicted
+
+
+class CapacityMetrics:
+    """Live sandboxes against the budget, evictions and creates turned away, from `make_room` spans.
+
+    Create jobs run in workers; their spans reach the controller's `/metrics` with the finished job.
+    """
+
+    def __init__(self):
+        self.live = 0
+        self.max_sandboxes = 0
+        self.evictions: Counter[str] = Counter()
+        self.rejections: Counter[str] = Counter()
+
+    def observe(self, span: Span) -> None:
+        if span.name != MAKE_ROOM_SPAN:
+            return
+        policy = span.attributes.get("policy", "unknown")
+        self.live = span.attributes.get("live", self.live)
+        self.max_sandboxes = span.attributes.get("max_sandboxes", self.max_sandboxes)
+        self.evictions[policy] += span.attributes.get("evicted", 0)
+        if span.attributes.get("rejected"):
+            self.rejections[policy] += 1
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# HELP modal_vibe_capacity_live_sandboxes Live sandboxes at the last create.",
+            "# TYPE modal_vibe_capacity_live_sandboxes gauge",
+            f"modal_vibe_capacity_live_sandboxes {self.live}",
+            "# HELP modal_vibe_capacity_max_sandboxes The sandbox budget.",
+            "# TYPE modal_vibe_capacity_max_sandboxes gauge",
+            f"modal_vibe_capacity_max_sandboxes {self.max_sandboxes}",
+            "# HELP modal_vibe_capacity_evictions_total Apps evicted to make room for new ones.",
+            "# TYPE modal_vibe_capacity_evictions_total counter",
+            *[f'modal_vibe_capacity_evictions_total{{policy="{policy}"}} {count}' for policy, count in sorted(self.evictions.items())],
+            "# HELP modal_vibe_capacity_rejections_total Creates that failed because no app could be evicted.",
+            "# TYPE modal_vibe_capacity_rejections_total counter",
+            *[f'modal_vibe_capacity_rejections_total{{policy="{policy}"}} {count}' for policy, count in sorted(self.rejections.items())],
+        ]
+        return "\n".join(lines) + "\n"
+
+
+capacity_metrics = CapacityMetrics()
+tracer.observers.append(capacity_metrics)
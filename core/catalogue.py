@@ -0,0 +1,335 @@
+"""The in-memory app catalogue, and secondary indexes over it for paged, filtered and sorted listing.
+
+`CatalogueStore` holds every app's metadata in columns rather than one `AppMetadata` per app:
+timestamps as epoch microseconds in arrays, statuses as one-byte codes, `is_featured` as a
+bitset and URLs interned. It is a mapping of app id to `AppMetadata` for code that needs the
+model, and hands out listing summaries straight from the columns for code that doesn't.
+
+`AppDirectory` keeps one `CatalogueIndex` up to date as apps are loaded, saved and removed.
+For every sort order the index holds one sorted list per partition: all apps, featured or
+not, each status, and each featured/status pair. A query walks the partition matching its
+filters exactly from a cursor found by bisection, so serving a page costs O(log N + page size) rather than
+materializing and sorting the whole catalogue.
+"""
+
+import base64
+import bisect
+import json
+import sys
+import typing as t
+from array import array
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from core.models import AppMetadata, AppStatus
+from core.responses import EncodedBody
+
+SORT_KEYS: dict[str, t.Callable[[AppMetadata], tuple]] = {
+    # Most recently edited first.
+    "updated_at": lambda metadata: (-metadata.updated_at.timestamp(), metadata.id),
+    # Newest first.
+    "created_at": lambda metadata: (-metadata.created_at.timestamp(), metadata.id),
+    # The gallery order: featured apps, then everything else, newest first within each group.
+    "featured": lambda metadata: (0 if metadata.is_featured else 1, -metadata.created_at.timestamp(), metadata.id),
+}
+
+_KEY_LENGTHS = {"updated_at": 2, "created_at": 2, "featured": 3}
+
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 200
+
+
+def encode_cursor(sort: str, key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort, *key]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> tuple:
+    """The sort key a cursor points after. Raises ValueError unless it is a cursor for `sort`."""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not isinstance(decoded, list) or not decoded or decoded[0] != sort:
+        raise ValueError(f"Cursor does not match sort {sort!r}")
+    key = tuple(decoded[1:])
+    # Every sort key is numbers followed by the app id, which breaks ties.
+    numbers, app_id = key[:-1], key[-1:]
+    if (
+        len(key) != _KEY_LENGTHS[sort]
+        or not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in numbers)
+        or not isinstance(app_id[0], str)
+    ):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return key
+
+
+def _partition_name(featured: t.Optional[bool], status: t.Optional[AppStatus]) -> str:
+    parts = []
+    if featured is not None:
+        parts.append("featured:true" if featured else "featured:false")
+    if status is not None:
+        parts.append(f"status:{status.value}")
+    return ",".join(parts) or "all"
+
+
+def _partitions(metadata: AppMetadata) -> list[str]:
+    return [
+        _partition_name(featured, status)
+        for featured in (None, metadata.is_featured)
+        for status in (None, metadata.status)
+    ]
+
+
+_STATUSES = list(AppStatus)
+_STATUS_CODES = {status: code for code, status in enumerate(_STATUSES)}
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_us(value: datetime) -> int:
+    """Exact epoch microseconds. Naive datetimes count from a naive epoch, so they round-trip as is."""
+    return (value - (_EPOCH if value.tzinfo is None else _EPOCH_UTC)) // _MICROSECOND
+
+
+def _from_us(us: int, aware: bool) -> datetime:
+    return (_EPOCH_UTC if aware else _EPOCH) + timedelta(microseconds=us)
+
+
+def _get_bit(bits: bytearray, row: int) -> bool:
+    return bool(bits[row >> 3] & (1 << (row & 7)))
+
+
+def _set_bit(bits: bytearray, row: int, value: bool) -> None:
+    if value:
+        bits[row >> 3] |= 1 << (row & 7)
+    else:
+        bits[row >> 3] &= ~(1 << (row & 7)) & 0xFF
+
+
+class CatalogueStore(MutableMapping):
+    """Column-oriented app metadata, keyed by app id.
+
+    Reading an item builds an `AppMetadata`; `summary` and `entry` read the columns directly.
+    `version` changes with every write, so anything derived from the catalogue can be cached
+    until it does.
+    """
+
+    def __init__(self, apps: t.Iterable[AppMetadata] = ()):
+        self.version = 0
+        self._rows: dict[str, int] = {}
+        self._ids: list[t.Optional[str]] = []
+        self._created = array("q")
+        self._updated = array("q")
+        self._status = bytearray()
+        self._featured = bytearray()  # One bit per row.
+        self._aware = bytearray()  # Whether the row's timestamps were timezone-aware (UTC).
+        self._urls: list[str] = []
+        self._titles: list[str] = []
+        self._hashes: list[str] = []
+        self._free: list[int] = []
+        for metadata in apps:
+            self[metadata.id] = metadata
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __iter__(self) -> t.Iterator[str]:
+        return iter(self._rows)
+
+    def __contains__(self, app_id: object) -> bool:
+        return app_id in self._rows
+
+    def __getitem__(self, app_id: str) -> AppMetadata:
+        row = self._rows[app_id]
+        aware = _get_bit(self._aware, row)
+        return AppMetadata.model_construct(
+            id=app_id,
+            created_at=_from_us(self._created[row], aware),
+            updated_at=_from_us(self._updated[row], aware),
+            status=_STATUSES[self._status[row]],
+            sandbox_user_tunnel_url=self._urls[row],
+            title=self._titles[row],
+            is_featured=_get_bit(self._featured, row),
+            component_hash=self._hashes[row],
+        )
+
+    def __setitem__(self, app_id: str, metadata: AppMetadata) -> None:
+        row = self._rows.get(app_id)
+        if row is None:
+            row = self._allocate(app_id)
+        aware = metadata.created_at.tzinfo is not None
+        self._created[row] = _to_us(metadata.created_at)
+        self._updated[row] = _to_us(metadata.updated_at)
+        self._status[row] = _STATUS_CODES[metadata.status]
+        # Sandbox URLs share their scheme and domain; interning also dedupes repeated loads of one app.
+        self._urls[row] = sys.intern(metadata.sandbox_user_tunnel_url)
+        self._titles[row] = metadata.title
+        self._hashes[row] = sys.intern(metadata.component_hash)
+        _set_bit(self._featured, row, metadata.is_featured)
+        _set_bit(self._aware, row, aware)
+        self.version += 1
+
+    def __delitem__(self, app_id: str) -> None:
+        row = self._rows.pop(app_id)
+        self._ids[row] = None
+        self._urls[row] = self._titles[row] = self._hashes[row] = ""
+        self._free.append(row)
+        self.version += 1
+
+    def _allocate(self, app_id: str) -> int:
+        if self._free:
+            row = self._free.pop()
+            self._ids[row] = app_id
+        else:
+            row = len(self._ids)
+            self._ids.append(app_id)
+            self._created.append(0)
+            self._updated.append(0)
+            self._status.append(0)
+            self._urls.append("")
+            self._titles.append("")
+            self._hashes.append("")
+            if row % 8 == 0:
+                self._featured.append(0)
+                self._aware.append(0)
+        self._rows[app_id] = row
+        return row
+
+    def rebuild(self, apps: t.Iterable[AppMetadata]) -> None:
+        version = self.version
+        self.__init__(apps)
+        # Past every version before, or pages cached for the old catalogue could be served for the new one.
+        self.version = version + self.version + 1
+
+    def summary(self, app_id: str) -> tuple[str, str, bool, str]:
+        """`(user tunnel url, title, is_featured, component hash)`, without building an `AppMetadata`."""
+        row = self._rows[app_id]
+        return self._urls[row], self._titles[row], _get_bit(self._featured, row), self._hashes[row]
+
+    def entry(self, app_id: str) -> dict:
+        """The app's catalogue entry as stored in the Modal Dict, i.e. `AppMetadata.model_dump()`."""
+        row = self._rows[app_id]
+        aware = _get_bit(self._aware, row)
+        return {
+            "id": app_id,
+            "created_at": _from_us(self._created[row], aware).isoformat(),
+            "updated_at": _from_us(self._updated[row], aware).isoformat(),
+            "status": _STATUSES[self._status[row]].value,
+            "sandbox_user_tunnel_url": self._urls[row],
+            "title": self._titles[row],
+            "is_featured": _get_bit(self._featured, row),
+            "component_hash": self._hashes[row],
+        }
+
+
+class SerializedPages:
+    """Serialized listing responses and rendered gallery pages, reused until the catalogue's version changes."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._version: t.Optional[int] = None
+        self._pages: OrderedDict[tuple, EncodedBody] = OrderedDict()
+
+    def get(self, version: int, key: tuple) -> t.Optional[EncodedBody]:
+        if version != self._version:
+            self._pages.clear()
+            self._version = version
+            return None
+        body = self._pages.get(key)
+        if body is not None:
+            self._pages.move_to_end(key)
+        return body
+
+    def put(self, version: int, key: tuple, body: EncodedBody) -> None:
+        if version != self._version:
+            self._pages.clear()
+            self._version = version
+        self._pages[key] = body
+        while len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
+
+
+@dataclass
+class CataloguePage:
+    app_ids: list[str]
+    next_cursor: t.Optional[str]
+    total: int
+
+
+class CatalogueIndex:
+    def __init__(self):
+        self._sorted: dict[str, dict[str, list[tuple]]] = {sort: {} for sort in SORT_KEYS}
+        self._entries: dict[str, tuple[list[str], dict[str, tuple]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def rebuild(self, apps: t.Mapping[str, AppMetadata]) -> None:
+        """Build from scratch in O(N log N), used after loading the catalogue."""
+        self._sorted = {sort: {} for sort in SORT_KEYS}
+        self._entries = {}
+        for app_id, metadata in apps.items():
+            partitions = _partitions(metadata)
+            keys = {sort: key_fn(metadata) for sort, key_fn in SORT_KEYS.items()}
+            self._entries[app_id] = (partitions, keys)
+            for sort, key in keys.items():
+                for partition in partitions:
+                    self._sorted[sort].setdefault(partition, []).append(key)
+        for lists in self._sorted.values():
+            for keys in lists.values():
+                keys.sort()
+
+    def upsert(self, metadata: AppMetadata) -> None:
+        self.remove(metadata.id)
+        partitions = _partitions(metadata)
+        keys = {sort: key_fn(metadata) for sort, key_fn in SORT_KEYS.items()}
+        self._entries[metadata.id] = (partitions, keys)
+        for sort, key in keys.items():
+            for partition in partitions:
+                bisect.insort(self._sorted[sort].setdefault(partition, []), key)
+
+    def remove(self, app_id: str) -> None:
+        entry = self._entries.pop(app_id, None)
+        if entry is None:
+            return
+        partitions, keys = entry
+        for sort, key in keys.items():
+            for partition in partitions:
+                ordered = self._sorted[sort][partition]
+                i = bisect.bisect_left(ordered, key)
+                if i < len(ordered) and ordered[i] == key:
+                    del ordered[i]
+
+    def count(self, featured: t.Optional[bool] = None, status: t.Optional[AppStatus] = None) -> int:
+        return len(self._sorted["updated_at"].get(_partition_name(featured, status), []))
+
+    def query(
+        self,
+        sort: str = "updated_at",
+        featured: t.Optional[bool] = None,
+        status: t.Optional[AppStatus] = None,
+        cursor: t.Optional[str] = None,
+        limit: int = DEFAULT_LIMIT,
+    ) -> CataloguePage:
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort {sort!r}, expected one of {', '.join(SORT_KEYS)}")
+        limit = max(1, min(limit, MAX_LIMIT))
+        app_ids = []
+        last_key = None
+        for key in self._iter(sort, featured, status, decode_cursor(cursor, sort) if cursor else None):
+            if len(app_ids) == limit:
+                # There is at least one more match, so hand out a cursor to it.
+                return CataloguePage(app_ids, encode_cursor(sort, last_key), self.count(featured, status))
+            app_ids.append(key[-1])
+            last_key = key
+        return CataloguePage(app_ids, None, self.count(featured, status))
+
+    def _iter(self, sort: str, featured: t.Optional[bool], status: t.Optional[AppStatus], after: t.Optional[tuple]) -> t.Iterator[tuple]:
+        ordered = self._sorted[sort].get(_partition_name(featured, status), [])
+        start = bisect.bisect_right(ordered, after) if after is not None else 0
+        for i in range(start, len(ordered)):
+            yield ordered[i]
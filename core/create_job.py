@@ -0,0 +1,257 @@
+"""App creation as a background job with persisted progress.
+
+`POST /api/create` only records a `CreateAppJob` and hands it to a worker, so the request
+returns as soon as the job is saved instead of holding the connection open for the whole
+sandbox boot and generation. Clients poll the job, and a cancelled job tears down the sandbox
+it had started. Retries are deduplicated by the endpoint's idempotency key (core/idempotency.py).
+With a sandbox budget, the job first makes room for its sandbox (core/capacity.py).
+The worker's spans are kept next to the job until one controller takes them for its `/metrics`.
+Jobs, their cancel requests and spans are deleted by the cleanup cron a day after they were last updated.
+"""
+
+import asyncio
+import contextlib
+import typing as t
+from datetime import datetime, timedelta
+
+import modal
+
+from core.capacity import CapacityExceeded, CapacityManager
+from core.models import CreateAppJob, CreateStage, JobStatus
+from core.sandbox import AppDirectory, SandboxApp
+from core.terminate import terminate_sandbox
+
+FINISHED = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+# Clients poll a job for minutes at most, and one still running after this long belongs to a worker that died.
+JOB_TTL_SECONDS = 24 * 3600
+_JOB_KEY_PREFIX = "create_job_"
+_CANCEL_KEY_SUFFIX = "_cancel"
+_SPANS_KEY_SUFFIX = "_spans"
+
+
+class CreateCancelled(Exception):
+    pass
+
+
+def _job_key(job_id: str) -> str:
+    return f"{_JOB_KEY_PREFIX}{job_id}"
+
+
+def _cancel_key(job_id: str) -> str:
+    # Kept apart from the job itself, which only the worker writes while the job runs.
+    return f"{_JOB_KEY_PREFIX}{job_id}{_CANCEL_KEY_SUFFIX}"
+
+
+def _spans_key(job_id: str) -> str:
+    return f"{_JOB_KEY_PREFIX}{job_id}{_SPANS_KEY_SUFFIX}"
+
+
+async def save_job(apps_dict: modal.Dict, job: CreateAppJob) -> None:
+    job.updated_at = datetime.now()
+    await apps_dict.put.aio(_job_key(job.id), job.model_dump())
+
+
+async def load_job(apps_dict: modal.Dict, job_id: str) -> t.Optional[CreateAppJob]:
+    job_data = await apps_dict.get.aio(_job_key(job_id))
+    if job_data is None:
+        return None
+    return CreateAppJob.model_validate(job_data)
+
+
+async def submit_job(apps_dict: modal.Dict, job_id: str, prompt: str) -> CreateAppJob:
+    """Record a new pending job."""
+    now = datetime.now()
+    job = CreateAppJob(
+        id=job_id,
+        status=JobStatus.PENDING,
+        stage=CreateStage.QUEUED,
+        created_at=now,
+        updated_at=now,
+        prompt=prompt,
+    )
+    await save_job(apps_dict, job)
+    return job
+
+
+async def fail_job(apps_dict: modal.Dict, job: CreateAppJob, error: str) -> None:
+    job.status, job.stage, job.error = JobStatus.FAILED, CreateStage.DONE, error
+    await save_job(apps_dict, job)
+
+
+async def request_cancel(apps_dict: modal.Dict, job_id: str) -> None:
+    await apps_dict.put.aio(_cancel_key(job_id), True)
+
+
+async def is_cancel_requested(apps_dict: modal.Dict, job_id: str) -> bool:
+    return await apps_dict.contains.aio(_cancel_key(job_id))
+
+
+async def save_spans(apps_dict: modal.Dict, job_id: str, spans: list[dict]) -> None:
+    await apps_dict.put.aio(_spans_key(job_id), spans)
+
+
+async def take_spans(apps_dict: modal.Dict, job_id: str) -> list[dict]:
+    """The spans the worker recorded for a job, handed to only one caller.
+
+    Popping is a single Dict operation, so of the controllers polling a job at the same time only
+    one gets its spans, and they are added to one `/metrics` once.
+    """
+    try:
+        return await apps_dict.pop.aio(_spans_key(job_id))
+    except KeyError:
+        return []
+
+
+async def cleanup_jobs(apps_dict: modal.Dict, ttl_seconds: float = JOB_TTL_SECONDS) -> int:
+    """Delete jobs not updated for `ttl_seconds`, and cancel requests and spans whose job is gone. Returns how many jobs."""
+    job_ids, cancel_ids, span_ids = set(), set(), set()
+    async for key in apps_dict.keys.aio():
+        if not isinstance(key, str) or not key.startswith(_JOB_KEY_PREFIX):
+            continue
+        if key.endswith(_CANCEL_KEY_SUFFIX):
+            cancel_ids.add(key[len(_JOB_KEY_PREFIX):-len(_CANCEL_KEY_SUFFIX)])
+        elif key.endswith(_SPANS_KEY_SUFFIX):
+            span_ids.add(key[len(_JOB_KEY_PREFIX):-len(_SPANS_KEY_SUFFIX)])
+        else:
+            job_ids.add(key[len(_JOB_KEY_PREFIX):])
+
+    cutoff = datetime.now() - timedelta(seconds=ttl_seconds)
+    kept = set()
+    for job_id in job_ids:
+        try:
+            job = await load_job(apps_dict, job_id)
+        except Exception as e:
+            print(f"Removing unreadable create job {job_id}: {e}")
+            job = None
+        if job is not None and job.updated_at >= cutoff:
+            kept.add(job_id)
+            continue
+        await _pop_if_present(apps_dict, _job_key(job_id))
+    for job_id in cancel_ids - kept:
+        await _pop_if_present(apps_dict, _cancel_key(job_id))
+    for job_id in span_ids - kept:
+        await _pop_if_present(apps_dict, _spans_key(job_id))
+    removed = len(job_ids) - len(kept)
+    if removed:
+        print(f"Removed {removed} create jobs not updated for {ttl_seconds / 3600:g} hours")
+    return removed
+
+
+async def _pop_if_present(apps_dict: modal.Dict, key: str) -> None:
+    if await apps_dict.contains.aio(key):
+        await apps_dict.pop.aio(key)
+
+
+async def _wait_for_cancel(apps_dict: modal.Dict, job_id: str, poll_interval: float) -> None:
+    while not await is_cancel_requested(apps_dict, job_id):
+        await asyncio.sleep(poll_interval)
+
+
+async def run_create_job(
+    apps_dict: modal.Dict,
+    app_directory: AppDirectory,
+    job_id: str,
+    image: t.Optional[modal.Image],
+    start_sandbox: t.Optional[t.Callable[..., t.Awaitable[tuple[str, str, str]]]] = None,
+    stop_sandbox: t.Callable[[str], t.Awaitable[bool]] = terminate_sandbox,
+    on_created: t.Optional[t.Callable[[SandboxApp], t.Awaitable[None]]] = None,
+    poll_interval: float = 1.0,
+    capacity: t.Optional[CapacityManager] = None,
+) -> CreateAppJob:
+    """Build and save the app for a pending job, recording each stage.
+
+    A cancel request is noticed within `poll_interval` seconds: the build is cancelled and the
+    sandbox, if it had booted, is terminated with `stop_sandbox`. Failed builds are torn down
+    the same way rather than leaving an uncatalogued sandbox running until its timeout.
+
+    With a `capacity` budget, apps are evicted to make room before the sandbox boots, and the
+    job fails if there is no room to make.
+    """
+    job = await load_job(apps_dict, job_id)
+    if job is None:
+        raise ValueError(f"Create job {job_id} not found")
+    if job.status in FINISHED:
+        return job
+    if await is_cancel_requested(apps_dict, job_id):
+        job.status, job.stage = JobStatus.CANCELLED, CreateStage.DONE
+        await save_job(apps_dict, job)
+        return job
+
+    if start_sandbox is None:
+        from sandbox.start_sandbox import run_sandbox as start_sandbox
+
+    booting: list[asyncio.Task] = []
+
+    async def _boot(**kwargs) -> tuple[str, str, str]:
+        sandbox = await start_sandbox(**kwargs)
+        job.sandbox_object_id = sandbox[2]
+        await save_job(apps_dict, job)
+        return sandbox
+
+    async def _start_sandbox(**kwargs) -> tuple[str, str, str]:
+        # Shielded, so a build cancelled while the sandbox boots still learns its id to tear it down.
+        boot = asyncio.create_task(_boot(**kwargs))
+        booting.append(boot)
+        sandbox = await asyncio.shield(boot)
+        # A cancel that came in while the sandbox booted.
+        if await is_cancel_requested(apps_dict, job_id):
+            raise CreateCancelled()
+        return sandbox
+
+    if capacity is not None:
+        try:
+            await capacity.make_room(app_directory)
+        except CapacityExceeded as e:
+            print(f"Create job {job_id} failed: {e}")
+            await fail_job(apps_dict, job, f"At capacity: {e}")
+            return job
+
+    job.status, job.stage = JobStatus.RUNNING, CreateStage.BUILDING
+    await save_job(apps_dict, job)
+
+    build = asyncio.create_task(
+        SandboxApp.create(
+            app_directory.app, app_directory.client, job.prompt, image=image, start_sandbox=_start_sandbox, transport=app_directory.transport,
+        )
+    )
+    cancelled = asyncio.create_task(_wait_for_cancel(apps_dict, job_id, poll_interval))
+    try:
+        await asyncio.wait({build, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+        if not build.done():
+            build.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await build
+            raise CreateCancelled()
+        sandbox_app = build.result()
+        if await is_cancel_requested(apps_dict, job_id):
+            raise CreateCancelled()
+
+        job.stage = CreateStage.SAVING
+        await save_job(apps_dict, job)
+        await app_directory.set_app(sandbox_app)
+        job.app_id = sandbox_app.id
+        job.status = JobStatus.SUCCEEDED
+        if on_created is not None:
+            try:
+                await on_created(sandbox_app)
+            except Exception as e:
+                print(f"Post-create hook failed for app {sandbox_app.id}: {e}")
+    except CreateCancelled:
+        print(f"Create job {job_id} was cancelled")
+        job.status = JobStatus.CANCELLED
+    except Exception as e:
+        print(f"Create job {job_id} failed: {e}")
+        job.status = JobStatus.FAILED
+        job.error = str(e) or type(e).__name__
+    finally:
+        cancelled.cancel()
+
+    for boot in booting:
+        # Wait for a sandbox still booting when the build stopped, so it is torn down too.
+        with contextlib.suppress(Exception):
+            await boot
+    if job.status != JobStatus.SUCCEEDED and job.sandbox_object_id:
+        await stop_sandbox(job.sandbox_object_id)
+    job.stage = CreateStage.DONE
+    await save_job(apps_dict, job)
+    return job
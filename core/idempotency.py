@@ -0,0 +1,201 @@
+"""Idempotency keys and request coalescing for endpoints that start expensive work.
+
+A request carrying an `Idempotency-Key` header runs at most once per key. Its response is kept
+in a Modal Dict of its own for `ttl_seconds` and repeats get that response back instead of booting
+another sandbox or making more LLM calls. A repeat that arrives while the first request is still
+running on the same container waits on the same in-flight future; on another container it gets
+a 409 and should retry. Reusing a key for a different request body is rejected with a 422.
+
+Requests without a key can still be coalesced while in flight with a `coalesce_key` derived
+from the request, e.g. the same edit text for the same app.
+
+An expired record is replaced when its key is used again, and `cleanup`, run by the cleanup
+cron, deletes the ones whose keys nobody reuses. Records are kept apart from the apps, so the
+sweep streams only them rather than every key of the catalogue.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+import typing as t
+from collections import Counter
+
+import modal
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+_RECORD_KEY_PREFIX = "idempotency_"
+
+
+def fingerprint(*parts: t.Any) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyConflict(Exception):
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class IdempotentResponse(t.NamedTuple):
+    status_code: int
+    body: t.Any
+    outcome: str  # "executed", "replayed" from a stored response, or "coalesced" onto an in-flight one
+
+
+class IdempotencyMetrics:
+    """Counters for `/metrics`: duplicate requests by outcome, and the work they did not repeat."""
+
+    def __init__(self):
+        self.requests: Counter[tuple[str, str]] = Counter()
+        self.saved: Counter[str] = Counter()
+
+    def observe(self, endpoint: str, outcome: str, cost: t.Mapping[str, int]) -> None:
+        self.requests[(endpoint, outcome)] += 1
+        if outcome in ("replayed", "coalesced"):
+            self.saved.update(cost)
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# HELP modal_vibe_idempotent_requests_total Requests with an idempotency or coalescing key, by outcome.",
+            "# TYPE modal_vibe_idempotent_requests_total counter",
+        ]
+        for (endpoint, outcome), count in sorted(self.requests.items()):
+            lines.append(f'modal_vibe_idempotent_requests_total{{endpoint="{endpoint}",outcome="{outcome}"}} {count}')
+        lines.append("# HELP modal_vibe_saved_work_total Work not repeated because a duplicate request got an earlier result.")
+        lines.append("# TYPE modal_vibe_saved_work_total counter")
+        for resource, count in sorted(self.saved.items()):
+            lines.append(f'modal_vibe_saved_work_total{{resource="{resource}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class IdempotencyStore:
+    def __init__(self, records_dict: modal.Dict, ttl_seconds: float = 24 * 3600, in_progress_timeout: float = 3600):
+        self.records_dict = records_dict
+        self.ttl_seconds = ttl_seconds
+        # A claim older than this is assumed to belong to a request whose container died.
+        self.in_progress_timeout = in_progress_timeout
+        self.metrics = IdempotencyMetrics()
+        self._inflight: dict[str, tuple[str, asyncio.Future]] = {}  # id -> (request fingerprint, response)
+
+    async def run(
+        self,
+        endpoint: str,
+        request_fingerprint: str,
+        fn: t.Callable[[], t.Awaitable[tuple[int, t.Any]]],
+        key: t.Optional[str] = None,
+        coalesce_key: t.Optional[str] = None,
+        cost: t.Optional[t.Mapping[str, int]] = None,
+    ) -> IdempotentResponse:
+        """Run `fn`, which returns `(status_code, body)`, unless an equivalent request already did.
+
+        `cost` is the work a duplicate avoids repeating, e.g. `{"llm_calls": 2}`. Raises
+        `IdempotencyConflict` when the key is in use elsewhere or was used for another request.
+        """
+        cost = cost or {}
+        if key is not None:
+            inflight_id = f"{endpoint}:key:{key}"
+        elif coalesce_key is not None:
+            inflight_id = f"{endpoint}:request:{coalesce_key}"
+        else:
+            inflight_id = None
+
+        if inflight_id is not None and inflight_id in self._inflight:
+            inflight_fingerprint, future = self._inflight[inflight_id]
+            if inflight_fingerprint != request_fingerprint:
+                self.metrics.observe(endpoint, "mismatch", {})
+                raise IdempotencyConflict("Idempotency-Key was already used for a different request", 422)
+            response = await asyncio.shield(future)
+            self.metrics.observe(endpoint, "coalesced", cost)
+            return response._replace(outcome="coalesced")
+
+        future = asyncio.get_running_loop().create_future()
+        if inflight_id is not None:
+            self._inflight[inflight_id] = (request_fingerprint, future)
+        try:
+            response = await self._execute(endpoint, request_fingerprint, fn, key)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Nobody may be waiting; don't warn about an unretrieved exception.
+            raise
+        else:
+            future.set_result(response)
+        finally:
+            if inflight_id is not None:
+                self._inflight.pop(inflight_id, None)
+        if inflight_id is not None:
+            self.metrics.observe(endpoint, response.outcome, cost)
+        return response
+
+    def _record_key(self, endpoint: str, key: str) -> str:
+        return f"{_RECORD_KEY_PREFIX}{endpoint}_{key}"
+
+    async def cleanup(self) -> int:
+        """Delete expired records. Returns how many."""
+        now = time.time()
+        removed = 0
+        async for record_key, stored in self.records_dict.items.aio():
+            if not isinstance(record_key, str) or not record_key.startswith(_RECORD_KEY_PREFIX):
+                continue
+            if stored["expires_at"] < now:
+                await self._release(record_key)
+                removed += 1
+        if removed:
+            print(f"Removed {removed} expired idempotency records")
+        return removed
+
+    async def _execute(
+        self,
+        endpoint: str,
+        request_fingerprint: str,
+        fn: t.Callable[[], t.Awaitable[tuple[int, t.Any]]],
+        key: t.Optional[str],
+    ) -> IdempotentResponse:
+        if key is None:
+            status_code, body = await fn()
+            return IdempotentResponse(status_code, body, "executed")
+
+        record_key = self._record_key(endpoint, key)
+        now = time.time()
+        claim = {"state": "in_progress", "fingerprint": request_fingerprint, "expires_at": now + self.in_progress_timeout}
+        if not await self.records_dict.put.aio(record_key, claim, skip_if_exists=True):
+            stored = await self.records_dict.get.aio(record_key)
+            if stored is None or stored["expires_at"] < now:
+                # An expired record is replaced by the claim rather than deleted first.
+                await self.records_dict.put.aio(record_key, claim)
+            elif stored["fingerprint"] != request_fingerprint:
+                self.metrics.observe(endpoint, "mismatch", {})
+                raise IdempotencyConflict("Idempotency-Key was already used for a different request", 422)
+            elif stored["state"] == "in_progress":
+                self.metrics.observe(endpoint, "in_progress", {})
+                raise IdempotencyConflict("A request with this Idempotency-Key is still in progress", 409)
+            else:
+                return IdempotentResponse(stored["status_code"], stored["body"], "replayed")
+
+        try:
+            status_code, body = await fn()
+        except BaseException:
+            await self._release(record_key)
+            raise
+        if status_code >= 500:
+            # Let a retry run again rather than replaying a server error for a day.
+            await self._release(record_key)
+        else:
+            await self.records_dict.put.aio(record_key, {
+                "state": "done",
+                "fingerprint": request_fingerprint,
+                "expires_at": time.time() + self.ttl_seconds,
+                "status_code": status_code,
+                "body": body,
+            })
+        return IdempotentResponse(status_code, body, "executed")
+
+    async def _release(self, record_key: str) -> None:
+        try:
+            if await self.records_dict.contains.aio(record_key):
+                await self.records_dict.pop.aio(record_key)
+        except Exception as e:
+            print(f"Failed to release idempotency record {record_key}: {e}")
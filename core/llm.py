@@ -1,21 +1,342 @@
-"""LLM logic for the sandbox app."""
+"""LLM logic for the sandbox app.
 
+Every call goes through an `LLMGateway`, which picks a chain of models for the task, bounds each
+attempt with a per-model timeout, retries overloaded or rate-limited requests with jittered
+backoff, falls back to the next model in the chain, and can hedge slow requests by firing a
+second one once the first is slower than a latency percentile.
+
+The provider is anything with the `AsyncAnthropic` interface (`messages.create`), such as the
+deterministic `FakeLLMClient` in local/fakes.py.
+"""
+
+import asyncio
 import os
+import random
+import re
+import time
+import typing as t
+from collections import Counter, deque
+from dataclasses import dataclass
+
 from dotenv import load_dotenv
 
-from anthropic import AsyncAnthropic
+from core.tracing import StageMetrics, Span, tracer
 
 load_dotenv()
 
-def get_llm_client():
-    return AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+SONNET = "claude-sonnet-4-6"
+SONNET_FALLBACK = "claude-sonnet-4-5-20250929"
+HAIKU = "claude-haiku-4-5-20251001"
+
+# Status codes worth retrying: rate limited, server errors and Anthropic's "overloaded".
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504, 529)
+
+
+@dataclass(frozen=True)
+class ModelConfig:
+    model: str
+    timeout: float  # Seconds per attempt.
+    max_attempts: int = 2
+
+    def __post_init__(self):
+        if self.max_attempts < 1:
+            raise ValueError(f"{self.model} needs at least one attempt, got max_attempts={self.max_attempts}")
+
+
+@dataclass(frozen=True)
+class Route:
+    models: tuple[ModelConfig, ...]  # Tried in order; later models are fallbacks.
+    # Fire a second request once the first is slower than this percentile of recent latencies.
+    hedge_percentile: t.Optional[float] = None
+
+    def __post_init__(self):
+        # `generate` re-raises the last model's error, so there has to be one.
+        if not self.models:
+            raise ValueError("A route needs at least one model")
+
+
+DEFAULT_ROUTES: dict[str, Route] = {
+    "generate": Route((ModelConfig(SONNET, 240, 3), ModelConfig(SONNET_FALLBACK, 240), ModelConfig(HAIKU, 120))),
+    "edit": Route((ModelConfig(SONNET, 240, 3), ModelConfig(SONNET_FALLBACK, 240), ModelConfig(HAIKU, 120))),
+    # Cosmetic one-liners don't need the big model.
+    "edit_small": Route((ModelConfig(HAIKU, 90), ModelConfig(SONNET, 240))),
+    # Explanations are 64 tokens, so hedging them is cheap.
+    "explain": Route((ModelConfig(HAIKU, 20, 3), ModelConfig(SONNET, 30)), hedge_percentile=0.9),
+}
+
+SMALL_EDIT_MAX_WORDS = 16
+_SMALL_EDIT_WORDS = re.compile(
+    r"\b(colou?rs?|font|bold|italic|bigger|smaller|size|text|title|heading|label|rename|padding|margin|spacing|"
+    r"background|dark|light|theme|border|rounded|shadow|align|center|centre|emoji|icon|copy|wording|typo)\b",
+    re.IGNORECASE,
+)
+
+
+def is_small_edit(instruction: str) -> bool:
+    """Short, cosmetic instructions like "make the title bigger" rather than new features."""
+    return len(instruction.split()) <= SMALL_EDIT_MAX_WORDS and bool(_SMALL_EDIT_WORDS.search(instruction))
+
+
+def _status_code(error: BaseException) -> t.Optional[int]:
+    return getattr(error, "status_code", None)
+
+
+def _is_retryable(error: BaseException) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    status_code = _status_code(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    # Connection errors and timeouts raised by the client carry no status code.
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def _retry_after(error: BaseException) -> t.Optional[float]:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except Exception:
+        return None
+
+
+class LatencyWindow:
+    """Recent successful latencies of one model, for picking the hedge delay."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> t.Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class LLMMetrics:
+    """Per-model latency, outcome, token, hedge and fallback metrics, derived from LLM spans.
+
+    Registered as a tracer observer, so spans shipped back from worker containers count too.
+    """
+
+    def __init__(self):
+        self.latency = StageMetrics(
+            metric="modal_vibe_llm_request_duration_ms",
+            label="model",
+            help_text="Duration of successful LLM requests in milliseconds.",
+            errors_metric=None,
+        )
+        self.requests: Counter[tuple[str, str]] = Counter()
+        self.tokens: Counter[tuple[str, str]] = Counter()
+        self.hedges: Counter[tuple[str, str]] = Counter()
+        self.fallbacks: Counter[str] = Counter()
+
+    def observe(self, span: Span) -> None:
+        attributes = span.attributes
+        if span.name == "llm.attempt":
+            model, outcome = attributes.get("model", ""), attributes.get("outcome", "error")
+            self.requests[(model, outcome)] += 1
+            if outcome == "ok":
+                self.latency.observe_value(model, span.duration_ms)
+                self.tokens[(model, "input")] += attributes.get("input_tokens", 0)
+                self.tokens[(model, "output")] += attributes.get("output_tokens", 0)
+            if attributes.get("hedge"):
+                # The hedge either beat the first request, lost to it and was cancelled, or failed.
+                winner = {"ok": "hedge", "cancelled": "primary"}.get(outcome, "hedge_failed")
+                self.hedges[(model, winner)] += 1
+        elif attributes.get("fallbacks"):
+            self.fallbacks[attributes.get("task", span.name)] += attributes["fallbacks"]
+
+    def render_prometheus(self) -> str:
+        lines = [self.latency.render_prometheus().rstrip("\n")]
+        lines.append("# HELP modal_vibe_llm_requests_total LLM request attempts by model and outcome.")
+        lines.append("# TYPE modal_vibe_llm_requests_total counter")
+        for (model, outcome), count in sorted(self.requests.items()):
+            lines.append(f'modal_vibe_llm_requests_total{{model="{model}",outcome="{outcome}"}} {count}')
+        lines.append("# HELP modal_vibe_llm_tokens_total Tokens used by successful LLM requests.")
+        lines.append("# TYPE modal_vibe_llm_tokens_total counter")
+        for (model, direction), count in sorted(self.tokens.items()):
+            lines.append(f'modal_vibe_llm_tokens_total{{model="{model}",direction="{direction}"}} {count}')
+        lines.append("# HELP modal_vibe_llm_hedges_total Hedged requests, by which of the two requests won.")
+        lines.append("# TYPE modal_vibe_llm_hedges_total counter")
+        for (model, winner), count in sorted(self.hedges.items()):
+            lines.append(f'modal_vibe_llm_hedges_total{{model="{model}",winner="{winner}"}} {count}')
+        lines.append("# HELP modal_vibe_llm_fallbacks_total Times a task fell back to the next model in its chain.")
+        lines.append("# TYPE modal_vibe_llm_fallbacks_total counter")
+        for task, count in sorted(self.fallbacks.items()):
+            lines.append(f'modal_vibe_llm_fallbacks_total{{task="{task}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+llm_metrics = LLMMetrics()
+tracer.observers.append(llm_metrics)
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        provider,
+        routes: t.Optional[dict[str, Route]] = None,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 8.0,
+        seed: t.Optional[int] = None,
+    ):
+        self.provider = provider
+        self.routes = routes if routes is not None else DEFAULT_ROUTES
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._random = random.Random(seed)
+        self._latencies: dict[str, LatencyWindow] = {}
+
+    def choose_task(self, task: str, instruction: t.Optional[str] = None) -> str:
+        if task == "edit" and instruction is not None and "edit_small" in self.routes and is_small_edit(instruction):
+            return "edit_small"
+        return task
+
+    async def generate(
+        self,
+        prompt: str,
+        task: str = "generate",
+        max_tokens: int = 8192,
+        temperature: float = 0.5,
+        instruction: t.Optional[str] = None,
+        span_name: t.Optional[str] = None,
+    ) -> str:
+        """Generate a completion for `prompt` with the model chain routed for `task`.
+
+        `instruction` is the user's edit request, used to route small edits to a faster model.
+        """
+        task = self.choose_task(task, instruction)
+        route = self.routes[task]
+        with tracer.span(span_name or f"llm.{task}", task=task, max_tokens=max_tokens) as span:
+            last_error: t.Optional[BaseException] = None
+            for fallbacks, config in enumerate(route.models):
+                span.set_attribute("fallbacks", fallbacks)
+                try:
+                    message = await self._call_with_retries(config, route, prompt, max_tokens, temperature)
+                except Exception as e:
+                    if not _is_retryable(e) and _status_code(e) != 404:
+                        raise
+                    print(f"[LLMGateway] {config.model} failed for {task}, falling back: {e!r}")
+                    last_error = e
+                    continue
+                span.set_attribute("model", config.model)
+                usage = getattr(message, "usage", None)
+                if usage is not None:
+                    span.set_attribute("input_tokens", usage.input_tokens)
+                    span.set_attribute("output_tokens", usage.output_tokens)
+                return message.content[0].text
+            raise last_error
+
+    async def _call_with_retries(self, config: ModelConfig, route: Route, prompt: str, max_tokens: int, temperature: float):
+        for attempt in range(config.max_attempts):
+            try:
+                return await self._call_maybe_hedged(config, route, prompt, max_tokens, temperature, attempt)
+            except Exception as e:
+                if not _is_retryable(e) or attempt == config.max_attempts - 1:
+                    raise
+                # Full jitter, unless the provider told us how long to wait.
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = self._random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                print(f"[LLMGateway] {config.model} attempt {attempt + 1} failed ({e!r}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def _call_maybe_hedged(self, config: ModelConfig, route: Route, prompt: str, max_tokens: int, temperature: float, attempt: int):
+        hedge_after = None
+        if route.hedge_percentile is not None:
+            hedge_after = self._latencies.setdefault(config.model, LatencyWindow()).percentile(route.hedge_percentile)
+        primary = asyncio.create_task(self._call(config, prompt, max_tokens, temperature, attempt, hedge=False))
+        if hedge_after is None:
+            return await primary
+
+        pending = {primary}
+        error: t.Optional[BaseException] = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_after)
+            if done:
+                return primary.result()
+            pending.add(asyncio.create_task(self._call(config, prompt, max_tokens, temperature, attempt, hedge=True)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Including when our caller is cancelled while we wait, so no request is left running.
+            for task in pending:
+                task.cancel()
+
+    async def _call(self, config: ModelConfig, prompt: str, max_tokens: int, temperature: float, attempt: int, hedge: bool):
+        with tracer.span("llm.attempt", model=config.model, attempt=attempt + 1, hedge=hedge) as span:
+            start = time.monotonic()
+            try:
+                message = await asyncio.wait_for(
+                    self.provider.messages.create(
+                        model=config.model,
+                        messages=[{"role": "user", "content": prompt}],
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                    ),
+                    timeout=config.timeout,
+                )
+            except asyncio.CancelledError:
+                span.set_attribute("outcome", "cancelled")
+                raise
+            except asyncio.TimeoutError:
+                span.set_attribute("outcome", "timeout")
+                raise
+            except Exception as e:
+                span.set_attribute("outcome", "retryable_error" if _is_retryable(e) else "error")
+                span.set_attribute("status_code", _status_code(e) or 0)
+                raise
+            self._latencies.setdefault(config.model, LatencyWindow()).add(time.monotonic() - start)
+            span.set_attribute("outcome", "ok")
+            usage = getattr(message, "usage", None)
+            if usage is not None:
+                span.set_attribute("input_tokens", usage.input_tokens)
+                span.set_attribute("output_tokens", usage.output_tokens)
+            return message
+
+
+class LazyAnthropic:
+    """An `AsyncAnthropic` client that is only imported and constructed when first used.
+
+    Importing the SDK takes over a second, which functions that never call the LLM, like the
+    cleanup cron, would otherwise pay on every cold start.
+    """
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._client = None
+
+    def __getattr__(self, name: str):
+        if self._client is None:
+            from anthropic import AsyncAnthropic
+
+            self._client = AsyncAnthropic(**self._kwargs)
+        return getattr(self._client, name)
+
+
+def get_llm_client() -> LLMGateway:
+    # The gateway does its own retries and fallbacks, so the SDK's are turned off.
+    return LLMGateway(LazyAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=0))
 
 
-async def generate_response(client, prompt, model="claude-sonnet-4-6", max_tokens=8192, temperature=0.5):
-    message = await client.messages.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=max_tokens,
-        temperature=temperature,
+async def generate_response(
+    client: LLMGateway,
+    prompt: str,
+    task: str = "generate",
+    max_tokens: int = 8192,
+    temperature: float = 0.5,
+    instruction: t.Optional[str] = None,
+    span_name: t.Optional[str] = None,
+) -> str:
+    return await client.generate(
+        prompt, task=task, max_tokens=max_tokens, temperature=temperature, instruction=instruction, span_name=span_name
     )
-    return message.content[0].text
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""Event loop lag instrumentation for the async controller.
+
+A ticker task sleeps for a short interval and measures how late it wakes up. If the loop was
+blocked for longer than the threshold (e.g. by a synchronous Modal call inside an `async def`
+handler), the stall is recorded together with the requests that were in flight at the time.
+
+In tests, wrap the code under test and assert nothing blocked the loop:
+
+    async with LoopLagMonitor(threshold_ms=20) as monitor:
+        await client.get("/api/apps")
+    monitor.assert_no_stalls()
+"""
+
+import asyncio
+import itertools
+import time
+import typing as t
+from collections import deque
+from dataclasses import dataclass, field
+
+# Stalls kept for inspection; older ones are only counted, so a long-running controller doesn't grow.
+MAX_STALLS = 1000
+
+
+@dataclass
+class LoopStall:
+    lag_ms: float
+    in_flight: list[str] = field(default_factory=list)
+
+
+class LoopLagMonitor:
+    def __init__(self, threshold_ms: float = 50.0, interval_ms: float = 10.0):
+        self.threshold_ms = threshold_ms
+        self.interval_ms = interval_ms
+        self.stalls: deque[LoopStall] = deque(maxlen=MAX_STALLS)
+        self.stall_count = 0
+        self.max_lag_ms = 0.0
+        self._in_flight: dict[int, str] = {}
+        self._started_since_tick: set[str] = set()
+        self._tokens = itertools.count()
+        self._task: t.Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._tick())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def __aenter__(self) -> "LoopLagMonitor":
+        self.start()
+        # Let the ticker take its first timestamp before the monitored code runs.
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        # One more tick so a stall at the very end of the block is still measured.
+        await asyncio.sleep(self.interval_ms / 1000)
+        await self.stop()
+
+    def request_started(self, name: str) -> int:
+        token = next(self._tokens)
+        self._in_flight[token] = name
+        self._started_since_tick.add(name)
+        return token
+
+    def request_finished(self, token: int) -> None:
+        self._in_flight.pop(token, None)
+
+    def assert_no_stalls(self) -> None:
+        if self.stalls:
+            worst = max(self.stalls, key=lambda stall: stall.lag_ms)
+            raise AssertionError(
+                f"Event loop blocked {self.stall_count} time(s) for more than {self.threshold_ms}ms; "
+                f"worst was {worst.lag_ms:.1f}ms while handling {worst.in_flight}"
+            )
+
+    async def _tick(self) -> None:
+        interval = self.interval_ms / 1000
+        while True:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            lag_ms = (time.perf_counter() - expected) * 1000
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            # A blocking handler may start and finish between two ticks, so blame both the
+            # requests still in flight and those that started since the previous tick.
+            suspects = self._started_since_tick | set(self._in_flight.values())
+            self._started_since_tick = set()
+            if lag_ms > self.threshold_ms:
+                in_flight = sorted(suspects)
+                self.stalls.append(LoopStall(lag_ms=lag_ms, in_flight=in_flight))
+                self.stall_count += 1
+                print(f"⚠️ Event loop blocked for {lag_ms:.1f}ms while handling {in_flight}")
@@ -4,6 +4,7 @@ from enum import Enum
 import json
 from pydantic import BaseModel
 from datetime import datetime
+import typing as t
 
 
 class DateTimeEncoder(json.JSONEncoder):
@@ -49,6 +50,7 @@ class AppMetadata(BaseModel):
     sandbox_user_tunnel_url: str
     title: str = ""
     is_featured: bool = False 
+    component_hash: str = ""  # Hash of the current component, which keys its gallery thumbnail.
     
     def model_dump(self, **kwargs):
         """Override model_dump to handle AppStatus enum serialization"""
@@ -73,3 +75,122 @@ class AppData(BaseModel):
         data = super().model_dump(**kwargs)
         data['message_history'] = [msg.model_dump() for msg in self.message_history]
         return data
+
+
+class JobStatus(Enum):
+    PENDING = "pending"      # The job is recorded but has not started running yet.
+    RUNNING = "running"      # The job is running.
+    SUCCEEDED = "succeeded"  # The job finished without failures.
+    FAILED = "failed"        # The job finished, but some or all of its work failed.
+    CANCELLED = "cancelled"  # The job was cancelled before it finished.
+
+    def __json__(self):
+        return self.value
+
+class TerminateAllJob(BaseModel):
+    """Progress of a bulk `terminate-all` run, persisted so any controller container can report it."""
+    id: str
+    status: JobStatus
+    created_at: datetime
+    updated_at: datetime
+    total: int = 0
+    terminated: int = 0
+    failed: int = 0
+    failed_ids: list[str] = []
+
+    def model_dump(self, **kwargs):
+        data = super().model_dump(**kwargs)
+        data['status'] = self.status.value
+        data['created_at'] = self.created_at.isoformat()
+        data['updated_at'] = self.updated_at.isoformat()
+        return data
+
+
+class CreateStage(Enum):
+    QUEUED = "queued"      # Waiting for a worker to pick the job up.
+    BUILDING = "building"  # Booting the sandbox and generating the first component, then pushing it.
+    SAVING = "saving"      # Saving the new app to the catalogue.
+    DONE = "done"          # Finished, whatever the outcome.
+
+    def __json__(self):
+        return self.value
+
+class CreateAppJob(BaseModel):
+    """Progress of one app creation, persisted so any controller container can report it."""
+    id: str
+    status: JobStatus
+    stage: CreateStage
+    created_at: datetime
+    updated_at: datetime
+    prompt: str
+    app_id: t.Optional[str] = None
+    sandbox_object_id: t.Optional[str] = None  # Set once the sandbox has booted, so it can be torn down.
+    error: t.Optional[str] = None
+
+    def model_dump(self, **kwargs):
+        data = super().model_dump(**kwargs)
+        data['status'] = self.status.value
+        data['stage'] = self.stage.value
+        data['created_at'] = self.created_at.isoformat()
+        data['updated_at'] = self.updated_at.isoformat()
+        return data
+
+
+class SeedComponent(BaseModel):
+    """A first component generated ahead of time for a seed prompt, cached until an app is built from it."""
+    prompt: str
+    component: str
+    explanation: str
+    model: str
+    created_at: datetime
+    app_id: t.Optional[str] = None  # Set once an app has been built from it, so re-runs skip it.
+
+    def model_dump(self, **kwargs):
+        data = super().model_dump(**kwargs)
+        data['created_at'] = self.created_at.isoformat()
+        return data
+
+
+class AppResources(BaseModel):
+    """Rolling resource usage of one sandbox, from the cleanup sweep scraping its `/metrics`."""
+    app_id: str
+    scraped_at: datetime
+    samples: int = 0
+    rss_bytes: int = 0  # Uvicorn, Vite and everything else in the sandbox, at the last scrape.
+    rss_bytes_avg: float = 0.0  # Exponentially weighted over scrapes.
+    rss_bytes_max: int = 0
+    cpu_seconds: float = 0.0  # Cumulative, at the last scrape.
+    cpu_cores_avg: float = 0.0  # CPU used between scrapes, exponentially weighted.
+    open_connections: int = 0
+    viewers: int = 0  # Pages connected to Vite.
+    requests: int = 0
+    compiles: int = 0
+    compile_ms_avg: float = 0.0
+    last_active_at: t.Optional[datetime] = None  # Last edit or page request.
+
+    def model_dump(self, **kwargs):
+        data = super().model_dump(**kwargs)
+        data['scraped_at'] = self.scraped_at.isoformat()
+        data['last_active_at'] = self.last_active_at.isoformat() if self.last_active_at else None
+        return data
+
+
+class AppUsage(BaseModel):
+    """How often and how recently an app was viewed and edited, counted by the controllers (see core/capacity.py)."""
+    app_id: str
+    views: int = 0  # Loads of /app/{id}.
+    edits: int = 0  # Successful /write calls.
+    first_seen_at: datetime
+    last_viewed_at: t.Optional[datetime] = None
+    last_edited_at: t.Optional[datetime] = None
+
+    @property
+    def last_used_at(self) -> datetime:
+        return max(filter(None, (self.first_seen_at, self.last_viewed_at, self.last_edited_at)))
+
+    def model_dump(self, **kwargs):
+        data = super().model_dump(**kwargs)
+        data['first_seen_at'] = self.first_seen_at.isoformat()
+        data['last_viewed_at'] = self.last_viewed_at.isoformat() if self.last_viewed_at else None
+        data['last_edited_at'] = self.last_edited_at.isoformat() if self.last_edited_at else None
+        return data
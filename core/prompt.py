@@ -1,11 +1,14 @@
 """Prompting texts used to build the sandbox app."""
 
-from core.llm import generate_response
-import anthropic
+import typing as t
+
+from core.llm import LLMGateway, generate_response
 from core.models import Message
 
-async def _generate_init_edit(client: anthropic.Anthropic, message: str) -> str:
-    prompt = f"""
+EXPLAIN_MAX_TOKENS = 64
+
+def init_edit_prompt(message: str) -> str:
+    return f"""
     You are given the following prompt and your job is to generate a React component that is a good example of the prompt.
     You should use Tailwind CSS for styling. Please make sure to export the component as default.
     This is incredibly important for my job, please be careful and don't make any mistakes.
@@ -25,13 +28,9 @@ async def _generate_init_edit(client: anthropic.Anthropic, message: str) -> str:
 
     DO NOT include any other text in your response. Only the React component. MAKE SURE TO NAME THE COMPONENT "LLMComponent". DO NOT WRAP THE CODE IN A CODE BLOCK.
     """
-    response = await generate_response(client, prompt)
-    return response
 
-async def _explain_init_edit(
-    message: str, html: str, client: anthropic.Anthropic
-) -> str:
-    prompt = f"""
+def explain_init_edit_prompt(message: str, html: str) -> str:
+    return f"""
     You were given the following prompt and you generated the following React component:
 
     Prompt: {message}
@@ -44,23 +43,48 @@ async def _explain_init_edit(
     Be as concise as possible, but always be friendly!
     """
 
-    explanation = await generate_response(
-        client,
-        prompt,
-        model="claude-haiku-4-5-20251001",
-        max_tokens=64,
-    )
+async def _generate_init_edit(client: LLMGateway, message: str) -> str:
+    response = await generate_response(client, init_edit_prompt(message))
+    return response
+
+async def _explain_init_edit(
+    message: str, html: str, client: LLMGateway
+) -> str:
+    explanation = await generate_response(client, explain_init_edit_prompt(message, html), task="explain", max_tokens=EXPLAIN_MAX_TOKENS)
     return explanation
 
-async def generate_and_explain_init_edit(client: anthropic.Anthropic, message: str) -> tuple[str, str]:
+async def generate_and_explain_init_edit(client: LLMGateway, message: str) -> tuple[str, str]:
     edit = await _generate_init_edit(client, message)
     explanation = await _explain_init_edit(message, edit, client)
     return edit, explanation
 
-async def _generate_followup_edit(client: anthropic.Anthropic, message: str, original_html: str, message_history: list[Message]) -> str:
-    message_history = '\n'.join([f"{msg.type}: {msg.content}" for msg in message_history])
+def _history_line(msg: Message) -> str:
+    return f"{msg.type}: {msg.content}"
 
-    prompt = f"""
+class RenderedHistory:
+    """An app's message history as the edit prompt shows it, rendered a message at a time.
+
+    Histories only ever grow at the end, so an app kept warm between edits (see core/sessions.py)
+    only renders the messages added since its previous edit.
+    """
+
+    def __init__(self):
+        self._lines: list[str] = []
+
+    def render(self, message_history: list[Message]) -> str:
+        if len(message_history) < len(self._lines):
+            self._lines = []
+        for msg in message_history[len(self._lines):]:
+            self._lines.append(_history_line(msg))
+        return '\n'.join(self._lines)
+
+def followup_edit_prompt(message: str, original_html: str, message_history: list[Message], rendered: t.Optional[RenderedHistory] = None) -> str:
+    if rendered is not None:
+        message_history = rendered.render(message_history)
+    else:
+        message_history = '\n'.join([_history_line(msg) for msg in message_history])
+
+    return f"""
     You should use Tailwind CSS for styling. Please make sure to export the component as default.
     This is incredibly important for my job, please be careful and don't make any mistakes.
     Make sure you import all necessary dependencies.
@@ -89,11 +113,21 @@ async def _generate_followup_edit(client: anthropic.Anthropic, message: str, ori
 
     DO NOT include any other text in your response. Only the React component. MAKE SURE TO NAME THE COMPONENT "LLMComponent". DO NOT WRAP THE CODE IN A CODE BLOCK.
     """
-    return await generate_response(client, prompt)
+
+async def _generate_followup_edit(
+    client: LLMGateway,
+    message: str,
+    original_html: str,
+    message_history: list[Message],
+    span_name: t.Optional[str] = None,
+    rendered: t.Optional[RenderedHistory] = None,
+) -> str:
+    prompt = followup_edit_prompt(message, original_html, message_history, rendered=rendered)
+    return await generate_response(client, prompt, task="edit", instruction=message, span_name=span_name)
 
 
-async def _explain_followup_edit(client: anthropic.Anthropic, message: str, original_html: str, new_html: str) -> str:
-    prompt = f"""
+def explain_followup_edit_prompt(message: str, original_html: str, new_html: str) -> str:
+    return f"""
     You generated the following React component edit to the prompt:
 
     Prompt: {message}
@@ -108,12 +142,9 @@ async def _explain_followup_edit(client: anthropic.Anthropic, message: str, orig
 
     Be as concise as possible, but always be friendly!
     """
-    
-    explanation = await generate_response(
-        client,
-        prompt,
-        model="claude-haiku-4-5-20251001",
-        max_tokens=64,
-    )
+
+async def _explain_followup_edit(client: LLMGateway, message: str, original_html: str, new_html: str) -> str:
+    prompt = explain_followup_edit_prompt(message, original_html, new_html)
+    explanation = await generate_response(client, prompt, task="explain", max_tokens=EXPLAIN_MAX_TOKENS)
     return explanation
     
\ No newline at end of file
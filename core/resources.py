@@ -0,0 +1,166 @@
+"""Per-app resource accounting, scraped from each sandbox's metrics (see sandbox/control.py).
+
+The cleanup sweep scrapes every live sandbox once a minute and folds the readings into rolling
+aggregates per app, stored under the app's own `app_resources_{id}` key in the Modal Dict, so a
+sweep only reads and writes the apps it scraped and replicas never overwrite each other's apps.
+`heaviest_idle` ranks apps nobody is using by memory, for eviction and hibernation policies to
+target.
+"""
+
+import asyncio
+import typing as t
+from datetime import datetime, timedelta
+
+import modal
+from pydantic import BaseModel
+
+from core.models import AppData, AppResources
+from core.tracing import tracer
+from core.transport import SandboxTransport
+
+RESOURCES_PREFIX = "app_resources_"
+# Per-app entries read at once by `load_per_app`.
+LOAD_CHUNK = 200
+# Weight of the newest scrape in the rolling averages.
+EWMA_ALPHA = 0.3
+
+M = t.TypeVar("M", bound=BaseModel)
+
+
+def parse_prometheus(text: str) -> list[tuple[str, dict[str, str], float]]:
+    """Parse `name{label="value",...} number` lines of the Prometheus text format."""
+    samples = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        series, _, value = line.rpartition(" ")
+        name, _, labels = series.partition("{")
+        parsed_labels = {}
+        for pair in labels.rstrip("}").split(","):
+            if "=" in pair:
+                key, _, label_value = pair.partition("=")
+                parsed_labels[key.strip()] = label_value.strip().strip('"')
+        try:
+            samples.append((name, parsed_labels, float(value)))
+        except ValueError:
+            continue
+    return samples
+
+
+def summarize(samples: t.Iterable[tuple[str, dict[str, str], float]]) -> dict[str, float]:
+    """Sum every series of a metric across its labels."""
+    totals: dict[str, float] = {}
+    for name, _, value in samples:
+        totals[name] = totals.get(name, 0.0) + value
+    return totals
+
+
+async def scrape(transport: SandboxTransport, data: AppData) -> t.Optional[dict[str, float]]:
+    text = await transport.metrics(data)
+    return summarize(parse_prometheus(text)) if text is not None else None
+
+
+def accumulate(
+    previous: t.Optional[AppResources],
+    app_id: str,
+    sample: dict[str, float],
+    now: datetime,
+    alpha: float = EWMA_ALPHA,
+) -> AppResources:
+    """Fold one scrape into an app's rolling aggregates."""
+    rss_bytes = int(sample.get("sandbox_resident_memory_bytes", 0))
+    cpu_seconds = sample.get("sandbox_cpu_seconds_total", 0.0)
+    compiles = int(sample.get("sandbox_vite_compiles_total", 0))
+    last_activity = sample.get("sandbox_last_activity_timestamp_seconds", 0)
+    resources = AppResources(
+        app_id=app_id,
+        scraped_at=now,
+        samples=1,
+        rss_bytes=rss_bytes,
+        rss_bytes_avg=rss_bytes,
+        rss_bytes_max=rss_bytes,
+        cpu_seconds=cpu_seconds,
+        open_connections=int(sample.get("sandbox_open_connections", 0)),
+        viewers=int(sample.get("sandbox_vite_clients", 0)),
+        requests=int(sample.get("sandbox_requests_total", 0) + sample.get("sandbox_vite_requests_total", 0)),
+        compiles=compiles,
+        compile_ms_avg=sample.get("sandbox_vite_compile_ms_sum", 0.0) / compiles if compiles else 0.0,
+        last_active_at=datetime.fromtimestamp(last_activity) if last_activity else None,
+    )
+    if previous is None:
+        return resources
+
+    resources.samples = previous.samples + 1
+    resources.rss_bytes_avg = alpha * rss_bytes + (1 - alpha) * previous.rss_bytes_avg
+    resources.rss_bytes_max = max(rss_bytes, previous.rss_bytes_max)
+    elapsed = (now - previous.scraped_at).total_seconds()
+    # CPU time goes backwards if the sandbox's processes restarted; skip that interval.
+    if elapsed > 0 and cpu_seconds >= previous.cpu_seconds:
+        cores = (cpu_seconds - previous.cpu_seconds) / elapsed
+        resources.cpu_cores_avg = cores if previous.samples == 1 else alpha * cores + (1 - alpha) * previous.cpu_cores_avg
+    else:
+        resources.cpu_cores_avg = previous.cpu_cores_avg
+    if resources.last_active_at is None or (previous.last_active_at and previous.last_active_at > resources.last_active_at):
+        resources.last_active_at = previous.last_active_at
+    return resources
+
+
+def heaviest_idle(
+    resources: t.Iterable[AppResources],
+    idle_for: timedelta,
+    now: t.Optional[datetime] = None,
+    limit: t.Optional[int] = None,
+) -> list[AppResources]:
+    """Apps with no open page and no activity for `idle_for`, by average memory, heaviest first."""
+    now = now or datetime.now()
+    idle = [
+        app for app in resources
+        if app.viewers == 0 and (app.last_active_at is None or now - app.last_active_at >= idle_for)
+    ]
+    idle.sort(key=lambda app: (app.rss_bytes_avg, app.cpu_cores_avg), reverse=True)
+    return idle[:limit] if limit is not None else idle
+
+
+async def load_per_app(apps_dict: modal.Dict, prefix: str, app_ids: t.Iterable[str], model: type[M]) -> dict[str, M]:
+    """The entries of `app_ids` stored under `{prefix}{app_id}`; apps without one are left out."""
+    app_ids = list(app_ids)
+    entries = {}
+    for start in range(0, len(app_ids), LOAD_CHUNK):
+        chunk = app_ids[start:start + LOAD_CHUNK]
+        with tracer.span(f"dict.get_{prefix.rstrip('_')}", count=len(chunk)):
+            stored = await asyncio.gather(*[apps_dict.get.aio(f"{prefix}{app_id}") for app_id in chunk], return_exceptions=True)
+        for app_id, entry in zip(chunk, stored):
+            if entry is None:
+                continue
+            try:
+                if isinstance(entry, Exception):
+                    raise entry
+                entries[app_id] = model.model_validate(entry)
+            except Exception as e:
+                print(f"Error loading {prefix}{app_id}: {e}")
+    return entries
+
+
+class ResourceStore:
+    def __init__(self, apps_dict: modal.Dict):
+        self.apps_dict = apps_dict
+
+    async def load(self, app_ids: t.Iterable[str]) -> dict[str, AppResources]:
+        """The stored aggregates of `app_ids`; apps never scraped are left out."""
+        return await load_per_app(self.apps_dict, RESOURCES_PREFIX, app_ids, AppResources)
+
+    async def record(self, samples: dict[str, dict[str, float]]) -> dict[str, AppResources]:
+        """Fold a sweep's scrapes into the stored aggregates of the apps scraped.
+
+        Removed apps' aggregates go with the rest of their data (see `AppDirectory.remove_apps`).
+        """
+        now = datetime.now()
+        with tracer.span("dict.record_resources", apps=len(samples)):
+            previous = await self.load(samples)
+            resources = {app_id: accumulate(previous.get(app_id), app_id, sample, now) for app_id, sample in samples.items()}
+            if resources:
+                await self.apps_dict.update.aio(
+                    {f"{RESOURCES_PREFIX}{app_id}": entry.model_dump() for app_id, entry in resources.items()}
+                )
+        return resources
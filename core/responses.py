@@ -0,0 +1,202 @@
+"""Compressed and cached response bodies for the controller.
+
+- `EncodedBody` is a response body together with its gzip and Brotli encodings, compressed the
+  first time a client asks for them and kept for as long as the body is cached: listing pages
+  (`SerializedPages`), rendered HTML pages (`RenderedPages`) and static assets (core/assets.py).
+- `CompressionMiddleware` compresses every other HTML, JSON, JS or CSS response on the fly.
+
+Brotli needs the `brotli` package, which the controller image installs. Without it responses are
+gzipped instead.
+"""
+
+import gzip
+import hashlib
+import typing as t
+from collections import Counter, OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from core.tracing import tracer
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+MIN_COMPRESS_SIZE = 512  # Bytes; smaller bodies aren't worth the CPU or the extra header.
+
+# Cached bodies are compressed once and served many times; on-the-fly compression has to be quick.
+GZIP_LEVEL = {"cached": 9, "dynamic": 5}
+BROTLI_QUALITY = {"cached": 9, "dynamic": 4}
+
+
+def is_compressible(media_type: t.Optional[str]) -> bool:
+    return bool(media_type) and media_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(data: bytes, encoding: str, effort: str = "dynamic") -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY[effort])
+    return gzip.compress(data, compresslevel=GZIP_LEVEL[effort], mtime=0)
+
+
+def accepted_encoding(accept_encoding: t.Optional[str]) -> t.Optional[str]:
+    """The best encoding this server supports out of an Accept-Encoding header, or None for identity."""
+    accepted = set()
+    for part in (accept_encoding or "").lower().split(","):
+        name, *params = part.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip())
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class EncodedBody:
+    def __init__(self, data: bytes, media_type: str):
+        self.data = data
+        self.media_type = media_type
+        self.etag = f'"{hashlib.sha1(data).hexdigest()[:20]}"'
+        self._encoded: dict[str, bytes] = {}
+
+    def encoded(self, encoding: t.Optional[str]) -> tuple[bytes, t.Optional[str]]:
+        """The body in `encoding` if that's worth it, and the encoding it actually is in."""
+        if encoding is None or len(self.data) < MIN_COMPRESS_SIZE or not is_compressible(self.media_type):
+            return self.data, None
+        if encoding not in self._encoded:
+            self._encoded[encoding] = compress(self.data, encoding, effort="cached")
+        return self._encoded[encoding], encoding
+
+
+def encoded_response(request, body: EncodedBody, headers: t.Optional[dict[str, str]] = None):
+    """Serve a cached body in the best encoding the client accepts, or a 304 if it already has it."""
+    from starlette.responses import Response
+
+    headers = {"ETag": body.etag, "Vary": "Accept-Encoding", **(headers or {})}
+    if request.headers.get("if-none-match") == body.etag:
+        return Response(status_code=304, headers=headers)
+    data, encoding = body.encoded(accepted_encoding(request.headers.get("accept-encoding")))
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    response_metrics.observe_body(len(body.data), len(data), encoding)
+    return Response(content=data, media_type=body.media_type, headers=headers)
+
+
+class RenderedPages:
+    """Rendered pages by key, each reused for as long as the version it was rendered at is current."""
+
+    def __init__(self, name: str, max_entries: int = 1024):
+        self.name = name
+        self.max_entries = max_entries
+        self._pages: OrderedDict[t.Hashable, tuple[t.Hashable, EncodedBody]] = OrderedDict()
+
+    def get(self, key: t.Hashable, version: t.Hashable) -> t.Optional[EncodedBody]:
+        cached = self._pages.get(key)
+        if cached is None or cached[0] != version:
+            response_metrics.page_cache[(self.name, "miss")] += 1
+            return None
+        self._pages.move_to_end(key)
+        response_metrics.page_cache[(self.name, "hit")] += 1
+        return cached[1]
+
+    def put(self, key: t.Hashable, version: t.Hashable, body: EncodedBody) -> None:
+        self._pages[key] = (version, body)
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
+
+
+class ResponseMetrics:
+    """Bytes sent per encoding against their uncompressed size, and hits of the rendered page caches."""
+
+    def __init__(self):
+        self.uncompressed_bytes = 0
+        self.sent_bytes: Counter[str] = Counter()
+        self.page_cache: Counter[tuple[str, str]] = Counter()
+
+    def observe_body(self, uncompressed: int, sent: int, encoding: t.Optional[str]) -> None:
+        self.uncompressed_bytes += uncompressed
+        self.sent_bytes[encoding or "identity"] += sent
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# HELP modal_vibe_response_uncompressed_bytes_total Size of compressible response bodies before encoding.",
+            "# TYPE modal_vibe_response_uncompressed_bytes_total counter",
+            f"modal_vibe_response_uncompressed_bytes_total {self.uncompressed_bytes}",
+            "# HELP modal_vibe_response_bytes_total Size of compressible response bodies as sent.",
+            "# TYPE modal_vibe_response_bytes_total counter",
+            *[f'modal_vibe_response_bytes_total{{encoding="{encoding}"}} {count}' for encoding, count in sorted(self.sent_bytes.items())],
+            "# HELP modal_vibe_page_cache_total Lookups of rendered pages.",
+            "# TYPE modal_vibe_page_cache_total counter",
+            *[f'modal_vibe_page_cache_total{{page="{page}",result="{result}"}} {count}' for (page, result), count in sorted(self.page_cache.items())],
+        ]
+        return "\n".join(lines) + "\n"
+
+
+response_metrics = ResponseMetrics()
+tracer.renderers.append(response_metrics)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing compressible responses that aren't encoded yet.
+
+    The body is buffered, so this is meant for the controller's pages and API responses, not streams.
+    """
+
+    def __init__(self, app, minimum_size: int = MIN_COMPRESS_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = dict(scope["headers"])
+        encoding = accepted_encoding(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        start: t.Optional[dict] = None
+        chunks: list[bytes] = []
+
+        async def send_compressed(message: dict) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = {name.lower(): value for name, value in message.get("headers", [])}
+                media_type = headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in headers or not is_compressible(media_type) or scope["method"] == "HEAD":
+                    await send(message)
+                    return
+                start = message
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            await self._send(send, start, b"".join(chunks), encoding)
+
+        await self.app(scope, receive, send_compressed)
+
+    async def _send(self, send, start: dict, body: bytes, encoding: t.Optional[str]) -> None:
+        headers = [(name, value) for name, value in start.get("headers", []) if name.lower() != b"content-length"]
+        vary = [i for i, (name, _) in enumerate(headers) if name.lower() == b"vary"]
+        if vary:
+            headers[vary[0]] = (b"vary", headers[vary[0]][1] + b", Accept-Encoding")
+        else:
+            headers.append((b"vary", b"Accept-Encoding"))
+        sent = body
+        if encoding is not None and len(body) >= self.minimum_size:
+            sent = compress(body, encoding)
+            headers.append((b"content-encoding", encoding.encode()))
+        headers.append((b"content-length", str(len(sent)).encode()))
+        response_metrics.observe_body(len(body), len(sent), encoding if sent is not body else None)
+        await send({**start, "headers": headers})
+        await send({"type": "http.response.body", "body": sent})
@@ -1,53 +1,95 @@
 import asyncio
+import time
+from core.catalogue import CatalogueIndex, CataloguePage, CatalogueStore, DEFAULT_LIMIT
 from core.models import AppData, AppMetadata, AppStatus, Message, MessageType
-from core.prompt import generate_and_explain_init_edit, _generate_followup_edit, _explain_followup_edit
-import httpx
+from core.llm import LLMGateway
+from core.search import SEARCH_DOC_PREFIX, SEARCH_INDEX_KEY, SearchHit, SearchIndex, document_text, document_tokens
+from core.capacity import USAGE_PREFIX
+from core.resources import RESOURCES_PREFIX, ResourceStore, scrape as scrape_resources
+from core.prompt import RenderedHistory, generate_and_explain_init_edit, _generate_followup_edit, _explain_followup_edit
+from core.transport import SandboxTransport, transport_for
+from core.write_behind import DEFAULT_MAX_PENDING, AppSnapshot, WriteBehindBuffer
 import modal
-import anthropic
+from core.startup import startup
+from core.thumbnails import component_hash
+from core.tracing import tracer
 from datetime import datetime
 import typing as t
 
 
+# Apps validated or indexed between yields to the event loop, so that hydrating a large catalogue in
+# the background doesn't hold up requests that don't need it.
+HYDRATE_CHUNK = 200
+# Next to each app's data, the `updated_at` of its last save, so that a container holding the app
+# in memory can tell whether it is still current without reading the data back (see core/sessions.py).
+APP_VERSION_PREFIX = "app_version_"
+# Compact the search index into its blob once a load had to read this many apps' documents one by one.
+SEARCH_COMPACT_AFTER = 200
+# Sandboxes the cleanup sweep checks and scrapes at once.
+CLEANUP_CONCURRENCY = 32
+
+
+def app_version(metadata: AppMetadata) -> str:
+    return metadata.updated_at.isoformat()
+
+
+async def _yield_every(i: int) -> None:
+    if i % HYDRATE_CHUNK == HYDRATE_CHUNK - 1:
+        await asyncio.sleep(0)
+
+
 class SandboxApp:
     id: str
     metadata: t.Optional[AppMetadata] = None
     data: t.Optional[AppData] = None
     _wait_for_sandbox_alive_task: t.Optional[asyncio.Task] = None
 
-    @property
-    def edit_url(self) -> str:
-        if self.data is None:
-            raise ValueError("Data is not set")
-        return f"{self.data.sandbox_tunnel_url}/edit"
-
     def __init__(
         self,
         app_id: str,
-        client: anthropic.Anthropic,
+        client: LLMGateway,
         metadata: AppMetadata,
         data: AppData,
+        transport: t.Optional[SandboxTransport] = None,
     ):
         self.id = app_id
         self.client = client
         self.metadata = metadata
         self.data = data
+        self.transport = transport or transport_for(data)
+        self.history = RenderedHistory()
 
     @staticmethod
     async def create(
         app: modal.App, 
-        client: anthropic.Anthropic,
+        client: LLMGateway,
         message: str,
         image: modal.Image,
+        start_sandbox: t.Optional[t.Callable[..., t.Awaitable[tuple[str, str, str]]]] = None,
+        init_edit: t.Optional[tuple[str, str]] = None,
+        transport: t.Optional[SandboxTransport] = None,
     ) -> "SandboxApp":
-        from sandbox.start_sandbox import run_sandbox_server_with_tunnel
+        """Boot a sandbox and generate the initial component concurrently, then push it.
+
+        `start_sandbox` returns `(tunnel_url, user_tunnel_url, sandbox_object_id)` and defaults to
+        `run_sandbox`; the local load-test harness passes fake sandboxes instead. `transport`
+        defaults to the one matching how the sandbox was started (see core/transport.py).
+        `init_edit` is an already generated `(component, explanation)`, e.g. from the seeding
+        pipeline in core/seed.py, in which case no LLM call is made.
+        """
+        if start_sandbox is None:
+            from sandbox.start_sandbox import run_sandbox as start_sandbox
 
         create_sandbox_task = asyncio.create_task(
-            run_sandbox_server_with_tunnel(app=app, image=image)
-        )
-        create_init_edit_task = asyncio.create_task(
-            generate_and_explain_init_edit(client, message)
+            start_sandbox(app=app, image=image)
         )
-        sandbox, init_edit = await asyncio.gather(create_sandbox_task, create_init_edit_task)
+        if init_edit is None:
+            create_init_edit_task = asyncio.create_task(
+                generate_and_explain_init_edit(client, message)
+            )
+            sandbox, init_edit = await asyncio.gather(create_sandbox_task, create_init_edit_task)
+        else:
+            sandbox = await create_sandbox_task
         sandbox_tunnel_url, sandbox_user_tunnel_url, sandbox_object_id = sandbox
         edit, explanation = init_edit
 
@@ -61,6 +103,7 @@ class SandboxApp:
                 status=AppStatus.CREATED,
                 sandbox_user_tunnel_url=sandbox_user_tunnel_url,
                 title=message,
+                component_hash=component_hash(edit),
             ),
             data=AppData(
                 id=sandbox_object_id,
@@ -73,24 +116,34 @@ class SandboxApp:
                 sandbox_user_tunnel_url=sandbox_user_tunnel_url,
                 sandbox_object_id=sandbox_object_id,
             ),
+            transport=transport,
         )
         await sandbox_app._wait_for_sandbox_alive()
-        async with httpx.AsyncClient() as web_client:
-
-            response = await web_client.post(
-                    sandbox_app.edit_url,
-                    json={"component": str(edit)},
-                    timeout=60.0,
-            )
-            print(f"Wrote initial edit to sandbox app: {response.status_code}")
-            response.raise_for_status()
+        result = await sandbox_app._push_component(edit)
+        print(f"Wrote initial edit to sandbox app: {result['status']}")
         return sandbox_app
+
+    async def _push_component(self, component: str) -> dict:
+        """Write the component to the sandbox and wait for Vite to compile it.
+
+        The result carries the compile outcome under "hmr" (see sandbox/control.py).
+        """
+        with tracer.span("sandbox.push_component", app_id=self.id, component_length=len(component), transport=self.transport.name) as span:
+            result = await self.transport.push_component(self.data, str(component))
+            hmr = result.get("hmr") or {}
+            span.set_attribute("hmr_outcome", hmr.get("outcome", "unknown"))
+            if hmr.get("outcome") == "error":
+                print(f"Component for app {self.id} failed to compile: {hmr.get('error')}")
+        return result
             
     
     async def edit(
         self,
         message: str,
-    ) -> httpx.Response:
+        component: t.Optional[str] = None,
+    ) -> dict:
+        """Apply an edit. `component` is the edited component if it was already generated
+        speculatively (see core/speculation.py)."""
         if self.metadata.status not in (AppStatus.READY, AppStatus.ACTIVE):
             raise ValueError("Sandbox is not ready or active")
         self.data.message_history.append(
@@ -98,65 +151,63 @@ class SandboxApp:
         )
         
         original_html = self.data.current_component
-        async with httpx.AsyncClient() as web_client:
-            self.metadata.updated_at = datetime.now()
-            edit = await _generate_followup_edit(self.client, message, self.data.current_component, self.data.message_history)
-            self.data.current_component = edit
-            response = await web_client.post(
-                self.edit_url,
-                json={"component": str(edit)},
-                timeout=60.0,
+        self.metadata.updated_at = datetime.now()
+        if component is None:
+            edit = await _generate_followup_edit(
+                self.client, message, self.data.current_component, self.data.message_history, rendered=self.history
             )
-            response.raise_for_status()
-            explanation = await _explain_followup_edit(self.client, message, original_html, edit)
-            self.data.message_history.append(
-                Message(content=explanation, type=MessageType.ASSISTANT)
-            )
-            print(f"Write response status: {response.status_code}")
+        else:
+            edit = component
+        self.data.current_component = edit
+        self.metadata.component_hash = component_hash(edit)
+        result = await self._push_component(edit)
+        explanation = await _explain_followup_edit(self.client, message, original_html, edit)
+        self.data.message_history.append(
+            Message(content=explanation, type=MessageType.ASSISTANT)
+        )
+        print(f"Write result status: {result['status']}")
 
         self.metadata.status = AppStatus.ACTIVE
-        return response
+        return result
 
 
     async def _wait_for_sandbox_alive(self, max_attempts: int = 30, delay: float = 1.0):
-        """Wait for the sandbox server to be ready by polling the heartbeat endpoint"""
-        async with httpx.AsyncClient() as client:
-            for attempt in range(max_attempts):
-                try:
-                    print(
-                        f"Health check attempt {attempt + 1}/{max_attempts} for {self.id}"
-                    )
-                    if await self.is_alive(client):
-                        print(f"✅ Sandbox server {self.id} is ready!")
-                        self.metadata.status = AppStatus.READY
-                        return
-                except Exception as e:
-                    print(f"Health check attempt {attempt + 1} failed: {str(e)}")
-                if attempt < max_attempts - 1:
-                    await asyncio.sleep(delay)
-            print(
-                f"❌ Sandbox server {self.id} failed to become ready after {max_attempts} attempts"
-            )
-            self.metadata.status = AppStatus.TERMINATED
+        """Wait for the sandbox to be ready by polling its heartbeat"""
+        with tracer.span("sandbox.heartbeat_wait", app_id=self.id) as span:
+            await self._poll_heartbeat(max_attempts, delay)
+            span.set_attribute("status", self.metadata.status.value)
+
+    async def _poll_heartbeat(self, max_attempts: int, delay: float):
+        for attempt in range(max_attempts):
+            try:
+                print(
+                    f"Health check attempt {attempt + 1}/{max_attempts} for {self.id}"
+                )
+                if await self.is_alive():
+                    print(f"✅ Sandbox server {self.id} is ready!")
+                    self.metadata.status = AppStatus.READY
+                    return
+            except Exception as e:
+                print(f"Health check attempt {attempt + 1} failed: {str(e)}")
+            if attempt < max_attempts - 1:
+                await asyncio.sleep(delay)
+        print(
+            f"❌ Sandbox server {self.id} failed to become ready after {max_attempts} attempts"
+        )
+        self.metadata.status = AppStatus.TERMINATED
 
-    async def is_alive(self, client: httpx.AsyncClient) -> bool:
-        """Check if the sandbox server is alive by making a heartbeat request"""
+    async def is_alive(self) -> bool:
+        """Check if the sandbox is alive through its transport's heartbeat"""
         if self.metadata.status == AppStatus.TERMINATED:
             return False
-        heartbeat_url = f"{self.data.sandbox_tunnel_url}/heartbeat"
-        try:
-            response = await client.get(heartbeat_url, timeout=10.0)
-            return response.status_code == 200
-        except Exception as e:
-            # TODO(joy): if it is not alive, instead of deleting it, we should allow sandboxes to be reactivated.
-            print(f"Health check failed for {self.id}: {str(e)}")
-            return False
+        # TODO(joy): if it is not alive, instead of deleting it, we should allow sandboxes to be reactivated.
+        return await self.transport.is_alive(self.data)
     
-    def terminate(self) -> bool:
+    async def terminate(self) -> bool:
         """Terminate the sandbox using its object_id"""
         try:
-            sandbox = modal.Sandbox.from_id(self.data.sandbox_object_id)
-            sandbox.terminate()
+            sandbox = await modal.Sandbox.from_id.aio(self.data.sandbox_object_id)
+            await sandbox.terminate.aio()
             self.metadata.status = AppStatus.TERMINATED
             print(f"✅ Successfully terminated sandbox {self.id} (object_id: {self.data.sandbox_object_id})")
             return True
@@ -164,96 +215,370 @@ class SandboxApp:
             print(f"❌ Failed to terminate sandbox {self.id}: {str(e)}")
             return False
 
+def _fingerprint(entry: dict) -> int:
+    try:
+        return hash(tuple(sorted(entry.items())))
+    except TypeError:
+        return hash(repr(sorted(entry.items())))  # An entry holding a list or dict.
+
+
 class AppDirectory:
-    """Manages the directory of created sandbox apps."""
-    apps: dict[str, AppMetadata] = {}
+    """Manages the directory of created sandbox apps.
+
+    All methods that touch the Modal Dict are async and use its `.aio` interface, so they never
+    block the event loop of the controller serving many concurrent requests.
+
+    `apps` is the compact in-memory catalogue, and `index` is kept in sync with it to serve paged
+    listings (see core/catalogue.py).
+    `search` is the full-text index over titles and user messages (see core/search.py). Each app's
+    document is saved with its data, and the compacted index is read at load.
+    With `start_write_behind`, saves are buffered and written in batches (see core/write_behind.py).
+    With `start_loading`, the catalogue is hydrated in the background and everything that lists or
+    saves apps waits for it; single apps are read straight from the dict in the meantime.
+    """
+    apps: CatalogueStore
 
-    def __init__(self, apps_dict: modal.Dict, app: modal.App, client: anthropic.Anthropic):
+    def __init__(self, apps_dict: modal.Dict, app: modal.App, client: LLMGateway, transport: t.Optional[SandboxTransport] = None):
         self.apps_dict = apps_dict
         self.app = app
         self.client = client
-        self.apps = {}
+        # Overrides the per-app choice in `transport_for`, e.g. with the local harness's fake.
+        self.transport = transport
+        self.apps = CatalogueStore()
+        self.index = CatalogueIndex()
+        # Fingerprints of catalogue entries as last seen, so refreshes only re-validate and re-index changed apps.
+        self._fingerprints: dict[str, int] = {}
+        self._loaded_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+        self.search = SearchIndex()
+        # `search.changes` when the index last matched the compacted blob in the dict, if it has.
+        self._search_compacted: t.Optional[int] = None
+        self.write_behind: t.Optional[WriteBehindBuffer] = None
+        self._loading: t.Optional[asyncio.Task] = None
+
+
+    def start_loading(self) -> None:
+        """Start hydrating the catalogue without waiting for it, so the controller can serve right away."""
+        if self._loading is None:
+            self._loading = asyncio.create_task(self._hydrate())
 
+    async def _hydrate(self) -> None:
+        with startup.phase("hydrate_catalogue") as span:
+            await self.load()
+            span.set_attribute("apps", len(self.apps))
 
-    def load(self) -> None:
+    async def ready(self) -> None:
+        """Wait for a hydration started with `start_loading` to finish."""
+        if self._loading is not None and not self._loading.done():
+            await asyncio.shield(self._loading)
+
+    async def load(self) -> None:
         try:
-            catalogue_data = self.apps_dict.get("catalogue", {})
-            self.apps = {app_id: AppMetadata.model_validate(app_data) 
-                        for app_id, app_data in catalogue_data.items()}
+            with tracer.span("dict.load_catalogue"):
+                catalogue_data = await self.apps_dict.get.aio("catalogue", {})
+            apps = []
+            for i, app_data in enumerate(catalogue_data.values()):
+                apps.append(AppMetadata.model_validate(app_data))
+                await _yield_every(i)
+            self.apps.rebuild(apps)
+            self._fingerprints = {app_id: _fingerprint(app_data) for app_id, app_data in catalogue_data.items()}
             print(f"[AppDirectory.load] Loaded {len(self.apps)} apps from Modal Dict")
         except Exception as e:
             print(f"Error loading apps from dict: {e}")
-            self.apps = {}
+            apps = []
+            self.apps.rebuild(apps)
+            self._fingerprints = {}
+        await asyncio.sleep(0)
+        self.index.rebuild({metadata.id: metadata for metadata in apps})
+        await asyncio.sleep(0)
+        await self._load_search_index()
+        self._loaded_at = time.monotonic()
+
+    async def _load_search_index(self) -> None:
+        try:
+            with tracer.span("dict.load_search_index"):
+                blob = await self.apps_dict.get.aio(SEARCH_INDEX_KEY)
+            if blob:
+                self.search.sync_from_blob(blob)
+                self._search_compacted = self.search.changes
+        except Exception as e:
+            print(f"Error loading search index from dict: {e}")
+        for app_id in [app_id for app_id in self.search.app_ids() if app_id not in self.apps]:
+            self.search.remove(app_id)
+        # Apps saved since the index was last compacted. Documents without a version are taken as current.
+        stale = [
+            app_id
+            for app_id in self.apps
+            if app_id not in self.search or self.search.version(app_id) not in (None, app_version(self.apps[app_id]))
+        ]
+        await self._reindex(stale)
+        if len(stale) >= SEARCH_COMPACT_AFTER:
+            await self.compact_search_index()
+
+    async def _reindex(self, app_ids: list[str]) -> None:
+        """Read the persisted documents of `app_ids` into the search index."""
+        for start in range(0, len(app_ids), HYDRATE_CHUNK):
+            chunk = app_ids[start:start + HYDRATE_CHUNK]
+            with tracer.span("dict.get_search_docs", count=len(chunk)):
+                docs = await asyncio.gather(
+                    *[self.apps_dict.get.aio(f"{SEARCH_DOC_PREFIX}{app_id}") for app_id in chunk], return_exceptions=True
+                )
+            for app_id, joined in zip(chunk, docs):
+                metadata = self.apps.get(app_id)
+                if metadata is None:
+                    continue  # Removed meanwhile.
+                if isinstance(joined, str):
+                    self.search.upsert_tokens(app_id, joined, app_version(metadata))
+                elif app_id not in self.search:
+                    # Apps saved before they had documents are at least searchable by title.
+                    self.search.upsert(app_id, document_text(metadata, None), app_version(metadata))
+
+    async def compact_search_index(self) -> None:
+        """Write the whole search index as one blob, so loads don't have to read every app's document."""
+        changes = self.search.changes
+        with tracer.span("dict.save_search_index", apps=len(self.search)):
+            await self.apps_dict.put.aio(SEARCH_INDEX_KEY, self.search.dumps())
+        self._search_compacted = changes
+
+    @property
+    def search_index_changed(self) -> bool:
+        """Whether the search index changed since it was loaded from, or last written to, its blob."""
+        return self.search.changes != self._search_compacted
+
+    async def refresh(self, max_age: float = 2.0) -> None:
+        """Pick up changes made by other containers if the catalogue is older than `max_age` seconds.
+
+        Only apps whose catalogue entry changed are re-validated and re-indexed.
+        """
+        await self.ready()
+        if time.monotonic() - self._loaded_at < max_age:
+            return
+        async with self._refresh_lock:
+            if time.monotonic() - self._loaded_at < max_age:
+                return
+            try:
+                with tracer.span("dict.load_catalogue"):
+                    catalogue_data = await self.apps_dict.get.aio("catalogue", {})
+            except Exception as e:
+                print(f"Error refreshing apps from dict: {e}")
+                return
+            changed = []
+            # Saves still buffered here are newer than what the dict has.
+            pending = self.write_behind.pending if self.write_behind else {}
+            for app_id in [app_id for app_id in self.apps if app_id not in catalogue_data and app_id not in pending]:
+                self._forget(app_id)
+            for app_id, app_data in catalogue_data.items():
+                fingerprint = _fingerprint(app_data)
+                if self._fingerprints.get(app_id) == fingerprint or app_id in pending:
+                    continue
+                try:
+                    metadata = AppMetadata.model_validate(app_data)
+                except Exception as e:
+                    print(f"Error loading metadata for app {app_id}: {e}")
+                    continue
+                self.apps[app_id] = metadata
+                self._fingerprints[app_id] = fingerprint
+                self.index.upsert(metadata)
+                changed.append(app_id)
+            await self._reindex(changed)
+            self._loaded_at = time.monotonic()
+
+    def list_apps(
+        self,
+        sort: str = "updated_at",
+        featured: t.Optional[bool] = None,
+        status: t.Optional[AppStatus] = None,
+        cursor: t.Optional[str] = None,
+        limit: int = DEFAULT_LIMIT,
+    ) -> CataloguePage:
+        return self.index.query(sort=sort, featured=featured, status=status, cursor=cursor, limit=limit)
+
+    def search_apps(self, query: str, limit: int = DEFAULT_LIMIT) -> list[SearchHit]:
+        with tracer.span("search.query", terms=len(query.split())) as span:
+            hits = self.search.search(query, limit=limit, allowed=self.apps)
+            span.set_attribute("hits", len(hits))
+        return hits
+
+    def _forget(self, app_id: str) -> None:
+        self.apps.pop(app_id, None)
+        self._fingerprints.pop(app_id, None)
+        self.index.remove(app_id)
+        self.search.remove(app_id)
     
-    async def cleanup(self, client: httpx.AsyncClient) -> None:
-        """Cleanup dead apps from the dict"""
+    async def cleanup(self, resources: t.Optional[ResourceStore] = None, concurrency: int = CLEANUP_CONCURRENCY) -> None:
+        """Cleanup dead apps from the dict, and scrape the resource usage of live ones into `resources`
+
+        Up to `concurrency` sandboxes are checked at once.
+        """
         print("Cleaning up dead apps")
-        self.load()
-        apps = self.apps.copy()
-        for app_id, metadata in apps.items():
-            print(f"Checking app {app_id}, last updated at {metadata.updated_at}, status {metadata.status}")
-            app = self.get_app(app_id)
-            if not app:
-                print(f"App {app_id} not found in directory")
-                self.remove_app(app_id)
-                continue
-            if not await app.is_alive(client):
-                print(f"App {app_id} is not alive")
-                self.remove_app(app_id)
-                continue
-            if app.metadata.status == AppStatus.TERMINATED:
-                print(f"App {app_id} is terminated")
-                print(f"Removing terminated app {app_id}")
-                self.remove_app(app_id)
-
-    def set_app(self, app: SandboxApp) -> None:
+        await self.load()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def check(app_id: str) -> tuple[bool, t.Optional[dict[str, float]]]:
+            """Whether the app is dead, and the resource usage of its sandbox if it's alive."""
+            async with semaphore:
+                metadata = self.apps.get(app_id)
+                if metadata is None:
+                    return False, None  # Removed while checking other apps.
+                print(f"Checking app {app_id}, last updated at {metadata.updated_at}, status {metadata.status}")
+                app = await self.get_app(app_id)
+                if not app:
+                    print(f"App {app_id} not found in directory")
+                    return True, None
+                if not await app.is_alive():
+                    print(f"App {app_id} is not alive")
+                    return True, None
+                if app.metadata.status == AppStatus.TERMINATED:
+                    print(f"App {app_id} is terminated")
+                    return True, None
+                if resources is None:
+                    return False, None
+                return False, await scrape_resources(app.transport, app.data)
+
+        app_ids = list(self.apps)
+        checks = await asyncio.gather(*[check(app_id) for app_id in app_ids])
+        dead = [app_id for app_id, (is_dead, _) in zip(app_ids, checks) if is_dead]
+        if dead:
+            print(f"Removing {len(dead)} dead apps")
+            await self.remove_apps(dead)
+        if resources is not None:
+            samples = {
+                app_id: sample for app_id, (_, sample) in zip(app_ids, checks) if sample is not None and app_id in self.apps
+            }
+            await resources.record(samples)
+        if self.search_index_changed:
+            await self.compact_search_index()
+
+    def start_write_behind(self, flush_interval: float, max_pending: int = DEFAULT_MAX_PENDING) -> None:
+        """Buffer saves from now on and write them in batches. Needs a running event loop."""
+        if self.write_behind is None:
+            self.write_behind = WriteBehindBuffer(self._write_snapshots, flush_interval=flush_interval, max_pending=max_pending)
+            self.write_behind.start()
+
+    async def stop_write_behind(self) -> None:
+        """Write any buffered saves; later saves are written through again."""
+        if self.write_behind is not None:
+            write_behind, self.write_behind = self.write_behind, None
+            await write_behind.stop()
+
+    def _snapshot(self, app: SandboxApp) -> AppSnapshot:
+        """Apply a save to the in-memory state and return what has to be written for it."""
+        self.apps[app.id] = app.metadata
+        self.index.upsert(app.metadata)
+        metadata = app.metadata.model_dump()
+        self._fingerprints[app.id] = _fingerprint(metadata)
+        text = document_text(app.metadata, app.data)
+        changed = self.search.upsert(app.id, text, app_version(app.metadata))
+        return AppSnapshot(app.id, metadata, app.data.model_dump(), text if changed else None)
+
+    async def _write_snapshots(self, snapshots: list[AppSnapshot]) -> int:
+        """Write saves to the dict and return the number of apps in the catalogue."""
+        with tracer.span("dict.set_apps", count=len(snapshots)):
+            # App data goes first: a crash before the catalogue write leaves data nothing points
+            # to yet, rather than catalogue entries whose data is missing.
+            writes = {}
+            for snapshot in snapshots:
+                writes[f"app_{snapshot.app_id}"] = snapshot.data
+                writes[f"{APP_VERSION_PREFIX}{snapshot.app_id}"] = snapshot.metadata["updated_at"]
+                if snapshot.search_text is not None:
+                    writes[f"{SEARCH_DOC_PREFIX}{snapshot.app_id}"] = document_tokens(snapshot.search_text)
+            await self.apps_dict.update.aio(writes)
+            catalogue_data = await self.apps_dict.get.aio("catalogue", {})
+            for snapshot in snapshots:
+                catalogue_data[snapshot.app_id] = snapshot.metadata
+            await self.apps_dict.put.aio("catalogue", catalogue_data)
+        return len(catalogue_data)
+
+    async def set_app(self, app: SandboxApp) -> None:
         """Save or update an app in the directory"""
+        await self.ready()
         try:
-            self.apps[app.id] = app.metadata
-            
-            catalogue_data = self.apps_dict.get("catalogue", {})
-            
-            catalogue_data[app.id] = app.metadata.model_dump()
-            
-            self.apps_dict["catalogue"] = catalogue_data
-            
-            app_data_dict = app.data.model_dump()
-            self.apps_dict[f"app_{app.id}"] = app_data_dict
-                
+            snapshot = self._snapshot(app)
+            if self.write_behind is not None:
+                self.write_behind.add(snapshot)
+                return
+            total = await self._write_snapshots([snapshot])
             print(f"[AppDirectory.set_app] Saved app {app.id} to Modal Dict with {len(app.data.message_history)} messages and component of length {len(app.data.current_component)}")
-            print(f"[AppDirectory.set_app] Total apps in catalogue: {len(catalogue_data)}")
+            print(f"[AppDirectory.set_app] Total apps in catalogue: {total}")
         except Exception as e:
             print(f"Error saving app {app.id} to dict: {e}")
     
-    def remove_app(self, app_id: str) -> None:
-        del self.apps[app_id]
-        
-        catalogue_data = {}
-        for remaining_app_id, metadata in self.apps.items():
-            catalogue_data[remaining_app_id] = metadata.model_dump()
-        
-        if f"app_{app_id}" in self.apps_dict:
-            self.apps_dict.pop(f"app_{app_id}")
-        self.apps_dict.put("catalogue", catalogue_data)
-        
-        if f"app_{app_id}" in self.apps_dict:
-            del self.apps_dict[f"app_{app_id}"]
-    
-    def get_app(self, app_id: str) -> t.Optional[SandboxApp]:
+    async def set_apps(self, apps: t.Iterable[SandboxApp]) -> None:
+        """Save many new or updated apps at once, rewriting the catalogue and search index a single time."""
+        await self.ready()
+        snapshots = [self._snapshot(app) for app in apps]
+        if not snapshots:
+            return
+        if self.write_behind is not None:
+            for snapshot in snapshots:
+                self.write_behind.add(snapshot)
+            return
+        total = await self._write_snapshots(snapshots)
+        print(f"[AppDirectory.set_apps] Saved {len(snapshots)} apps, total apps in catalogue: {total}")
+
+    async def remove_app(self, app_id: str) -> None:
+        await self.remove_apps([app_id])
+
+    async def remove_apps(self, app_ids: t.Iterable[str]) -> None:
+        """Remove many apps at once, rewriting the catalogue a single time.
+
+        The catalogue is updated read-modify-write, so other containers' saves, and this one's
+        still buffered, stay as they are, and its entries go before the data they point to.
+        """
+        await self.ready()
+        app_ids = set(app_ids)
+        if self.write_behind is not None:
+            await self.write_behind.discard(app_ids)
+        for app_id in app_ids:
+            self._forget(app_id)
+
+        catalogue_data = await self.apps_dict.get.aio("catalogue", {})
+        for app_id in app_ids:
+            catalogue_data.pop(app_id, None)
+        await self.apps_dict.put.aio("catalogue", catalogue_data)
+
+        await asyncio.gather(*[self._pop_app_data(app_id) for app_id in app_ids])
+
+    async def _pop_app_data(self, app_id: str) -> None:
+        keys = (
+            f"app_{app_id}", f"{APP_VERSION_PREFIX}{app_id}", f"{SEARCH_DOC_PREFIX}{app_id}",
+            f"{RESOURCES_PREFIX}{app_id}", f"{USAGE_PREFIX}{app_id}",
+        )
+        for key in keys:
+            if await self.apps_dict.contains.aio(key):
+                await self.apps_dict.pop.aio(key)
+
+    async def saved_version(self, app_id: str) -> t.Optional[str]:
+        """The `app_version` of the app's last save, or None if it isn't saved (or was saved before versions were)."""
+        pending = self.write_behind.get(app_id) if self.write_behind else None
+        if pending is not None:
+            return pending.metadata["updated_at"]
+        with tracer.span("dict.get_app_version", app_id=app_id):
+            return await self.apps_dict.get.aio(f"{APP_VERSION_PREFIX}{app_id}")
+
+    async def get_app(self, app_id: str) -> t.Optional[SandboxApp]:
         """Get an app from the directory"""
         if app_id not in self.apps:
-            catalogue_data = self.apps_dict.get("catalogue", {})
+            catalogue_data = await self.apps_dict.get.aio("catalogue", {})
             if app_id not in catalogue_data:
                 return None
             try:
-                self.apps[app_id] = AppMetadata.model_validate(catalogue_data[app_id])
+                metadata = AppMetadata.model_validate(catalogue_data[app_id])
+                self.apps[app_id] = metadata
+                self._fingerprints[app_id] = _fingerprint(catalogue_data[app_id])
+                self.index.upsert(metadata)
             except Exception as e:
                 print(f"Error loading metadata for app {app_id}: {e}")
                 return None
         
         app_metadata = self.apps[app_id]
         
-        app_data_dict = self.apps_dict.get(f"app_{app_id}")
+        pending = self.write_behind.get(app_id) if self.write_behind else None
+        if pending is not None:
+            app_data_dict = pending.data
+        else:
+            with tracer.span("dict.get_app", app_id=app_id):
+                app_data_dict = await self.apps_dict.get.aio(f"app_{app_id}")
         if app_data_dict is None:
             print(f"Inconsistent state: App data for {app_id} does not exist but app {app_id} is in the catalogue")
             return None
@@ -271,4 +596,4 @@ class AppDirectory:
             sandbox_object_id=app_data_dict["sandbox_object_id"],
         )
         
-        return SandboxApp(app_id, self.client, app_metadata, app_data)
+        return SandboxApp(app_id, self.client, app_metadata, app_data, transport=self.transport)
@@ -0,0 +1,175 @@
+"""Full-text search over app titles and edit instructions.
+
+`SearchIndex` is an in-memory inverted index ranked with BM25. Each app is one document made of
+its title (the original prompt) and every user message in its history.
+
+`AppDirectory` persists each app's document under its own `search_doc_{id}` key, written with the
+app's data, so saving an edit costs the same however many apps there are. Loading thousands of
+those keys one by one would make startup slow, so the whole index is also compacted now and then
+into one compressed blob under `SEARCH_INDEX_KEY`, which records the app version each document
+was indexed at. A controller loads the blob and then reads `search_doc_{id}` only for apps saved
+since; refreshes read it only for apps whose catalogue entry changed.
+
+Documents are persisted as their tokens; postings and document frequencies are rebuilt from them
+on load, which keeps them a few bytes per word.
+"""
+
+import heapq
+import json
+import math
+import re
+import typing as t
+import zlib
+from collections import Counter
+
+from core.models import AppData, AppMetadata, MessageType
+
+SEARCH_INDEX_KEY = "search_index"
+SEARCH_DOC_PREFIX = "search_doc_"
+SEARCH_INDEX_VERSION = 2
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in into is it its make of on or so that the their "
+    "them then there these this to was were will with you your".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def document_tokens(text: str) -> str:
+    """A document as it is indexed and persisted: its tokens joined by spaces."""
+    return " ".join(tokenize(text))
+
+
+def document_text(metadata: AppMetadata, data: t.Optional[AppData]) -> str:
+    """The searchable text of an app: its title and the instructions the user typed."""
+    parts = [metadata.title]
+    if data is not None:
+        parts.extend(message.content for message in data.message_history if message.type == MessageType.USER)
+    return "\n".join(part for part in parts if part)
+
+
+class SearchHit(t.NamedTuple):
+    app_id: str
+    score: float
+
+
+class SearchIndex:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._docs: dict[str, str] = {}  # app id -> its tokens joined by spaces, as persisted
+        self._versions: dict[str, t.Optional[str]] = {}  # app id -> the app version its document is from
+        self._lengths: dict[str, int] = {}
+        self._postings: dict[str, dict[str, int]] = {}
+        self._total_length = 0
+        # Bumped by every change to a document or its version, so callers can tell whether the
+        # index still matches what they last persisted.
+        self.changes = 0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, app_id: str) -> bool:
+        return app_id in self._docs
+
+    def app_ids(self) -> list[str]:
+        return list(self._docs)
+
+    def tokens(self, app_id: str) -> t.Optional[str]:
+        return self._docs.get(app_id)
+
+    def version(self, app_id: str) -> t.Optional[str]:
+        return self._versions.get(app_id)
+
+    def upsert(self, app_id: str, text: str, version: t.Optional[str] = None) -> bool:
+        """Index `text` as the document for `app_id` as of app `version`. Returns False if it was already indexed as is."""
+        return self.upsert_tokens(app_id, document_tokens(text), version)
+
+    def upsert_tokens(self, app_id: str, joined: str, version: t.Optional[str] = None) -> bool:
+        if app_id not in self._versions or self._versions[app_id] != version:
+            self._versions[app_id] = version
+            self.changes += 1
+        if self._docs.get(app_id) == joined:
+            return False
+        self._remove_postings(app_id)
+        self._add(app_id, joined)
+        self.changes += 1
+        return True
+
+    def remove(self, app_id: str) -> bool:
+        self._versions.pop(app_id, None)
+        removed = self._remove_postings(app_id)
+        self.changes += removed
+        return removed
+
+    def _remove_postings(self, app_id: str) -> bool:
+        joined = self._docs.pop(app_id, None)
+        if joined is None:
+            return False
+        self._total_length -= self._lengths.pop(app_id)
+        for term in set(joined.split()):
+            postings = self._postings[term]
+            del postings[app_id]
+            if not postings:
+                del self._postings[term]
+        return True
+
+    def _add(self, app_id: str, joined: str) -> None:
+        tokens = joined.split()
+        self._docs[app_id] = joined
+        self._lengths[app_id] = len(tokens)
+        self._total_length += len(tokens)
+        for term, count in Counter(tokens).items():
+            self._postings.setdefault(term, {})[app_id] = count
+
+    def search(self, query: str, limit: int = 24, allowed: t.Optional[t.Container[str]] = None) -> list[SearchHit]:
+        """Rank documents containing any query term by BM25, optionally only those in `allowed`."""
+        terms = set(tokenize(query))
+        if not terms or not self._docs:
+            return []
+        num_docs = len(self._docs)
+        avg_length = self._total_length / num_docs or 1.0
+        scores: dict[str, float] = {}
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for app_id, tf in postings.items():
+                if allowed is not None and app_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[app_id] / avg_length)
+                scores[app_id] = scores.get(app_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return [SearchHit(app_id, score) for app_id, score in best]
+
+    def dumps(self) -> bytes:
+        """The compacted index: every document and the app version it is from."""
+        payload = {"version": SEARCH_INDEX_VERSION, "docs": self._docs, "versions": self._versions}
+        return zlib.compress(json.dumps(payload, separators=(",", ":")).encode(), 1)
+
+    @classmethod
+    def loads(cls, blob: bytes) -> "SearchIndex":
+        index = cls()
+        index.sync_from_blob(blob)
+        return index
+
+    def sync_from_blob(self, blob: bytes) -> int:
+        payload = json.loads(zlib.decompress(blob))
+        if payload.get("version") != SEARCH_INDEX_VERSION:
+            raise ValueError(f"Unsupported search index version {payload.get('version')!r}")
+        return self.sync(payload["docs"], payload["versions"])
+
+    def sync(self, docs: t.Mapping[str, str], versions: t.Mapping[str, t.Optional[str]]) -> int:
+        """Make this index match persisted `docs` and their `versions`, touching only documents that differ. Returns how many did."""
+        changed = 0
+        for app_id in [app_id for app_id in self._docs if app_id not in docs]:
+            self.remove(app_id)
+            changed += 1
+        for app_id, joined in docs.items():
+            changed += self.upsert_tokens(app_id, joined, versions.get(app_id))
+        return changed
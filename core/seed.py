@@ -0,0 +1,257 @@
+"""Offline seeding of the gallery from core/prompts.txt.
+
+Seeding by firing hundreds of concurrent `/api/create` calls makes one interactive LLM request per
+prompt and quickly runs into rate limits. Instead, seeding runs in two steps:
+
+1. `pregenerate` submits the first components, and then their explanations, as Message Batches.
+   Batches have their own, much larger, rate limits and cost half as much. Results are cached in
+   the Modal Dict keyed by prompt, so a re-run only submits prompts that have no component yet.
+2. `materialize` builds an app from each cached component. It makes no LLM calls, so seeding is
+   bounded by how many sandboxes can boot at once (`concurrency`), not by LLM rate limits.
+"""
+
+import asyncio
+import hashlib
+import os
+import typing as t
+from datetime import datetime
+
+import modal
+
+from core.llm import LLMGateway
+from core.models import SeedComponent
+from core.prompt import EXPLAIN_MAX_TOKENS, explain_init_edit_prompt, init_edit_prompt
+from core.sandbox import AppDirectory, SandboxApp
+from core.terminate import terminate_sandbox
+from core.tracing import tracer
+
+PROMPTS_PATH = os.path.join(os.path.dirname(__file__), "prompts.txt")
+
+# The API takes up to 100k requests or 256 MB per batch; smaller batches finish sooner.
+MAX_BATCH_SIZE = 5000
+GENERATE_MAX_TOKENS = 8192
+TEMPERATURE = 0.5
+# Used when a component was generated but its explanation failed, rather than throwing it away.
+DEFAULT_EXPLANATION = "Here's your app! Let me know if you want any changes."
+
+
+def load_prompts(limit: t.Optional[int] = None, path: str = PROMPTS_PATH) -> list[str]:
+    with open(path, "r") as f:
+        prompts = list(dict.fromkeys(p.strip() for p in f if p.strip()))
+    return prompts[:limit] if limit is not None else prompts
+
+
+def seed_id(prompt: str) -> str:
+    # Also the batch request's custom_id, which must match ^[a-zA-Z0-9_-]{1,64}$.
+    return hashlib.sha256(prompt.encode()).hexdigest()[:32]
+
+
+class ComponentCache:
+    """Pre-generated components in the Modal Dict, keyed by prompt."""
+
+    def __init__(self, apps_dict: modal.Dict, max_concurrency: int = 32):
+        self.apps_dict = apps_dict
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def _key(self, prompt: str) -> str:
+        return f"seed_component_{seed_id(prompt)}"
+
+    async def get(self, prompt: str) -> t.Optional[SeedComponent]:
+        async with self._semaphore:
+            data = await self.apps_dict.get.aio(self._key(prompt))
+        return SeedComponent.model_validate(data) if data is not None else None
+
+    async def get_many(self, prompts: t.Iterable[str]) -> dict[str, SeedComponent]:
+        prompts = list(prompts)
+        seeds = await asyncio.gather(*[self.get(prompt) for prompt in prompts])
+        return {prompt: seed for prompt, seed in zip(prompts, seeds) if seed is not None}
+
+    async def put_many(self, seeds: t.Iterable[SeedComponent], chunk_size: int = 100) -> None:
+        seeds = list(seeds)
+        for i in range(0, len(seeds), chunk_size):
+            chunk = seeds[i:i + chunk_size]
+            await self.apps_dict.update.aio({self._key(seed.prompt): seed.model_dump() for seed in chunk})
+
+
+async def run_batch(
+    provider,
+    model: str,
+    prompts: dict[str, str],
+    max_tokens: int,
+    poll_interval: float = 30.0,
+) -> dict[str, str]:
+    """Run `custom_id -> prompt` as Message Batches and return the text of each request that succeeded."""
+    texts: dict[str, str] = {}
+    items = list(prompts.items())
+    chunks = [dict(items[i:i + MAX_BATCH_SIZE]) for i in range(0, len(items), MAX_BATCH_SIZE)]
+    for result in await asyncio.gather(*[_run_one_batch(provider, model, chunk, max_tokens, poll_interval) for chunk in chunks]):
+        texts.update(result)
+    return texts
+
+
+async def _run_one_batch(provider, model: str, prompts: dict[str, str], max_tokens: int, poll_interval: float) -> dict[str, str]:
+    with tracer.span("llm.batch", model=model, requests=len(prompts)) as span:
+        batch = await provider.messages.batches.create(requests=[
+            {
+                "custom_id": custom_id,
+                "params": {
+                    "model": model,
+                    "max_tokens": max_tokens,
+                    "temperature": TEMPERATURE,
+                    "messages": [{"role": "user", "content": prompt}],
+                },
+            }
+            for custom_id, prompt in prompts.items()
+        ])
+        span.set_attribute("batch_id", batch.id)
+        print(f"[seed] Submitted batch {batch.id} of {len(prompts)} requests to {model}")
+        while batch.processing_status != "ended":
+            await asyncio.sleep(poll_interval)
+            batch = await provider.messages.batches.retrieve(batch.id)
+
+        texts: dict[str, str] = {}
+        failures = 0
+        async for entry in await provider.messages.batches.results(batch.id):
+            if entry.result.type == "succeeded":
+                texts[entry.custom_id] = entry.result.message.content[0].text
+            else:
+                failures += 1
+        span.set_attribute("succeeded", len(texts))
+        span.set_attribute("failed", failures)
+        print(f"[seed] Batch {batch.id} finished: {len(texts)} succeeded, {failures} failed")
+    return texts
+
+
+async def pregenerate(
+    client: LLMGateway,
+    cache: ComponentCache,
+    prompts: list[str],
+    poll_interval: float = 30.0,
+) -> dict:
+    """Generate and cache the first component and explanation for every prompt not cached yet.
+
+    Uses the first model of the gateway's "generate" and "explain" routes. Prompts whose component
+    could not be generated stay uncached and are resubmitted by the next run.
+    """
+    cached = await cache.get_many(prompts)
+    missing = {seed_id(prompt): prompt for prompt in prompts if prompt not in cached}
+    print(f"[seed] {len(cached)} of {len(prompts)} prompts already have a component")
+    if not missing:
+        return {"prompts": len(prompts), "cached": len(cached), "generated": 0, "failed": 0}
+
+    generate_model = client.routes["generate"].models[0].model
+    explain_model = client.routes["explain"].models[0].model
+    components = await run_batch(
+        client.provider,
+        generate_model,
+        {custom_id: init_edit_prompt(prompt) for custom_id, prompt in missing.items()},
+        GENERATE_MAX_TOKENS,
+        poll_interval,
+    )
+    explanations = await run_batch(
+        client.provider,
+        explain_model,
+        {custom_id: explain_init_edit_prompt(missing[custom_id], component) for custom_id, component in components.items()},
+        EXPLAIN_MAX_TOKENS,
+        poll_interval,
+    )
+
+    now = datetime.now()
+    await cache.put_many(
+        SeedComponent(
+            prompt=missing[custom_id],
+            component=component,
+            explanation=explanations.get(custom_id, DEFAULT_EXPLANATION),
+            model=generate_model,
+            created_at=now,
+        )
+        for custom_id, component in components.items()
+    )
+    return {
+        "prompts": len(prompts),
+        "cached": len(cached),
+        "generated": len(components),
+        "failed": len(missing) - len(components),
+    }
+
+
+async def materialize(
+    app_directory: AppDirectory,
+    cache: ComponentCache,
+    prompts: list[str],
+    image: t.Optional[modal.Image],
+    concurrency: int = 50,
+    start_sandbox: t.Optional[t.Callable[..., t.Awaitable[tuple[str, str, str]]]] = None,
+    stop_sandbox: t.Callable[[str], t.Awaitable[bool]] = terminate_sandbox,
+    on_created: t.Optional[t.Callable[[SandboxApp], t.Awaitable[None]]] = None,
+    save_every: int = 25,
+) -> dict:
+    """Build an app for every cached component that has none yet, booting `concurrency` sandboxes at a time.
+
+    Apps are saved `save_every` at a time with `AppDirectory.set_apps`, so the catalogue is not
+    rewritten once per app. A sandbox whose app fails to build is terminated.
+    """
+    if start_sandbox is None:
+        from sandbox.start_sandbox import run_sandbox as start_sandbox
+
+    cached = await cache.get_many(prompts)
+    seeds = [seed for seed in cached.values() if seed.app_id is None]
+    print(f"[seed] Building {len(seeds)} apps ({len(cached) - len(seeds)} already built, {len(prompts) - len(cached)} without a component)")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def build(seed: SeedComponent) -> tuple[SeedComponent, t.Optional[SandboxApp]]:
+        sandbox_ids: list[str] = []
+
+        async def _start_sandbox(**kwargs) -> tuple[str, str, str]:
+            sandbox = await start_sandbox(**kwargs)
+            sandbox_ids.append(sandbox[2])
+            return sandbox
+
+        async with semaphore:
+            try:
+                sandbox_app = await SandboxApp.create(
+                    app_directory.app,
+                    app_directory.client,
+                    seed.prompt,
+                    image=image,
+                    start_sandbox=_start_sandbox,
+                    init_edit=(seed.component, seed.explanation),
+                    transport=app_directory.transport,
+                )
+                return seed, sandbox_app
+            except Exception as e:
+                print(f"[seed] Failed to build app for {seed.prompt[:60]!r}: {e}")
+                for sandbox_id in sandbox_ids:
+                    await stop_sandbox(sandbox_id)
+                return seed, None
+
+    built: list[tuple[SeedComponent, SandboxApp]] = []
+    created = failed = 0
+
+    async def save() -> None:
+        await app_directory.set_apps(sandbox_app for _, sandbox_app in built)
+        for seed, sandbox_app in built:
+            seed.app_id = sandbox_app.id
+        await cache.put_many(seed for seed, _ in built)
+        if on_created is not None:
+            for _, sandbox_app in built:
+                try:
+                    await on_created(sandbox_app)
+                except Exception as e:
+                    print(f"Post-create hook failed for app {sandbox_app.id}: {e}")
+        built.clear()
+
+    with tracer.span("seed.materialize", apps=len(seeds), concurrency=concurrency) as span:
+        for next_built in asyncio.as_completed([build(seed) for seed in seeds]):
+            seed, sandbox_app = await next_built
+            if sandbox_app is None:
+                failed += 1
+                continue
+            created += 1
+            built.append((seed, sandbox_app))
+            if len(built) >= save_every:
+                await save()
+        await save()
+        span.set_attribute("created", created)
+        span.set_attribute("failed", failed)
+    return {"prompts": len(prompts), "created": created, "failed": failed, "missing": len(prompts) - len(cached)}
@@ -0,0 +1,178 @@
+"""Warm edit sessions, and consistent hashing to keep each app's edits on one controller.
+
+Without a session, every `/write` rebuilds the app from the Modal Dict: `get_app` reads and
+validates the whole `app_{id}` blob, which grows with the chat, builds a new `SandboxApp` and
+renders the full message history into the prompt again. `EditSessions` instead keeps the apps
+this controller edited recently in memory: their hydrated `AppData`, their transport (which holds
+on to the sandbox handle or HTTP connection pool, see core/transport.py) and their rendered
+history (see `RenderedHistory` in core/prompt.py). The next edit of the same app only reads the
+small `app_version_{id}` key to check that nobody saved the app since, and edits the warm copy.
+A session whose app was saved elsewhere, or removed, is dropped and the edit hydrates from the
+Dict as before.
+
+Sessions only pay off if a user's edits keep landing on the same controller. `HashRing` maps app
+ids onto replicas with consistent hashing, so a router in front of them sends each app's edits to
+one replica, and adding or removing a replica only moves the apps it owned. Modal's web endpoints
+balance requests across containers on their own, so in production sessions hit whenever edits
+land on the same container, which is always the case while one container serves the controller;
+`local/bench_affinity.py` runs several replicas behind a hashing router to measure the difference.
+
+Sessions are a cache of state that is always saved before the edit returns, so handing an app
+over is just forgetting it: on scale-down the controller flushes its write-behind buffer and
+drops its sessions, and the app's next owner hydrates it from the Dict once.
+"""
+
+import bisect
+import hashlib
+import time
+import typing as t
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+
+from core.sandbox import AppDirectory, SandboxApp, app_version
+from core.tracing import Span, StageMetrics, tracer
+
+CHECKOUT_SPAN = "session.checkout"
+DEFAULT_MAX_SESSIONS = 256
+DEFAULT_IDLE_SECONDS = 600.0
+RING_REPLICAS = 64
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of app ids onto controller replicas.
+
+    Each replica is placed at `replicas` points on the ring, and an app belongs to the replica at
+    the first point after the app id's hash, so load spreads evenly and a replica leaving only
+    moves its own apps.
+    """
+
+    def __init__(self, members: t.Iterable[str], replicas: int = RING_REPLICAS):
+        self.members = sorted(set(members))
+        points = sorted((_hash(f"{member}#{i}"), member) for member in self.members for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, key: str) -> t.Optional[str]:
+        if not self._owners:
+            return None
+        return self._owners[bisect.bisect(self._hashes, _hash(key)) % len(self._owners)]
+
+
+class SessionMetrics:
+    """How often edits found their app warm, and the controller's own share of each edit's latency."""
+
+    def __init__(self):
+        self.checkouts: Counter[str] = Counter()
+        self.edit_overhead = StageMetrics(
+            metric="modal_vibe_edit_overhead_ms",
+            label="session",
+            help_text="Time edit requests spend in the controller outside the LLM and the sandbox, in milliseconds, by session outcome.",
+            errors_metric=None,
+        )
+
+    def observe(self, span: Span) -> None:
+        if span.name == CHECKOUT_SPAN:
+            self.checkouts[span.attributes.get("outcome", "unknown")] += 1
+
+    def render_prometheus(self) -> str:
+        lines = [self.edit_overhead.render_prometheus().rstrip("\n")]
+        lines.append("# HELP modal_vibe_edit_sessions_total Edit session checkouts by outcome.")
+        lines.append("# TYPE modal_vibe_edit_sessions_total counter")
+        for outcome, count in sorted(self.checkouts.items()):
+            lines.append(f'modal_vibe_edit_sessions_total{{outcome="{outcome}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+session_metrics = SessionMetrics()
+tracer.observers.append(session_metrics)
+
+
+@dataclass
+class _Session:
+    app: SandboxApp
+    version: str
+    last_used: float
+    in_use: bool = False
+
+
+class EditSessions:
+    """Apps this controller edited recently, kept warm for their next edit.
+
+    `checkout` an app before editing it and `checkin` it afterwards. An app is only handed to one
+    edit at a time; a concurrent edit of the same app gets a copy from the Dict, as it would
+    without sessions. At most `max_sessions` apps are kept, least recently edited out first, and
+    none longer than `idle_seconds` after their last edit; 0 sessions turns them off.
+    """
+
+    def __init__(
+        self,
+        app_directory: AppDirectory,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        idle_seconds: float = DEFAULT_IDLE_SECONDS,
+        clock: t.Callable[[], float] = time.monotonic,
+    ):
+        self.app_directory = app_directory
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self.metrics = session_metrics
+        self._sessions: OrderedDict[str, _Session] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def checkout(self, app_id: str) -> tuple[t.Optional[SandboxApp], str]:
+        """The app to edit, and whether it was "warm", "stale", "busy" or not kept ("cold").
+
+        The app is None if it doesn't exist.
+        """
+        with tracer.span(CHECKOUT_SPAN, app_id=app_id) as span:
+            self._expire()
+            session = self._sessions.get(app_id)
+            outcome = "cold"
+            if session is not None and session.in_use:
+                outcome = "busy"
+            elif session is not None:
+                # Claim the session before awaiting, so an edit checking out meanwhile sees it busy.
+                session.in_use = True
+                if await self.app_directory.saved_version(app_id) == session.version:
+                    span.set_attribute("outcome", "warm")
+                    return session.app, "warm"
+                session.in_use = False
+                if self._sessions.get(app_id) is session:
+                    del self._sessions[app_id]
+                outcome = "stale"
+            span.set_attribute("outcome", outcome)
+            return await self.app_directory.get_app(app_id), outcome
+
+    def checkin(self, app: SandboxApp, saved: bool) -> None:
+        """Keep `app` warm after an edit that was `saved`; an edit that failed part way is forgotten."""
+        session = self._sessions.get(app.id)
+        if session is not None and session.app is not app and session.in_use:
+            return  # A concurrent edit of the same app still has the warm copy.
+        if not saved or self.max_sessions <= 0:
+            self._sessions.pop(app.id, None)
+            return
+        self._sessions[app.id] = _Session(app=app, version=app_version(app.metadata), last_used=self.clock())
+        self._sessions.move_to_end(app.id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def drop(self, app_id: str) -> None:
+        self._sessions.pop(app_id, None)
+
+    def clear(self) -> int:
+        """Forget every session, e.g. before the container shuts down. Returns how many there were."""
+        count = len(self._sessions)
+        self._sessions.clear()
+        return count
+
+    def _expire(self) -> None:
+        now = self.clock()
+        for app_id, session in list(self._sessions.items()):
+            if now - session.last_used > self.idle_seconds and not session.in_use:
+                del self._sessions[app_id]
@@ -0,0 +1,180 @@
+"""Speculative edit generation while the user is still typing.
+
+The app page posts its draft edit to `/api/app/{app_id}/speculate` once typing pauses. The
+controller starts generating the edited component right away, keyed by the app's version and the
+normalized draft text. When the edit is submitted, a matching speculation, finished or still
+running, is used instead of starting the generation from scratch. A newer draft cancels the
+session's older speculation, and an applied edit cancels every speculation for the old version.
+
+Speculations live in the controller's memory, so a submit that lands on another container simply
+misses. Each session may start `per_minute` speculations a minute; 0 turns speculation off.
+"""
+
+import asyncio
+import re
+import time
+import typing as t
+from collections import Counter, deque
+from dataclasses import dataclass, field
+
+from core.models import Message, MessageType
+from core.prompt import _generate_followup_edit
+from core.tracing import Span, StageMetrics, tracer
+
+if t.TYPE_CHECKING:
+    from core.sandbox import SandboxApp
+
+SESSION_HEADER = "X-Session-Id"
+SPECULATION_SPAN = "llm.speculate"
+MIN_DRAFT_CHARS = 8
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def app_version(app: "SandboxApp") -> str:
+    # Everything the edit prompt is built from besides the instruction itself.
+    return f"{app.metadata.component_hash}:{len(app.data.message_history)}"
+
+
+class SpeculationMetrics:
+    """Perceived edit latency with and without a speculation, against the tokens speculation spends."""
+
+    def __init__(self):
+        self.edit_latency = StageMetrics(
+            metric="modal_vibe_edit_duration_ms",
+            label="speculation",
+            help_text="Duration of edit requests in milliseconds, by whether a speculation was used.",
+            errors_metric=None,
+        )
+        self.speculations: Counter[str] = Counter()
+        self.tokens: Counter[str] = Counter()
+
+    def observe(self, span: Span) -> None:
+        if span.name == SPECULATION_SPAN:
+            self.tokens["input"] += span.attributes.get("input_tokens", 0)
+            self.tokens["output"] += span.attributes.get("output_tokens", 0)
+
+    def render_prometheus(self) -> str:
+        lines = [self.edit_latency.render_prometheus().rstrip("\n")]
+        lines.append("# HELP modal_vibe_speculations_total Speculative edit generations by outcome.")
+        lines.append("# TYPE modal_vibe_speculations_total counter")
+        for outcome, count in sorted(self.speculations.items()):
+            lines.append(f'modal_vibe_speculations_total{{outcome="{outcome}"}} {count}')
+        lines.append("# HELP modal_vibe_speculation_tokens_total Tokens spent on speculative edit generations, used or not.")
+        lines.append("# TYPE modal_vibe_speculation_tokens_total counter")
+        for direction, count in sorted(self.tokens.items()):
+            lines.append(f'modal_vibe_speculation_tokens_total{{direction="{direction}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+speculation_metrics = SpeculationMetrics()
+tracer.observers.append(speculation_metrics)
+
+
+@dataclass
+class _Speculation:
+    app_id: str
+    version: str
+    text: str
+    task: asyncio.Task
+    sessions: set[str] = field(default_factory=set)
+    finished_at: t.Optional[float] = None
+
+
+class SpeculativeEdits:
+    def __init__(self, per_minute: int = 6, ttl_seconds: float = 120.0, clock: t.Callable[[], float] = time.monotonic):
+        self.per_minute = per_minute
+        self.ttl_seconds = ttl_seconds  # How long a finished speculation waits for its submit.
+        self.clock = clock
+        self.metrics = speculation_metrics
+        self._speculations: dict[tuple[str, str, str], _Speculation] = {}  # (app id, version, text) ->
+        self._latest: dict[tuple[str, str], tuple[str, str, str]] = {}  # (session, app id) -> newest key
+        self._started: dict[str, deque[float]] = {}  # session -> start times in the last minute
+
+    def speculate(self, session: str, app: "SandboxApp", text: str) -> str:
+        """Start generating `app`'s edit for the draft `text` unless it already is.
+
+        Returns "started", "running", "too_short", "over_budget" or "disabled".
+        """
+        self._expire()
+        if self.per_minute <= 0:
+            return "disabled"
+        if len(normalize(text)) < MIN_DRAFT_CHARS:
+            return "too_short"
+        key = (app.id, app_version(app), normalize(text))
+        previous = self._latest.get((session, app.id))
+        if previous is not None and previous != key:
+            self._release(previous, session)
+        self._latest[(session, app.id)] = key
+        if key in self._speculations:
+            self._speculations[key].sessions.add(session)
+            return "running"
+
+        started = self._started.setdefault(session, deque())
+        now = self.clock()
+        while started and now - started[0] > 60:
+            started.popleft()
+        if len(started) >= self.per_minute:
+            self.metrics.speculations["over_budget"] += 1
+            return "over_budget"
+        started.append(now)
+
+        history = app.data.message_history + [Message(content=text, type=MessageType.USER)]
+        task = asyncio.create_task(
+            _generate_followup_edit(app.client, text, app.data.current_component, history, span_name=SPECULATION_SPAN)
+        )
+        speculation = _Speculation(app_id=app.id, version=key[1], text=text, task=task, sessions={session})
+        task.add_done_callback(lambda _: setattr(speculation, "finished_at", self.clock()))
+        self._speculations[key] = speculation
+        self.metrics.speculations["started"] += 1
+        return "started"
+
+    async def take(self, app: "SandboxApp", text: str) -> t.Optional[str]:
+        """Return the component speculated for this edit, waiting for it if it is still running.
+
+        Every other speculation for the app is cancelled, since the edit makes them stale.
+        """
+        self._expire()
+        speculation = self._speculations.pop((app.id, app_version(app), normalize(text)), None)
+        self._discard(lambda s: s.app_id == app.id, "stale")
+        if speculation is None:
+            return None
+        try:
+            component = await speculation.task
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Speculative edit for app {app.id} failed, generating again: {e}")
+            self.metrics.speculations["failed"] += 1
+            return None
+        self.metrics.speculations["used"] += 1
+        return component
+
+    def _release(self, key: tuple[str, str, str], session: str) -> None:
+        """Drop `session`'s interest in a speculation, cancelling it if nobody else is waiting on it."""
+        speculation = self._speculations.get(key)
+        if speculation is None:
+            return
+        speculation.sessions.discard(session)
+        if not speculation.sessions:
+            self._discard(lambda s: s is speculation, "superseded")
+
+    def _expire(self) -> None:
+        now = self.clock()
+        self._discard(lambda s: s.finished_at is not None and now - s.finished_at > self.ttl_seconds, "expired")
+
+    def _discard(self, predicate: t.Callable[[_Speculation], bool], outcome: str) -> None:
+        for key, speculation in list(self._speculations.items()):
+            if not predicate(speculation):
+                continue
+            del self._speculations[key]
+            if not speculation.task.done():
+                speculation.task.cancel()
+            elif not speculation.task.cancelled():
+                speculation.task.exception()  # Don't warn about an unretrieved exception.
+            self.metrics.speculations[outcome] += 1
+        for session_app, key in list(self._latest.items()):
+            if key not in self._speculations:
+                del self._latest[session_app]
@@ -0,0 +1,94 @@
+"""Cold start phases of the controller and the worker functions.
+
+Every phase of bringing a container up is a `startup.<phase>` span, so it shows up in the function's
+logs, in the stage histograms on `/metrics`, and as this container's latest reading on
+`modal_vibe_startup_phase_ms{phase=...}`:
+
+- `import`: importing main.py, measured from when this module was first imported.
+- `preload`: importing modules the function will need anyway before the memory snapshot is taken.
+- `hydrate_dicts`: looking up the Modal Dicts, which is otherwise done by the first call to each.
+- `build_web_app`: building the controller's FastAPI app, routes and templates.
+- `hydrate_catalogue`: loading the catalogue and search index. The controller does this in the
+  background once it is serving (see `AppDirectory.start_loading`).
+- `ready`: from the start of the process, or from its memory snapshot point, until the controller
+  can serve requests.
+
+Containers of functions deployed with `enable_memory_snapshot=True` are restored from a snapshot
+taken after their imports and `@modal.enter(snap=True)` hooks ran, so they skip those phases;
+`resumed()` marks where every container picks up again.
+"""
+
+import contextlib
+import importlib
+import secrets
+import time
+import typing as t
+
+from core.tracing import Span, tracer
+
+PHASE_PREFIX = "startup."
+
+
+class StartupPhases:
+    def __init__(self):
+        self.origin_ns = time.time_ns()
+        self.snapshotted = False
+        self.durations_ms: dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str, **attributes) -> t.Iterator[Span]:
+        with tracer.span(PHASE_PREFIX + name, **attributes) as span:
+            yield span
+        self._finished(span)
+
+    def since_start(self, name: str, **attributes) -> Span:
+        """Record a phase that started with the process, or at its memory snapshot point."""
+        span = Span(
+            name=PHASE_PREFIX + name,
+            trace_id=secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            start_time_ns=self.origin_ns,
+            end_time_ns=time.time_ns(),
+            attributes={"snapshotted": self.snapshotted, **attributes},
+        )
+        tracer.record([span])
+        self._finished(span)
+        return span
+
+    def preload(self, modules: t.Iterable[str]) -> None:
+        """Import `modules` now, so that a memory snapshot taken afterwards already has them."""
+        modules = [module for module in modules if module]
+        if not modules:
+            return
+        with self.phase("preload", modules=",".join(modules)):
+            for module in modules:
+                importlib.import_module(module)
+
+    def resumed(self) -> None:
+        """Called by the first hook after the memory snapshot point; later phases are timed from here.
+
+        That is right after the restore for every container but the one that takes the snapshot.
+        """
+        self.origin_ns = time.time_ns()
+        self.snapshotted = True
+        print("[startup] Resumed after the memory snapshot point")
+
+    def _finished(self, span: Span) -> None:
+        name = span.name[len(PHASE_PREFIX):]
+        self.durations_ms[name] = span.duration_ms
+        print(f"[startup] {name} took {span.duration_ms:.0f}ms")
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# HELP modal_vibe_startup_phase_ms How long each startup phase of this container took.",
+            "# TYPE modal_vibe_startup_phase_ms gauge",
+            *[f'modal_vibe_startup_phase_ms{{phase="{name}"}} {duration:.1f}' for name, duration in self.durations_ms.items()],
+            "# HELP modal_vibe_startup_memory_snapshot Whether phases before the snapshot point are restored rather than rerun.",
+            "# TYPE modal_vibe_startup_memory_snapshot gauge",
+            f"modal_vibe_startup_memory_snapshot {int(self.snapshotted)}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+startup = StartupPhases()
+tracer.renderers.append(startup)
@@ -0,0 +1,109 @@
+"""Bulk termination of every sandbox app, run as a background job with persisted progress."""
+
+import asyncio
+import random
+import time
+from datetime import datetime
+import typing as t
+
+import modal
+
+from core.models import JobStatus, TerminateAllJob
+
+if t.TYPE_CHECKING:
+    from core.sandbox import AppDirectory
+
+# Failed sandbox ids kept on the job for an admin to look at; `failed` counts all of them.
+MAX_FAILED_IDS = 100
+
+
+def _job_key(job_id: str) -> str:
+    return f"terminate_job_{job_id}"
+
+
+async def save_job(apps_dict: modal.Dict, job: TerminateAllJob) -> None:
+    job.updated_at = datetime.now()
+    await apps_dict.put.aio(_job_key(job.id), job.model_dump())
+
+
+async def load_job(apps_dict: modal.Dict, job_id: str) -> t.Optional[TerminateAllJob]:
+    job_data = await apps_dict.get.aio(_job_key(job_id))
+    if job_data is None:
+        return None
+    return TerminateAllJob.model_validate(job_data)
+
+
+async def terminate_sandbox(object_id: str, max_attempts: int = 3) -> bool:
+    """Terminate one sandbox, retrying with jittered backoff. A sandbox that is already gone counts as terminated."""
+    for attempt in range(max_attempts):
+        try:
+            sandbox = await modal.Sandbox.from_id.aio(object_id)
+            await sandbox.terminate.aio()
+            return True
+        except modal.exception.NotFoundError:
+            return True
+        except Exception as e:
+            print(f"Attempt {attempt + 1}/{max_attempts} to terminate {object_id} failed: {e}")
+            if attempt < max_attempts - 1:
+                await asyncio.sleep(0.5 * 2 ** attempt + random.random() * 0.5)
+    return False
+
+
+async def list_sandboxes(modal_app_id: str) -> t.AsyncIterator[str]:
+    """The object ids of every running sandbox of `modal_app_id`."""
+    async for sandbox in modal.Sandbox.list.aio(app_id=modal_app_id):
+        yield sandbox.object_id
+
+
+async def terminate_all(
+    apps_dict: modal.Dict,
+    app_directory: "AppDirectory",
+    modal_app_id: str,
+    job: TerminateAllJob,
+    concurrency: int = 32,
+    progress_interval: float = 1.0,
+    stop_sandbox: t.Callable[[str], t.Awaitable[bool]] = terminate_sandbox,
+    list_sandboxes: t.Callable[[str], t.AsyncIterator[str]] = list_sandboxes,
+) -> TerminateAllJob:
+    """Terminate every catalogued app plus any stray sandboxes of `modal_app_id`.
+
+    Terminations run with bounded parallelism. Successfully terminated apps are removed from the
+    catalogue in one batch at the end; failures stay catalogued so re-running the job retries them.
+    """
+    await app_directory.load()
+    object_ids = list(app_directory.apps.keys())
+    async for object_id in list_sandboxes(modal_app_id):
+        if object_id not in app_directory.apps:
+            object_ids.append(object_id)
+
+    job.status = JobStatus.RUNNING
+    job.total = len(object_ids)
+    await save_job(apps_dict, job)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    terminated_ids: list[str] = []
+    last_saved = time.monotonic()
+
+    async def terminate_with_limit(object_id: str) -> None:
+        nonlocal last_saved
+        async with semaphore:
+            success = await stop_sandbox(object_id)
+        if success:
+            terminated_ids.append(object_id)
+            job.terminated += 1
+        else:
+            job.failed += 1
+            if len(job.failed_ids) < MAX_FAILED_IDS:
+                job.failed_ids.append(object_id)
+        if time.monotonic() - last_saved >= progress_interval:
+            last_saved = time.monotonic()
+            await save_job(apps_dict, job)
+
+    await asyncio.gather(*[terminate_with_limit(object_id) for object_id in object_ids])
+
+    await app_directory.remove_apps(app_id for app_id in terminated_ids if app_id in app_directory.apps)
+
+    job.status = JobStatus.FAILED if job.failed else JobStatus.SUCCEEDED
+    await save_job(apps_dict, job)
+    print(f"Terminate-all job {job.id}: terminated {job.terminated}/{job.total}, {job.failed} failed")
+    return job
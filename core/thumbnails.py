@@ -0,0 +1,114 @@
+"""Static thumbnails for the home gallery.
+
+After a component is pushed to a sandbox, a headless browser renders the app once and the
+compressed screenshot is stored under the hash of the component source. Gallery cards show that
+image and only load the live sandbox iframe on hover, so scrolling the gallery no longer boots
+dozens of Vite dev pages. Because the key is a content hash, a thumbnail never changes and can be
+served with immutable caching.
+"""
+
+import asyncio
+import hashlib
+import typing as t
+from collections import OrderedDict
+
+import modal
+
+THUMBNAIL_VIEWPORT = {"width": 1024, "height": 768}  # 4:3, like the gallery cards
+
+
+def component_hash(component: str) -> str:
+    return hashlib.sha256(component.encode()).hexdigest()[:24]
+
+
+def thumbnail_url(hash_: str) -> str:
+    return f"/thumbnails/{hash_}" if hash_ else ""
+
+
+class Thumbnail(t.NamedTuple):
+    content_type: str
+    data: bytes
+
+
+class ThumbnailStore:
+    """Content-addressed thumbnail storage in a Modal Dict, with a small in-process LRU in front."""
+
+    def __init__(self, thumbnails_dict: modal.Dict, cache_size: int = 256):
+        self.thumbnails_dict = thumbnails_dict
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, Thumbnail] = OrderedDict()
+
+    async def get(self, hash_: str) -> t.Optional[Thumbnail]:
+        if hash_ in self._cache:
+            self._cache.move_to_end(hash_)
+            return self._cache[hash_]
+        stored = await self.thumbnails_dict.get.aio(hash_)
+        if stored is None:
+            return None
+        thumbnail = Thumbnail(stored["content_type"], stored["data"])
+        self._remember(hash_, thumbnail)
+        return thumbnail
+
+    async def contains(self, hash_: str) -> bool:
+        return hash_ in self._cache or await self.thumbnails_dict.contains.aio(hash_)
+
+    async def put(self, hash_: str, thumbnail: Thumbnail) -> None:
+        await self.thumbnails_dict.put.aio(hash_, {"content_type": thumbnail.content_type, "data": thumbnail.data})
+        self._remember(hash_, thumbnail)
+
+    def _remember(self, hash_: str, thumbnail: Thumbnail) -> None:
+        self._cache[hash_] = thumbnail
+        self._cache.move_to_end(hash_)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+class PlaywrightRenderer:
+    """Screenshots a page with headless Chromium as a downscaled JPEG.
+
+    Works anywhere `playwright` and its Chromium build are installed, including locally.
+    """
+
+    def __init__(self, quality: int = 70, scale: float = 0.5, settle_seconds: float = 1.0, timeout_ms: int = 30000):
+        self.quality = quality
+        self.scale = scale
+        self.settle_seconds = settle_seconds
+        self.timeout_ms = timeout_ms
+
+    async def render(self, url: str) -> Thumbnail:
+        from playwright.async_api import async_playwright
+
+        async with async_playwright() as playwright:
+            browser = await playwright.chromium.launch()
+            try:
+                page = await browser.new_page(viewport=THUMBNAIL_VIEWPORT, device_scale_factor=self.scale)
+                await page.goto(url, wait_until="networkidle", timeout=self.timeout_ms)
+                # Let entry animations and web fonts settle before the screenshot.
+                await asyncio.sleep(self.settle_seconds)
+                data = await page.screenshot(type="jpeg", quality=self.quality)
+            finally:
+                await browser.close()
+        return Thumbnail("image/jpeg", data)
+
+
+class PlaceholderRenderer:
+    """Renders a deterministic SVG card instead of a screenshot, for tests and the local harness."""
+
+    async def render(self, url: str) -> Thumbnail:
+        label = hashlib.sha256(url.encode()).hexdigest()[:8]
+        svg = (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{THUMBNAIL_VIEWPORT["width"] // 2}" '
+            f'height="{THUMBNAIL_VIEWPORT["height"] // 2}"><rect width="100%" height="100%" fill="#{label[:6]}"/>'
+            f'<text x="50%" y="50%" fill="#fff" text-anchor="middle">{label}</text></svg>'
+        )
+        return Thumbnail("image/svg+xml", svg.encode())
+
+
+async def render_and_store(store: ThumbnailStore, renderer, url: str, hash_: str) -> bool:
+    """Render `url` and store it under `hash_`, unless a thumbnail for that component already exists."""
+    if await store.contains(hash_):
+        return False
+    thumbnail = await renderer.render(url)
+    await store.put(hash_, thumbnail)
+    print(f"Stored {thumbnail.content_type} thumbnail {hash_} ({len(thumbnail.data)} bytes) for {url}")
+    return True
@@ -0,0 +1,334 @@
+"""Lightweight per-stage tracing for app creation and edits.
+
+Spans follow the OpenTelemetry data model (128-bit trace ids, 64-bit span ids, parent links,
+attributes) and propagate across processes with the W3C `traceparent` header, so they can be
+exported as OTLP/JSON to any OpenTelemetry collector without adding the OTel SDK to the image.
+
+Every finished span is also observed into a per-stage latency histogram, which the controller
+exposes on `/metrics` in the Prometheus text format.
+
+    with tracer.span("llm.generate", model=model) as span:
+        message = await client.messages.create(...)
+        span.set_attribute("output_tokens", message.usage.output_tokens)
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import os
+import secrets
+import time
+import typing as t
+from dataclasses import dataclass, field
+
+TRACEPARENT_HEADER = "traceparent"
+
+# Upper bounds in milliseconds, from a Dict read up to a full Sonnet generation.
+DEFAULT_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: t.Optional[str] = None
+    start_time_ns: int = 0
+    end_time_ns: int = 0
+    attributes: dict[str, t.Any] = field(default_factory=dict)
+    error: t.Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_time_ns - self.start_time_ns) / 1e6
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: t.Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_ns": self.start_time_ns,
+            "end_time_ns": self.end_time_ns,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Span":
+        return cls(**data)
+
+    def to_otlp(self) -> dict:
+        """Render the span in the OTLP/JSON encoding."""
+        def _value(value: t.Any) -> dict:
+            if isinstance(value, bool):
+                return {"boolValue": value}
+            if isinstance(value, int):
+                return {"intValue": str(value)}
+            if isinstance(value, float):
+                return {"doubleValue": value}
+            return {"stringValue": str(value)}
+
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_time_ns),
+            "endTimeUnixNano": str(self.end_time_ns),
+            "attributes": [{"key": key, "value": _value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+def parse_traceparent(header: t.Optional[str]) -> t.Optional[tuple[str, str]]:
+    """Return `(trace_id, parent_span_id)` from a W3C traceparent header, or None if it is malformed."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+class InMemorySpanExporter:
+    """Keeps finished spans in a list. Meant for tests and for shipping spans back from remote functions."""
+
+    def __init__(self):
+        self.spans: list[Span] = []
+
+    def export(self, spans: t.Sequence[Span]) -> None:
+        self.spans.extend(spans)
+
+    def get_finished_spans(self, name: t.Optional[str] = None) -> list[Span]:
+        return [span for span in self.spans if name is None or span.name == name]
+
+    def clear(self) -> None:
+        self.spans = []
+
+
+class OTLPHttpExporter:
+    """Buffers spans and posts them as OTLP/JSON to `{endpoint}/v1/traces`."""
+
+    def __init__(self, endpoint: str, service_name: str, batch_size: int = 64):
+        self.url = f"{endpoint.rstrip('/')}/v1/traces"
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self._buffer: list[Span] = []
+        # Posts started by `export`, kept so they aren't garbage collected before they finish.
+        self._posts: set[asyncio.Task] = set()
+
+    def export(self, spans: t.Sequence[Span]) -> None:
+        self._buffer.extend(spans)
+        if len(self._buffer) >= self.batch_size:
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        try:
+            task = asyncio.get_running_loop().create_task(self._post())
+        except RuntimeError:
+            return
+        self._posts.add(task)
+        task.add_done_callback(self._post_done)
+
+    def _post_done(self, task: asyncio.Task) -> None:
+        self._posts.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Exporting spans to {self.url} failed: {task.exception()!r}")
+
+    async def flush(self) -> None:
+        """Post the buffered spans and wait for posts already under way."""
+        await asyncio.gather(self._post(), *self._posts, return_exceptions=True)
+
+    async def _post(self) -> None:
+        import httpx
+
+        spans, self._buffer = self._buffer, []
+        if not spans:
+            return
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": "modal-vibe"}, "spans": [span.to_otlp() for span in spans]}],
+            }]
+        }
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                response = await client.post(self.url, json=payload)
+                response.raise_for_status()
+        except Exception as e:
+            print(f"Failed to export {len(spans)} spans to {self.url}: {e}")
+
+
+class StageMetrics:
+    """Cumulative latency histograms keyed by span name, or by any other label via `observe_value`."""
+
+    def __init__(
+        self,
+        buckets_ms: t.Sequence[float] = DEFAULT_BUCKETS_MS,
+        metric: str = "modal_vibe_stage_duration_ms",
+        label: str = "stage",
+        help_text: str = "Duration of each traced stage in milliseconds.",
+        errors_metric: t.Optional[str] = "modal_vibe_stage_errors_total",
+    ):
+        self.buckets_ms = tuple(buckets_ms)
+        self.metric = metric
+        self.label = label
+        self.help_text = help_text
+        self.errors_metric = errors_metric
+        self._counts: dict[str, list[int]] = {}
+        self._sums: dict[str, float] = {}
+        self._errors: dict[str, int] = {}
+
+    def observe(self, span: Span) -> None:
+        self.observe_value(span.name, span.duration_ms, error=bool(span.error))
+
+    def observe_value(self, key: str, duration_ms: float, error: bool = False) -> None:
+        counts = self._counts.setdefault(key, [0] * (len(self.buckets_ms) + 1))
+        for i, bound in enumerate(self.buckets_ms):
+            if duration_ms <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self._sums[key] = self._sums.get(key, 0.0) + duration_ms
+        if error:
+            self._errors[key] = self._errors.get(key, 0) + 1
+
+    def render_prometheus(self) -> str:
+        metric, label = self.metric, self.label
+        lines = [
+            f"# HELP {metric} {self.help_text}",
+            f"# TYPE {metric} histogram",
+        ]
+        for key in sorted(self._counts):
+            counts = self._counts[key]
+            cumulative = 0
+            for bound, count in zip(self.buckets_ms, counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{label}="{key}",le="{bound:g}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{metric}_bucket{{{label}="{key}",le="+Inf"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{label}="{key}"}} {self._sums[key]:.3f}')
+            lines.append(f'{metric}_count{{{label}="{key}"}} {cumulative}')
+        if self.errors_metric:
+            lines.append(f"# HELP {self.errors_metric} Traced stages that raised.")
+            lines.append(f"# TYPE {self.errors_metric} counter")
+            for key in sorted(self._errors):
+                lines.append(f'{self.errors_metric}{{{label}="{key}"}} {self._errors[key]}')
+        return "\n".join(lines) + "\n"
+
+
+_current_span: contextvars.ContextVar[t.Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+_remote_parent: contextvars.ContextVar[t.Optional[tuple[str, str]]] = contextvars.ContextVar("remote_parent", default=None)
+
+
+class Tracer:
+    def __init__(self, exporters: t.Optional[list] = None, metrics: t.Optional[StageMetrics] = None):
+        self.exporters = exporters if exporters is not None else []
+        self.metrics = metrics or StageMetrics()
+        # Everything that derives metrics from finished spans, local or shipped back from other
+        # processes. Each has `observe(span)` and `render_prometheus()`.
+        self.observers: list = [self.metrics]
+        # Metrics kept some other way that `/metrics` renders after the observers'. Each has
+        # `render_prometheus()`.
+        self.renderers: list = []
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes) -> t.Iterator[Span]:
+        parent = _current_span.get()
+        if parent is not None:
+            trace_id, parent_span_id = parent.trace_id, parent.span_id
+        elif _remote_parent.get() is not None:
+            trace_id, parent_span_id = _remote_parent.get()
+        else:
+            trace_id, parent_span_id = secrets.token_hex(16), None
+        span = Span(
+            name=name,
+            trace_id=trace_id,
+            span_id=secrets.token_hex(8),
+            parent_span_id=parent_span_id,
+            start_time_ns=time.time_ns(),
+            attributes=dict(attributes),
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_time_ns = time.time_ns()
+            self.record([span])
+
+    @contextlib.contextmanager
+    def remote_parent(self, traceparent: t.Optional[str]) -> t.Iterator[None]:
+        """Parent spans opened inside this block under a span from another process."""
+        token = _remote_parent.set(parse_traceparent(traceparent))
+        try:
+            yield
+        finally:
+            _remote_parent.reset(token)
+
+    @contextlib.contextmanager
+    def capture(self) -> t.Iterator[InMemorySpanExporter]:
+        """Collect every span finished inside this block, e.g. to return them from a remote function."""
+        exporter = InMemorySpanExporter()
+        self.exporters.append(exporter)
+        try:
+            yield exporter
+        finally:
+            self.exporters.remove(exporter)
+
+    def current_traceparent(self) -> t.Optional[str]:
+        span = _current_span.get()
+        return span.traceparent if span is not None else None
+
+    def record(self, spans: t.Iterable[Span]) -> None:
+        """Export spans and add them to the stage histograms."""
+        spans = list(spans)
+        for span in spans:
+            for observer in self.observers:
+                observer.observe(span)
+        for exporter in self.exporters:
+            exporter.export(spans)
+
+    def observe_remote(self, spans: t.Iterable[dict]) -> None:
+        """Add spans shipped back from another process to the stage histograms.
+
+        They are not exported again: the process that produced them already did.
+        """
+        for span in spans:
+            span = Span.from_dict(span)
+            for observer in self.observers:
+                observer.observe(span)
+
+    def render_prometheus(self) -> str:
+        return "".join(renderer.render_prometheus() for renderer in [*self.observers, *self.renderers])
+
+    async def flush(self) -> None:
+        for exporter in self.exporters:
+            if hasattr(exporter, "flush"):
+                await exporter.flush()
+
+
+def _tracer_from_env() -> Tracer:
+    exporters = []
+    endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+    if endpoint:
+        exporters.append(OTLPHttpExporter(endpoint, service_name=os.getenv("OTEL_SERVICE_NAME", "modal-vibe")))
+    return Tracer(exporters=exporters)
+
+
+tracer = _tracer_from_env()
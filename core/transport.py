@@ -0,0 +1,175 @@
+"""How the controller reaches the control plane of a sandbox: pushing components, checking it is
+alive and reading its resource usage.
+
+- `ExecTransport` writes components with the Modal sandbox filesystem API and runs
+  `python -m sandbox.control` (see sandbox/control.py) with `Sandbox.exec`. Sandboxes only expose
+  the user-facing Vite tunnel, and no traffic goes through a public control endpoint.
+- `HttpTransport` calls the FastAPI server in sandbox/server.py through its tunnel. Sandboxes
+  created before exec control existed (those with a `sandbox_tunnel_url`) keep using it.
+- `local.fakes.FakeSandboxTransport` keeps components in memory for the local harness.
+
+Every call is traced as `transport.<name>.<operation>`, so `/metrics` has edit latency per transport.
+"""
+
+import abc
+import asyncio
+import json
+import typing as t
+from collections import OrderedDict
+
+import httpx
+import modal
+
+from core.models import AppData
+from core.tracing import tracer
+from sandbox.control import COMPONENT_PATH, component_version, is_component_valid
+
+# Long enough for `sandbox.control ack` to wait out its own compile and serve timeouts.
+EXEC_TIMEOUT = 60
+CONTROL_WORKDIR = "/root"
+MAX_CACHED_SANDBOXES = 1024
+
+
+class SandboxTransport(abc.ABC):
+    name = "base"
+
+    @abc.abstractmethod
+    async def push_component(self, data: AppData, component: str) -> dict:
+        """Write the component and wait for Vite to compile it.
+
+        Returns `{"status": "ok", "hmr": {...}}` with the compile outcome (see sandbox/control.py),
+        or `{"status": "error", "message": ...}` if the sandbox rejected the component.
+        """
+
+    @abc.abstractmethod
+    async def is_alive(self, data: AppData) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def metrics(self, data: AppData) -> t.Optional[str]:
+        """The sandbox's resource usage in the Prometheus text format, or None if it can't be read."""
+
+
+class HttpTransport(SandboxTransport):
+    name = "http"
+
+    def __init__(self, max_keepalive: int = MAX_CACHED_SANDBOXES):
+        self.max_keepalive = max_keepalive
+        # One connection pool for all sandboxes, so consecutive calls to a sandbox reuse its connection.
+        self._client: t.Optional[httpx.AsyncClient] = None
+        self._client_loop: t.Optional[asyncio.AbstractEventLoop] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        # Connections belong to the event loop that opened them, and scripts may run several loops.
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            limits = httpx.Limits(max_connections=None, max_keepalive_connections=self.max_keepalive)
+            self._client, self._client_loop = httpx.AsyncClient(limits=limits), loop
+        return self._client
+
+    async def push_component(self, data: AppData, component: str) -> dict:
+        with tracer.span("transport.http.push_component", app_id=data.id, component_length=len(component)):
+            response = await self._http().post(f"{data.sandbox_tunnel_url}/edit", json={"component": component}, timeout=60.0)
+            response.raise_for_status()
+            return response.json()
+
+    async def is_alive(self, data: AppData) -> bool:
+        with tracer.span("transport.http.is_alive", app_id=data.id) as span:
+            try:
+                response = await self._http().get(f"{data.sandbox_tunnel_url}/heartbeat", timeout=10.0)
+                alive = response.status_code == 200
+            except Exception as e:
+                print(f"Health check failed for {data.id}: {str(e)}")
+                alive = False
+            span.set_attribute("alive", alive)
+            return alive
+
+    async def metrics(self, data: AppData) -> t.Optional[str]:
+        with tracer.span("transport.http.metrics", app_id=data.id):
+            try:
+                response = await self._http().get(f"{data.sandbox_tunnel_url}/metrics", timeout=5.0)
+                if response.status_code != 200:
+                    return None  # Sandboxes started before /metrics existed.
+                return response.text
+            except Exception as e:
+                print(f"Failed to scrape metrics from {data.sandbox_tunnel_url}: {e}")
+                return None
+
+
+class ExecTransport(SandboxTransport):
+    name = "exec"
+
+    def __init__(self, max_cached: int = MAX_CACHED_SANDBOXES):
+        self.max_cached = max_cached
+        # Hydrated sandbox handles by object id, so each call skips the `from_id` round trip.
+        self._sandboxes: OrderedDict[str, modal.Sandbox] = OrderedDict()
+
+    async def _sandbox(self, data: AppData) -> modal.Sandbox:
+        sandbox = self._sandboxes.get(data.sandbox_object_id)
+        if sandbox is None:
+            sandbox = await modal.Sandbox.from_id.aio(data.sandbox_object_id)
+            self._sandboxes[data.sandbox_object_id] = sandbox
+            while len(self._sandboxes) > self.max_cached:
+                self._sandboxes.popitem(last=False)
+        else:
+            self._sandboxes.move_to_end(data.sandbox_object_id)
+        return sandbox
+
+    async def _control(self, data: AppData, *args: str) -> tuple[int, str]:
+        """Run `python -m sandbox.control <args>` in the sandbox, returning its exit code and stdout."""
+        sandbox = await self._sandbox(data)
+        process = await sandbox.exec.aio(
+            "python", "-m", "sandbox.control", *args,
+            workdir=CONTROL_WORKDIR,
+            timeout=EXEC_TIMEOUT,
+        )
+        stdout = await process.stdout.read.aio()
+        returncode = await process.wait.aio()
+        if returncode != 0:
+            stderr = await process.stderr.read.aio()
+            print(f"sandbox.control {args[0]} exited with {returncode} in {data.sandbox_object_id}: {stderr.strip()}")
+        return returncode, stdout
+
+    async def push_component(self, data: AppData, component: str) -> dict:
+        if not is_component_valid(component):
+            print(f"Invalid component: {component}")
+            return {"status": "error", "message": "Invalid component"}
+        with tracer.span("transport.exec.push_component", app_id=data.id, component_length=len(component)):
+            sandbox = await self._sandbox(data)
+            with tracer.span("transport.exec.write_component", app_id=data.id):
+                await sandbox.filesystem.write_text.aio(component, COMPONENT_PATH)
+            returncode, stdout = await self._control(data, "ack", component_version(component))
+            if returncode != 0:
+                raise RuntimeError(f"Waiting for the component to compile failed in {data.sandbox_object_id}")
+            return {"status": "ok", "hmr": json.loads(stdout)}
+
+    async def is_alive(self, data: AppData) -> bool:
+        with tracer.span("transport.exec.is_alive", app_id=data.id) as span:
+            try:
+                sandbox = await self._sandbox(data)
+                # `poll` is None while the sandbox runs; startup.sh exits if Vite dies.
+                alive = await sandbox.poll.aio() is None and (await self._control(data, "heartbeat"))[0] == 0
+            except Exception as e:
+                print(f"Health check failed for {data.id}: {str(e)}")
+                self._sandboxes.pop(data.sandbox_object_id, None)
+                alive = False
+            span.set_attribute("alive", alive)
+            return alive
+
+    async def metrics(self, data: AppData) -> t.Optional[str]:
+        with tracer.span("transport.exec.metrics", app_id=data.id):
+            try:
+                returncode, stdout = await self._control(data, "metrics")
+                return stdout if returncode == 0 else None
+            except Exception as e:
+                print(f"Failed to scrape metrics from {data.sandbox_object_id}: {e}")
+                return None
+
+
+http_transport = HttpTransport()
+exec_transport = ExecTransport()
+
+
+def transport_for(data: AppData) -> SandboxTransport:
+    """Sandboxes started with a control tunnel are reached through it, the rest with exec."""
+    return http_transport if data.sandbox_tunnel_url else exec_transport
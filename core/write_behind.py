@@ -0,0 +1,184 @@
+"""Write-behind buffer for `AppDirectory` saves in the controller.
+
+Edits and admin toggles call `set_app` in the request path. With the buffer on, `set_app` only
+updates the directory's in-memory state and queues a snapshot of the app here. Snapshots of the
+same app coalesce, latest wins, and a background task writes them with one bulk save every
+`flush_interval` seconds, or as soon as `max_pending` apps are waiting.
+
+The container that buffered a save reads it back from memory until it is flushed (see
+`AppDirectory.get_app` and `AppDirectory.refresh`). Other containers see it after the next flush.
+Stopping the buffer flushes whatever is left, so a graceful shutdown loses nothing; a crash loses
+at most one interval of saves and never leaves a catalogue entry without its app data.
+"""
+
+import asyncio
+import time
+import typing as t
+from dataclasses import dataclass
+
+from core.tracing import Span, tracer
+
+FLUSH_SPAN = "write_behind.flush"
+DEFAULT_FLUSH_INTERVAL = 0.2
+DEFAULT_MAX_PENDING = 100
+
+
+@dataclass
+class AppSnapshot:
+    """What saving an app writes: its catalogue entry, its data and, if it changed, its search text."""
+
+    app_id: str
+    metadata: dict
+    data: dict
+    search_text: t.Optional[str] = None
+
+
+class WriteBehindMetrics:
+    """How many saves were buffered against how many were written, and how long flushes take."""
+
+    def __init__(self):
+        self.updates = 0
+        self.writes = 0
+        self.flushes = 0
+        self.failures = 0
+        self.pending = 0
+        self.flush_ms_sum = 0.0
+
+    def observe(self, span: Span) -> None:
+        if span.name == FLUSH_SPAN and not span.error:
+            self.flushes += 1
+            self.writes += span.attributes.get("apps", 0)
+            self.flush_ms_sum += span.duration_ms
+
+    @property
+    def coalescing_ratio(self) -> float:
+        return self.updates / self.writes if self.writes else 0.0
+
+    def render_prometheus(self) -> str:
+        # Flush latency histograms are under modal_vibe_stage_duration_ms{stage="write_behind.flush"}.
+        lines = [
+            "# HELP modal_vibe_write_behind_updates_total App saves buffered for writing.",
+            "# TYPE modal_vibe_write_behind_updates_total counter",
+            f"modal_vibe_write_behind_updates_total {self.updates}",
+            "# HELP modal_vibe_write_behind_writes_total App saves written after coalescing.",
+            "# TYPE modal_vibe_write_behind_writes_total counter",
+            f"modal_vibe_write_behind_writes_total {self.writes}",
+            "# HELP modal_vibe_write_behind_flushes_total Batched writes of buffered saves.",
+            "# TYPE modal_vibe_write_behind_flushes_total counter",
+            f"modal_vibe_write_behind_flushes_total {self.flushes}",
+            "# HELP modal_vibe_write_behind_flush_failures_total Flushes that failed and were retried.",
+            "# TYPE modal_vibe_write_behind_flush_failures_total counter",
+            f"modal_vibe_write_behind_flush_failures_total {self.failures}",
+            "# HELP modal_vibe_write_behind_pending Apps waiting to be written.",
+            "# TYPE modal_vibe_write_behind_pending gauge",
+            f"modal_vibe_write_behind_pending {self.pending}",
+            "# HELP modal_vibe_write_behind_coalescing_ratio Buffered saves per written save.",
+            "# TYPE modal_vibe_write_behind_coalescing_ratio gauge",
+            f"modal_vibe_write_behind_coalescing_ratio {self.coalescing_ratio:.3f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+write_behind_metrics = WriteBehindMetrics()
+tracer.observers.append(write_behind_metrics)
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        write: t.Callable[[list[AppSnapshot]], t.Awaitable[t.Any]],
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        self.write = write
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.metrics = write_behind_metrics
+        self.pending: dict[str, AppSnapshot] = {}
+        self._lock = asyncio.Lock()  # Held while a flush writes, so removals can wait it out.
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task: t.Optional[asyncio.Task] = None
+
+    def __contains__(self, app_id: str) -> bool:
+        return app_id in self.pending
+
+    def get(self, app_id: str) -> t.Optional[AppSnapshot]:
+        return self.pending.get(app_id)
+
+    def add(self, snapshot: AppSnapshot) -> None:
+        previous = self.pending.pop(snapshot.app_id, None)
+        if previous is not None and snapshot.search_text is None:
+            # The earlier save changed the search text and hasn't written it yet.
+            snapshot.search_text = previous.search_text
+        self.pending[snapshot.app_id] = snapshot
+        self.metrics.updates += 1
+        self.metrics.pending = len(self.pending)
+        if len(self.pending) >= self.max_pending:
+            self._wake.set()
+
+    async def discard(self, app_ids: t.Iterable[str]) -> None:
+        """Drop buffered saves of apps being removed, waiting for a flush that may be writing them."""
+        async with self._lock:
+            for app_id in app_ids:
+                self.pending.pop(app_id, None)
+            self.metrics.pending = len(self.pending)
+
+    async def flush(self) -> int:
+        """Write everything buffered so far. Returns how many apps were written."""
+        async with self._lock:
+            if not self.pending:
+                return 0
+            batch = list(self.pending.values())
+            self.pending = {}
+            try:
+                with tracer.span(FLUSH_SPAN, apps=len(batch)):
+                    await self.write(batch)
+            except asyncio.CancelledError:
+                self._requeue(batch)
+                raise
+            except Exception as e:
+                print(f"[WriteBehindBuffer] Failed to write {len(batch)} apps, retrying next flush: {e}")
+                self.metrics.failures += 1
+                self._requeue(batch)
+                return 0
+            finally:
+                self.metrics.pending = len(self.pending)
+        return len(batch)
+
+    def _requeue(self, batch: list[AppSnapshot]) -> None:
+        """Put back saves that weren't written, unless a newer save of the same app came in meanwhile."""
+        for snapshot in batch:
+            newer = self.pending.get(snapshot.app_id)
+            if newer is None:
+                self.pending[snapshot.app_id] = snapshot
+            elif newer.search_text is None:
+                newer.search_text = snapshot.search_text
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background flushes and write whatever is still buffered."""
+        if self._task is not None:
+            # Let a flush that is already writing finish rather than cancelling it halfway.
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        started = time.monotonic()
+        written = await self.flush()
+        if self.pending:
+            print(f"[WriteBehindBuffer] {len(self.pending)} apps could not be written on shutdown")
+        print(f"[WriteBehindBuffer] Flushed {written} apps on shutdown in {(time.monotonic() - started) * 1000:.0f}ms")
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not self._stopping:
+                await self.flush()
@@ -0,0 +1,215 @@
+"""Per-edit controller overhead with and without edit affinity across controller replicas.
+
+Runs `--replicas` local controllers (see `build_local_app` in local/harness.py) against one
+in-memory Dict and one set of fake sandboxes, as autoscaled containers would share them. Each of
+`--apps` apps then gets `--edits` edits, one after the other, all apps at once. Every edit is
+routed either to a random replica, as Modal's load balancer does, or with affinity, to the replica
+that owns the app on a `HashRing` (see core/sessions.py). Halfway through, one replica is scaled
+down the way the controller shuts down, and its apps move to the others.
+
+The LLM and sandboxes answer instantly, so what an edit costs is the controller's own work:
+hydrating the app, rendering the prompt and saving. For each routing the report has the session
+outcomes, the controller overhead per edit (from `modal_vibe_edit_overhead_ms`) and the edit
+latency percentiles. It fails if an edit was lost, i.e. an app's history doesn't have every edit
+at the end; with random routing and `--write-behind-ms` above 0 edits are lost with or without
+sessions, since a container only sees another's saves once they are flushed, so that isn't checked.
+
+    python -m local.bench_affinity --replicas 4 --apps 40 --edits 20 --history 50 --dict-latency 0.002
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import statistics
+import time
+import typing as t
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+
+import httpx
+
+from core.models import Message, MessageType
+from core.sandbox import AppDirectory
+from core.sessions import HashRing, session_metrics
+from local.fakes import FakeDict, FakeSandboxes
+from local.harness import build_local_app, percentile
+
+ROUTINGS = ("random", "affinity")
+
+
+@dataclass
+class Replica:
+    name: str
+    web_app: t.Any
+    app_directory: AppDirectory
+    client: httpx.AsyncClient
+
+    async def shutdown(self) -> None:
+        # What the controller's shutdown handler does: write buffered saves, then hand sessions over.
+        await self.app_directory.stop_write_behind()
+        self.web_app.state.sessions.clear()
+        await self.client.aclose()
+
+
+def _overhead() -> tuple[dict[str, int], dict[str, float]]:
+    """Edits and total overhead so far, by session outcome, out of `modal_vibe_edit_overhead_ms`."""
+    metrics = session_metrics.edit_overhead
+    return {key: sum(counts) for key, counts in metrics._counts.items()}, dict(metrics._sums)
+
+
+async def _create(client: httpx.AsyncClient, prompt: str) -> str:
+    response = await client.post("/api/create", json={"prompt": prompt})
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    while True:
+        job = (await client.get(f"/api/create/{job_id}")).json()
+        if job["status"] == "succeeded":
+            return job["app_id"]
+        if job["status"] in ("failed", "cancelled"):
+            raise RuntimeError(f"Creating an app failed: {job}")
+        await asyncio.sleep(0.02)
+
+
+async def _pad_history(fake_dict: FakeDict, app_ids: list[str], messages: int) -> None:
+    """Give every app a longer chat, as apps that have been edited for a while have."""
+    app_directory = AppDirectory(fake_dict, None, None)
+    await app_directory.load()
+    for app_id in app_ids:
+        sandbox_app = await app_directory.get_app(app_id)
+        sandbox_app.data.message_history += [
+            Message(content=f"Earlier message {i} about what the app should do next", type=MessageType.USER if i % 2 == 0 else MessageType.ASSISTANT)
+            for i in range(messages)
+        ]
+        sandbox_app.metadata.updated_at = datetime.now()
+        await app_directory.set_app(sandbox_app)
+
+
+async def run(routing: str, args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    fake_dict = FakeDict(latency=args.dict_latency)
+    fake_sandboxes = FakeSandboxes()
+    fake_sandboxes.start()
+    replicas: dict[str, Replica] = {}
+    try:
+        for i in range(args.replicas):
+            web_app, app_directory, _ = build_local_app(
+                dict_latency=args.dict_latency, transport=args.transport, fake_dict=fake_dict, fake_sandboxes=fake_sandboxes,
+            )
+            await app_directory.load()
+            if args.write_behind_ms > 0:
+                app_directory.start_write_behind(args.write_behind_ms / 1000)
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=web_app), base_url=f"http://replica-{i}", timeout=60)
+            replicas[f"replica-{i}"] = Replica(f"replica-{i}", web_app, app_directory, client)
+
+        first = next(iter(replicas.values()))
+        # One at a time: creates racing on the catalogue's read-modify-write can drop each other's entry.
+        app_ids = [await _create(first.client, f"A tiny app number {i}") for i in range(args.apps)]
+        await _pad_history(fake_dict, app_ids, args.history)
+
+        ring = HashRing(replicas)
+        latencies: list[float] = []
+        errors: Counter[str] = Counter()
+        checkouts_before = Counter(session_metrics.checkouts)
+        counts_before, sums_before = _overhead()
+
+        async def edit(app_id: str, step: int) -> None:
+            name = ring.owner(app_id) if routing == "affinity" else rng.choice(sorted(replicas))
+            start = time.perf_counter()
+            response = await replicas[name].client.post(f"/api/app/{app_id}/write", json={"text": f"Edit number {step}"})
+            if response.status_code != 200:
+                errors[f"http_{response.status_code}"] += 1
+                return
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        for step in range(args.edits):
+            if step == args.edits // 2 and args.replicas > 1:
+                # Scale down: the replica stops getting traffic, then shuts down.
+                leaving = replicas.pop(sorted(replicas)[-1])
+                ring = HashRing(replicas)
+                await leaving.shutdown()
+            await asyncio.gather(*[edit(app_id, step) for app_id in app_ids])
+        elapsed = time.perf_counter() - start
+
+        for replica in replicas.values():
+            await replica.shutdown()
+        counts_after, sums_after = _overhead()
+        overhead = {
+            outcome: (sums_after[outcome] - sums_before.get(outcome, 0.0)) / (count - counts_before.get(outcome, 0))
+            for outcome, count in counts_after.items()
+            if count > counts_before.get(outcome, 0)
+        }
+        edits = sum(count - counts_before.get(outcome, 0) for outcome, count in counts_after.items())
+        total_overhead = sum(sums_after.values()) - sum(sums_before.values())
+
+        # Every edit adds the instruction and its explanation to the history.
+        check = AppDirectory(fake_dict, None, None)
+        await check.load()
+        expected = 2 + args.history + 2 * args.edits
+        lost = 0
+        for app_id in app_ids:
+            sandbox_app = await check.get_app(app_id)
+            lost += (expected - len(sandbox_app.data.message_history)) // 2
+        return {
+            "checkouts": Counter(session_metrics.checkouts) - checkouts_before,
+            "overhead": overhead,
+            "mean_overhead": total_overhead / edits if edits else 0.0,
+            "latencies": sorted(latencies),
+            "errors": errors,
+            "lost": lost,
+            "elapsed": elapsed,
+        }
+    finally:
+        for replica in replicas.values():
+            if not replica.client.is_closed:
+                await replica.shutdown()
+        fake_sandboxes.stop()
+
+
+async def _main(args: argparse.Namespace) -> int:
+    print(
+        f"{args.replicas} replicas (one scaled down halfway), {args.apps} apps x {args.edits} edits, "
+        f"{args.history} earlier messages, dict latency {args.dict_latency * 1000:g}ms, write-behind {args.write_behind_ms:g}ms"
+    )
+    print(f"{'routing':<9} {'warm':>6} {'overhead ms':>12} {'warm ms':>8} {'cold ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} {'lost':>5}")
+    failed = False
+    for routing in args.routing:
+        # The controllers log every save and edit; keep the report readable.
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = await run(routing, args)
+        checkouts = result["checkouts"]
+        warm = checkouts["warm"] / max(1, sum(checkouts.values()))
+        latencies = result["latencies"] or [0.0]
+        cold = [result["overhead"][outcome] for outcome in ("cold", "stale", "busy") if outcome in result["overhead"]]
+        print(
+            f"{routing:<9} {warm:>6.0%} {result['mean_overhead']:>12.2f} {result['overhead'].get('warm', 0.0):>8.2f} "
+            f"{statistics.mean(cold) if cold else 0.0:>8.2f} {percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f} "
+            f"{sum(result['errors'].values()):>7} {result['lost']:>5}"
+        )
+        print(f"          sessions: " + ", ".join(f"{outcome}: {count}" for outcome, count in checkouts.most_common()))
+        checked = routing == "affinity" or args.write_behind_ms <= 0
+        if result["errors"] or (checked and result["lost"]):
+            print(f"  ❌ {sum(result['errors'].values())} failed and {result['lost']} lost edits")
+            failed = True
+    return 1 if failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, default=4)
+    parser.add_argument("--apps", type=int, default=40)
+    parser.add_argument("--edits", type=int, default=20, help="Edits per app")
+    parser.add_argument("--history", type=int, default=50, help="Messages each app's chat starts with")
+    parser.add_argument("--dict-latency", type=float, default=0.002, help="Fake Modal Dict latency per call")
+    parser.add_argument("--write-behind-ms", type=float, default=200.0, help="Buffer app saves this long, as the controller does by default; 0 writes through")
+    parser.add_argument("--transport", choices=("http", "fake"), default="http", help="How the controllers reach the fake sandboxes")
+    parser.add_argument("--routing", nargs="+", choices=ROUTINGS, default=list(ROUTINGS))
+    parser.add_argument("--seed", type=int, default=0)
+    raise SystemExit(asyncio.run(_main(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Catalogue listing benchmark.
+
+Builds a `CatalogueIndex` over a synthetic catalogue and times a rebuild, first and deep page
+queries for each sort and filter, and single-app upserts, so listing latency can be checked
+at catalogue sizes we don't have in production yet.
+
+It also compares the memory the controller holds per app, one `AppMetadata` plus a copy of its
+raw catalogue entry against a `CatalogueStore` plus fingerprints, and the time to serve a
+`/api/apps` page body from each, or from the serialized page cache.
+
+    python -m local.bench_catalogue --num-apps 10000 100000
+"""
+
+import argparse
+import gc
+import json
+import pickle
+import random
+import statistics
+import time
+import tracemalloc
+import typing as t
+from datetime import datetime, timedelta, timezone
+
+from core.catalogue import CatalogueIndex, CatalogueStore, SerializedPages
+from core.models import AppMetadata, AppStatus
+from core.responses import EncodedBody
+from core.sandbox import _fingerprint
+from core.thumbnails import thumbnail_url
+
+
+def _synthetic_apps(num_apps: int, seed: int = 0) -> dict[str, AppMetadata]:
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    apps = {}
+    for i in range(num_apps):
+        created_at = now - timedelta(seconds=rng.randint(0, 90 * 24 * 3600))
+        app_id = f"sb-{i:08d}"
+        apps[app_id] = AppMetadata(
+            id=app_id,
+            created_at=created_at,
+            updated_at=created_at + timedelta(seconds=rng.randint(0, 3600)),
+            status=rng.choice(list(AppStatus)),
+            sandbox_user_tunnel_url=f"https://{app_id}.example.com",
+            title=f"Synthetic app number {i}",
+            is_featured=rng.random() < 0.01,
+            component_hash=f"{rng.getrandbits(96):024x}",
+        )
+    return apps
+
+
+def _allocated_mb(build: t.Callable[[], t.Any]) -> tuple[t.Any, float]:
+    gc.collect()
+    tracemalloc.start()
+    built = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return built, size / 1e6
+
+
+def _time_ms(fn, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _report(name: str, timings: list[float]) -> None:
+    print(f"{name:<40} median {statistics.median(timings):8.3f} ms   max {max(timings):8.3f} ms")
+
+
+def _bench_store(apps: dict[str, AppMetadata], index: CatalogueIndex, repeat: int) -> None:
+    # Both are built from a freshly unpickled catalogue, like `AppDirectory.load` gets from the Dict.
+    blob = pickle.dumps({app_id: metadata.model_dump() for app_id, metadata in apps.items()})
+
+    def _models():
+        # What the directory held before CatalogueStore: validated models and raw entries.
+        entries = pickle.loads(blob)
+        return {app_id: AppMetadata.model_validate(entry) for app_id, entry in entries.items()}, entries
+
+    def _store():
+        entries = pickle.loads(blob)
+        return CatalogueStore(AppMetadata.model_validate(entry) for entry in entries.values()), {
+            app_id: _fingerprint(entry) for app_id, entry in entries.items()
+        }
+
+    (models, _), models_mb = _allocated_mb(_models)
+    (store, _), store_mb = _allocated_mb(_store)
+    print(f"{'memory, AppMetadata + raw entries':<40} {models_mb:8.1f} MB   {models_mb * 1e6 / len(apps):6.0f} B/app")
+    print(f"{'memory, CatalogueStore + fingerprints':<40} {store_mb:8.1f} MB   {store_mb * 1e6 / len(apps):6.0f} B/app")
+
+    app_ids = index.query(sort="featured", limit=200).app_ids
+
+    def _page_from_models():
+        page = {
+            app_id: {
+                "url": models[app_id].sandbox_user_tunnel_url,
+                "title": models[app_id].title,
+                "is_featured": models[app_id].is_featured,
+                "thumbnail_url": thumbnail_url(models[app_id].component_hash),
+            }
+            for app_id in app_ids
+        }
+        return json.dumps({"apps": page}, separators=(",", ":")).encode()
+
+    def _page_from_store():
+        page = {}
+        for app_id in app_ids:
+            url, title, is_featured, component_hash = store.summary(app_id)
+            page[app_id] = {"url": url, "title": title, "is_featured": is_featured, "thumbnail_url": thumbnail_url(component_hash)}
+        return json.dumps({"apps": page}, separators=(",", ":")).encode()
+
+    pages = SerializedPages()
+    key = ("featured", None, None, None, 200)
+    pages.put(store.version, key, EncodedBody(_page_from_store(), "application/json"))
+    _report("/api/apps body, 200 apps, AppMetadata", _time_ms(_page_from_models, repeat))
+    _report("/api/apps body, 200 apps, CatalogueStore", _time_ms(_page_from_store, repeat))
+    _report("/api/apps body, 200 apps, cached", _time_ms(lambda: pages.get(store.version, key), repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-apps", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    for num_apps in args.num_apps:
+        print(f"--- {num_apps} apps")
+        _bench(num_apps, args.repeat)
+
+
+def _bench(num_apps: int, repeat: int) -> None:
+    apps = _synthetic_apps(num_apps)
+    index = CatalogueIndex()
+    _report(f"rebuild ({num_apps} apps)", _time_ms(lambda: index.rebuild(apps), 3))
+
+    for sort in ("featured", "updated_at", "created_at"):
+        _report(f"first page, sort={sort}", _time_ms(lambda: index.query(sort=sort), repeat))
+
+    cursor = None
+    for _ in range(100):
+        cursor = index.query(sort="updated_at", cursor=cursor).next_cursor
+    _report("page 101, sort=updated_at", _time_ms(lambda: index.query(sort="updated_at", cursor=cursor), repeat))
+    _report("first page, featured=true", _time_ms(lambda: index.query(featured=True), repeat))
+    _report(
+        "first page, status=active, featured=false",
+        _time_ms(lambda: index.query(status=AppStatus.ACTIVE, featured=False), repeat),
+    )
+
+    ids = list(apps)
+    now = datetime.now(timezone.utc)
+
+    def _touch():
+        metadata = apps[random.choice(ids)]
+        metadata.updated_at = now
+        index.upsert(metadata)
+
+    _report("upsert", _time_ms(_touch, repeat))
+    _bench_store(apps, index, repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Cold-start benchmark for sandbox images.
+
+Boots sandboxes from the base `sandbox_image` and, if one has been built with
+`modal run main.py::build_warm_sandbox_image`, from the warm snapshot image, and reports
+how long each takes until the user tunnel serves its first byte.
+
+    modal run -m local.bench_cold_start --num-sandboxes 5
+"""
+
+import asyncio
+import statistics
+import time
+
+import httpx
+import modal
+
+from main import WARM_SANDBOX_IMAGE_KEY, apps_dict, sandbox_image
+
+app = modal.App(name="modal-vibe-cold-start-bench")
+
+
+async def _time_to_first_byte(url: str, start: float, timeout: float = 300.0) -> float:
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        while time.time() - start < timeout:
+            try:
+                async with client.stream("GET", url) as response:
+                    if response.status_code == 200:
+                        async for _ in response.aiter_bytes():
+                            return time.time() - start
+            except Exception:
+                pass
+            await asyncio.sleep(0.25)
+    raise TimeoutError(f"{url} did not serve a byte within {timeout}s")
+
+
+async def _boot_once(image: modal.Image, sandbox_app: modal.App) -> dict[str, float]:
+    start = time.time()
+    sb = await modal.Sandbox.create.aio(
+        "/bin/bash",
+        "/root/startup.sh",
+        image=image,
+        app=sandbox_app,
+        timeout=600,
+        encrypted_ports=[8000, 5173],
+    )
+    created = time.time() - start
+    try:
+        tunnels = await sb.tunnels.aio()
+        tunneled = time.time() - start
+        first_byte = await _time_to_first_byte(tunnels[5173].url, start)
+        return {"create": created, "tunnels": tunneled, "first_byte": first_byte}
+    finally:
+        await sb.terminate.aio()
+
+
+def _report(name: str, runs: list[dict[str, float]]) -> None:
+    print(f"\n{name} ({len(runs)} sandboxes)")
+    for stage in ("create", "tunnels", "first_byte"):
+        values = sorted(run[stage] for run in runs)
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        print(f"  {stage:<11} p50={statistics.median(values):6.2f}s  p95={p95:6.2f}s  max={values[-1]:6.2f}s")
+
+
+@app.local_entrypoint()
+async def main(num_sandboxes: int = 5):
+    sandbox_app = await modal.App.lookup.aio("modal-vibe-cold-start-bench", create_if_missing=True)
+
+    images = {"base": sandbox_image}
+    warm_image_id = await apps_dict.get.aio(WARM_SANDBOX_IMAGE_KEY)
+    if warm_image_id:
+        images["warm snapshot"] = modal.Image.from_id(warm_image_id)
+    else:
+        print("No warm sandbox image found, only benchmarking the base image")
+
+    for name, image in images.items():
+        runs = await asyncio.gather(*[_boot_once(image, sandbox_app) for _ in range(num_sandboxes)])
+        _report(name, runs)
@@ -0,0 +1,334 @@
+"""Micro-benchmarks of the controller's hot paths, with baselines to catch regressions.
+
+Times each path per call, and measures the memory a single call allocates at its peak, against
+an in-memory Modal Dict at every `--apps` catalogue size and `--history` chat length:
+
+- `AppMetadata` and `AppData` (with its `Message` history) dumps and validation;
+- the edit and explanation prompts of core/prompt.py;
+- `AppDirectory.load`, `get_app`, `set_app` (written through, and buffered by write-behind) and
+  `remove_app`;
+- projecting a catalogue page into the `/api/apps` and home page summaries.
+
+`--save-baseline` writes the results to `--baseline`; later runs compare against it and exit
+non-zero if any path got more than `--threshold` slower, or allocates more than
+`--alloc-threshold` more, than in the baseline. Paths that should not depend on the catalogue
+size also fail if they are more than `--max-growth` times slower at the largest size than at the
+smallest, which catches a new O(N) step without a baseline. Baselines are only comparable on the
+same machine, so keep them out of the repo and save one on the machine that gates.
+
+    python -m local.bench_hot_paths --save-baseline
+    python -m local.bench_hot_paths --threshold 0.4
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import inspect
+import json
+import os
+import pickle
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import typing as t
+from dataclasses import dataclass
+
+from core.models import AppData, AppMetadata, Message, MessageType
+from core.prompt import explain_followup_edit_prompt, followup_edit_prompt
+from core.sandbox import AppDirectory, SandboxApp
+from core.search import SEARCH_INDEX_KEY
+from core.thumbnails import thumbnail_url
+from local.bench_catalogue import _synthetic_apps
+from local.fakes import FakeDict
+
+DEFAULT_BASELINE = ".benchmarks/hot_paths.json"
+COMPONENT = "export default function LLMComponent() {\n" + "  return <div className=\"p-4\">Hello</div>;\n" * 40 + "}\n"
+# Timings this close to the baseline are noise however large the relative change.
+MIN_DELTA_US = 2.0
+MIN_DELTA_BYTES = 4096
+
+
+def _reference() -> t.Any:
+    """Fixed work that doesn't touch this repo's code, to tell how fast the machine is right now."""
+    payload = [{"id": f"sb-{i:08d}", "title": f"App {i}", "views": i * 7 % 1000} for i in range(1000)]
+    return sorted(pickle.loads(pickle.dumps(payload)), key=lambda app: (app["views"], app["id"]))
+
+
+@dataclass
+class Case:
+    name: str
+    run: t.Callable[[], t.Any]
+    reset: t.Optional[t.Callable[[], t.Any]] = None  # Runs untimed before every call.
+    size_independent: bool = False  # Fails if it slows down with the catalogue size.
+
+
+async def _call(fn: t.Callable[[], t.Any]) -> None:
+    result = fn()
+    if inspect.isawaitable(result):
+        await result
+
+
+async def _time_us(case: Case, min_time: float, repeat: int) -> float:
+    """Fastest per-call time of `repeat` batches, each at least `min_time` seconds long.
+
+    The fastest batch is the one least disturbed by the rest of the machine and, as with `timeit`,
+    the garbage collector is off while timing so that its pauses don't land on whichever path
+    happens to be running.
+    """
+    gc.collect()
+    gc.disable()
+    try:
+        number = 1
+        while True:
+            elapsed = await _batch(case, number)
+            if elapsed >= min_time or number >= 1_000_000:
+                break
+            number *= 2 if elapsed > min_time / 10 else 10
+        timings = [await _batch(case, number) / number for _ in range(repeat)]
+    finally:
+        gc.enable()
+    return min(timings) * 1e6
+
+
+async def _batch(case: Case, number: int) -> float:
+    elapsed = 0.0
+    for _ in range(number):
+        if case.reset is not None:
+            await _call(case.reset)
+        start = time.perf_counter()
+        await _call(case.run)
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+async def _peak_bytes(case: Case) -> int:
+    """Memory allocated at the peak of one call, above what was allocated before it."""
+    if case.reset is not None:
+        await _call(case.reset)
+    await _call(case.run)  # Warm caches and lazy imports first.
+    if case.reset is not None:
+        await _call(case.reset)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        await _call(case.run)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return max(0, peak - before)
+
+
+def _message(i: int) -> Message:
+    text = f"Make the buttons {['bigger', 'rounder', 'green', 'animated'][i % 4]} and add a counter for step {i}. " * 3
+    return Message(content=text, type=MessageType.USER if i % 2 == 0 else MessageType.ASSISTANT)
+
+
+def _app_data(app_id: str, metadata: AppMetadata, history: int) -> AppData:
+    return AppData(
+        id=app_id,
+        message_history=[_message(i) for i in range(history)],
+        current_component=COMPONENT,
+        sandbox_tunnel_url="",
+        sandbox_user_tunnel_url=metadata.sandbox_user_tunnel_url,
+        sandbox_object_id=app_id,
+    )
+
+
+def _model_cases(history_sizes: list[int]) -> list[Case]:
+    metadata = next(iter(_synthetic_apps(1).values()))
+    metadata_dict = metadata.model_dump()
+    cases = [
+        Case("AppMetadata.model_dump", metadata.model_dump),
+        Case("AppMetadata.model_validate", lambda: AppMetadata.model_validate(metadata_dict)),
+        Case("explain_followup_edit_prompt", lambda: explain_followup_edit_prompt("Make it blue", COMPONENT, COMPONENT)),
+    ]
+    for history in history_sizes:
+        data = _app_data(metadata.id, metadata, history)
+        data_dict = data.model_dump()
+        messages = data.message_history
+        cases += [
+            Case(f"AppData.model_dump[history={history}]", data.model_dump),
+            Case(f"AppData.model_validate[history={history}]", lambda data_dict=data_dict: AppData.model_validate(data_dict)),
+            Case(
+                f"followup_edit_prompt[history={history}]",
+                lambda messages=messages: followup_edit_prompt("Make it blue", COMPONENT, messages),
+            ),
+        ]
+    return cases
+
+
+async def _directory_cases(num_apps: int, history: int) -> tuple[list[Case], t.Callable[[], t.Awaitable[None]]]:
+    """Cases against a catalogue of `num_apps` apps, and a coroutine that tears them down."""
+    apps = _synthetic_apps(num_apps)
+    fake_dict = FakeDict()
+    fake_dict.data["catalogue"] = pickle.dumps({app_id: metadata.model_dump() for app_id, metadata in apps.items()})
+    app_id = next(iter(apps))
+    data = _app_data(app_id, apps[app_id], history)
+    fake_dict._put(f"app_{app_id}", data.model_dump())
+
+    directory = AppDirectory(fake_dict, None, None)
+    await directory.load()
+    # As a deployed catalogue would have it, so load reads the index rather than rebuilding it.
+    fake_dict._put(SEARCH_INDEX_KEY, directory.search.dumps())
+    await directory.load()
+    buffered = AppDirectory(fake_dict, None, None)
+    await buffered.load()
+    buffered.start_write_behind(3600)
+
+    sandbox_app = SandboxApp(app_id, None, apps[app_id], data)
+    removed_id = list(apps)[-1]
+    removed_app = SandboxApp(removed_id, None, apps[removed_id], _app_data(removed_id, apps[removed_id], history))
+
+    def page_projection() -> dict:
+        # What the home page and /api/apps build for a page (see `_page` in main.py).
+        page = directory.list_apps(sort="featured", limit=24)
+        summaries = {}
+        for page_app_id in page.app_ids:
+            url, title, is_featured, component_hash = directory.apps.summary(page_app_id)
+            summaries[page_app_id] = {"url": url, "title": title, "is_featured": is_featured, "thumbnail_url": thumbnail_url(component_hash)}
+        return {"apps": summaries, "next_cursor": page.next_cursor, "total": page.total}
+
+    async def restore_removed() -> None:
+        if removed_id not in directory.apps:
+            await directory.set_app(removed_app)
+
+    async def stop() -> None:
+        await buffered.write_behind.discard(list(buffered.write_behind.pending))
+        await buffered.stop_write_behind()
+
+    size = f"apps={num_apps}"
+    cases = [
+        Case(f"AppDirectory.load[{size}]", directory.load),
+        Case(f"AppDirectory.get_app[{size},history={history}]", lambda: directory.get_app(app_id), size_independent=True),
+        Case(f"AppDirectory.set_app[{size},history={history}]", lambda: directory.set_app(sandbox_app)),
+        Case(f"AppDirectory.set_app.buffered[{size},history={history}]", lambda: buffered.set_app(sandbox_app)),
+        Case(f"AppDirectory.remove_app[{size}]", lambda: directory.remove_app(removed_id), reset=restore_removed),
+        Case(f"page_projection[{size}]", page_projection, size_independent=True),
+    ]
+    return cases, stop
+
+
+def _compare(results: dict[str, dict], baseline: dict[str, dict], speed: float, threshold: float, alloc_threshold: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        expected = base["us"] * speed
+        if result["us"] > expected * (1 + threshold) and result["us"] - expected > MIN_DELTA_US:
+            regressions.append(f"{name}: {expected:.1f}us -> {result['us']:.1f}us ({result['us'] / expected - 1:+.0%})")
+        if result["peak_bytes"] > base["peak_bytes"] * (1 + alloc_threshold) and result["peak_bytes"] - base["peak_bytes"] > MIN_DELTA_BYTES:
+            regressions.append(f"{name}: peak {base['peak_bytes'] / 1024:.1f}KB -> {result['peak_bytes'] / 1024:.1f}KB")
+    return regressions
+
+
+def _growth(results: dict[str, dict], cases: dict[str, Case], app_sizes: list[int], max_growth: float) -> list[str]:
+    """Size-independent paths that are much slower at the largest catalogue than at the smallest."""
+    smallest, largest = f"apps={min(app_sizes)}", f"apps={max(app_sizes)}"
+    failures = []
+    for name, case in cases.items():
+        if not case.size_independent or largest not in name:
+            continue
+        small = results.get(name.replace(largest, smallest))
+        if small and results[name]["us"] > small["us"] * max_growth and results[name]["us"] - small["us"] > MIN_DELTA_US:
+            failures.append(f"{name}: {results[name]['us'] / small['us']:.1f}x slower than at {smallest}")
+    return failures
+
+
+async def _main(args: argparse.Namespace) -> int:
+    results: dict[str, dict] = {}
+    cases: dict[str, Case] = {}
+    print(f"{'path':<58} {'us/call':>10} {'peak KB':>9} {'baseline':>10}")
+
+    baseline: dict[str, dict] = {}
+    baseline_reference_us = 0.0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        baseline, baseline_reference_us = saved["cases"], saved["reference_us"]
+    # The whole machine gets faster and slower from one run to the next, so baseline timings are
+    # scaled by how long the same reference work takes now compared to when they were recorded.
+    references: list[float] = []
+    reference = Case("reference", _reference)
+
+    def speed() -> float:
+        return statistics.median(references) / baseline_reference_us if baseline else 1.0
+
+    async def measure(case: Case) -> None:
+        cases[case.name] = case
+        base = baseline.get(case.name)
+        # AppDirectory logs every load, save and removal; keep the report readable.
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            us = await _time_us(case, args.min_time, args.repeat)
+            # Re-time what looks slower than the baseline before calling it a regression.
+            for _ in range(args.retries):
+                if base is None or us <= base["us"] * speed() * (1 + args.threshold):
+                    break
+                references.append(await _time_us(reference, args.min_time, args.repeat))
+                us = min(us, await _time_us(case, args.min_time, args.repeat))
+            results[case.name] = {"us": us, "peak_bytes": await _peak_bytes(case)}
+        change = f"{results[case.name]['us'] / (base['us'] * speed()) - 1:+.0%}" if base else "-"
+        print(f"{case.name:<58} {results[case.name]['us']:>10.1f} {results[case.name]['peak_bytes'] / 1024:>9.1f} {change:>10}")
+
+    references.append(await _time_us(reference, args.min_time, args.repeat))
+    for case in _model_cases(args.history):
+        await measure(case)
+    for num_apps in args.apps:
+        references.append(await _time_us(reference, args.min_time, args.repeat))
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            directory_cases, stop = await _directory_cases(num_apps, max(args.history))
+        try:
+            for case in directory_cases:
+                await measure(case)
+        finally:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                await stop()
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "machine": platform.platform(),
+                    "reference_us": statistics.median(references),
+                    "cases": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Saved baseline of {len(results)} paths to {args.baseline}")
+
+    failures = _growth(results, cases, args.apps, args.max_growth)
+    if baseline:
+        print(f"Machine speed against the baseline: {1 / speed():.2f}x")
+        failures += _compare(results, baseline, speed(), args.threshold, args.alloc_threshold)
+    elif not args.save_baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+    for failure in failures:
+        print(f"❌ {failure}")
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", type=int, nargs="+", default=[1000, 10000], help="Catalogue sizes")
+    parser.add_argument("--history", type=int, nargs="+", default=[10, 100], help="Chat history lengths")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed batches per path; the fastest is reported")
+    parser.add_argument("--min-time", type=float, default=0.05, help="Seconds each timed batch runs for at least")
+    parser.add_argument("--retries", type=int, default=2, help="Times to re-time a path that looks slower than the baseline")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Record this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.4, help="Allowed slowdown against the baseline")
+    parser.add_argument("--alloc-threshold", type=float, default=0.1, help="Allowed growth of peak allocations against the baseline")
+    parser.add_argument("--max-growth", type=float, default=3.0, help="Allowed slowdown of size-independent paths across catalogue sizes")
+    raise SystemExit(asyncio.run(_main(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""HTML page and listing benchmark.
+
+Runs the real controller in-process against the local fakes, with a synthetic catalogue and one app
+with a long chat history, and requests the gallery (`/`), that app's editor (`/app/{id}`) and a
+listing page (`/api/apps`) from `--concurrency` clients at once, in each encoding. Reports bytes
+per page view, request latency, and how often and for how long the server rendered templates.
+
+`--churn-every N` edits the app every N requests, which changes both the catalogue's and the
+app's version, so cached pages are rendered again.
+
+    python -m local.bench_pages --num-apps 5000 --history 40 --concurrency 50 --requests 2000
+"""
+
+import argparse
+import asyncio
+import pickle
+import statistics
+import time
+from datetime import datetime
+
+import httpx
+
+from core.models import Message, MessageType
+from core.responses import brotli
+from core.tracing import tracer
+from local.bench_catalogue import _synthetic_apps
+from local.harness import build_local_app
+
+ENCODINGS = ("identity", "gzip", "br")
+
+
+def _message(i: int) -> dict:
+    text = f"Make the buttons {['bigger', 'rounder', 'green', 'animated'][i % 4]} and add a counter for step {i}. " * 4
+    return Message(content=text, type=MessageType.USER if i % 2 == 0 else MessageType.ASSISTANT).model_dump()
+
+
+async def _populate(fake_dict, num_apps: int, history: int) -> str:
+    apps = _synthetic_apps(num_apps)
+    fake_dict.data["catalogue"] = pickle.dumps({app_id: metadata.model_dump() for app_id, metadata in apps.items()})
+    app_id = next(iter(apps))
+    await fake_dict.put.aio(f"app_{app_id}", {
+        "id": app_id,
+        "message_history": [_message(i) for i in range(history)],
+        "current_component": "export default function App() { return null }",
+        "sandbox_tunnel_url": "",
+        "sandbox_user_tunnel_url": apps[app_id].sandbox_user_tunnel_url,
+        "sandbox_object_id": app_id,
+    })
+    return app_id
+
+
+async def _run(client: httpx.AsyncClient, app_directory, app_id: str, path: str, encoding: str, args) -> dict:
+    latencies: list[float] = []
+    sizes: list[int] = []
+    next_request = 0
+
+    async def worker() -> None:
+        nonlocal next_request
+        while next_request < args.requests:
+            next_request += 1
+            if args.churn_every and next_request % args.churn_every == 0:
+                app = await app_directory.get_app(app_id)
+                app.metadata.updated_at = datetime.now()
+                await app_directory.set_app(app)
+            start = time.perf_counter()
+            # Read the body as sent, so the client doesn't spend this process's CPU decompressing it.
+            async with client.stream("GET", path, headers={"accept-encoding": encoding}) as response:
+                response.raise_for_status()
+                sizes.append(sum([len(chunk) async for chunk in response.aiter_raw()]))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    with tracer.capture() as captured:
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    renders = captured.get_finished_spans("render_template")
+    latencies.sort()
+    return {
+        "bytes": statistics.mean(sizes),
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "renders": len(renders),
+        "render_ms": statistics.mean(span.duration_ms for span in renders) if renders else 0.0,
+    }
+
+
+async def _main(args: argparse.Namespace) -> None:
+    web_app, app_directory, fake_sandboxes = build_local_app()
+    try:
+        app_id = await _populate(app_directory.apps_dict, args.num_apps, args.history)
+        await app_directory.load()
+        paths = {"home": "/", "app": f"/app/{app_id}", "listing": "/api/apps?limit=24"}
+        encodings = [encoding for encoding in ENCODINGS if encoding != "br" or brotli is not None]
+        print(
+            f"{args.num_apps} apps, {args.history} messages, {args.concurrency} concurrent clients, "
+            f"{args.requests} requests per row, churn every {args.churn_every or 'never'}"
+        )
+        if brotli is None:
+            print("brotli is not installed, skipping br")
+        print(f"{'page':<8} {'encoding':<9} {'bytes/view':>11} {'p50 ms':>8} {'p95 ms':>8} {'renders':>8} {'render ms':>10}")
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=web_app), base_url="http://controller") as client:
+            for name, path in paths.items():
+                for encoding in encodings:
+                    result = await _run(client, app_directory, app_id, path, encoding, args)
+                    print(
+                        f"{name:<8} {encoding:<9} {result['bytes']:>11.0f} {result['p50']:>8.2f} {result['p95']:>8.2f} "
+                        f"{result['renders']:>8} {result['render_ms']:>10.2f}"
+                    )
+    finally:
+        await app_directory.stop_write_behind()
+        fake_sandboxes.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-apps", type=int, default=5000)
+    parser.add_argument("--history", type=int, default=40, help="Messages in the benchmarked app's chat history")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per page and encoding")
+    parser.add_argument("--churn-every", type=int, default=0, help="Edit the app every N requests; 0 never does")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
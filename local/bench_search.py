@@ -0,0 +1,68 @@
+"""Full-text search benchmark.
+
+Indexes a corpus of synthetic apps whose titles and edit instructions come from
+`local/generate_prompts.py`, then times queries, incremental updates and a save/load
+round trip of the compacted index.
+
+    python -m local.bench_search --num-apps 50000
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from core.search import SearchIndex
+from local.generate_prompts import generate_ideas, qualifiers
+
+
+def _report(name: str, timings: list[float]) -> None:
+    print(f"{name:<36} median {statistics.median(timings):8.3f} ms   p95 {statistics.quantiles(timings, n=20)[-1]:8.3f} ms")
+
+
+def _time_ms(fn, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-apps", type=int, default=50000)
+    parser.add_argument("--edits-per-app", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(0)
+    titles = generate_ideas(args.num_apps, seed=0)
+    documents = {
+        f"sb-{i:08d}": "\n".join([title, *random.sample(qualifiers, random.randint(0, args.edits_per_app))])
+        for i, title in enumerate(titles)
+    }
+
+    index = SearchIndex()
+    start = time.perf_counter()
+    for app_id, text in documents.items():
+        index.upsert(app_id, text)
+    print(f"indexed {len(index)} apps in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    queries = [" ".join(random.sample(title.split(), 2)) for title in random.sample(titles, args.repeat)]
+    queries_iter = iter(queries * 2)
+    _report("search (2 terms)", _time_ms(lambda: index.search(next(queries_iter)), args.repeat))
+    _report("search 'gay notebooks'", _time_ms(lambda: index.search("gay notebooks"), args.repeat))
+
+    ids = list(documents)
+    _report("upsert (edit)", _time_ms(lambda: index.upsert(random.choice(ids), random.choice(titles)), args.repeat))
+
+    blob = index.dumps()
+    print(f"persisted index: {len(blob) / 1024:.0f} KiB")
+    _report("dumps", _time_ms(index.dumps, 5))
+    _report("loads", _time_ms(lambda: SearchIndex.loads(blob), 5))
+    _report("sync_from_blob (refresh, unchanged)", _time_ms(lambda: index.sync_from_blob(blob), 5))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Cold start benchmark for the controller and worker functions.
+
+Starts each function in a fresh interpreter against the local fakes, with a catalogue of
+`--num-apps` apps in a fake Dict, and reports how long each startup phase takes (see
+core/startup.py). Each function runs in the modes it can be deployed in:
+
+- `eager`: everything after the process starts, hydrating the catalogue before serving, as the
+  controller used to.
+- `deferred`: everything after the process starts, hydrating the catalogue in the background.
+- `snapshot`: only what runs after the memory snapshot point; imports, preloads and building the
+  web app are done before it and restored rather than rerun.
+
+`ready`, `first_app_page` and `first_list` are measured from the start of the process, or from the
+snapshot point, so they are how long the first request to each waits on a cold container.
+
+    python -m local.bench_startup --num-apps 10000 --dict-latency 0.02 --repeat 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import statistics
+import subprocess
+import sys
+import time
+
+FUNCTIONS = {
+    "controller": ("eager", "deferred", "snapshot"),
+    "create_sandbox_app_job": ("deferred", "snapshot"),
+    "clean_up_dead_apps": ("deferred", "snapshot"),
+}
+
+
+def _since(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+def _populated_dict(num_apps: int, dict_latency: float):
+    from local.bench_catalogue import _synthetic_apps
+    from local.fakes import FakeDict
+
+    fake_dict = FakeDict(latency=dict_latency)
+    apps = _synthetic_apps(num_apps)
+    fake_dict.data["catalogue"] = pickle.dumps({app_id: metadata.model_dump() for app_id, metadata in apps.items()})
+    first_id = next(iter(apps))
+    fake_dict._put(f"app_{first_id}", {
+        "id": first_id,
+        "message_history": [],
+        "current_component": "export default function App() { return null }",
+        "sandbox_tunnel_url": "",
+        "sandbox_user_tunnel_url": apps[first_id].sandbox_user_tunnel_url,
+        "sandbox_object_id": first_id,
+    })
+    return fake_dict, first_id
+
+
+async def _lifespan_startup(web_app) -> asyncio.Task:
+    """Run the app's startup handlers like uvicorn would, returning the task that runs shutdown."""
+    started = asyncio.Event()
+    messages: asyncio.Queue = asyncio.Queue()
+    messages.put_nowait({"type": "lifespan.startup"})
+
+    async def send(message: dict) -> None:
+        if message["type"] == "lifespan.startup.complete":
+            started.set()
+        elif message["type"] == "lifespan.startup.failed":
+            raise RuntimeError(message.get("message"))
+
+    task = asyncio.create_task(web_app({"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}, messages.get, send))
+    await started.wait()
+    task.messages = messages
+    return task
+
+
+async def _controller(mode: str, num_apps: int, dict_latency: float, phases: dict, offset_ms: float) -> None:
+    import httpx
+
+    from core.llm import LLMGateway
+    from core.sandbox import AppDirectory
+    from core.startup import startup
+    from local.fakes import FakeLLMClient
+    from main import create_web_app
+
+    fake_dict, app_id = _populated_dict(num_apps, dict_latency)
+    web_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "web")
+
+    start = time.perf_counter()
+    app_directory = AppDirectory(fake_dict, None, LLMGateway(FakeLLMClient()))
+
+    async def start_create_job(job_id: str) -> None:
+        pass
+
+    web_app = create_web_app(app_directory, start_create_job, web_dir=web_dir)
+    if mode == "snapshot":
+        start = time.perf_counter()
+    else:
+        phases["build_web_app"] = _since(start)
+    startup.resumed()
+
+    if mode == "eager":
+        await app_directory.load()
+    lifespan = await _lifespan_startup(web_app)
+    phases["ready"] = offset_ms + _since(start)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=web_app), base_url="http://controller") as client:
+        async def first(path: str) -> float:
+            response = await client.get(path)
+            response.raise_for_status()
+            return offset_ms + _since(start)
+
+        phases["first_app_page"], phases["first_list"] = await asyncio.gather(first(f"/app/{app_id}"), first("/api/apps"))
+    await app_directory.ready()
+    lifespan.messages.put_nowait({"type": "lifespan.shutdown"})
+    await lifespan
+
+
+async def _create_sandbox_app_job(mode: str, num_apps: int, dict_latency: float, phases: dict, offset_ms: float) -> None:
+    from main import llm_client
+
+    # The first LLM call constructs the client, importing the SDK unless the snapshot preloaded it.
+    start = time.perf_counter()
+    llm_client.provider.messages
+    phases["first_llm_client"] = _since(start)
+
+
+async def _clean_up_dead_apps(mode: str, num_apps: int, dict_latency: float, phases: dict, offset_ms: float) -> None:
+    from core.sandbox import AppDirectory
+    from main import llm_client
+
+    fake_dict, _ = _populated_dict(num_apps, dict_latency)
+    start = time.perf_counter()
+    await AppDirectory(fake_dict, None, llm_client).load()
+    phases["hydrate_catalogue"] = _since(start)
+
+
+def _child(function: str, mode: str, num_apps: int, dict_latency: float) -> None:
+    start = time.perf_counter()
+    if mode == "snapshot" and function == "create_sandbox_app_job":
+        os.environ["PRELOAD_MODULES"] = "anthropic"
+    import main  # noqa: F401
+
+    phases: dict[str, float] = {}
+    if mode != "snapshot":
+        phases["import"] = _since(start)
+    runner = {"controller": _controller, "create_sandbox_app_job": _create_sandbox_app_job, "clean_up_dead_apps": _clean_up_dead_apps}[function]
+    asyncio.run(runner(mode, num_apps, dict_latency, phases, phases.get("import", 0.0)))
+    print(json.dumps(phases))
+
+
+def _run_child(function: str, mode: str, num_apps: int, dict_latency: float) -> dict[str, float]:
+    output = subprocess.run(
+        [sys.executable, "-m", "local.bench_startup", "--child", function, mode, "--num-apps", str(num_apps), "--dict-latency", str(dict_latency)],
+        check=True,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PRELOAD_MODULES": ""},
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _interpreter_ms(repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        timings.append(_since(start))
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-apps", type=int, default=10000)
+    parser.add_argument("--dict-latency", type=float, default=0.02, help="Fake Modal Dict latency per call")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--function", choices=sorted(FUNCTIONS), nargs="+", default=list(FUNCTIONS))
+    parser.add_argument("--child", nargs=2, metavar=("FUNCTION", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(*args.child, args.num_apps, args.dict_latency)
+        return
+
+    print(f"{args.num_apps} apps, {args.dict_latency * 1000:.0f}ms per Dict call, median of {args.repeat} runs")
+    print(f"Python interpreter start, not included below: {_interpreter_ms(args.repeat):.0f}ms")
+    for function in args.function:
+        modes = FUNCTIONS[function]
+        runs = {mode: [_run_child(function, mode, args.num_apps, args.dict_latency) for _ in range(args.repeat)] for mode in modes}
+        phase_names = list(dict.fromkeys(phase for mode in modes for run in runs[mode] for phase in run))
+        print(f"\n{function:<24}" + "".join(f"{mode:>12}" for mode in modes))
+        for phase in phase_names:
+            cells = []
+            for mode in modes:
+                values = [run[phase] for run in runs[mode] if phase in run]
+                cells.append(f"{statistics.median(values):>10.0f}ms" if values else f"{'-':>12}")
+            print(f"  {phase:<22}" + "".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""In-process stand-ins for Modal Dicts, the Anthropic client and sandboxes.
+
+They let `create_web_app` from `main.py` run on a laptop or in CI without any network access
+beyond localhost. Every fake takes injectable latencies so load tests can model slow dependencies.
+"""
+
+import asyncio
+import hashlib
+import pickle
+import socket
+import threading
+import time
+import typing as t
+import uuid
+from collections import Counter
+from types import SimpleNamespace
+
+from core.tracing import tracer
+from core.transport import SandboxTransport
+
+
+class _FakeMethod:
+    """Mimics a Modal method: call it directly for the blocking version, or use `.aio` from async code."""
+
+    def __init__(self, fn: t.Callable, latency: float):
+        self._fn = fn
+        self._latency = latency
+
+    def __call__(self, *args, **kwargs):
+        if self._latency:
+            time.sleep(self._latency)
+        return self._fn(*args, **kwargs)
+
+    async def aio(self, *args, **kwargs):
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        return self._fn(*args, **kwargs)
+
+
+class _FakeIterMethod(_FakeMethod):
+    """Like `_FakeMethod`, for methods that stream their results, e.g. `async for key in d.keys.aio()`."""
+
+    async def aio(self, *args, **kwargs):
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        for item in self._fn(*args, **kwargs):
+            yield item
+
+
+class FakeDict:
+    """In-memory `modal.Dict`. Values are pickled on the way in and out, like the real thing."""
+
+    def __init__(self, latency: float = 0.0):
+        self.data: dict[t.Any, bytes] = {}
+        self.reads = 0
+        self.writes = 0
+        self.get = _FakeMethod(self._get, latency)
+        self.put = _FakeMethod(self._put, latency)
+        self.pop = _FakeMethod(self._pop, latency)
+        self.contains = _FakeMethod(self._contains, latency)
+        self.update = _FakeMethod(self._update, latency)
+        self.len = _FakeMethod(lambda: len(self.data), latency)
+        self.keys = _FakeIterMethod(lambda: list(self.data), latency)
+        self.items = _FakeIterMethod(self._items, latency)
+
+    def _get(self, key, default=None):
+        self.reads += 1
+        if key not in self.data:
+            return default
+        return pickle.loads(self.data[key])
+
+    def _put(self, key, value, skip_if_exists: bool = False) -> bool:
+        self.writes += 1
+        if skip_if_exists and key in self.data:
+            return False
+        self.data[key] = pickle.dumps(value)
+        return True
+
+    def _pop(self, key):
+        self.writes += 1
+        return pickle.loads(self.data.pop(key))
+
+    def _items(self) -> list[tuple]:
+        self.reads += 1
+        return [(key, pickle.loads(value)) for key, value in self.data.items()]
+
+    def _contains(self, key) -> bool:
+        self.reads += 1
+        return key in self.data
+
+    def _update(self, other=None, **kwargs) -> None:
+        self.writes += 1
+        for key, value in {**(other or {}), **kwargs}.items():
+            self.data[key] = pickle.dumps(value)
+
+    def __contains__(self, key) -> bool:
+        return self._contains(key)
+
+    def __getitem__(self, key):
+        if key not in self.data:
+            raise KeyError(key)
+        return self._get(key)
+
+    def __setitem__(self, key, value) -> None:
+        self._put(key, value)
+
+    def __delitem__(self, key) -> None:
+        self._pop(key)
+
+
+FAKE_COMPONENT = """import React from 'react';
+export default function LLMComponent() {{
+    return (
+        <div className="bg-blue-500 text-white p-8 min-h-screen">
+            <h1 className="text-4xl font-bold">Fake component {digest}</h1>
+        </div>
+    )
+}}
+"""
+
+
+class FakeAPIError(Exception):
+    """Carries a `status_code` like the Anthropic SDK's `APIStatusError`, e.g. 429 or 529 (overloaded)."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Fake API error {status_code}")
+        self.status_code = status_code
+
+
+class _FakeMessages:
+    def __init__(self, client: "FakeLLMClient"):
+        self._client = client
+        self.batches = _FakeBatches(client)
+
+    async def create(self, model: str, messages: list[dict], max_tokens: int, temperature: float = 1.0, **kwargs):
+        self._client.calls += 1
+        self._client.calls_by_model[model] += 1
+        failure = self._client.next_failure(model)
+        if failure == "hang":
+            await asyncio.sleep(3600)
+        await asyncio.sleep(self._client.latency.get(model, self._client.default_latency))
+        if isinstance(failure, int):
+            raise FakeAPIError(failure)
+        return self._client.respond(model, messages[-1]["content"], max_tokens)
+
+
+async def _iterate(items: list) -> t.AsyncIterator:
+    for item in items:
+        yield item
+
+
+class _FakeBatches:
+    """Message Batches: every request is answered at submission, and the batch ends after `batch_latency`."""
+
+    def __init__(self, client: "FakeLLMClient"):
+        self._client = client
+        self._batches: dict[str, tuple[float, list]] = {}
+
+    async def create(self, requests: list[dict]):
+        self._client.batches += 1
+        results = []
+        for request in requests:
+            params = request["params"]
+            self._client.calls_by_model[params["model"]] += 1
+            failure = self._client.next_failure(params["model"])
+            if failure == "hang":
+                result = SimpleNamespace(type="expired")
+            elif isinstance(failure, int):
+                result = SimpleNamespace(type="errored", error=SimpleNamespace(type="api_error", message=str(FakeAPIError(failure))))
+            else:
+                message = self._client.respond(params["model"], params["messages"][-1]["content"], params["max_tokens"])
+                result = SimpleNamespace(type="succeeded", message=message)
+            results.append(SimpleNamespace(custom_id=request["custom_id"], result=result))
+        batch_id = f"msgbatch_fake_{uuid.uuid4().hex[:12]}"
+        self._batches[batch_id] = (time.monotonic() + self._client.batch_latency, results)
+        return await self.retrieve(batch_id)
+
+    async def retrieve(self, batch_id: str):
+        ends_at, _ = self._batches[batch_id]
+        return SimpleNamespace(id=batch_id, processing_status="ended" if time.monotonic() >= ends_at else "in_progress")
+
+    async def results(self, batch_id: str) -> t.AsyncIterator:
+        return _iterate(self._batches[batch_id][1])
+
+
+class FakeLLMClient:
+    """Deterministic stand-in for `AsyncAnthropic`: the same prompt and model always give the same text.
+
+    `failures` scripts what the next calls to a model do, in order: a status code to raise
+    `FakeAPIError` with, "hang" to never answer (so the gateway's timeout fires), or None to succeed.
+    In a Message Batch those become an errored or expired result.
+    """
+
+    def __init__(
+        self,
+        default_latency: float = 0.0,
+        latency: t.Optional[dict[str, float]] = None,
+        failures: t.Optional[dict[str, list]] = None,
+        batch_latency: float = 0.0,
+    ):
+        self.default_latency = default_latency
+        self.latency = latency or {}
+        self.failures = failures or {}
+        self.batch_latency = batch_latency
+        self.calls = 0
+        self.batches = 0
+        self.calls_by_model: Counter[str] = Counter()
+        self.messages = _FakeMessages(self)
+
+    def next_failure(self, model: str) -> t.Optional[t.Union[int, str]]:
+        scripted = self.failures.get(model)
+        return scripted.pop(0) if scripted else None
+
+    def respond(self, model: str, prompt: str, max_tokens: int) -> SimpleNamespace:
+        digest = hashlib.sha256(f"{model}:{prompt}".encode()).hexdigest()[:12]
+        # Explanations are requested with a tiny token budget; everything else is a component.
+        text = f"Done! ({digest})" if max_tokens <= 256 else FAKE_COMPONENT.format(digest=digest)
+        return SimpleNamespace(
+            model=model,
+            content=[SimpleNamespace(type="text", text=text)],
+            usage=SimpleNamespace(input_tokens=len(prompt) // 4, output_tokens=len(text) // 4),
+        )
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeSandboxes:
+    """Serves `/edit`, `/heartbeat` and `/metrics` for any number of fake sandboxes from one localhost server.
+
+    Pass `start_sandbox` to `SandboxApp.create` in place of `run_sandbox_server_with_tunnel`. `transport`
+    reaches the same sandboxes without HTTP, like `ExecTransport` does real ones.
+    """
+
+    def __init__(self, create_latency: float = 0.0, edit_latency: float = 0.0):
+        self.create_latency = create_latency
+        self.edit_latency = edit_latency
+        self.components: dict[str, str] = {}
+        self.terminated: set[str] = set()
+        self.port = _free_port()
+        self._server = None
+        self._thread: t.Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> None:
+        import uvicorn
+        from fastapi import FastAPI
+        from pydantic import BaseModel
+
+        sandbox_server = FastAPI()
+
+        class EditRequest(BaseModel):
+            component: str
+
+        @sandbox_server.post("/{sandbox_id}/edit")
+        async def edit(sandbox_id: str, request: EditRequest):
+            return await self.edit(sandbox_id, request.component)
+
+        @sandbox_server.get("/{sandbox_id}/metrics")
+        async def metrics(sandbox_id: str):
+            from fastapi.responses import PlainTextResponse
+
+            return PlainTextResponse(self.metrics(sandbox_id))
+
+        @sandbox_server.get("/{sandbox_id}/heartbeat")
+        async def heartbeat(sandbox_id: str):
+            return {"status": "ok"}
+
+        self._server = uvicorn.Server(uvicorn.Config(sandbox_server, host="127.0.0.1", port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+
+    async def edit(self, sandbox_id: str, component: str) -> dict:
+        if "export default" not in component:
+            return {"status": "error", "message": "Invalid component"}
+        await asyncio.sleep(self.edit_latency)
+        self.components[sandbox_id] = component
+        hmr = {"outcome": "ok", "duration_ms": self.edit_latency * 1000, "compile_ms": 0, "error": None, "served": True}
+        return {"status": "ok", "hmr": hmr}
+
+    def metrics(self, sandbox_id: str) -> str:
+        # Roughly one idle uvicorn + Vite pair, heavier once it has a component.
+        rss_bytes = 180_000_000 + len(self.components.get(sandbox_id, "")) * 1000
+        return (
+            f'sandbox_resident_memory_bytes{{process="vite"}} {rss_bytes}\n'
+            f'sandbox_cpu_seconds_total{{process="vite"}} {time.process_time():.2f}\n'
+            f"sandbox_open_connections 1\n"
+            f"sandbox_vite_clients 0\n"
+        )
+
+    async def start_sandbox(self, app=None, image=None) -> tuple[str, str, str]:
+        await asyncio.sleep(self.create_latency)
+        sandbox_id = f"sb-fake-{uuid.uuid4().hex[:12]}"
+        return f"{self.base_url}/{sandbox_id}", f"{self.base_url}/{sandbox_id}/user", sandbox_id
+
+    async def start_exec_sandbox(self, app=None, image=None) -> tuple[str, str, str]:
+        """Like `run_sandbox_with_exec_control`: no control tunnel, only the user-facing one."""
+        _, user_url, sandbox_id = await self.start_sandbox(app, image)
+        return "", user_url, sandbox_id
+
+    async def terminate_sandbox(self, sandbox_id: str) -> bool:
+        self.terminated.add(sandbox_id)
+        self.components.pop(sandbox_id, None)
+        return True
+
+
+class FakeSandboxTransport(SandboxTransport):
+    """Reaches `FakeSandboxes` in memory instead of over HTTP, standing in for `ExecTransport`.
+
+    Pass it to `AppDirectory` and create apps with `FakeSandboxes.start_exec_sandbox`.
+    """
+
+    name = "fake"
+
+    def __init__(self, sandboxes: FakeSandboxes):
+        self.sandboxes = sandboxes
+
+    async def push_component(self, data, component: str) -> dict:
+        with tracer.span("transport.fake.push_component", app_id=data.id, component_length=len(component)):
+            return await self.sandboxes.edit(data.sandbox_object_id, component)
+
+    async def is_alive(self, data) -> bool:
+        with tracer.span("transport.fake.is_alive", app_id=data.id):
+            return data.sandbox_object_id not in self.sandboxes.terminated
+
+    async def metrics(self, data) -> t.Optional[str]:
+        with tracer.span("transport.fake.metrics", app_id=data.id):
+            return self.sandboxes.metrics(data.sandbox_object_id)
@@ -1,5 +1,5 @@
 import random
-import pandas as pd
+import typing as t
 
 adjectives = [
     "smart", "eco-friendly", "social", "AI-powered", "blockchain-based", "augmented reality",
@@ -84,7 +84,7 @@ class WeightedRandomSelector:
     """
     A class that tracks usage of items and decreases their probability of being selected.
     """
-    def __init__(self, items, initial_weight=1.0, decay_factor=0.7):
+    def __init__(self, items, initial_weight=1.0, decay_factor=0.7, rng=None):
         """
         Initialize the selector with items and their weights.
         
@@ -92,53 +92,64 @@ class WeightedRandomSelector:
             items: List of items to select from
             initial_weight: Starting weight for each item (default 1.0)
             decay_factor: Factor to multiply weight by after each use (default 0.7)
+            rng: `random.Random` to draw from, so a seeded one gives the same picks every run
         """
-        self.items = items
-        self.weights = {item: initial_weight for item in items}
+        # Duplicates are one item, as they were when weights were keyed by item.
+        self.items = list(dict.fromkeys(items))
+        # Kept in step with `items` and updated in place, rather than rebuilt on every choice.
+        self.weights = [initial_weight] * len(self.items)
         self.decay_factor = decay_factor
         self.min_weight = 0.01  # Minimum weight to prevent items from being completely excluded
+        self.random = rng or random.Random()
     
     def choose(self):
         """
         Choose an item based on current weights and update its weight.
         """
-        # Get items and their current weights
-        items_list = list(self.weights.keys())
-        weights_list = list(self.weights.values())
-        
-        # Choose based on weights
-        chosen = random.choices(items_list, weights=weights_list, k=1)[0]
+        index = self.random.choices(range(len(self.items)), weights=self.weights, k=1)[0]
         
         # Decrease weight of chosen item
-        self.weights[chosen] = max(self.weights[chosen] * self.decay_factor, self.min_weight)
+        self.weights[index] = max(self.weights[index] * self.decay_factor, self.min_weight)
         
-        return chosen
+        return self.items[index]
     
     def reset_weights(self, weight=1.0):
         """Reset all weights to a specific value."""
-        for item in self.weights:
-            self.weights[item] = weight
+        self.weights = [weight] * len(self.items)
+
+def generate_ideas(num_ideas: int = 1000, seed: t.Optional[int] = None) -> list[str]:
+    """App ideas built from the word lists above; the same `seed` always gives the same ideas."""
+    rng = random.Random(seed)
+    adj_selector = WeightedRandomSelector(adjectives, decay_factor=0.8, rng=rng)
+    noun_selector = WeightedRandomSelector(nouns, decay_factor=0.8, rng=rng)
+    verb_selector = WeightedRandomSelector(verbs, decay_factor=0.75, rng=rng)
+    qualifier_selector = WeightedRandomSelector(qualifiers, decay_factor=0.7, rng=rng)
+
+    ideas = []
+    for i in range(num_ideas):
+        if i == 6:
+            ideas.append("Gay notebooks.") # Easter egg
+            continue
+        adj = adj_selector.choose()
+        noun1 = noun_selector.choose()
+        verb_phrase = verb_selector.choose()
+        noun2 = noun_selector.choose()
+        qualifier = qualifier_selector.choose()
+        idea = f"A {adj} {noun1} that {verb_phrase} your {noun2}. {qualifier}"
+        ideas.append(idea)
+    return ideas
 
-adj_selector = WeightedRandomSelector(adjectives, decay_factor=0.8)
-noun_selector = WeightedRandomSelector(nouns, decay_factor=0.8)
-verb_selector = WeightedRandomSelector(verbs, decay_factor=0.75)
-qualifier_selector = WeightedRandomSelector(qualifiers, decay_factor=0.7)
 
-ideas = []
-for i in range(1000):
-    if i == 6:
-        ideas.append("Gay notebooks.") # Easter egg
-        continue
-    adj = adj_selector.choose()
-    noun1 = noun_selector.choose()
-    verb_phrase = verb_selector.choose()
-    noun2 = noun_selector.choose()
-    qualifier = qualifier_selector.choose()
-    idea = f"A {adj} {noun1} that {verb_phrase} your {noun2}. {qualifier}"
-    ideas.append(idea)
+if __name__ == "__main__":
+    import argparse
 
-df = pd.DataFrame({"App Idea": ideas})
+    parser = argparse.ArgumentParser(description="Write app ideas to a prompts file, one per line.")
+    parser.add_argument("--num-ideas", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=None, help="Same seed, same ideas")
+    parser.add_argument("--output", default="prompts.txt")
+    args = parser.parse_args()
 
-with open("prompts.txt", "w") as f:
-    for idea in ideas:
-        f.write(idea + "\n")
\ No newline at end of file
+    ideas = generate_ideas(args.num_ideas, seed=args.seed)
+    with open(args.output, "w") as f:
+        for idea in ideas:
+            f.write(idea + "\n")
@@ -0,0 +1,454 @@
+"""Open-loop load test harness for the controller.
+
+Requests arrive as a Poisson process at `--rate` per second regardless of how fast the server
+answers, so queueing shows up as latency instead of silently lowering the offered load. Each
+arrival picks an operation from `--mix`:
+
+    create  POST /api/create, then poll GET /api/create/{job_id} until the app exists
+    write   POST /api/app/{id}/write
+    apps    GET  /api/apps
+    page    GET  / or GET /app/{id}
+
+Latency percentiles and an error taxonomy are reported per operation.
+
+Against a deployment:
+
+    python -m local.harness --url https://<workspace>--modal-vibe-fastapi-app.modal.run --rate 5 --duration 60
+
+Fully local, with a fake LLM, an in-memory Dict and fake sandboxes (no network needed):
+
+    python -m local.harness --local --rate 50 --duration 20 --llm-latency 0.2 --max-p95-ms 500
+
+`--trace` replays a workload trace from `local/workload.py` instead, sped up `--speedup` times:
+each session's edits go to the app it created, once that create has finished, and views of
+featured apps or popularity ranks go to the apps listed when the run starts and those created
+since.
+
+    python -m local.harness --local --trace trace.jsonl --speedup 10 --duration 60
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import typing as t
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+import httpx
+
+EDIT_INSTRUCTIONS = [
+    "Make the background dark blue",
+    "Add a button that shows a random fact",
+    "Use a bigger, bolder font for the title",
+    "Add a footer with a copyright notice",
+    "Make it look more playful",
+]
+
+DEFAULT_MIX = "create=1,write=4,apps=5,page=10"
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def classify_error(error: t.Optional[BaseException] = None, status_code: t.Optional[int] = None) -> str:
+    """Bucket a failure so the report shows what kind of errors happened, not just how many."""
+    if status_code is not None:
+        return f"http_{status_code}"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.ConnectError):
+        return "connect_error"
+    if isinstance(error, httpx.RemoteProtocolError):
+        return "protocol_error"
+    return type(error).__name__
+
+
+@dataclass
+class EndpointStats:
+    latencies_ms: list[float] = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+
+    @property
+    def count(self) -> int:
+        return len(self.latencies_ms) + sum(self.errors.values())
+
+    def summary(self) -> dict[str, float]:
+        values = sorted(self.latencies_ms)
+        return {
+            "ok": len(values),
+            "errors": sum(self.errors.values()),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": values[-1] if values else float("nan"),
+        }
+
+    def histogram(self, buckets_ms: t.Sequence[float] = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)) -> list[tuple[str, int]]:
+        counts = Counter()
+        for value in self.latencies_ms:
+            label = next((f"<={bucket:g}ms" for bucket in buckets_ms if value <= bucket), f">{buckets_ms[-1]:g}ms")
+            counts[label] += 1
+        labels = [f"<={bucket:g}ms" for bucket in buckets_ms] + [f">{buckets_ms[-1]:g}ms"]
+        return [(label, counts[label]) for label in labels if counts[label]]
+
+
+def read_trace(path: str) -> t.Iterator[dict]:
+    """Events of a `local/workload.py` trace, skipping its header. Read lazily, so traces can be large."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                event = json.loads(line)
+                if "type" not in event:
+                    yield event
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("create", "write", "apps", "page"):
+            raise ValueError(f"Unknown operation in mix: {name!r}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+class LoadHarness:
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        mix: dict[str, float],
+        rate: float,
+        duration: float,
+        prompts: t.Sequence[str],
+        seed: int = 0,
+    ):
+        self.client = client
+        self.mix = mix
+        self.rate = rate
+        self.duration = duration
+        self.prompts = prompts
+        self.random = random.Random(seed)
+        self.app_ids: list[str] = []
+        self.featured_ids: list[str] = []
+        # App each replayed session created, or None if its create failed.
+        self.sessions: dict[int, asyncio.Future] = {}
+        self.events = 0
+        self.stats: dict[str, EndpointStats] = {name: EndpointStats() for name in mix}
+
+    async def _timed(self, operation: str, method: str, url: str, record: bool = True, **kwargs) -> t.Optional[httpx.Response]:
+        """Send a request, counting failures against `operation` and, if `record`, its latency."""
+        stats = self.stats[operation]
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except Exception as e:
+            stats.errors[classify_error(error=e)] += 1
+            return None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if response.status_code >= 400:
+            stats.errors[classify_error(status_code=response.status_code)] += 1
+            return None
+        if record:
+            stats.latencies_ms.append(elapsed_ms)
+        return response
+
+    async def create(self, prompt: t.Optional[str] = None, poll_interval: float = 0.1) -> t.Optional[str]:
+        """Latency is measured until the create job has finished, not just until it was accepted.
+
+        Returns the new app's id, or None if the create failed."""
+        start = time.perf_counter()
+        response = await self._timed("create", "POST", "/api/create", record=False, json={"prompt": prompt or self.random.choice(self.prompts)})
+        if response is None:
+            return None
+        job_id = response.json()["job_id"]
+        while True:
+            response = await self._timed("create", "GET", f"/api/create/{job_id}", record=False)
+            if response is None:
+                return None
+            job = response.json()
+            if job["status"] == "succeeded":
+                self.stats["create"].latencies_ms.append((time.perf_counter() - start) * 1000)
+                self.app_ids.append(job["app_id"])
+                return job["app_id"]
+            if job["status"] in ("failed", "cancelled"):
+                self.stats["create"].errors[f"job_{job['status']}"] += 1
+                return None
+            await asyncio.sleep(poll_interval)
+
+    async def write(self, app_id: t.Optional[str] = None, text: t.Optional[str] = None) -> None:
+        if app_id is None and not self.app_ids:
+            self.stats["write"].errors["no_app_to_edit"] += 1
+            return
+        app_id = app_id or self.random.choice(self.app_ids)
+        await self._timed("write", "POST", f"/api/app/{app_id}/write", json={"text": text or self.random.choice(EDIT_INSTRUCTIONS)})
+
+    async def apps(self) -> None:
+        await self._timed("apps", "GET", "/api/apps")
+
+    async def page(self, app_id: t.Optional[str] = None) -> None:
+        if app_id is None and self.app_ids and self.random.random() < 0.5:
+            app_id = self.random.choice(self.app_ids)
+        await self._timed("page", "GET", f"/app/{app_id}" if app_id else "/")
+
+    async def _session_app(self, operation: str, session: int) -> t.Optional[str]:
+        """The app a replayed session created, waiting for its create to finish."""
+        if session not in self.sessions:
+            self.stats[operation].errors["session_not_started"] += 1
+            return None
+        app_id = await self.sessions[session]
+        if app_id is None:
+            self.stats[operation].errors["session_create_failed"] += 1
+        return app_id
+
+    async def _replay_event(self, event: dict) -> None:
+        operation = event["op"]
+        if operation == "create":
+            created = self.sessions[event["session"]] = asyncio.get_running_loop().create_future()
+            created.set_result(await self.create(prompt=event.get("prompt")))
+        elif operation == "write":
+            app_id = await self._session_app("write", event["session"])
+            if app_id is not None:
+                await self.write(app_id, event.get("text"))
+        elif operation == "apps":
+            await self.apps()
+        elif "session" in event:
+            app_id = await self._session_app("page", event["session"])
+            if app_id is not None:
+                await self.page(app_id)
+        elif "featured" in event and self.featured_ids:
+            await self.page(self.featured_ids[event["featured"] % len(self.featured_ids)])
+        elif "featured" in event or "rank" in event:
+            if not self.app_ids:
+                self.stats["page"].errors["no_app_to_view"] += 1
+                return
+            await self.page(self.app_ids[event.get("rank", event.get("featured")) % len(self.app_ids)])
+        else:
+            await self._timed("page", "GET", "/")
+
+    async def _discover_apps(self) -> None:
+        response = await self.client.get("/api/apps", params={"sort": "featured", "limit": 100})
+        if response.status_code == 200:
+            apps = response.json().get("apps", {})
+            self.app_ids.extend(apps.keys())
+            self.featured_ids.extend(app_id for app_id, app in apps.items() if app.get("is_featured"))
+
+    async def replay(self, events: t.Iterable[dict], speedup: float = 1.0) -> None:
+        """Send each event of a workload trace at its time, divided by `speedup`, for up to `duration` seconds."""
+        await self._discover_apps()
+        tasks: set[asyncio.Task] = set()
+        start = time.perf_counter()
+        for event in events:
+            at = event["t"] / speedup
+            if at > self.duration:
+                break
+            await asyncio.sleep(max(0.0, start + at - time.perf_counter()))
+            task = asyncio.create_task(self._replay_event(event))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            self.events += 1
+        await asyncio.gather(*tasks)
+        self.elapsed = time.perf_counter() - start
+
+    async def run(self) -> None:
+        response = await self.client.get("/api/apps")
+        if response.status_code == 200:
+            self.app_ids.extend(response.json().get("apps", {}).keys())
+
+        operations = list(self.mix)
+        weights = [self.mix[name] for name in operations]
+        tasks = []
+        start = time.perf_counter()
+        next_arrival = start
+        while next_arrival - start < self.duration:
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            operation = self.random.choices(operations, weights=weights, k=1)[0]
+            tasks.append(asyncio.create_task(getattr(self, operation)()))
+            next_arrival += self.random.expovariate(self.rate)
+        await asyncio.gather(*tasks)
+        self.elapsed = time.perf_counter() - start
+
+    def report(self) -> str:
+        lines = [f"{'operation':<8} {'count':>6} {'ok':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+        for name, stats in self.stats.items():
+            summary = stats.summary()
+            lines.append(
+                f"{name:<8} {stats.count:>6} {summary['ok']:>6} {summary['errors']:>6} "
+                f"{summary['p50']:>9.1f} {summary['p95']:>9.1f} {summary['p99']:>9.1f} {summary['max']:>9.1f}"
+            )
+        for name, stats in self.stats.items():
+            if stats.latencies_ms:
+                lines.append(f"{name} histogram: " + ", ".join(f"{label}: {count}" for label, count in stats.histogram()))
+            if stats.errors:
+                lines.append(f"{name} errors: " + ", ".join(f"{kind}: {count}" for kind, count in stats.errors.most_common()))
+        return "\n".join(lines)
+
+
+def build_local_app(
+    llm_latency: float = 0.0,
+    sandbox_create_latency: float = 0.0,
+    sandbox_edit_latency: float = 0.0,
+    dict_latency: float = 0.0,
+    transport: str = "http",
+    max_sandboxes: int = 0,
+    eviction_policy: str = "cost",
+    fake_dict=None,
+    fake_sandboxes=None,
+):
+    """Build the real controller app wired to fakes. Returns `(web_app, app_directory, fake_sandboxes)`.
+
+    `transport` is "http" to reach the fake sandboxes over localhost like `HttpTransport`, or
+    "fake" to call them in memory like `ExecTransport` (see core/transport.py).
+    `max_sandboxes` budgets live sandboxes like `MAX_SANDBOXES` does in production; 0 is unbounded.
+    Pass the `fake_dict` and started `fake_sandboxes` of another local app to build a replica of it,
+    as autoscaling would.
+    """
+    from core.capacity import CapacityManager, UsageStore, get_policy
+    from core.create_job import run_create_job
+    from core.resources import ResourceStore
+    from core.llm import LLMGateway
+    from core.sandbox import AppDirectory, SandboxApp
+    from core.thumbnails import PlaceholderRenderer, ThumbnailStore, render_and_store
+    from local.fakes import FakeDict, FakeLLMClient, FakeSandboxes, FakeSandboxTransport
+    from main import create_web_app
+
+    if fake_dict is None:
+        fake_dict = FakeDict(latency=dict_latency)
+    llm_client = LLMGateway(FakeLLMClient(default_latency=llm_latency))
+    if fake_sandboxes is None:
+        fake_sandboxes = FakeSandboxes(create_latency=sandbox_create_latency, edit_latency=sandbox_edit_latency)
+        fake_sandboxes.start()
+    sandbox_transport = FakeSandboxTransport(fake_sandboxes) if transport == "fake" else None
+    start_sandbox = fake_sandboxes.start_exec_sandbox if transport == "fake" else fake_sandboxes.start_sandbox
+    app_directory = AppDirectory(fake_dict, None, llm_client, transport=sandbox_transport)
+
+    thumbnail_store = ThumbnailStore(FakeDict(latency=dict_latency))
+
+    async def request_thumbnail(url: str, hash_: str) -> None:
+        asyncio.create_task(render_and_store(thumbnail_store, PlaceholderRenderer(), url, hash_))
+
+    async def on_created(sandbox_app: SandboxApp) -> None:
+        await request_thumbnail(sandbox_app.data.sandbox_user_tunnel_url, sandbox_app.metadata.component_hash)
+
+    def capacity() -> t.Optional[CapacityManager]:
+        if max_sandboxes <= 0:
+            return None
+        return CapacityManager(
+            max_sandboxes, get_policy(eviction_policy), UsageStore(fake_dict), ResourceStore(fake_dict),
+            stop_sandbox=fake_sandboxes.terminate_sandbox,
+            grace=timedelta(0),  # Runs last seconds, so every app would still be in the production grace period.
+        )
+
+    async def start_create_job(job_id: str) -> None:
+        # Each job runs with its own directory, like a separate worker container would.
+        asyncio.create_task(run_create_job(
+            fake_dict,
+            AppDirectory(fake_dict, None, llm_client, transport=sandbox_transport),
+            job_id,
+            image=None,
+            start_sandbox=start_sandbox,
+            stop_sandbox=fake_sandboxes.terminate_sandbox,
+            on_created=on_created,
+            poll_interval=0.05,
+            capacity=capacity(),
+        ))
+
+    web_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "web")
+    web_app = create_web_app(
+        app_directory,
+        start_create_job,
+        web_dir=web_dir,
+        thumbnail_store=thumbnail_store,
+        request_thumbnail=request_thumbnail,
+    )
+    return web_app, app_directory, fake_sandboxes
+
+
+async def _main(args: argparse.Namespace) -> int:
+    prompts_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core", "prompts.txt")
+    with open(prompts_path) as f:
+        prompts = [p.strip() for p in f if p.strip()]
+
+    fake_sandboxes = None
+    if args.local:
+        web_app, app_directory, fake_sandboxes = build_local_app(
+            llm_latency=args.llm_latency,
+            sandbox_create_latency=args.sandbox_create_latency,
+            sandbox_edit_latency=args.sandbox_edit_latency,
+            dict_latency=args.dict_latency,
+            transport=args.transport,
+            max_sandboxes=args.max_sandboxes,
+            eviction_policy=args.eviction_policy,
+        )
+        # httpx's ASGI transport doesn't run startup and shutdown events, so do their work here.
+        await app_directory.load()
+        if args.write_behind_ms > 0:
+            app_directory.start_write_behind(args.write_behind_ms / 1000)
+        web_app.state.usage.start()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=web_app), base_url="http://controller", timeout=args.timeout)
+    else:
+        if not args.url:
+            raise SystemExit("Pass --url or set API_URL, or use --local")
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+
+    try:
+        async with client:
+            if args.trace:
+                harness = LoadHarness(client, parse_mix(DEFAULT_MIX), args.rate, args.duration, prompts, seed=args.seed)
+                await harness.replay(read_trace(args.trace), speedup=args.speedup)
+            else:
+                harness = LoadHarness(client, parse_mix(args.mix), args.rate, args.duration, prompts, seed=args.seed)
+                await harness.run()
+    finally:
+        if fake_sandboxes is not None:
+            await app_directory.stop_write_behind()
+            await web_app.state.usage.stop()
+            fake_sandboxes.stop()
+
+    if args.trace:
+        print(f"Replayed {harness.events} events of {args.trace} at {args.speedup:g}x, finished in {harness.elapsed:.1f}s")
+    else:
+        print(f"Offered {args.rate}/s for {args.duration}s, finished in {harness.elapsed:.1f}s")
+    print(harness.report())
+
+    if args.max_p95_ms is not None:
+        regressed = [name for name, stats in harness.stats.items() if stats.summary()["p95"] > args.max_p95_ms]
+        if regressed:
+            print(f"❌ p95 above {args.max_p95_ms}ms for: {', '.join(regressed)}")
+            return 1
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("API_URL"), help="Controller base URL (defaults to $API_URL)")
+    parser.add_argument("--local", action="store_true", help="Run the controller in-process against fakes")
+    parser.add_argument("--rate", type=float, default=10.0, help="Mean arrivals per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to keep generating arrivals")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace", default=None, help="Replay this local/workload.py trace instead of --rate and --mix")
+    parser.add_argument("--speedup", type=float, default=1.0, help="With --trace: replay this many times faster than recorded")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Local mode: fake LLM latency per call")
+    parser.add_argument("--sandbox-create-latency", type=float, default=0.0, help="Local mode: fake sandbox boot time")
+    parser.add_argument("--sandbox-edit-latency", type=float, default=0.0, help="Local mode: fake sandbox /edit time")
+    parser.add_argument("--transport", choices=("http", "fake"), default="http", help="Local mode: how the controller reaches fake sandboxes")
+    parser.add_argument("--write-behind-ms", type=float, default=200.0, help="Local mode: buffer app saves this long; 0 writes through")
+    parser.add_argument("--dict-latency", type=float, default=0.0, help="Local mode: fake Modal Dict latency per call")
+    parser.add_argument("--max-sandboxes", type=int, default=0, help="Local mode: sandbox budget, evicting apps past it; 0 is unbounded")
+    parser.add_argument("--eviction-policy", choices=("lru", "lfu", "cost"), default="cost", help="Local mode: which apps go first")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="Exit non-zero if any operation's p95 exceeds this")
+    raise SystemExit(asyncio.run(_main(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 
+import os
+
 from core.llm import get_llm_client
 import modal
 from dotenv import load_dotenv
@@ -35,6 +37,9 @@ image = (
 
 app = modal.App(name="modal-vibe-loadtest", image=image)
 
+# Override with `--api-url` or the API_URL environment variable when launching the load test.
+DEFAULT_API_URL = os.getenv("API_URL", "https://modal-labs-joy-dev--modal-vibe-fastapi-app.modal.run")
+
 
 @app.function(
     image=image,
@@ -42,22 +47,42 @@ app = modal.App(name="modal-vibe-loadtest", image=image)
     timeout=3600,
 )
 @modal.concurrent(max_inputs=1000)
-async def make_create_app_request(prompt: str):
+async def make_create_app_request(prompt: str, api_url: str, idempotency_key: str, poll_interval: float = 2.0):
+    """Submit a create job and wait for it to finish. Retries reuse `idempotency_key`, so they
+    attach to the job already running instead of creating another app."""
+    import asyncio
     import httpx
 
-    API_URL = "https://modal-labs-joy-dev--modal-vibe-fastapi-app.modal.run"
     num_retries = 5
-    for i in range(num_retries):
-        try:
-            async with httpx.AsyncClient(timeout=300.0) as client:
-                response = await client.post(f"{API_URL}/api/create", json={"prompt": prompt})
+    last_error = None
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        for i in range(num_retries):
+            try:
+                response = await client.post(
+                    f"{api_url}/api/create", json={"prompt": prompt}, headers={"Idempotency-Key": idempotency_key}
+                )
+                response.raise_for_status()
+                job_id = response.json()["job_id"]
+                break
+            except Exception as e:
+                print(f"Create attempt {i + 1}/{num_retries} failed: {e!r}")
+                last_error = e
+        else:
+            raise Exception(f"Failed to create app after {num_retries} retries") from last_error
+
+        while True:
+            await asyncio.sleep(poll_interval)
+            try:
+                response = await client.get(f"{api_url}/api/create/{job_id}")
                 response.raise_for_status()
-                result = response.json()
-                app_id = result["app_id"]
-                return app_id
-        except Exception as e:
-            continue
-    raise Exception(f"Failed to create app after {num_retries} retries")
+            except Exception as e:
+                print(f"Polling create job {job_id} failed: {e!r}")
+                continue
+            job = response.json()
+            if job["status"] == "succeeded":
+                return job["app_id"]
+            if job["status"] in ("failed", "cancelled"):
+                raise Exception(f"Create job {job_id} {job['status']}: {job.get('error')}")
 
 
 @app.function(
@@ -66,9 +91,10 @@ async def make_create_app_request(prompt: str):
     timeout=3600,
 )
 @modal.concurrent(max_inputs=1000)
-async def create_app_loadtest_function(num_apps: int = 100):
+async def create_app_loadtest_function(num_apps: int = 100, api_url: str = DEFAULT_API_URL):
     import time
     import asyncio
+    import uuid
     from typing import Any
 
     start_time = time.time()
@@ -77,9 +103,8 @@ async def create_app_loadtest_function(num_apps: int = 100):
     app_buffers = 30
     effective_num = requested_num + app_buffers
 
-    API_URL = "https://modal-labs-joy-dev--modal-vibe-fastapi-app.modal.run"
-    if not API_URL:
-        raise ValueError("API_URL environment variable is not set")
+    if not api_url:
+        raise ValueError("api_url is not set")
 
     with open("/root/core/prompts.txt", "r") as f:
         prompts = [p.strip() for p in f if p.strip()]
@@ -89,6 +114,7 @@ async def create_app_loadtest_function(num_apps: int = 100):
 
     async def create_app_with_limit(prompt: str, index: int) -> Any | None:
         print(f"Creating app with prompt: {prompt}")
+        idempotency_key = uuid.uuid4().hex
         async with semaphore:
             delays = [0, 0.1, 0.5]  # seconds
             for attempt, delay in enumerate([0, *delays], start=1):
@@ -96,8 +122,8 @@ async def create_app_loadtest_function(num_apps: int = 100):
                     await asyncio.sleep(delay)
                 try:
                     return await asyncio.wait_for(
-                        make_create_app_request.remote.aio(prompt),
-                        timeout=30,
+                        make_create_app_request.remote.aio(prompt, api_url, idempotency_key),
+                        timeout=600,
                     )
                 except asyncio.TimeoutError:
                     if attempt == len(delays) + 1:
@@ -0,0 +1,258 @@
+"""Simulated traffic against the sandbox budget, comparing eviction policies.
+
+Generates one synthetic trace and replays it against each policy in core/capacity.py, through the
+real `CapacityManager`, `UsageTracker` and `AppDirectory` on an in-memory Dict with a simulated
+clock:
+
+- apps are created at `--creates-per-hour`, each with a memory footprint drawn from a log-normal;
+- page views follow a Zipf popularity over the apps created so far, and most apps are only popular
+  for a while after they are created (a per-app half-life), while some stay popular;
+- a fraction of views are followed by an edit;
+- `--featured` apps exist from the start and get a share of the views throughout.
+
+Views and edits of apps that were evicted, or never created because there was no room, are
+misses: those users would have seen a 404. The report has the hit ratios, how many apps each
+policy evicted and turned away, and how much sandbox memory the live apps held on average.
+
+The run fails if any policy evicts a featured app or one still in its grace period, or ends a
+create with more live sandboxes than the budget.
+
+    python -m local.sim_capacity --max-sandboxes 200 --hours 24 --creates-per-hour 20 --views-per-hour 2000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import math
+import random
+import statistics
+import typing as t
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from core.capacity import DEFAULT_GRACE, POLICIES, CapacityExceeded, CapacityManager, UsageStore, UsageTracker, get_policy
+from core.models import AppData, AppMetadata, AppResources, AppStatus
+from core.resources import RESOURCES_PREFIX, ResourceStore
+from core.sandbox import AppDirectory, SandboxApp
+from local.fakes import FakeDict
+
+START = datetime(2025, 1, 1)
+STEP = timedelta(minutes=5)  # Usage is flushed, and popularity recomputed, once per step.
+
+
+@dataclass
+class TraceApp:
+    app_id: str
+    created_at: datetime
+    rss_bytes: float
+    half_life_hours: float  # Infinite for apps that stay popular.
+    rank_weight: float
+    is_featured: bool = False
+
+    def weight(self, now: datetime) -> float:
+        age_hours = (now - self.created_at).total_seconds() / 3600
+        return self.rank_weight * math.pow(0.5, age_hours / self.half_life_hours)
+
+
+@dataclass
+class Event:
+    at: datetime
+    kind: str  # "create", "view" or "edit".
+    app: TraceApp
+
+
+def generate_trace(args: argparse.Namespace) -> tuple[list[TraceApp], list[Event]]:
+    rng = random.Random(args.seed)
+    apps: list[TraceApp] = []
+    events: list[Event] = []
+
+    def new_app(created_at: datetime, is_featured: bool = False) -> TraceApp:
+        rank = rng.randint(1, 10 * args.max_sandboxes)
+        evergreen = is_featured or rng.random() < args.evergreen
+        app = TraceApp(
+            app_id=f"sb-sim-{len(apps):06d}",
+            created_at=created_at,
+            rss_bytes=rng.lognormvariate(math.log(400 * 1024 ** 2), 0.5),
+            half_life_hours=math.inf if evergreen else rng.uniform(0.5, 12),
+            rank_weight=1 / rank ** args.zipf,
+            is_featured=is_featured,
+        )
+        apps.append(app)
+        return app
+
+    featured = [new_app(START, is_featured=True) for _ in range(args.featured)]
+    for app in featured:
+        events.append(Event(START, "create", app))
+
+    now = START
+    end = START + timedelta(hours=args.hours)
+    steps_per_hour = timedelta(hours=1) / STEP
+    while now < end:
+        step_events = []
+        for _ in range(_poisson(rng, args.creates_per_hour / steps_per_hour)):
+            app = new_app(now + STEP * rng.random())
+            step_events.append(Event(app.created_at, "create", app))
+        created = [app for app in apps if app.created_at <= now]
+        weights = [app.weight(now) for app in created]
+        featured_share = args.featured_share if featured else 0.0
+        for _ in range(_poisson(rng, args.views_per_hour / steps_per_hour)):
+            app = rng.choice(featured) if rng.random() < featured_share else rng.choices(created, weights)[0]
+            at = now + STEP * rng.random()
+            step_events.append(Event(at, "view", app))
+            if rng.random() < args.edit_ratio:
+                step_events.append(Event(at + timedelta(seconds=30), "edit", app))
+        events.extend(sorted(step_events, key=lambda event: event.at))
+        now += STEP
+    return apps, events
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    # Knuth's method; the means here are small.
+    limit, count, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def _sandbox_app(app: TraceApp) -> SandboxApp:
+    metadata = AppMetadata(
+        id=app.app_id,
+        created_at=app.created_at,
+        updated_at=app.created_at,
+        status=AppStatus.ACTIVE,
+        sandbox_user_tunnel_url=f"https://{app.app_id}.example.com",
+        title=f"Simulated app {app.app_id}",
+        is_featured=app.is_featured,
+    )
+    data = AppData(
+        id=app.app_id,
+        message_history=[],
+        current_component="export default function App() { return null }",
+        sandbox_tunnel_url="",
+        sandbox_user_tunnel_url=metadata.sandbox_user_tunnel_url,
+        sandbox_object_id=app.app_id,
+    )
+    return SandboxApp(app.app_id, None, metadata, data)
+
+
+async def replay(policy_name: t.Optional[str], apps: list[TraceApp], events: list[Event], args: argparse.Namespace) -> dict:
+    """Replay the trace with one policy, or with no budget at all if `policy_name` is None."""
+    fake_dict = FakeDict()
+    now = START
+
+    def clock() -> datetime:
+        return now
+
+    app_directory = AppDirectory(fake_dict, None, None)
+    await app_directory.load()
+    tracker = UsageTracker(UsageStore(fake_dict), clock=clock)
+    evicted: list[str] = []
+    violations: list[str] = []
+    created_at = {app.app_id: app.created_at for app in apps}
+
+    async def stop_sandbox(app_id: str) -> bool:
+        evicted.append(app_id)
+        if now - created_at[app_id] < DEFAULT_GRACE:
+            violations.append(f"app {app_id} was evicted {now - created_at[app_id]} after it was created")
+        return True
+
+    manager = None
+    if policy_name is not None:
+        manager = CapacityManager(
+            args.max_sandboxes, get_policy(policy_name), UsageStore(fake_dict), ResourceStore(fake_dict),
+            stop_sandbox=stop_sandbox, clock=clock,
+        )
+    resources: dict[str, dict] = {}
+    hits = {"view": 0, "edit": 0}
+    misses = {"view": 0, "edit": 0}
+    rejected = 0
+    held_bytes: list[float] = []
+    peak = 0
+    next_flush = START + STEP
+
+    for event in events:
+        now = event.at
+        while now >= next_flush:
+            await tracker.flush()
+            held_bytes.append(sum(resources[app_id]["rss_bytes_avg"] for app_id in app_directory.apps))
+            next_flush += STEP
+        if event.kind == "create":
+            if manager is not None:
+                try:
+                    await manager.make_room(app_directory)
+                except CapacityExceeded:
+                    rejected += 1
+                    continue
+            # The cleanup sweep would have scraped it within a minute of it booting.
+            resources[event.app.app_id] = AppResources(
+                app_id=event.app.app_id, scraped_at=now, samples=1,
+                rss_bytes=int(event.app.rss_bytes), rss_bytes_avg=event.app.rss_bytes, rss_bytes_max=int(event.app.rss_bytes),
+            ).model_dump()
+            await app_directory.set_app(_sandbox_app(event.app))
+            await fake_dict.put.aio(f"{RESOURCES_PREFIX}{event.app.app_id}", resources[event.app.app_id])
+            live = len(app_directory.apps)
+            peak = max(peak, live)
+            if manager is not None and live > args.max_sandboxes:
+                violations.append(f"{live} live sandboxes after creating {event.app.app_id}")
+        elif event.app.app_id in app_directory.apps:
+            hits[event.kind] += 1
+            tracker.view(event.app.app_id) if event.kind == "view" else tracker.edit(event.app.app_id)
+        else:
+            misses[event.kind] += 1
+
+    featured = {app.app_id for app in apps if app.is_featured}
+    violations.extend(f"featured app {app_id} was evicted" for app_id in evicted if app_id in featured)
+    return {
+        "views": hits["view"] / max(1, hits["view"] + misses["view"]),
+        "edits": hits["edit"] / max(1, hits["edit"] + misses["edit"]),
+        "evicted": len(evicted),
+        "rejected": rejected,
+        "peak": peak,
+        "held_gb": statistics.mean(held_bytes) / 1024 ** 3 if held_bytes else 0.0,
+        "violations": violations,
+    }
+
+
+async def _main(args: argparse.Namespace) -> int:
+    apps, events = generate_trace(args)
+    counts = {kind: sum(1 for event in events if event.kind == kind) for kind in ("create", "view", "edit")}
+    print(
+        f"{args.hours}h trace: {counts['create']} creates ({args.featured} featured), {counts['view']} views, "
+        f"{counts['edit']} edits; budget {args.max_sandboxes} sandboxes"
+    )
+    print(f"{'policy':<10} {'view hits':>10} {'edit hits':>10} {'evicted':>8} {'rejected':>9} {'peak':>6} {'avg GB held':>12}")
+    failed = False
+    for policy_name in [None, *args.policies]:
+        # AppDirectory logs every save and removal; keep the report readable.
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = await replay(policy_name, apps, events, args)
+        print(
+            f"{policy_name or 'unbounded':<10} {result['views']:>10.1%} {result['edits']:>10.1%} {result['evicted']:>8} "
+            f"{result['rejected']:>9} {result['peak']:>6} {result['held_gb']:>12.1f}"
+        )
+        for violation in result["violations"][:5]:
+            print(f"  ❌ {violation}")
+        failed = failed or bool(result["violations"])
+    return 1 if failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-sandboxes", type=int, default=200)
+    parser.add_argument("--policies", nargs="+", choices=sorted(POLICIES), default=list(POLICIES))
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--creates-per-hour", type=float, default=20)
+    parser.add_argument("--views-per-hour", type=float, default=2000)
+    parser.add_argument("--edit-ratio", type=float, default=0.05, help="Fraction of views followed by an edit")
+    parser.add_argument("--featured", type=int, default=12)
+    parser.add_argument("--featured-share", type=float, default=0.2, help="Fraction of views that go to featured apps")
+    parser.add_argument("--evergreen", type=float, default=0.1, help="Fraction of apps that stay popular")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Exponent of the popularity distribution")
+    parser.add_argument("--seed", type=int, default=0)
+    raise SystemExit(asyncio.run(_main(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
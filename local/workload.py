@@ -0,0 +1,208 @@
+"""Seeded workload traces for the load harness.
+
+Writes a JSONL trace of what users do over `--duration` seconds, one event per line, sorted by
+time, and streamed so that million-event traces never sit in memory:
+
+- Sessions arrive as a Poisson process at `--session-rate` per second. Each creates an app, opens
+  its editor, then makes a geometric number of follow-up edits (mean `--edits-mean`), each after a
+  log-normal think time (median `--think-median` seconds).
+- Page views of other apps arrive at `--view-rate` per second: `--featured-share` of them go to
+  one of `--featured` featured apps, the rest to the catalogue, both with Zipf popularity
+  (`--zipf`). `--home-share` and `--apps-share` of views load the gallery or `/api/apps` instead.
+- Arrivals are bursty: about `--bursts-per-hour` times an hour, every rate is multiplied by
+  `--burst-multiplier` for an exponentially distributed `--burst-length` seconds.
+
+Events are sampled a window at a time with numpy, so the same seed and options always give the
+same trace. The first line is a header with both. Apps are referred to by session (the app that
+session created), by featured index or by popularity rank; `python -m local.harness --trace`
+resolves those to the apps it knows about and replays the trace open-loop.
+
+    python -m local.workload --duration 3600 --session-rate 2 --view-rate 50 --seed 1 --output trace.jsonl
+    python -m local.workload --events 1000000 --output big.jsonl
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import sys
+import time
+import typing as t
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+from local.generate_prompts import generate_ideas, qualifiers
+
+WINDOW = 10.0  # Seconds sampled at a time.
+NUM_PROMPTS = 1000
+EDIT_VERBS = ["Add", "Use", "Try", "Give it", "Switch to", "Go for"]
+EDIT_INSTRUCTIONS = [
+    "Make the background dark blue",
+    "Add a button that shows a random fact",
+    "Use a bigger, bolder font for the title",
+    "Add a footer with a copyright notice",
+    "Make it look more playful",
+    "Fix the layout on small screens",
+    "Add a dark mode toggle",
+    "Show a loading spinner while it works",
+]
+
+
+@dataclass
+class WorkloadConfig:
+    seed: int = 0
+    duration: t.Optional[float] = 3600.0  # None keeps going, e.g. until enough events were read.
+    session_rate: float = 0.5
+    edits_mean: float = 4.0
+    think_median: float = 20.0
+    think_sigma: float = 0.8
+    view_rate: float = 10.0
+    featured: int = 12
+    featured_share: float = 0.3
+    home_share: float = 0.2
+    apps_share: float = 0.1
+    catalogue_size: int = 10000
+    zipf: float = 1.1
+    bursts_per_hour: float = 2.0
+    burst_length: float = 120.0
+    burst_multiplier: float = 5.0
+
+
+def zipf_cdf(size: int, exponent: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, size + 1, dtype=np.float64) ** exponent
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+class WorkloadGenerator:
+    def __init__(self, config: WorkloadConfig):
+        self.config = config
+        self.rng = np.random.default_rng(config.seed)
+        self.prompts = generate_ideas(NUM_PROMPTS, seed=config.seed)
+        self.edits = EDIT_INSTRUCTIONS + [f"{verb} {qualifier}" for verb in EDIT_VERBS for qualifier in qualifiers]
+        self.featured_cdf = zipf_cdf(max(1, config.featured), config.zipf)
+        self.catalogue_cdf = zipf_cdf(max(1, config.catalogue_size), config.zipf)
+        self.burst_until = 0.0
+        self.sessions = 0
+
+    def _multiplier(self, start: float) -> float:
+        """How much busier than usual the window starting at `start` is."""
+        config = self.config
+        if start >= self.burst_until and self.rng.random() < 1 - np.exp(-config.bursts_per_hour * WINDOW / 3600):
+            self.burst_until = start + self.rng.exponential(config.burst_length)
+        return config.burst_multiplier if start < self.burst_until else 1.0
+
+    def _arrivals(self, start: float, rate: float) -> np.ndarray:
+        count = self.rng.poisson(rate * WINDOW)
+        return np.sort(start + self.rng.random(count) * WINDOW)
+
+    def _sessions(self, start: float, multiplier: float) -> t.Iterator[tuple[float, dict]]:
+        config = self.config
+        starts = self._arrivals(start, config.session_rate * multiplier)
+        if not len(starts):
+            return
+        ids = np.arange(self.sessions, self.sessions + len(starts))
+        self.sessions += len(starts)
+        prompts = self.rng.integers(len(self.prompts), size=len(starts))
+        # Geometric number of edits, including zero, with the configured mean.
+        edits = self.rng.geometric(1 / (config.edits_mean + 1), size=len(starts)) - 1
+        thinks = self.rng.lognormal(np.log(config.think_median), config.think_sigma, size=int(edits.sum()))
+        texts = self.rng.integers(len(self.edits), size=len(thinks))
+        # Each session's edits are at its start plus the running sum of its own think times.
+        owners = np.repeat(np.arange(len(starts)), edits)
+        elapsed = np.cumsum(thinks)
+        before = np.concatenate(([0.0], elapsed))[np.cumsum(edits) - edits]
+        at = starts[owners] + elapsed - before[owners]
+
+        for session, session_start, prompt in zip(ids.tolist(), starts.tolist(), prompts.tolist()):
+            yield session_start, {"op": "create", "session": session, "prompt": self.prompts[prompt]}
+            yield session_start, {"op": "page", "session": session}
+        for session, edit_at, text in zip(ids[owners].tolist(), at.tolist(), texts.tolist()):
+            yield edit_at, {"op": "write", "session": session, "text": self.edits[text]}
+
+    def _views(self, start: float, multiplier: float) -> t.Iterator[tuple[float, dict]]:
+        config = self.config
+        at = self._arrivals(start, config.view_rate * multiplier)
+        featured_share = config.featured_share if config.featured else 0.0
+        shares = np.array([config.home_share, config.apps_share, featured_share, 0.0])
+        shares[3] = max(0.0, 1 - shares.sum())  # Everything else goes to the catalogue.
+        kinds = self.rng.choice(4, size=len(at), p=shares / shares.sum())
+        featured = np.searchsorted(self.featured_cdf, self.rng.random(len(at)))
+        ranks = np.searchsorted(self.catalogue_cdf, self.rng.random(len(at)))
+        for view_at, kind, featured_index, rank in zip(at.tolist(), kinds.tolist(), featured.tolist(), ranks.tolist()):
+            if kind == 0:
+                yield view_at, {"op": "page"}
+            elif kind == 1:
+                yield view_at, {"op": "apps"}
+            elif kind == 2:
+                yield view_at, {"op": "page", "featured": featured_index}
+            else:
+                yield view_at, {"op": "page", "rank": rank}
+
+    def events(self) -> t.Iterator[dict]:
+        """Every event of the trace, in time order."""
+        pending: list[tuple[float, int, dict]] = []
+        order = itertools.count()
+        duration = self.config.duration if self.config.duration is not None else float("inf")
+        start = 0.0
+        while start < duration:
+            multiplier = self._multiplier(start)
+            for at, event in itertools.chain(self._sessions(start, multiplier), self._views(start, multiplier)):
+                if at < duration:
+                    heapq.heappush(pending, (at, next(order), event))
+            start += WINDOW
+            # Later windows only add events after `start`, so everything before it is final.
+            while pending and pending[0][0] < start:
+                at, _, event = heapq.heappop(pending)
+                yield {"t": round(at, 3), **event}
+
+
+def write_trace(config: WorkloadConfig, out: t.TextIO, max_events: t.Optional[int] = None) -> dict[str, int]:
+    out.write(json.dumps({"type": "header", "generator": "local.workload", "config": asdict(config)}) + "\n")
+    counts: dict[str, int] = {}
+    for event in itertools.islice(WorkloadGenerator(config).events(), max_events):
+        out.write(json.dumps(event, separators=(",", ":")) + "\n")
+        counts[event["op"]] = counts.get(event["op"], 0) + 1
+    return counts
+
+
+def main() -> None:
+    defaults = WorkloadConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="-", help="Trace file, or - for stdout")
+    parser.add_argument("--events", type=int, default=None, help="Stop after this many events")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--duration", type=float, default=defaults.duration, help="Seconds of traffic")
+    parser.add_argument("--session-rate", type=float, default=defaults.session_rate, help="Edit sessions starting per second")
+    parser.add_argument("--edits-mean", type=float, default=defaults.edits_mean, help="Mean follow-up edits per session")
+    parser.add_argument("--think-median", type=float, default=defaults.think_median, help="Median seconds between a session's edits")
+    parser.add_argument("--think-sigma", type=float, default=defaults.think_sigma, help="Log-normal sigma of think times")
+    parser.add_argument("--view-rate", type=float, default=defaults.view_rate, help="Views of other apps and the gallery per second")
+    parser.add_argument("--featured", type=int, default=defaults.featured, help="Number of featured apps")
+    parser.add_argument("--featured-share", type=float, default=defaults.featured_share)
+    parser.add_argument("--home-share", type=float, default=defaults.home_share)
+    parser.add_argument("--apps-share", type=float, default=defaults.apps_share)
+    parser.add_argument("--catalogue-size", type=int, default=defaults.catalogue_size, help="Popularity ranks views are spread over")
+    parser.add_argument("--zipf", type=float, default=defaults.zipf, help="Exponent of app popularity")
+    parser.add_argument("--bursts-per-hour", type=float, default=defaults.bursts_per_hour)
+    parser.add_argument("--burst-length", type=float, default=defaults.burst_length, help="Mean seconds a burst lasts")
+    parser.add_argument("--burst-multiplier", type=float, default=defaults.burst_multiplier)
+    args = parser.parse_args()
+
+    config = WorkloadConfig(**{name: getattr(args, name) for name in asdict(defaults)})
+    if args.events is not None and args.duration == defaults.duration:
+        # Enough traffic for the requested events, at the configured rates.
+        config.duration = None
+    start = time.perf_counter()
+    if args.output == "-":
+        counts = write_trace(config, sys.stdout, args.events)
+    else:
+        with open(args.output, "w") as f:
+            counts = write_trace(config, f, args.events)
+    summary = ", ".join(f"{op}: {count}" for op, count in sorted(counts.items()))
+    print(f"Wrote {sum(counts.values())} events ({summary}) in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
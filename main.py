@@ -1,20 +1,52 @@
 """Main entrypoint that runs the FastAPI controller that serves the web app and manages the sandbox apps."""
 
-import os
-from datetime import datetime
+from core.startup import startup  # First, so the import phase covers everything below.
 
+import contextlib
+import json
+import os
+import time
+import typing as t
+import uuid
+from datetime import datetime, timedelta
+
+from core.assets import StaticAssets
+from core.capacity import CapacityManager, UsageStore, UsageTracker, get_policy
+from core.idempotency import IDEMPOTENCY_HEADER, IdempotencyConflict, IdempotencyStore, fingerprint
 from core.llm import get_llm_client
+from core.loop_monitor import LoopLagMonitor
+from core.catalogue import DEFAULT_LIMIT, MAX_LIMIT, SerializedPages
+from core.create_job import FINISHED, cleanup_jobs as clean_up_create_jobs, fail_job, load_job as load_create_job, request_cancel, run_create_job, save_spans, submit_job, take_spans
+from core.models import AppStatus, CreateAppJob, JobStatus, TerminateAllJob
+from core.resources import ResourceStore, heaviest_idle
+from core.responses import CompressionMiddleware, EncodedBody, RenderedPages, encoded_response
 from core.sandbox import AppDirectory, SandboxApp
+from core.sessions import EditSessions
+from core.speculation import SESSION_HEADER, SpeculativeEdits
+from core.seed import ComponentCache, load_prompts, materialize, pregenerate
+from core.thumbnails import PlaywrightRenderer, ThumbnailStore, render_and_store, thumbnail_url
+from core.tracing import TRACEPARENT_HEADER, tracer
+from core.terminate import load_job as load_terminate_job, save_job as save_terminate_job, terminate_all
 import modal
 from dotenv import load_dotenv
 from modal import Dict
 
 load_dotenv()
+# Cheap: the Anthropic SDK is only imported once the client is first used (see core/llm.py).
 llm_client = get_llm_client()
 
 # Persist Sandbox application metadata in a Modal Dict so it can be shared across containers and restarts.
 # This will create the dict on first run if it does not already exist.
 apps_dict = Dict.from_name("sandbox-apps", create_if_missing=True)
+# Gallery thumbnails keyed by component hash, see core/thumbnails.py.
+thumbnails_dict = Dict.from_name("sandbox-thumbnails", create_if_missing=True)
+# Responses to requests with an Idempotency-Key, see core/idempotency.py.
+idempotency_dict = Dict.from_name("sandbox-idempotency", create_if_missing=True)
+
+startup.since_start("import")
+# Functions list the modules they will import anyway in PRELOAD_MODULES, so that their memory
+# snapshot includes them rather than the first request paying for them.
+startup.preload(os.getenv("PRELOAD_MODULES", "").split(","))
 
 core_image = (
     modal.Image.debian_slim()
@@ -27,6 +59,7 @@ core_image = (
         "python-dotenv",
         "anthropic",
         "tqdm",
+        "brotli",
     )
     .add_local_dir("core", "/root/core")
 )
@@ -37,6 +70,21 @@ image = (
     .add_local_dir("core", "/root/core")
 )
 
+thumbnail_image = (
+    modal.Image.debian_slim()
+    .env({"PYTHONDONTWRITEBYTECODE": "1"})
+    .pip_install(
+        "httpx",
+        "python-dotenv",
+        "anthropic",
+        "pydantic",
+        "playwright",
+    )
+    .run_commands("playwright install --with-deps chromium")
+    .add_local_dir("core", "/root/core")
+    .add_local_dir("sandbox", "/root/sandbox")
+)
+
 
 app = modal.App(name="modal-vibe", image=image)
 
@@ -49,69 +97,227 @@ sandbox_image = (
             "SHELL": "/bin/bash",
         }
     )
+    # startup.sh only needs curl and ps; skip recommended packages and drop the apt lists.
     .run_commands(
-        "apt-get update && apt-get install -y curl netcat-openbsd procps net-tools"
+        "apt-get update && apt-get install -y --no-install-recommends curl procps"
+        " && rm -rf /var/lib/apt/lists/*"
     )
+    # Vite is run from the app's own node_modules, so no global install is needed.
     .run_commands(
-        "corepack enable && corepack prepare pnpm@latest --activate && pnpm setup && pnpm add -g vite"
+        "corepack enable && corepack prepare pnpm@latest --activate && pnpm setup"
     )
     .pip_install(
         "fastapi[standard]",
-    )
-    .pip_install(
         "httpx",
     )
-    .add_local_dir("web/vite-app", "/root/vite-app", copy=True)
+    .add_local_dir("web/vite-app", "/root/vite-app", copy=True, ignore=["node_modules", "dist"])
     .run_commands(
-        "pnpm install --dir /root/vite-app --force"
+        "pnpm install --dir /root/vite-app --frozen-lockfile && pnpm store prune"
     )
+    # Pre-bundle Vite's optimized deps at build time so the first page load doesn't pay for it.
+    .add_local_file("sandbox/prebundle.sh", "/root/prebundle.sh", copy=True)
+    .run_commands("bash /root/prebundle.sh")
     .add_local_file("sandbox/startup.sh", "/root/startup.sh", copy=True)
     .run_commands("chmod +x /root/startup.sh")
     .add_local_dir("sandbox", "/root/sandbox")
     .add_local_file("sandbox/server.py", "/root/server.py")
 )
 
+# Featured row plus the first page of regular apps, inlined into the home page.
+HOME_FIRST_PAGE_SIZE = 30
+
+# Work a duplicate request would repeat, counted on /metrics when it is served an earlier result.
+CREATE_REQUEST_COST = {"sandboxes": 1, "llm_calls": 2}  # Generate and explain the first component.
+WRITE_REQUEST_COST = {"llm_calls": 2}  # Generate and explain the edit.
+
+# Most sandboxes allowed to run at once, and how apps are picked for eviction to stay within that
+# (see core/capacity.py). Read when deploying and passed on to the create workers through their
+# environment; 0 leaves the number of sandboxes unbounded.
+MAX_SANDBOXES = int(os.getenv("MAX_SANDBOXES", "0"))
+EVICTION_POLICY = os.getenv("EVICTION_POLICY", "cost")
+
+# Admin endpoints that only read take the admin secret in this header rather than a request body.
+ADMIN_SECRET_HEADER = "X-Admin-Secret"
+
+# Key in `apps_dict` holding the object id of the warm sandbox image built by `build_warm_sandbox_image`.
+WARM_SANDBOX_IMAGE_KEY = "warm_sandbox_image_id"
+
+
+async def get_sandbox_image() -> modal.Image:
+    """Return the warm snapshot image if one has been built, otherwise the base sandbox image."""
+    warm_image_id = await apps_dict.get.aio(WARM_SANDBOX_IMAGE_KEY)
+    if warm_image_id:
+        try:
+            return modal.Image.from_id(warm_image_id)
+        except Exception as e:
+            print(f"Failed to load warm sandbox image {warm_image_id}, falling back to base image: {e}")
+    return sandbox_image
+
+
+def get_capacity_manager() -> t.Optional[CapacityManager]:
+    if MAX_SANDBOXES <= 0:
+        return None
+    return CapacityManager(
+        MAX_SANDBOXES,
+        get_policy(EVICTION_POLICY),
+        UsageStore(apps_dict),
+        ResourceStore(apps_dict),
+    )
+
+
+@app.function(image=image, timeout=1800)
+async def build_warm_sandbox_image() -> str:
+    """Boot a sandbox until startup.sh is ready, snapshot its filesystem and use it for new sandboxes."""
+    from sandbox.start_sandbox import snapshot_warm_sandbox_image
+
+    warm_image = await snapshot_warm_sandbox_image(app=app, image=sandbox_image)
+    await apps_dict.put.aio(WARM_SANDBOX_IMAGE_KEY, warm_image.object_id)
+    print(f"Saved warm sandbox image {warm_image.object_id}")
+    return warm_image.object_id
+
 @app.function(
     image=image,
     secrets=[modal.Secret.from_name("anthropic-secret")],
     timeout=3600,
+    enable_memory_snapshot=True,
+    env={"PRELOAD_MODULES": "anthropic", "MAX_SANDBOXES": str(MAX_SANDBOXES), "EVICTION_POLICY": EVICTION_POLICY},
 )
-async def create_sandbox_app(prompt: str) -> str:    
-    print(f"Creating sandbox app with prompt: {prompt}")
-    
-    app_directory = AppDirectory(apps_dict, app, llm_client)
-    print("Initialized app directory")
-    sandbox_app = await SandboxApp.create(app, llm_client, prompt, image=sandbox_image)
-    app_directory.set_app(sandbox_app)
-    print(f"Created image {sandbox_image.object_id}")
-    print(f"Created and saved sandbox app with ID: {sandbox_app.id}")
-    
-    return sandbox_app.id
+async def create_sandbox_app_job(job_id: str, traceparent: t.Optional[str] = None) -> dict:
+    """Background worker behind /api/create: builds and saves the app for a pending create job.
+
+    The spans recorded along the way are stored next to the job, so the controller that reports
+    the finished job can include them in its `/metrics`."""
+    async def request_thumbnail(sandbox_app: SandboxApp) -> None:
+        await render_thumbnail.spawn.aio(sandbox_app.data.sandbox_user_tunnel_url, sandbox_app.metadata.component_hash)
+
+    with tracer.remote_parent(traceparent), tracer.capture() as captured:
+        with tracer.span("create_sandbox_app", job_id=job_id):
+            app_directory = AppDirectory(apps_dict, app, llm_client)
+            sandbox_image_to_use = await get_sandbox_image()
+            job = await run_create_job(
+                apps_dict, app_directory, job_id, sandbox_image_to_use, on_created=request_thumbnail, capacity=get_capacity_manager(),
+            )
+    await tracer.flush()
+    await save_spans(apps_dict, job_id, [span.to_dict() for span in captured.spans])
+    print(f"Create job {job_id} finished as {job.status.value}, app {job.app_id}")
+    return job.model_dump()
 
 @app.function(
+    image=image,
+    secrets=[modal.Secret.from_name("anthropic-secret")],
+    timeout=86400,
+)
+async def seed_apps(num_apps: int = 100, concurrency: int = 50, build_apps: bool = True, poll_interval: float = 30.0) -> dict:
+    """Seed the gallery with apps for the first `num_apps` prompts in core/prompts.txt (see core/seed.py).
+
+    Components are generated with Message Batches, then apps are built from them `concurrency`
+    sandboxes at a time. Safe to re-run: cached components and already built apps are skipped.
+    """
+    async def request_thumbnail(sandbox_app: SandboxApp) -> None:
+        await render_thumbnail.spawn.aio(sandbox_app.data.sandbox_user_tunnel_url, sandbox_app.metadata.component_hash)
+
+    prompts = load_prompts(num_apps)
+    cache = ComponentCache(apps_dict)
+    generated = await pregenerate(llm_client, cache, prompts, poll_interval=poll_interval)
+    print(f"Pre-generated components: {generated}")
+    if not build_apps:
+        return {"pregenerate": generated}
+
+    app_directory = AppDirectory(apps_dict, app, llm_client)
+    await app_directory.load()
+    built = await materialize(
+        app_directory, cache, prompts, await get_sandbox_image(), concurrency=concurrency, on_created=request_thumbnail
+    )
+    await tracer.flush()
+    print(f"Built apps: {built}")
+    return {"pregenerate": generated, "materialize": built}
+
+@app.cls(
     image=image,
     secrets=[modal.Secret.from_name("anthropic-secret"), modal.Secret.from_name("admin-secret")],
-    min_containers=1
+    min_containers=1,
+    enable_memory_snapshot=True,
 )
 @modal.concurrent(max_inputs=100)
-@modal.asgi_app(custom_domains=["vibes.modal.chat"])
-def fastapi_app():
+class Controller:
+    """The controller's web app.
+
+    Imports, Dict lookups and building the FastAPI app happen before the memory snapshot is
+    taken, so autoscaled replicas restored from it only hydrate the catalogue, in the background.
+    """
+
+    @modal.enter(snap=True)
+    def build(self):
+        startup.preload(["anthropic"])
+        with startup.phase("hydrate_dicts"):
+            apps_dict.hydrate()
+            thumbnails_dict.hydrate()
+            idempotency_dict.hydrate()
+        with startup.phase("build_web_app"):
+            self.web_app = build_controller()
+
+    @modal.enter(snap=False)
+    def resume(self):
+        startup.resumed()
+
+    @modal.asgi_app(custom_domains=["vibes.modal.chat"])
+    def fastapi_app(self):
+        return self.web_app
+
+
+def build_controller():
+    app_directory = AppDirectory(apps_dict, app, llm_client)
+
+    async def start_create_job(job_id: str) -> None:
+        await create_sandbox_app_job.spawn.aio(job_id, tracer.current_traceparent())
+
+    async def request_thumbnail(url: str, hash_: str) -> None:
+        await render_thumbnail.spawn.aio(url, hash_)
+
+    return create_web_app(
+        app_directory,
+        start_create_job,
+        thumbnail_store=ThumbnailStore(thumbnails_dict),
+        request_thumbnail=request_thumbnail,
+        idempotency_dict=idempotency_dict,
+    )
+
+
+@app.function(image=thumbnail_image, timeout=300)
+async def render_thumbnail(url: str, hash_: str) -> None:
+    """Screenshot a sandbox app for the gallery once its component has been pushed."""
+    await render_and_store(ThumbnailStore(thumbnails_dict), PlaywrightRenderer(), url, hash_)
+
+
+def create_web_app(
+    app_directory: AppDirectory,
+    start_create_job: t.Callable[[str], t.Awaitable[None]],
+    web_dir: str = "/root/web",
+    thumbnail_store: t.Optional[ThumbnailStore] = None,
+    request_thumbnail: t.Optional[t.Callable[[str, str], t.Awaitable[None]]] = None,
+    idempotency_dict: t.Optional[modal.Dict] = None,
+):
+    """Build the controller's FastAPI app.
+
+    `start_create_job` starts running a pending create job (see core/create_job.py) in the
+    background. In production it spawns the `create_sandbox_app_job` Modal function;
+    `local/harness.py` passes an in-process stand-in.
+    `request_thumbnail(user_url, component_hash)` is called after each successful edit.
+    Idempotency records are kept in `idempotency_dict`, or alongside the apps without one.
+    """
     from fastapi import FastAPI, Request, HTTPException
-    from fastapi.responses import JSONResponse
-    from fastapi.staticfiles import StaticFiles
+    from fastapi.responses import JSONResponse, PlainTextResponse, Response
     from fastapi.templating import Jinja2Templates
     from pydantic import BaseModel
-    import httpx
-
-    app_directory = AppDirectory(apps_dict, app, llm_client)
-    app_directory.load()
 
 
     class CreateAppRequest(BaseModel):
         prompt: str
         
     class CreateAppResponse(BaseModel):
-        app_id: str
+        job_id: str
+        status: str
+        app_id: t.Optional[str] = None
     
     class WriteAppRequest(BaseModel):
         text: str
@@ -124,19 +330,90 @@ def fastapi_app():
 
     class SnapshotAppRequest(BaseModel):
         admin_secret: str
+
+    class ResourcesRequest(BaseModel):
+        admin_secret: str
+        idle_minutes: float = 30
+        limit: int = 20
         
 
+    assets = StaticAssets(f"{web_dir}/static")
+
+    # Set LOOP_LAG_THRESHOLD_MS to log any request that blocks the event loop for longer than that.
+    loop_lag_threshold_ms = os.getenv("LOOP_LAG_THRESHOLD_MS")
+    loop_monitor = LoopLagMonitor(threshold_ms=float(loop_lag_threshold_ms)) if loop_lag_threshold_ms else None
+
+    idempotency = IdempotencyStore(idempotency_dict if idempotency_dict is not None else app_directory.apps_dict)
+    # Views and edits per app, which decide what is evicted when the sandbox budget is reached.
+    usage = UsageTracker(UsageStore(app_directory.apps_dict))
+    # Apps kept warm between edits (see core/sessions.py); 0 hydrates every edit from the dict.
+    sessions = EditSessions(app_directory, max_sessions=int(os.getenv("EDIT_SESSIONS", "256")))
+    # Speculative edit generations each session may start per minute; 0 turns speculation off.
+    speculations = SpeculativeEdits(per_minute=int(os.getenv("SPECULATION_PER_MINUTE", "6")))
+    serialized_pages = SerializedPages()
+    app_pages = RenderedPages("app")
+    # Milliseconds app saves are buffered for before being written in a batch; 0 writes them through.
+    write_behind_ms = float(os.getenv("WRITE_BEHIND_MS", "200"))
+
+    @contextlib.asynccontextmanager
+    async def lifespan(_: FastAPI):
+        # Requests that list or save apps wait for the catalogue; app pages read the dict meanwhile.
+        app_directory.start_loading()
+        if write_behind_ms > 0:
+            app_directory.start_write_behind(write_behind_ms / 1000)
+        usage.start()
+        if loop_monitor:
+            loop_monitor.start()
+        startup.since_start("ready")
+        yield
+        # Hand warm apps over: once buffered saves are written, whichever container edits them next
+        # hydrates them from the dict.
+        await app_directory.stop_write_behind()
+        print(f"Dropped {sessions.clear()} edit sessions on shutdown")
+        await usage.stop()
+
     web_app = FastAPI(
         title="Modal Sandbox API",
         description="API for creating and managing sandbox applications",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan,
     )
-    web_app.mount("/static", StaticFiles(directory="/root/web/static"), name="static")
+    web_app.add_middleware(CompressionMiddleware)
+    web_app.state.loop_monitor = loop_monitor
+    web_app.state.usage = usage
+    web_app.state.sessions = sessions
+
+    @web_app.middleware("http")
+    async def trace_request(request: Request, call_next):
+        if request.url.path.startswith("/static") or request.url.path == "/metrics":
+            return await call_next(request)
+        with tracer.remote_parent(request.headers.get(TRACEPARENT_HEADER)):
+            with tracer.span("http.request", method=request.method, path=request.url.path) as span:
+                response = await call_next(request)
+                span.set_attribute("status_code", response.status_code)
+                return response
+
+    @web_app.middleware("http")
+    async def track_loop_lag(request: Request, call_next):
+        if not loop_monitor:
+            return await call_next(request)
+        token = loop_monitor.request_started(f"{request.method} {request.url.path}")
+        try:
+            return await call_next(request)
+        finally:
+            loop_monitor.request_finished(token)
 
-    templates = Jinja2Templates(directory="/root/web/templates")
+    templates = Jinja2Templates(directory=f"{web_dir}/templates")
+    templates.env.globals["static_url"] = assets.url
 
-    def _get_app_or_raise(app_id: str) -> SandboxApp:
-        sandbox_app = app_directory.get_app(app_id)
+    def _render(name: str, context: dict) -> EncodedBody:
+        with tracer.span("render_template", template=name) as span:
+            html = templates.get_template(name).render(context).encode("utf-8")
+            span.set_attribute("bytes", len(html))
+        return EncodedBody(html, "text/html; charset=utf-8")
+
+    async def _get_app_or_raise(app_id: str) -> SandboxApp:
+        sandbox_app = await app_directory.get_app(app_id)
         if not sandbox_app:
             raise HTTPException(status_code=404, detail="App not found")
         return sandbox_app
@@ -144,104 +421,255 @@ def fastapi_app():
     @web_app.exception_handler(404)
     async def not_found_handler(request: Request, exc):
         return templates.TemplateResponse(
-            name="pages/404.html", context={"request": request}, status_code=404
+            request=request, name="pages/404.html", context={"request": request}, status_code=404
         )
 
     @web_app.exception_handler(503)
     async def service_unavailable_handler(request: Request, exc):
         return templates.TemplateResponse(
-            name="pages/503.html", context={"request": request}, status_code=503
+            request=request, name="pages/503.html", context={"request": request}, status_code=503
         )
 
+    @web_app.get("/static/{path:path}")
+    async def static(request: Request, path: str):
+        return assets.response(request, path)
+
     @web_app.get("/")
     async def home(request: Request):
-        print("Fetching home page")
-        apps_dict = await _get_apps_dict()
-        return templates.TemplateResponse(
-            name="pages/home.html", context={"request": request, "apps": apps_dict}
-        )
-
-    async def _get_apps_dict():
-        # app_directory already loaded on startup
-        # TODO(joy): Passing in the client is unclean, figure out a better way to do this.
-        # async with httpx.AsyncClient() as client:
-        #     await app_directory.cleanup(client)
-        app_directory.load()
-        apps_dict = {}
-        count = 0
-        for app_id, app_metadata in app_directory.apps.items():
-            count += 1
-            apps_dict[app_id] = {
-                "url": app_metadata.sandbox_user_tunnel_url,
-                "title": app_metadata.title if hasattr(app_metadata, 'title') else "",
-                "is_featured": app_metadata.is_featured if hasattr(app_metadata, 'is_featured') else False
-            }
-        return apps_dict
+        """The gallery. It is rendered once per catalogue version, like the /api/apps pages."""
+        # Cheap when fresh: picks up apps created by other containers at most every couple of seconds.
+        await app_directory.refresh()
+        key = ("home",)
+        body = serialized_pages.get(app_directory.apps.version, key)
+        if body is None:
+            print("Rendering home page")
+            # Only the first page of the gallery is inlined; the page fetches the rest from /api/apps.
+            page = _page(sort="featured", limit=HOME_FIRST_PAGE_SIZE)
+            body = _render("pages/home.html", {"apps": page["apps"], "next_cursor": page["next_cursor"], "total": page["total"]})
+            serialized_pages.put(app_directory.apps.version, key, body)
+        return encoded_response(request, body, {"Cache-Control": "no-cache"})
+
+    def _page(**query) -> dict:
+        page = app_directory.list_apps(**query)
+        apps_dict = {app_id: _app_summary(app_id) for app_id in page.app_ids}
+        return {"apps": apps_dict, "next_cursor": page.next_cursor, "total": page.total}
+
+    def _app_summary(app_id: str) -> dict:
+        url, title, is_featured, component_hash = app_directory.apps.summary(app_id)
+        return {
+            "url": url,
+            "title": title,
+            "is_featured": is_featured,
+            "thumbnail_url": thumbnail_url(component_hash),
+        }
         
 
     @web_app.get("/app/{app_id}")
     async def app_page(request: Request, app_id: str):
-        app = _get_app_or_raise(app_id)
-        return templates.TemplateResponse(
-            name="pages/app.html",
-            context={
-                "request": request,
-                "app_id": app_id,
-                "app_url": app.data.sandbox_user_tunnel_url,
-                "relay_url": app.data.sandbox_tunnel_url,
-                "message_history": app.data.message_history,
-                "app_title": app.metadata.title if hasattr(app.metadata, 'title') else "",
-                "is_featured": app.metadata.is_featured if hasattr(app.metadata, 'is_featured') else False,
-            },
+        """The editor of one app, rendered again only once the app has been edited or its metadata changed."""
+        app = await _get_app_or_raise(app_id)
+        usage.view(app_id)
+        context = {
+            "app_id": app_id,
+            "app_url": app.data.sandbox_user_tunnel_url,
+            "relay_url": app.data.sandbox_tunnel_url,
+            "message_history": app.data.message_history,
+            "app_title": app.metadata.title if hasattr(app.metadata, 'title') else "",
+            "is_featured": app.metadata.is_featured if hasattr(app.metadata, 'is_featured') else False,
+        }
+        # Messages are only ever appended, and every edit or toggle bumps `updated_at`.
+        version = (
+            app.metadata.updated_at, len(app.data.message_history),
+            context["app_url"], context["relay_url"], context["app_title"], context["is_featured"],
+        )
+        body = app_pages.get(app_id, version)
+        if body is None:
+            body = _render("pages/app.html", context)
+            app_pages.put(app_id, version, body)
+        return encoded_response(request, body, {"Cache-Control": "no-cache"})
+
+    @web_app.get("/metrics")
+    async def metrics():
+        """Per-stage, per-model LLM and speculation metrics and duplicate-request counters in the Prometheus text format"""
+        return PlainTextResponse(tracer.render_prometheus() + idempotency.metrics.render_prometheus())
+
+    @web_app.get("/thumbnails/{hash_}")
+    async def get_thumbnail(hash_: str):
+        """Serve a gallery thumbnail. The URL is content-addressed, so it can be cached forever."""
+        thumbnail = await thumbnail_store.get(hash_) if thumbnail_store else None
+        if thumbnail is None:
+            return Response(status_code=404, headers={"Cache-Control": "no-store"})
+        return Response(
+            content=thumbnail.data,
+            media_type=thumbnail.content_type,
+            headers={"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{hash_}"'},
         )
 
     @web_app.get("/api/apps")
-    async def get_apps():
-        """Get the list of all apps for live updates"""
-        apps_dict = await _get_apps_dict()
-        print(f"[API /api/apps] Returning {len(apps_dict)} apps")
-        return JSONResponse({"apps": apps_dict})
+    async def get_apps(
+        request: Request,
+        cursor: t.Optional[str] = None,
+        limit: int = DEFAULT_LIMIT,
+        featured: t.Optional[bool] = None,
+        status: t.Optional[str] = None,
+        sort: str = "updated_at",
+    ):
+        """Get a page of apps, e.g. `/api/apps?sort=created_at&featured=false&limit=24&cursor=...`
+
+        Response bodies are serialized, and compressed, once and reused until the catalogue changes."""
+        await app_directory.refresh()
+        key = (sort, featured, status, cursor, limit)
+        body = serialized_pages.get(app_directory.apps.version, key)
+        if body is None:
+            try:
+                page = _page(
+                    sort=sort,
+                    featured=featured,
+                    status=AppStatus(status) if status else None,
+                    cursor=cursor,
+                    limit=limit,
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            # The same encoding JSONResponse uses.
+            body = EncodedBody(
+                json.dumps(page, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8"),
+                "application/json",
+            )
+            serialized_pages.put(app_directory.apps.version, key, body)
+            print(f"[API /api/apps] Returning {len(page['apps'])} of {page['total']} apps")
+        return encoded_response(request, body)
+
+    @web_app.get("/api/apps/search")
+    async def search_apps(q: str = "", limit: int = DEFAULT_LIMIT):
+        """Search apps by title and edit instructions, best match first, e.g. `/api/apps/search?q=recipe+planner`"""
+        await app_directory.refresh()
+        hits = app_directory.search_apps(q, limit=max(1, min(limit, MAX_LIMIT)))
+        apps_dict = {}
+        for hit in hits:
+            apps_dict[hit.app_id] = {**_app_summary(hit.app_id), "score": round(hit.score, 4)}
+        print(f"[API /api/apps/search] {len(apps_dict)} matches for {q!r}")
+        return JSONResponse({"query": q, "apps": apps_dict})
+
+    @web_app.post("/api/create", response_model=CreateAppResponse, status_code=202)
+    async def create_app(request: Request, request_data: CreateAppRequest) -> CreateAppResponse:
+        """Start creating an app and return its job right away; poll `/api/create/{job_id}` for progress.
+
+        Retries that send the same `Idempotency-Key` header get the original job back instead of
+        starting another one."""
+        async def _submit() -> tuple[int, dict]:
+            job = await submit_job(app_directory.apps_dict, uuid.uuid4().hex, request_data.prompt)
+            try:
+                await start_create_job(job.id)
+            except Exception as e:
+                # Without a worker the job would stay pending forever.
+                print(f"Failed to start create job {job.id}: {e}")
+                await fail_job(app_directory.apps_dict, job, f"Failed to start: {e}")
+                return 503, {"status": "error", "message": "Failed to start creating the app", "job_id": job.id}
+            return 202, CreateAppResponse(job_id=job.id, status=job.status.value).model_dump()
 
-    @web_app.post("/api/create", response_model=CreateAppResponse)
-    async def create_app(request_data: CreateAppRequest) -> CreateAppResponse:
-        app_id = await create_sandbox_app.remote.aio(request_data.prompt)
-        return CreateAppResponse(app_id=app_id)
+        try:
+            result = await idempotency.run(
+                "create",
+                fingerprint(request_data.prompt),
+                _submit,
+                key=request.headers.get(IDEMPOTENCY_HEADER),
+                cost=CREATE_REQUEST_COST,
+            )
+        except IdempotencyConflict as e:
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=e.status_code)
+        if result.outcome != "executed":
+            print(f"[API /api/create] Returning job {result.body['job_id']} ({result.outcome}) for a repeated request")
+        return JSONResponse(result.body, status_code=result.status_code)
+
+    async def _get_create_job_or_raise(job_id: str) -> CreateAppJob:
+        job = await load_create_job(app_directory.apps_dict, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job.status in FINISHED:
+            # Add the worker's spans to the /metrics of whichever container takes them first.
+            tracer.observe_remote(await take_spans(app_directory.apps_dict, job_id))
+        return job
+
+    @web_app.get("/api/create/{job_id}")
+    async def create_app_status(job_id: str):
+        """Report the status and stage of a create job, and the app id once it has succeeded"""
+        job = await _get_create_job_or_raise(job_id)
+        return JSONResponse(job.model_dump())
+
+    @web_app.post("/api/create/{job_id}/cancel")
+    async def cancel_create_app(job_id: str):
+        """Cancel a create job; the worker stops building and tears down the sandbox it started"""
+        job = await _get_create_job_or_raise(job_id)
+        if job.status in FINISHED:
+            return JSONResponse(
+                {"status": "error", "message": f"Job already {job.status.value}", "job": job.model_dump()},
+                status_code=409,
+            )
+        await request_cancel(app_directory.apps_dict, job_id)
+        return JSONResponse({"status": "success", "message": f"Cancelling job {job_id}"}, status_code=202)
 
     @web_app.post("/api/app/{app_id}/write")
-    async def write_app(app_id: str, request_data: WriteAppRequest):
-        app = _get_app_or_raise(app_id)
+    async def write_app(request: Request, app_id: str, request_data: WriteAppRequest):
+        """Edit an app. Repeats with the same `Idempotency-Key`, or identical edits still in flight,
+        get the first edit's response instead of generating again."""
+        try:
+            result = await idempotency.run(
+                "write",
+                fingerprint(app_id, request_data.text),
+                lambda: _write_app(app_id, request_data),
+                key=request.headers.get(IDEMPOTENCY_HEADER),
+                coalesce_key=fingerprint(app_id, request_data.text),
+                cost=WRITE_REQUEST_COST,
+            )
+        except IdempotencyConflict as e:
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=e.status_code)
+        return JSONResponse(result.body, status_code=result.status_code)
+
+    @web_app.post("/api/app/{app_id}/speculate", status_code=202)
+    async def speculate_app_edit(request: Request, app_id: str, request_data: WriteAppRequest):
+        """Start generating an edit from the user's draft, so submitting the same text can reuse it"""
+        app = await _get_app_or_raise(app_id)
+        session = request.headers.get(SESSION_HEADER) or (request.client.host if request.client else "anonymous")
+        status = speculations.speculate(session, app, request_data.text)
+        return JSONResponse({"status": status}, status_code=429 if status == "over_budget" else 202)
+
+    async def _write_app(app_id: str, request_data: WriteAppRequest) -> tuple[int, dict]:
+        received = time.monotonic()
+        app, session = await sessions.checkout(app_id)
+        if not app:
+            raise HTTPException(status_code=404, detail="App not found")
+        start = time.monotonic()
+        saved = False
         try:
             print(f"Starting edit for app {app_id} with text: {request_data.text[:100] if request_data.text else ''}...")
-            response = await app.edit(request_data.text)
-            print(f"Edit completed, response status: {response.status_code}")
-            app_directory.set_app(app)
-            
-            # Try to parse JSON response, handle both sync and async json() methods
-            try:
-                import inspect
-                json_method = response.json()
-                # Check if json() returns a coroutine (async) or a dict (sync)
-                if inspect.iscoroutine(json_method):
-                    response_data = await json_method
-                else:
-                    response_data = json_method
-                print(f"Successfully parsed response JSON: {response_data}")
-            except Exception as json_error:
-                print(f"Failed to parse JSON response: {json_error}")
-                # If JSON parsing fails, return a generic success response
-                response_data = {"status": "ok"}
-                
-            return JSONResponse(response_data, status_code=response.status_code)
+            component = await speculations.take(app, request_data.text)
+            result = await app.edit(request_data.text, component=component)
+            edited = time.monotonic()
+            usage.edit(app_id)
+            speculations.metrics.edit_latency.observe_value("hit" if component is not None else "miss", (edited - start) * 1000)
+            print(f"Edit completed, result status: {result['status']}")
+            await app_directory.set_app(app)
+            saved = True
+            sessions.metrics.edit_overhead.observe_value(session, (start - received + time.monotonic() - edited) * 1000)
+            if request_thumbnail:
+                try:
+                    await request_thumbnail(app.data.sandbox_user_tunnel_url, app.metadata.component_hash)
+                except Exception as e:
+                    print(f"Failed to request thumbnail for app {app_id}: {e}")
+            return 200, result
         except Exception as e:
             print(f"Error writing to relay with data: {request_data}: {str(e)}")
             import traceback
             traceback.print_exc()
-            return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+            return 500, {"status": "error", "message": str(e)}
+        finally:
+            sessions.checkin(app, saved)
 
     @web_app.get("/api/app/{app_id}/history")
     async def get_message_history(app_id: str):
         """Get the message history for an app"""
-        app = _get_app_or_raise(app_id)
+        app = await _get_app_or_raise(app_id)
         history_data = [
             {"content": msg.content, "type": msg.type.value}
             for msg in app.data.message_history
@@ -259,29 +687,16 @@ def fastapi_app():
     @web_app.get("/api/app/{app_id}/status")
     async def get_app_status(app_id: str):
         """Return the current metadata status for the requested app without pinging the sandbox."""
-        app = _get_app_or_raise(app_id)
+        app = await _get_app_or_raise(app_id)
         return JSONResponse({"status": app.metadata.status.value})
 
     @web_app.get("/api/app/{app_id}/ping")
     async def ping_app(app_id: str):
-        app = _get_app_or_raise(app_id)
-        heartbeat_url = f"{app.data.sandbox_tunnel_url}/heartbeat"
-        try:
-            print(f"Pinging relay at: {heartbeat_url}")
-            async with httpx.AsyncClient() as client:
-                response = await client.get(heartbeat_url, timeout=2.0)
-                print(f"Ping response status: {response.status_code}")
-                # Handle both sync and async json() methods
-                import inspect
-                json_method = response.json()
-                if inspect.iscoroutine(json_method):
-                    response_data = await json_method
-                else:
-                    response_data = json_method
-                return JSONResponse(response_data, status_code=response.status_code)
-        except Exception as e:
-            print(f"Error pinging relay: {str(e)}")
-            return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+        app = await _get_app_or_raise(app_id)
+        print(f"Pinging sandbox {app.data.sandbox_object_id} over {app.transport.name}")
+        if await app.transport.is_alive(app.data):
+            return JSONResponse({"status": "ok"})
+        return JSONResponse({"status": "error", "message": "Sandbox is not responding"}, status_code=500)
 
     @web_app.post("/api/app/{app_id}/terminate")
     async def terminate_app(app_id: str, request_data: TerminateAppRequest):
@@ -293,11 +708,12 @@ def fastapi_app():
         if request_data.admin_secret != admin_secret:
             return JSONResponse({"status": "error", "message": "Invalid admin secret"}, status_code=403)
         
-        app = _get_app_or_raise(app_id)
+        app = await _get_app_or_raise(app_id)
         try:
-            success = app.terminate()
+            success = await app.terminate()
             if success:
-                app_directory.remove_app(app_id)
+                await app_directory.remove_app(app_id)
+                sessions.drop(app_id)
                 return JSONResponse({"status": "success", "message": f"Sandbox {app_id} terminated successfully"})
             else:
                 return JSONResponse({"status": "error", "message": "Failed to terminate sandbox"}, status_code=500)
@@ -312,9 +728,9 @@ def fastapi_app():
         if not admin_secret or request_data.admin_secret != admin_secret:
             raise HTTPException(status_code=403, detail="Invalid admin secret")
         
-        app = _get_app_or_raise(app_id)
-        sandbox = modal.Sandbox.from_object_id(app.data.sandbox_object_id)
-        image = sandbox.snapshot_filesystem()
+        app = await _get_app_or_raise(app_id)
+        sandbox = await modal.Sandbox.from_id.aio(app.data.sandbox_object_id)
+        image = await sandbox.snapshot_filesystem.aio()
         return JSONResponse({"status": "success", "image": image.object_id}, status_code=200)
 
     @web_app.post("/api/app/{app_id}/toggle-feature")
@@ -324,13 +740,13 @@ def fastapi_app():
         if not admin_secret or request_data.admin_secret != admin_secret:
             raise HTTPException(status_code=403, detail="Invalid admin secret")
         
-        app = _get_app_or_raise(app_id)
+        app = await _get_app_or_raise(app_id)
         
         try:
             app.metadata.is_featured = not getattr(app.metadata, 'is_featured', False)
             app.metadata.updated_at = datetime.now()
             
-            app_directory.set_app(app)
+            await app_directory.set_app(app)
             
             return JSONResponse({
                 "status": "success", 
@@ -343,60 +759,81 @@ def fastapi_app():
 
     @web_app.post("/api/admin/terminate-all")
     async def terminate_all_sandboxes(request_data: TerminateAppRequest):
-        """Terminate all sandbox apps with admin authentication"""
+        """Start a background job that terminates all sandbox apps, with admin authentication"""
         admin_secret = os.getenv("ADMIN_SECRET")
         if not admin_secret:
             return JSONResponse({"status": "error", "message": "Admin functionality not configured"}, status_code=503)
         
         if request_data.admin_secret != admin_secret:
             return JSONResponse({"status": "error", "message": "Invalid admin secret"}, status_code=403)
-        
-        app_directory.load()  # Ensure we have the latest apps
-        apps = app_directory.apps.keys()
-        terminated_count = 0
-        failed_count = 0
-        apps_copy = list(apps)
-        
-        for app_id in apps_copy:
-            try:
-                sandbox_app = app_directory.get_app(app_id)
-                if not sandbox_app:
-                    print(f"❌ App {app_id} not found in catalogue")
-                    continue
-                success = sandbox_app.terminate()
-                app_directory.remove_app(app_id)
-                if success:
-                    terminated_count += 1
-                    print(f"✅ Terminated sandbox: {app_id}")
-                else:
-                    failed_count += 1
-                    print(f"❌ Failed to terminate sandbox: {app_id}")
-            except Exception as e:
-                failed_count += 1
-                print(f"❌ Error terminating sandbox {app_id}: {str(e)}")
-        
-        for sandbox in modal.Sandbox.list(app_id=app.app_id):
-            print(f"Sandbox: {sandbox.object_id}")
-            sandbox.terminate()
 
+        job = TerminateAllJob(
+            id=uuid.uuid4().hex,
+            status=JobStatus.PENDING,
+            created_at=datetime.now(),
+            updated_at=datetime.now(),
+        )
+        await save_terminate_job(app_directory.apps_dict, job)
+        await terminate_all_sandboxes_job.spawn.aio(job.id)
+
+        return JSONResponse({
+            "status": "success",
+            "message": f"Started terminate-all job {job.id}",
+            "job_id": job.id,
+        }, status_code=202)
+
+    @web_app.get("/api/admin/terminate-all/{job_id}/status")
+    async def terminate_all_status(request: Request, job_id: str):
+        """Report progress of a terminate-all job, with the admin secret in the `X-Admin-Secret` header"""
+        admin_secret = os.getenv("ADMIN_SECRET")
+        if not admin_secret:
+            return JSONResponse({"status": "error", "message": "Admin functionality not configured"}, status_code=503)
+
+        if request.headers.get(ADMIN_SECRET_HEADER) != admin_secret:
+            return JSONResponse({"status": "error", "message": "Invalid admin secret"}, status_code=403)
+
+        job = await load_terminate_job(app_directory.apps_dict, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return JSONResponse(job.model_dump())
+
+    @web_app.post("/api/admin/resources")
+    async def app_resources(request_data: ResourcesRequest):
+        """Report sandbox resource usage and the heaviest idle apps with admin authentication"""
+        admin_secret = os.getenv("ADMIN_SECRET")
+        if not admin_secret:
+            return JSONResponse({"status": "error", "message": "Admin functionality not configured"}, status_code=503)
+
+        if request_data.admin_secret != admin_secret:
+            return JSONResponse({"status": "error", "message": "Invalid admin secret"}, status_code=403)
+
+        await app_directory.ready()
+        resources = await ResourceStore(app_directory.apps_dict).load(app_directory.apps)
+        idle = heaviest_idle(resources.values(), timedelta(minutes=request_data.idle_minutes), limit=request_data.limit)
         return JSONResponse({
-            "status": "success", 
-            "message": f"Terminated {terminated_count} sandboxes successfully, {failed_count} failed",
-            "terminated": terminated_count,
-            "failed": failed_count
+            "apps": len(resources),
+            "rss_bytes": sum(entry.rss_bytes for entry in resources.values()),
+            "cpu_cores": round(sum(entry.cpu_cores_avg for entry in resources.values()), 3),
+            "viewers": sum(entry.viewers for entry in resources.values()),
+            "heaviest_idle": [entry.model_dump() for entry in idle],
         })
 
     return web_app
 
-@app.function(schedule=modal.Period(minutes=1))
-async def clean_up_dead_apps():
-    import httpx
+@app.function(image=image, timeout=3600)
+async def terminate_all_sandboxes_job(job_id: str) -> dict:
+    """Background job behind /api/admin/terminate-all. Safe to re-run: failures stay catalogued and are retried."""
+    job = await load_terminate_job(apps_dict, job_id)
+    if job is None:
+        raise ValueError(f"Terminate-all job {job_id} not found")
+    app_directory = AppDirectory(apps_dict, app, llm_client)
+    job = await terminate_all(apps_dict, app_directory, app.app_id, job)
+    return job.model_dump()
 
+@app.function(schedule=modal.Period(minutes=1), enable_memory_snapshot=True)
+async def clean_up_dead_apps():
     app_directory = AppDirectory(apps_dict, app, llm_client)
-    app_directory.load()  # Load apps for cleanup
-    # TODO(joy): I do not like how these async clients are created. Unclean.
-    # Use more resilient client settings for cleanup
-    limits = httpx.Limits(max_keepalive_connections=10, max_connections=20)
-    timeout = httpx.Timeout(timeout=30.0, connect=10.0, read=10.0)
-    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
-        await app_directory.cleanup(client)
+    await app_directory.load()  # Load apps for cleanup
+    await app_directory.cleanup(resources=ResourceStore(apps_dict))
+    await clean_up_create_jobs(apps_dict)
+    await IdempotencyStore(idempotency_dict).cleanup()
@@ -0,0 +1,285 @@
+"""
+The control plane of a sandbox: writing components, waiting for Vite to pick them up, and reporting
+resource usage.
+
+It is shared by the HTTP server (server.py), which the controller reaches through a tunnel, and by
+this module's command line, which the controller runs with `Sandbox.exec` instead (see
+core/transport.py):
+
+    python -m sandbox.control ack <version>   # Wait for Vite to compile it, print the outcome as JSON
+    python -m sandbox.control metrics         # Print resource usage in the Prometheus text format
+    python -m sandbox.control heartbeat       # Exit 0 once Vite is serving
+
+Each command runs in a fresh process, so compile counts are kept in a small JSON file between runs.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+from typing import Optional
+
+import httpx
+
+COMPONENT_PATH = "/root/vite-app/src/LLMComponent.tsx"
+# Served by the hmr-ack plugin in web/vite-app/vite.config.ts.
+HMR_ACK_URL = "http://127.0.0.1:5173/__hmr_ack"
+HMR_ACK_TIMEOUT = 15.0  # Seconds to wait for Vite to compile the new component.
+HMR_SERVED_TIMEOUT = 2.0  # Further seconds to wait for a connected page to fetch it.
+METRICS_MAX_AGE = 5.0  # Seconds /metrics reuses its /proc and Vite readings for.
+STATS_PATH = "/tmp/sandbox-control-stats.json"
+
+
+class ResourceSampler:
+    """Reads CPU time and memory of every process in the sandbox from /proc, plus open TCP connections.
+
+    Readings are cached for `max_age` seconds, so scraping /metrics stays cheap however often it's hit.
+    """
+
+    def __init__(self, max_age: float = METRICS_MAX_AGE):
+        self.max_age = max_age
+        self._sampled_at = 0.0
+        self._sample: dict = {}
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        self._clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def sample(self) -> dict:
+        if time.monotonic() - self._sampled_at >= self.max_age:
+            self._sample = {"processes": self._read_processes(), "connections": self._count_connections()}
+            self._sampled_at = time.monotonic()
+        return self._sample
+
+    @staticmethod
+    def _process_group(comm: str) -> str:
+        if comm.startswith("node"):
+            return "vite"
+        if comm.startswith(("python", "uvicorn")):
+            return "server"
+        return "other"
+
+    def _read_processes(self) -> dict[str, dict[str, float]]:
+        groups: dict[str, dict[str, float]] = {}
+        if not os.path.isdir("/proc"):
+            return groups
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    stat = f.read()
+            except OSError:
+                continue  # The process exited.
+            # The command name is in parentheses and may contain spaces.
+            comm = stat[stat.index("(") + 1:stat.rindex(")")]
+            fields = stat[stat.rindex(")") + 2:].split()
+            group = groups.setdefault(self._process_group(comm), {"rss_bytes": 0, "cpu_seconds": 0.0, "processes": 0})
+            group["cpu_seconds"] += (int(fields[11]) + int(fields[12])) / self._clock_ticks
+            group["rss_bytes"] += int(fields[21]) * self._page_size
+            group["processes"] += 1
+        return groups
+
+    @staticmethod
+    def _count_connections() -> int:
+        established = 0
+        for path in ("/proc/net/tcp", "/proc/net/tcp6"):
+            try:
+                with open(path) as f:
+                    next(f)  # Header
+                    established += sum(1 for line in f if line.split()[3] == "01")
+            except (OSError, StopIteration):
+                continue
+        return established
+
+
+class ServerStats:
+    """Request counts and Vite compile times of this sandbox, and Vite's own traffic counters.
+
+    The HTTP server keeps one instance in memory; the command line loads and saves it around each run.
+    """
+
+    def __init__(self, started_at: float = 0.0):
+        self.started_at = started_at or time.time()
+        self.requests: Counter[str] = Counter()
+        self.last_edit_at = 0.0
+        self.compiles: Counter[str] = Counter()
+        self.compile_ms_sum = 0.0
+        self._vite: dict = {}
+        self._vite_read_at = 0.0
+
+    @staticmethod
+    def load(path: str = STATS_PATH) -> "ServerStats":
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            # First command of this sandbox; its uptime starts with the sandbox's first process.
+            return ServerStats(started_at=_boot_time())
+        stats = ServerStats(started_at=saved["started_at"])
+        stats.last_edit_at = saved["last_edit_at"]
+        stats.compiles = Counter(saved["compiles"])
+        stats.compile_ms_sum = saved["compile_ms_sum"]
+        return stats
+
+    def save(self, path: str = STATS_PATH) -> None:
+        saved = {
+            "started_at": self.started_at,
+            "last_edit_at": self.last_edit_at,
+            "compiles": dict(self.compiles),
+            "compile_ms_sum": self.compile_ms_sum,
+        }
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(saved, f)
+        os.replace(f"{path}.tmp", path)
+
+    def observe_compile(self, hmr: dict) -> None:
+        self.last_edit_at = time.time()
+        self.compiles[hmr["outcome"]] += 1
+        if hmr.get("compile_ms") is not None:
+            self.compile_ms_sum += hmr["compile_ms"]
+
+    async def vite(self) -> dict:
+        if time.monotonic() - self._vite_read_at >= METRICS_MAX_AGE:
+            try:
+                async with httpx.AsyncClient(timeout=1.0) as client:
+                    self._vite = (await client.get(HMR_ACK_URL)).json()
+            except Exception:
+                self._vite = {}
+            self._vite_read_at = time.monotonic()
+        return self._vite
+
+
+def _boot_time() -> float:
+    try:
+        return os.stat("/proc/1").st_ctime
+    except OSError:
+        return time.time()
+
+
+def is_component_valid(component: str) -> bool:
+    return "export default" in component
+
+
+def component_version(component: str) -> str:
+    """FNV-1a over UTF-16 code units, matching `componentVersion` in the Vite plugin."""
+    version = 0x811C9DC5
+    data = component.encode("utf-16-le")
+    for i in range(0, len(data), 2):
+        version ^= data[i] | (data[i + 1] << 8)
+        version = (version * 0x01000193) & 0xFFFFFFFF
+    return format(version, "x")
+
+
+async def wait_for_hmr(version: str, transport: Optional[httpx.AsyncBaseTransport] = None) -> dict:
+    """Wait until Vite has compiled the component with this version, and a connected page has fetched it.
+
+    Returns the outcome ("ok", "error", or "timeout" if Vite never reported it), how long it took
+    and the compile error, if any. `transport` stands in for Vite's server in tests.
+    """
+    start = time.monotonic()
+    state = None
+    async with httpx.AsyncClient(timeout=2.0, transport=transport) as client:
+        while time.monotonic() - start < HMR_ACK_TIMEOUT:
+            try:
+                response = await client.get(HMR_ACK_URL)
+                state = response.json() if response.status_code == 200 else None
+            except Exception as e:
+                print(f"Failed to read HMR status: {e}", file=sys.stderr)
+                state = None
+            if state and state["version"] == version and state["outcome"] != "pending":
+                break
+            await asyncio.sleep(0.05)
+        else:
+            return {"outcome": "timeout", "duration_ms": (time.monotonic() - start) * 1000, "compile_ms": None, "error": None, "served": False}
+
+        served_deadline = time.monotonic() + HMR_SERVED_TIMEOUT
+        while state["outcome"] == "ok" and state["clients"] and not state["served"] and time.monotonic() < served_deadline:
+            await asyncio.sleep(0.05)
+            try:
+                latest = (await client.get(HMR_ACK_URL)).json()
+            except Exception:
+                break
+            if latest["version"] != version:
+                break  # A newer edit has been written since.
+            state = latest
+    return {
+        "outcome": state["outcome"],
+        "duration_ms": (time.monotonic() - start) * 1000,
+        "compile_ms": state["durationMs"],
+        "error": state["error"],
+        "served": state["served"],
+    }
+
+
+async def render_metrics(sampler: ResourceSampler, stats: ServerStats) -> str:
+    """Resource usage and activity of this sandbox in the Prometheus text format, scraped by the controller"""
+    sample = sampler.sample()
+    vite = await stats.vite()
+    lines = [
+        "# TYPE sandbox_resident_memory_bytes gauge",
+        *[f'sandbox_resident_memory_bytes{{process="{name}"}} {group["rss_bytes"]}' for name, group in sorted(sample["processes"].items())],
+        "# TYPE sandbox_cpu_seconds_total counter",
+        *[f'sandbox_cpu_seconds_total{{process="{name}"}} {group["cpu_seconds"]:.2f}' for name, group in sorted(sample["processes"].items())],
+        "# TYPE sandbox_open_connections gauge",
+        f"sandbox_open_connections {sample['connections']}",
+        "# TYPE sandbox_requests_total counter",
+        *[f'sandbox_requests_total{{path="{path}"}} {count}' for path, count in sorted(stats.requests.items())],
+        "# TYPE sandbox_vite_requests_total counter",
+        f"sandbox_vite_requests_total {vite.get('requests', 0)}",
+        "# TYPE sandbox_vite_clients gauge",
+        f"sandbox_vite_clients {vite.get('clients', 0)}",
+        "# TYPE sandbox_vite_compiles_total counter",
+        *[f'sandbox_vite_compiles_total{{outcome="{outcome}"}} {count}' for outcome, count in sorted(stats.compiles.items())],
+        "# TYPE sandbox_vite_compile_ms_sum counter",
+        f"sandbox_vite_compile_ms_sum {stats.compile_ms_sum:.1f}",
+        "# TYPE sandbox_last_activity_timestamp_seconds gauge",
+        f"sandbox_last_activity_timestamp_seconds {max(stats.last_edit_at, vite.get('lastRequestAt', 0) / 1000):.0f}",
+        "# TYPE sandbox_uptime_seconds gauge",
+        f"sandbox_uptime_seconds {time.time() - stats.started_at:.0f}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+async def _ack(version: str) -> int:
+    hmr = await wait_for_hmr(version)
+    stats = ServerStats.load()
+    stats.observe_compile(hmr)
+    stats.save()
+    print(json.dumps(hmr))
+    return 0
+
+
+async def _metrics() -> int:
+    print(await render_metrics(ResourceSampler(), ServerStats.load()), end="")
+    return 0
+
+
+async def _heartbeat() -> int:
+    try:
+        async with httpx.AsyncClient(timeout=2.0) as client:
+            response = await client.get(HMR_ACK_URL)
+        return 0 if response.status_code == 200 else 1
+    except Exception as e:
+        print(f"Vite is not serving yet: {e}", file=sys.stderr)
+        return 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Control commands run in the sandbox by the controller")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ack = commands.add_parser("ack", help="Wait for Vite to compile the component with this version")
+    ack.add_argument("version")
+    commands.add_parser("metrics", help="Print resource usage in the Prometheus text format")
+    commands.add_parser("heartbeat", help="Exit 0 once Vite is serving")
+    args = parser.parse_args()
+    if args.command == "ack":
+        raise SystemExit(asyncio.run(_ack(args.version)))
+    if args.command == "metrics":
+        raise SystemExit(asyncio.run(_metrics()))
+    raise SystemExit(asyncio.run(_heartbeat()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+#!/bin/bash
+# Run at image build time: boot Vite once so its dependency pre-bundling lands in
+# node_modules/.vite and sandboxes don't redo it on their first page load.
+set -e
+
+cd /root/vite-app
+pnpm exec vite --host 127.0.0.1 --port 5173 > /tmp/prebundle.log 2>&1 &
+VITE_PID=$!
+
+for i in {1..120}; do
+    # Requesting the entry module makes Vite crawl the imports and write the optimized deps.
+    curl -s http://127.0.0.1:5173/src/main.tsx > /dev/null 2>&1 || true
+    if [ -f node_modules/.vite/deps/_metadata.json ]; then
+        echo "✅ Vite deps pre-bundled"
+        break
+    fi
+    if [ $i -eq 120 ]; then
+        echo "❌ Vite deps were not pre-bundled in time. Log:"
+        cat /tmp/prebundle.log
+        kill $VITE_PID || true
+        exit 1
+    fi
+    sleep 0.5
+done
+
+kill $VITE_PID
+wait $VITE_PID 2>/dev/null || true
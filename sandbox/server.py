@@ -4,11 +4,14 @@ This is a simple FastAPI server that can be used to test the sandbox server.
 This file is read in by the sandbox server and executed in the sandbox.
 """
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 import uvicorn
 
+from sandbox.control import COMPONENT_PATH, ResourceSampler, ServerStats, component_version, is_component_valid, render_metrics, wait_for_hmr
+
 fastapi_app = FastAPI()
 
 fastapi_app.add_middleware(
@@ -19,9 +22,15 @@ fastapi_app.add_middleware(
     allow_headers=["*"],
 )
 
+sampler = ResourceSampler()
+stats = ServerStats()
+ROUTES = ("/edit", "/heartbeat", "/metrics")
+
 
-def is_component_valid(component: str) -> bool:
-    return "export default" in component
+@fastapi_app.middleware("http")
+async def count_requests(request: Request, call_next):
+    stats.requests[request.url.path if request.url.path in ROUTES else "other"] += 1
+    return await call_next(request)
 
 
 class EditRequest(BaseModel):
@@ -37,10 +46,19 @@ async def edit_text(request: EditRequest):
         return {"status": "error", "message": "Invalid component"}
 
     print(f"Existing component: {llm_react_app}")
-    with open("/root/vite-app/src/LLMComponent.tsx", "w+") as f:
+    with open(COMPONENT_PATH, "w+", encoding="utf-8") as f:
         f.write(llm_react_app)
     print(f"Component edited to: {llm_react_app}")
-    return {"status": "ok"}
+    hmr = await wait_for_hmr(component_version(llm_react_app))
+    stats.observe_compile(hmr)
+    print(f"HMR update: {hmr}")
+    return {"status": "ok", "hmr": hmr}
+
+
+@fastapi_app.get("/metrics")
+async def metrics():
+    """Resource usage and activity of this sandbox in the Prometheus text format, scraped by the controller"""
+    return PlainTextResponse(await render_metrics(sampler, stats))
 
 
 @fastapi_app.get("/heartbeat")
@@ -1,22 +1,67 @@
+import os
+
 import modal
 
+from core.tracing import tracer
+
 SANDBOX_TIMEOUT = 86400  # 24 hours
+# "exec" drives sandboxes through `Sandbox.exec` and the filesystem API, "http" through a tunnel
+# to the FastAPI server in sandbox/server.py. See core/transport.py.
+SANDBOX_CONTROL = os.getenv("SANDBOX_CONTROL", "exec")
+
+
+async def run_sandbox(app: modal.App, image: modal.Image):
+    """Create a sandbox controlled the way `SANDBOX_CONTROL` says"""
+    if SANDBOX_CONTROL == "http":
+        return await run_sandbox_server_with_tunnel(app, image)
+    return await run_sandbox_with_exec_control(app, image)
+
+
+async def run_sandbox_with_exec_control(app: modal.App, image: modal.Image):
+    """Create a sandbox whose only tunnel is the user-facing Vite one.
+
+    There is no control server: the controller writes components with the sandbox filesystem API
+    and runs `python -m sandbox.control` with `Sandbox.exec`. The tunnel URL returned for the
+    control server is empty, which is how `core.transport.transport_for` tells the two apart.
+    """
+    print("🚀 Creating sandbox...")
+    with tracer.span("sandbox.create") as span:
+        sb = await modal.Sandbox.create.aio(
+            "/bin/bash",
+            "/root/startup.sh",
+            image=image,
+            app=app,
+            timeout=SANDBOX_TIMEOUT,
+            encrypted_ports=[5173],
+            env={"SANDBOX_CONTROL": "exec"},
+        )
+        span.set_attribute("sandbox_id", sb.object_id)
+    print(f"📋 Created sandbox with ID: {sb.object_id}")
+
+    with tracer.span("sandbox.tunnels", sandbox_id=sb.object_id):
+        tunnels = await sb.tunnels.aio()
+    user_tunnel = tunnels[5173]
+    print(f"🌐 Frontend URL: {user_tunnel.url} <-- Open this in your browser!")
+    return "", user_tunnel.url, sb.object_id
 
 async def run_sandbox_server_with_tunnel(app: modal.App, image: modal.Image):
     """Create and run a sandbox with an HTTP server exposed via tunnel"""
     print("🚀 Creating sandbox...")
-    sb = await modal.Sandbox.create.aio(
-        "/bin/bash",
-        "/root/startup.sh",
-        image=image,
-        app=app,
-        timeout=SANDBOX_TIMEOUT,
-        encrypted_ports=[8000, 5173],
-    )
+    with tracer.span("sandbox.create") as span:
+        sb = await modal.Sandbox.create.aio(
+            "/bin/bash",
+            "/root/startup.sh",
+            image=image,
+            app=app,
+            timeout=SANDBOX_TIMEOUT,
+            encrypted_ports=[8000, 5173],
+        )
+        span.set_attribute("sandbox_id", sb.object_id)
     print(f"📋 Created sandbox with ID: {sb.object_id}")
 
     print("⏳ Waiting for tunnels to establish...")    
-    tunnels = await sb.tunnels.aio()
+    with tracer.span("sandbox.tunnels", sandbox_id=sb.object_id):
+        tunnels = await sb.tunnels.aio()
     main_tunnel = tunnels[8000]
     user_tunnel = tunnels[5173]
     print("\n🚀 Creating HTTP Server with tunnel!")
@@ -33,3 +78,35 @@ async def run_sandbox_server_with_tunnel(app: modal.App, image: modal.Image):
 
     print("Sandbox server with tunnel running")
     return main_tunnel.url, user_tunnel.url, sb.object_id
+
+
+async def snapshot_warm_sandbox_image(app: modal.App, image: modal.Image, max_attempts: int = 120, delay: float = 0.5) -> modal.Image:
+    """Boot a sandbox, wait for startup.sh to report both services ready, then snapshot its filesystem.
+
+    The snapshot keeps everything Vite and pnpm wrote during a real boot (optimized deps, caches),
+    so sandboxes created from it skip that work.
+    """
+    import asyncio
+
+    print("🚀 Creating sandbox for warm snapshot...")
+    sb = await modal.Sandbox.create.aio(
+        "/bin/bash",
+        "/root/startup.sh",
+        image=image,
+        app=app,
+        timeout=600,
+    )
+    try:
+        for attempt in range(max_attempts):
+            # Fetching the entry module makes Vite transform the app once before the snapshot.
+            process = await sb.exec.aio(
+                "bash", "-c",
+                "curl -sf http://localhost:8000/heartbeat > /dev/null && curl -sf http://localhost:5173/src/main.tsx > /dev/null",
+            )
+            if await process.wait.aio() == 0:
+                print(f"✅ Sandbox {sb.object_id} is ready, snapshotting filesystem")
+                return await sb.snapshot_filesystem.aio()
+            await asyncio.sleep(delay)
+        raise RuntimeError(f"Sandbox {sb.object_id} did not become ready after {max_attempts} attempts")
+    finally:
+        await sb.terminate.aio()
@@ -3,11 +3,18 @@ set -e
 
 echo "🚀 Starting sandbox services..."
 
-# Start FastAPI server in background with logs
-echo "📦 Starting FastAPI server..."
-python /root/server.py > /tmp/fastapi.log 2>&1 &
-FASTAPI_PID=$!
-echo "FastAPI started with PID: $FASTAPI_PID"
+# With SANDBOX_CONTROL=exec the controller drives the sandbox through `Sandbox.exec` and the
+# filesystem API (see sandbox/control.py), so there is no FastAPI server or tunnel to it.
+if [ "$SANDBOX_CONTROL" = "exec" ]; then
+    echo "📦 Exec control, skipping FastAPI server"
+    FASTAPI_PID=""
+else
+    # Start FastAPI server in background with logs
+    echo "📦 Starting FastAPI server..."
+    python /root/server.py > /tmp/fastapi.log 2>&1 &
+    FASTAPI_PID=$!
+    echo "FastAPI started with PID: $FASTAPI_PID"
+fi
 
 # Start Vite dev server in background with logs
 echo "⚡ Starting Vite dev server..."
@@ -18,11 +25,13 @@ VITE_PID=$!
 echo "Vite started with PID: $VITE_PID"
 
 # Give services a moment to start
-sleep 3
+sleep 0.5
 
 # Check if processes are still running
 echo "Checking if services are running..."
-if ps -p $FASTAPI_PID > /dev/null; then
+if [ -z "$FASTAPI_PID" ]; then
+    FASTAPI_READY=true
+elif ps -p $FASTAPI_PID > /dev/null; then
     echo "✅ FastAPI process is running"
 else
     echo "❌ FastAPI process died! Log:"
@@ -40,9 +49,9 @@ fi
 
 # Simple health check - just see if ports are open
 echo "⏳ Waiting for services to be ready..."
-for i in {1..30}; do
+for i in {1..120}; do
     # Check FastAPI
-    if curl -s http://localhost:8000/heartbeat > /dev/null 2>&1; then
+    if [ -n "$FASTAPI_PID" ] && curl -s http://localhost:8000/heartbeat > /dev/null 2>&1; then
         echo "✅ FastAPI is ready!"
         FASTAPI_READY=true
     fi
@@ -59,8 +68,8 @@ for i in {1..30}; do
         break
     fi
     
-    if [ $i -eq 30 ]; then
-        echo "❌ Services failed to start after 30 attempts"
+    if [ $i -eq 120 ]; then
+        echo "❌ Services failed to start after 120 attempts"
         echo "FastAPI log:"
         cat /tmp/fastapi.log
         echo "Vite log:"
@@ -68,8 +77,8 @@ for i in {1..30}; do
         exit 1
     fi
     
-    echo "Attempt $i/30: Waiting for services..."
-    sleep 2
+    echo "Attempt $i/120: Waiting for services..."
+    sleep 0.5
 done
 
 # Keep the script running
@@ -0,0 +1,68 @@
+"""Helpers shared by the tests, which run the real controller code against the fakes in local/fakes.py.
+
+Tests are plain functions that drive coroutines with `asyncio.run`, so no pytest plugin is needed.
+"""
+
+import os
+import typing as t
+from datetime import datetime, timedelta
+
+import httpx
+
+from core.models import AppData, AppMetadata, AppStatus, Message, MessageType
+from core.sandbox import AppDirectory, SandboxApp
+from local.fakes import FakeDict
+
+WEB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "web")
+
+
+def local_web_app(fake_dict: t.Optional[FakeDict] = None, start_create_job=None, **kwargs):
+    """The controller's FastAPI app over an in-memory Dict. Returns `(web_app, app_directory)`.
+
+    Create jobs are accepted but, without `start_create_job`, never run.
+    """
+    from main import create_web_app
+
+    app_directory = AppDirectory(fake_dict if fake_dict is not None else FakeDict(), None, None)
+
+    async def never_start(job_id: str) -> None:
+        pass
+
+    return create_web_app(app_directory, start_create_job or never_start, web_dir=WEB_DIR, **kwargs), app_directory
+
+
+def client_for(web_app) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=web_app), base_url="http://controller")
+
+
+
+def sandbox_app(app_id: str, title: str = "A tiny app", instructions: t.Sequence[str] = (), client=None, transport=None) -> SandboxApp:
+    """An app whose chat has `instructions` from the user, each answered by the assistant."""
+    now = datetime.now()
+    metadata = AppMetadata(
+        id=app_id,
+        created_at=now,
+        updated_at=now,
+        status=AppStatus.ACTIVE,
+        sandbox_user_tunnel_url=f"https://{app_id}.example/user",
+        title=title,
+    )
+    messages = [Message(content=title, type=MessageType.USER), Message(content="Made it!", type=MessageType.ASSISTANT)]
+    for instruction in instructions:
+        messages += [Message(content=instruction, type=MessageType.USER), Message(content="Done!", type=MessageType.ASSISTANT)]
+    data = AppData(
+        id=app_id,
+        message_history=messages,
+        current_component="export default function App() { return <div>Hi</div>; }",
+        sandbox_tunnel_url=f"https://{app_id}.example",
+        sandbox_user_tunnel_url=metadata.sandbox_user_tunnel_url,
+        sandbox_object_id=app_id,
+    )
+    return SandboxApp(app_id, client, metadata, data, transport=transport)
+
+
+def edit(app: SandboxApp, instruction: str) -> None:
+    """Add an edit to `app`'s chat the way `SandboxApp.edit` does, without the LLM or the sandbox."""
+    app.data.message_history += [Message(content=instruction, type=MessageType.USER), Message(content="Done!", type=MessageType.ASSISTANT)]
+    # Saves in quick succession would otherwise share a version.
+    app.metadata.updated_at = max(datetime.now(), app.metadata.updated_at + timedelta(microseconds=1))
@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from core.capacity import POLICIES, USAGE_PREFIX, CapacityExceeded, CapacityManager, EvictionPolicy, UsageStore, UsageTracker, get_policy
+from core.sandbox import AppDirectory
+from local.fakes import FakeDict
+from local.sim_capacity import generate_trace, replay
+from tests.helpers import sandbox_app
+
+TRACE_ARGS = argparse.Namespace(
+    max_sandboxes=15,
+    hours=3,
+    creates_per_hour=30,
+    views_per_hour=400,
+    edit_ratio=0.05,
+    featured=3,
+    featured_share=0.2,
+    evergreen=0.1,
+    zipf=1.1,
+    seed=7,
+)
+
+
+@pytest.mark.parametrize("policy_name", sorted(POLICIES))
+def test_seeded_trace_stays_within_the_budget(policy_name):
+    apps, events = generate_trace(TRACE_ARGS)
+    result = asyncio.run(replay(policy_name, apps, events, TRACE_ARGS))
+    # Neither a featured app nor one in its grace period was evicted, and no create went over.
+    assert result["violations"] == []
+    assert result["peak"] <= TRACE_ARGS.max_sandboxes
+    assert result["evicted"] > 0
+
+
+def test_trace_is_seeded():
+    first = generate_trace(TRACE_ARGS)[1]
+    second = generate_trace(TRACE_ARGS)[1]
+    assert [(event.at, event.kind, event.app.app_id) for event in first] == [
+        (event.at, event.kind, event.app.app_id) for event in second
+    ]
+
+
+def test_make_room_evicts_nothing_when_too_few_apps_can_go():
+    async def run():
+        fake_dict = FakeDict()
+        app_directory = AppDirectory(fake_dict, None, None)
+        await app_directory.load()
+        apps = [sandbox_app(f"sb-{i}") for i in range(4)]
+        apps[0].metadata.is_featured = True
+        apps[1].metadata.is_featured = True
+        for app in apps[2:]:
+            app.metadata.created_at = datetime(2025, 1, 1)
+        await app_directory.set_apps(apps)
+
+        stopped = []
+
+        async def stop_sandbox(app_id: str) -> bool:
+            stopped.append(app_id)
+            return True
+
+        # Room for one more needs 3 of the 4 apps gone, and only the 2 old, unfeatured ones may go.
+        manager = CapacityManager(2, get_policy("lru"), UsageStore(fake_dict), stop_sandbox=stop_sandbox)
+        with pytest.raises(CapacityExceeded):
+            await manager.make_room(app_directory)
+        assert stopped == []
+        assert sorted(app_directory.apps) == ["sb-0", "sb-1", "sb-2", "sb-3"]
+
+        # With room for two, the two old apps go.
+        manager.max_sandboxes = 3
+        assert sorted(await manager.make_room(app_directory)) == ["sb-2", "sb-3"]
+        assert sorted(app_directory.apps) == ["sb-0", "sb-1"]
+
+    asyncio.run(run())
+
+
+def test_replicas_flushing_usage_keep_each_others_counts():
+    async def run():
+        fake_dict = FakeDict()
+        clock = lambda: datetime(2025, 1, 1)
+        replica_a = UsageTracker(UsageStore(fake_dict), clock=clock)
+        replica_b = UsageTracker(UsageStore(fake_dict), clock=clock)
+        replica_a.view("sb-1")
+        replica_a.edit("sb-2")
+        replica_b.view("sb-3")
+        # Flushes of different apps touch different keys, so neither overwrites the other.
+        await asyncio.gather(replica_a.flush(), replica_b.flush())
+        replica_b.view("sb-1")
+        await replica_b.flush()
+
+        usage = await UsageStore(fake_dict).load(["sb-1", "sb-2", "sb-3", "sb-4"])
+        assert {app_id: (entry.views, entry.edits) for app_id, entry in usage.items()} == {
+            "sb-1": (2, 0), "sb-2": (0, 1), "sb-3": (1, 0),
+        }
+
+        # A flush reads and writes only the apps it has hits for.
+        replica_a.view("sb-3")
+        reads, writes = fake_dict.reads, fake_dict.writes
+        await replica_a.flush()
+        assert (fake_dict.reads - reads, fake_dict.writes - writes) == (1, 1)
+
+    asyncio.run(run())
+
+
+def test_removing_an_app_drops_its_usage():
+    async def run():
+        fake_dict = FakeDict()
+        app_directory = AppDirectory(fake_dict, None, None)
+        await app_directory.load()
+        await app_directory.set_apps([sandbox_app("sb-1"), sandbox_app("sb-2")])
+        tracker = UsageTracker(UsageStore(fake_dict))
+        tracker.view("sb-1")
+        tracker.view("sb-2")
+        await tracker.flush()
+
+        await app_directory.remove_app("sb-1")
+        assert f"{USAGE_PREFIX}sb-1" not in fake_dict.data
+        assert sorted(await UsageStore(fake_dict).load(["sb-1", "sb-2"])) == ["sb-2"]
+
+    asyncio.run(run())
+
+
+def test_eviction_policies_must_define_a_value():
+    class Unvalued(EvictionPolicy):
+        name = "unvalued"
+
+    with pytest.raises(TypeError, match="value"):
+        Unvalued()
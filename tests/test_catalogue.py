@@ -0,0 +1,168 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from core.catalogue import SORT_KEYS, CatalogueIndex, CatalogueStore, encode_cursor
+from core.models import AppMetadata, AppStatus
+from core.sandbox import AppDirectory
+from local.fakes import FakeDict
+from tests.helpers import client_for, local_web_app, sandbox_app
+
+FILTERS = [(featured, status) for featured in (None, True, False) for status in (None, *AppStatus)]
+
+
+def _catalogue(count: int, seed: int = 0) -> dict[str, AppMetadata]:
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    apps = {}
+    for i in range(count):
+        metadata = sandbox_app(f"sb-{i:03}").metadata
+        # Few distinct timestamps, so the app id has to break ties.
+        metadata.created_at = start + timedelta(minutes=rng.randrange(20))
+        metadata.updated_at = metadata.created_at + timedelta(minutes=rng.randrange(20))
+        metadata.is_featured = rng.random() < 0.2
+        metadata.status = rng.choice(list(AppStatus))
+        apps[metadata.id] = metadata
+    return apps
+
+
+def _expected(apps: dict[str, AppMetadata], sort: str, featured, status) -> list[str]:
+    matches = [
+        metadata for metadata in apps.values()
+        if (featured is None or metadata.is_featured == featured) and (status is None or metadata.status == status)
+    ]
+    return [metadata.id for metadata in sorted(matches, key=SORT_KEYS[sort])]
+
+
+def _page_through(index: CatalogueIndex, sort: str, featured, status, limit: int) -> list[str]:
+    app_ids, cursor = [], None
+    while True:
+        page = index.query(sort=sort, featured=featured, status=status, cursor=cursor, limit=limit)
+        assert page.total == index.count(featured, status)
+        assert len(page.app_ids) <= limit
+        app_ids += page.app_ids
+        if page.next_cursor is None:
+            return app_ids
+        cursor = page.next_cursor
+
+
+def test_rebuild_moves_the_version_forward():
+    apps = [sandbox_app(f"sb-{i}").metadata for i in range(3)]
+    store = CatalogueStore(apps)
+    versions = [store.version]
+    for _ in range(3):
+        store.rebuild(apps)
+        versions.append(store.version)
+    store.rebuild([])
+    versions.append(store.version)
+    assert versions == sorted(set(versions))
+
+
+def test_listing_is_not_served_from_before_a_reload():
+    async def run():
+        fake_dict = FakeDict()
+        other = AppDirectory(fake_dict, None, None)
+        await other.load()
+        await other.set_apps([sandbox_app("sb-a"), sandbox_app("sb-b")])
+
+        web_app, app_directory = local_web_app(fake_dict)
+        await app_directory.load()
+        async with client_for(web_app) as client:
+            before = (await client.get("/api/apps")).json()
+            # Another container swaps one app for another, so the catalogue is as large as before.
+            await other.remove_app("sb-a")
+            await other.set_app(sandbox_app("sb-c"))
+            await app_directory.load()
+            after = (await client.get("/api/apps")).json()
+        return before, after
+
+    before, after = asyncio.run(run())
+    assert sorted(before["apps"]) == ["sb-a", "sb-b"]
+    assert sorted(after["apps"]) == ["sb-b", "sb-c"]
+
+
+@pytest.mark.parametrize("sort", sorted(SORT_KEYS))
+def test_paging_visits_every_match_once_in_order(sort):
+    apps = _catalogue(80)
+    index = CatalogueIndex()
+    index.rebuild(apps)
+    for featured, status in FILTERS:
+        expected = _expected(apps, sort, featured, status)
+        assert index.count(featured, status) == len(expected)
+        for limit in (1, 7, 200):
+            assert _page_through(index, sort, featured, status, limit) == expected
+
+
+def test_upsert_and_remove_keep_every_partition_sorted():
+    apps = _catalogue(60)
+    index = CatalogueIndex()
+    index.rebuild(apps)
+    rng = random.Random(1)
+    for step in range(200):
+        app_id = f"sb-{rng.randrange(70):03}"
+        if app_id in apps and rng.random() < 0.3:
+            del apps[app_id]
+            index.remove(app_id)
+            continue
+        metadata = apps.get(app_id) or sandbox_app(app_id).metadata
+        metadata = metadata.model_copy(update={
+            "updated_at": datetime(2025, 1, 1) + timedelta(minutes=rng.randrange(40)),
+            "is_featured": rng.random() < 0.2,
+            "status": rng.choice(list(AppStatus)),
+        })
+        apps[app_id] = metadata
+        index.upsert(metadata)
+
+    rebuilt = CatalogueIndex()
+    rebuilt.rebuild(apps)
+    assert len(index) == len(apps)
+    for sort in SORT_KEYS:
+        for featured, status in FILTERS:
+            assert _page_through(index, sort, featured, status, 9) == _expected(apps, sort, featured, status)
+    # Partitions emptied along the way may linger, but hold nothing.
+    for sort, partitions in index._sorted.items():
+        for partition, keys in partitions.items():
+            assert keys == rebuilt._sorted[sort].get(partition, [])
+
+
+def test_bad_and_mismatched_cursors_are_rejected():
+    index = CatalogueIndex()
+    index.rebuild(_catalogue(10))
+    featured_cursor = index.query(sort="featured", limit=2).next_cursor
+    created_cursor = index.query(sort="created_at", limit=2).next_cursor
+    for sort, cursor in [
+        ("updated_at", "not a cursor"),
+        ("updated_at", featured_cursor),
+        ("updated_at", created_cursor),
+        ("featured", created_cursor),
+        ("updated_at", encode_cursor("updated_at", (1.0,))),
+        ("updated_at", encode_cursor("updated_at", ("x", "sb-1"))),
+        ("updated_at", encode_cursor("updated_at", (1.0, 2))),
+    ]:
+        with pytest.raises(ValueError):
+            index.query(sort=sort, cursor=cursor)
+    with pytest.raises(ValueError):
+        index.query(sort="title")
+
+
+def test_api_answers_a_bad_cursor_with_a_400():
+    async def run():
+        web_app, app_directory = local_web_app()
+        await app_directory.load()
+        await app_directory.set_apps([sandbox_app(f"sb-{i}") for i in range(3)])
+        async with client_for(web_app) as client:
+            first = (await client.get("/api/apps", params={"sort": "created_at", "limit": 2})).json()
+            second = await client.get("/api/apps", params={"sort": "created_at", "limit": 2, "cursor": first["next_cursor"]})
+            mismatched = await client.get("/api/apps", params={"sort": "featured", "cursor": first["next_cursor"]})
+            garbage = await client.get("/api/apps", params={"cursor": "%%%"})
+        return first, second, mismatched, garbage
+
+    first, second, mismatched, garbage = asyncio.run(run())
+    assert len(first["apps"]) == 2 and first["total"] == 3
+    assert second.status_code == 200
+    assert sorted([*first["apps"], *second.json()["apps"]]) == ["sb-0", "sb-1", "sb-2"]
+    assert second.json()["next_cursor"] is None
+    assert mismatched.status_code == 400
+    assert garbage.status_code == 400
@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from core.create_job import (
+    _cancel_key, _job_key, _spans_key, cleanup_jobs, load_job, request_cancel, run_create_job, save_spans, submit_job, take_spans,
+)
+from core.llm import LLMGateway
+from core.models import JobStatus
+from core.sandbox import AppDirectory
+from local.fakes import FakeDict, FakeLLMClient
+from tests.helpers import client_for, local_web_app
+
+
+async def _age(fake_dict: FakeDict, job_id: str, status: JobStatus, hours: float) -> None:
+    job = await load_job(fake_dict, job_id)
+    job.status = status
+    job.updated_at = datetime.now() - timedelta(hours=hours)
+    # Not with `save_job`, which would stamp it as updated now.
+    await fake_dict.put.aio(_job_key(job_id), job.model_dump())
+
+
+def test_cleanup_removes_jobs_and_cancel_requests_nobody_needs():
+    async def run():
+        fake_dict = FakeDict()
+        fake_dict._put("app_sb-1", {"id": "sb-1"})
+        for job_id in ("done", "stuck", "recent", "running"):
+            await submit_job(fake_dict, job_id, "A tiny app")
+        await _age(fake_dict, "done", JobStatus.SUCCEEDED, hours=25)
+        await _age(fake_dict, "stuck", JobStatus.RUNNING, hours=25)
+        await _age(fake_dict, "recent", JobStatus.SUCCEEDED, hours=1)
+        await request_cancel(fake_dict, "stuck")
+        await request_cancel(fake_dict, "running")
+        await request_cancel(fake_dict, "orphan")
+        await save_spans(fake_dict, "done", [])
+        await save_spans(fake_dict, "recent", [])
+
+        assert await cleanup_jobs(fake_dict) == 2
+        assert sorted(key for key in fake_dict.data if key.startswith("create_job_")) == [
+            _job_key("recent"), _spans_key("recent"), _job_key("running"), _cancel_key("running"),
+        ]
+        assert "app_sb-1" in fake_dict.data
+        assert await cleanup_jobs(fake_dict) == 0
+
+    asyncio.run(run())
+
+
+def test_unknown_job_is_a_404():
+    web_app, _ = local_web_app()
+
+    async def run():
+        async with client_for(web_app) as client:
+            return await client.get("/api/create/does-not-exist")
+
+    assert asyncio.run(run()).status_code == 404
+
+
+def test_spans_are_taken_once():
+    async def run():
+        fake_dict = FakeDict(latency=0.01)
+        await save_spans(fake_dict, "job-1", [{"name": "create_sandbox_app"}])
+        return await asyncio.gather(take_spans(fake_dict, "job-1"), take_spans(fake_dict, "job-1"))
+
+    assert sorted(asyncio.run(run()), key=len) == [[], [{"name": "create_sandbox_app"}]]
+
+
+def test_job_that_could_not_be_started_fails():
+    fake_dict = FakeDict()
+
+    async def start_create_job(job_id: str) -> None:
+        raise ConnectionError("spawn failed")
+
+    web_app, _ = local_web_app(fake_dict, start_create_job=start_create_job)
+
+    async def run():
+        async with client_for(web_app) as client:
+            response = await client.post("/api/create", json={"prompt": "A tiny app"})
+            status = await client.get(f"/api/create/{response.json()['job_id']}")
+        return response, status
+
+    response, status = asyncio.run(run())
+    assert response.status_code == 503
+    assert status.json()["status"] == "failed"
+    assert "spawn failed" in status.json()["error"]
+
+
+def _run_job(fake_dict: FakeDict, boot: float, cancel_during_boot: bool, poll_interval: float):
+    """Run a job whose sandbox takes `boot` seconds to start. Returns the job and the sandboxes stopped."""
+    stopped = []
+
+    async def start_sandbox(app=None, image=None):
+        if cancel_during_boot:
+            await request_cancel(fake_dict, "job-1")
+        await asyncio.sleep(boot)
+        return "https://sb-1.example", "https://sb-1.example/user", "sb-1"
+
+    async def stop_sandbox(object_id: str) -> bool:
+        stopped.append(object_id)
+        return True
+
+    async def run():
+        app_directory = AppDirectory(fake_dict, None, LLMGateway(FakeLLMClient()))
+        await app_directory.load()
+        await submit_job(fake_dict, "job-1", "A tiny app")
+        return await run_create_job(
+            fake_dict, app_directory, "job-1", None, start_sandbox=start_sandbox, stop_sandbox=stop_sandbox, poll_interval=poll_interval,
+        )
+
+    return asyncio.run(run()), stopped
+
+
+def test_cancel_before_the_sandbox_id_is_saved_stops_the_sandbox():
+    # The cancel lands while the sandbox boots and the watcher hasn't polled yet.
+    job, stopped = _run_job(FakeDict(), boot=0.01, cancel_during_boot=True, poll_interval=60)
+    assert job.status == JobStatus.CANCELLED
+    assert stopped == ["sb-1"]
+
+
+def test_build_cancelled_while_the_sandbox_boots_stops_it_once_booted():
+    job, stopped = _run_job(FakeDict(), boot=0.2, cancel_during_boot=True, poll_interval=0.01)
+    assert job.status == JobStatus.CANCELLED
+    assert job.sandbox_object_id == "sb-1"
+    assert stopped == ["sb-1"]
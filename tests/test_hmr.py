@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+
+from sandbox import control
+from sandbox.control import HMR_ACK_URL, component_version, wait_for_hmr
+
+VERSION = component_version("export default function App() { return <div>Hi</div> }")
+
+
+def _state(version: str = VERSION, outcome: str = "ok", **kwargs) -> dict:
+    """A /__hmr_ack reply of the hmr-ack plugin in web/vite-app/vite.config.ts."""
+    return {"version": version, "outcome": outcome, "error": None, "durationMs": 12, "served": False, "clients": 0,
+            "requests": 0, "lastRequestAt": 0, **kwargs}
+
+
+def _vite(*replies) -> tuple[httpx.MockTransport, list]:
+    """Answers each poll with the next reply, repeating the last one; a reply can be an exception to raise."""
+    polls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert str(request.url) == HMR_ACK_URL
+        reply = replies[min(len(polls), len(replies) - 1)]
+        polls.append(reply)
+        if isinstance(reply, Exception):
+            raise reply
+        return httpx.Response(200, json=reply)
+
+    return httpx.MockTransport(handler), polls
+
+
+def test_ok_once_vite_compiled_the_new_version():
+    transport, polls = _vite(_state(version="older"), _state(outcome="pending"), _state())
+    hmr = asyncio.run(wait_for_hmr(VERSION, transport=transport))
+    assert hmr["outcome"] == "ok"
+    assert hmr["compile_ms"] == 12
+    assert hmr["error"] is None
+    assert len(polls) == 3
+
+
+def test_compile_errors_are_reported():
+    transport, _ = _vite(_state(outcome="pending"), _state(outcome="error", error="Unexpected token (3:4)"))
+    hmr = asyncio.run(wait_for_hmr(VERSION, transport=transport))
+    assert hmr["outcome"] == "error"
+    assert hmr["error"] == "Unexpected token (3:4)"
+    assert hmr["served"] is False
+
+
+def test_waits_for_a_connected_page_to_fetch_the_update():
+    transport, polls = _vite(_state(clients=1), _state(clients=1), _state(clients=1, served=True))
+    hmr = asyncio.run(wait_for_hmr(VERSION, transport=transport))
+    assert hmr["outcome"] == "ok"
+    assert hmr["served"] is True
+    assert len(polls) == 3
+
+
+def test_stops_waiting_for_the_page_once_a_newer_edit_is_written():
+    transport, _ = _vite(_state(clients=1), _state(version="newer", outcome="pending"))
+    hmr = asyncio.run(wait_for_hmr(VERSION, transport=transport))
+    assert hmr["outcome"] == "ok"
+    assert hmr["served"] is False
+
+
+def test_times_out_when_vite_never_reports_the_version(monkeypatch):
+    monkeypatch.setattr(control, "HMR_ACK_TIMEOUT", 0.2)
+    transport, polls = _vite(httpx.ConnectError("Connection refused"), _state(outcome="pending"))
+    hmr = asyncio.run(wait_for_hmr(VERSION, transport=transport))
+    assert hmr["outcome"] == "timeout"
+    assert hmr["compile_ms"] is None
+    assert hmr["served"] is False
+    assert len(polls) > 1
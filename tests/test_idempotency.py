@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from core.idempotency import IdempotencyStore
+from local.fakes import FakeDict
+
+
+def _handler(calls: list):
+    async def fn():
+        calls.append(1)
+        return 202, {"job_id": f"job-{len(calls)}"}
+
+    return fn
+
+
+def test_repeats_replay_the_first_response():
+    async def run():
+        store = IdempotencyStore(FakeDict())
+        calls = []
+        first = await store.run("create", "fp", _handler(calls), key="k")
+        second = await store.run("create", "fp", _handler(calls), key="k")
+        return calls, first, second
+
+    calls, first, second = asyncio.run(run())
+    assert len(calls) == 1
+    assert (first.outcome, second.outcome) == ("executed", "replayed")
+    assert second.body == first.body
+
+
+def test_expired_records_are_run_again():
+    async def run():
+        store = IdempotencyStore(FakeDict(), ttl_seconds=-1)
+        calls = []
+        await store.run("create", "fp", _handler(calls), key="k")
+        response = await store.run("create", "fp", _handler(calls), key="k")
+        return calls, response
+
+    calls, response = asyncio.run(run())
+    assert len(calls) == 2
+    assert response.outcome == "executed"
+
+
+def test_cleanup_deletes_only_expired_records():
+    async def run():
+        records = FakeDict()
+        expiring = IdempotencyStore(records, ttl_seconds=-1)
+        await expiring.run("create", "fp", _handler([]), key="old")
+        for key in ("new", "newer", "newest"):
+            await IdempotencyStore(records).run("create", "fp", _handler([]), key=key)
+        records._put("idempotency_write_stuck", {"state": "in_progress", "fingerprint": "fp", "expires_at": time.time() - 1})
+
+        reads = records.reads
+        assert await IdempotencyStore(records).cleanup() == 2
+        # One pass over the records, and a check of each one deleted; no read per live record.
+        assert records.reads - reads == 1 + 2
+        return sorted(records.data)
+
+    assert asyncio.run(run()) == ["idempotency_create_new", "idempotency_create_newer", "idempotency_create_newest"]
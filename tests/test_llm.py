@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from core.llm import LatencyWindow, LLMGateway, ModelConfig, Route, llm_metrics
+from local.fakes import FakeAPIError, FakeLLMClient
+
+PRIMARY = "test-primary"
+FALLBACK = "test-fallback"
+
+
+def _gateway(fake: FakeLLMClient, hedge_percentile=None, timeout: float = 1.0) -> LLMGateway:
+    route = Route((ModelConfig(PRIMARY, timeout, 2), ModelConfig(FALLBACK, timeout)), hedge_percentile=hedge_percentile)
+    return LLMGateway(fake, routes={"generate": route}, backoff_base=0.0, seed=0)
+
+
+def _prime_latencies(gateway: LLMGateway, model: str, seconds: float) -> None:
+    window = gateway._latencies.setdefault(model, LatencyWindow())
+    for _ in range(window.min_samples):
+        window.add(seconds)
+
+
+def test_retries_overloaded_requests():
+    fake = FakeLLMClient(failures={PRIMARY: [529]})
+    text = asyncio.run(_gateway(fake).generate("Make a counter app"))
+    assert text
+    assert fake.calls_by_model == {PRIMARY: 2}
+
+
+def test_retries_timeouts():
+    fake = FakeLLMClient(failures={PRIMARY: ["hang"]})
+    asyncio.run(_gateway(fake, timeout=0.05).generate("Make a counter app"))
+    assert fake.calls_by_model == {PRIMARY: 2}
+
+
+def test_falls_back_once_retries_run_out():
+    fake = FakeLLMClient(failures={PRIMARY: [529, 429]})
+    fallbacks_before = llm_metrics.fallbacks["generate"]
+    text = asyncio.run(_gateway(fake).generate("Make a counter app"))
+    assert text == FakeLLMClient().respond(FALLBACK, "Make a counter app", 8192).content[0].text
+    assert fake.calls_by_model == {PRIMARY: 2, FALLBACK: 1}
+    assert llm_metrics.fallbacks["generate"] == fallbacks_before + 1
+
+
+def test_falls_back_when_the_model_is_missing():
+    fake = FakeLLMClient(failures={PRIMARY: [404]})
+    asyncio.run(_gateway(fake).generate("Make a counter app"))
+    assert fake.calls_by_model == {PRIMARY: 1, FALLBACK: 1}
+
+
+def test_raises_errors_that_are_not_worth_retrying():
+    fake = FakeLLMClient(failures={PRIMARY: [400]})
+    with pytest.raises(FakeAPIError) as error:
+        asyncio.run(_gateway(fake).generate("Make a counter app"))
+    assert error.value.status_code == 400
+    assert fake.calls_by_model == {PRIMARY: 1}
+
+
+def test_raises_the_last_error_when_every_model_fails():
+    fake = FakeLLMClient(failures={PRIMARY: [529, 529], FALLBACK: [503, 503]})
+    with pytest.raises(FakeAPIError) as error:
+        asyncio.run(_gateway(fake).generate("Make a counter app"))
+    assert error.value.status_code == 503
+
+
+def test_hedges_slow_requests():
+    # The first request never answers; the hedge, fired after the p90 latency, does.
+    fake = FakeLLMClient(failures={PRIMARY: ["hang"]})
+    gateway = _gateway(fake, hedge_percentile=0.9, timeout=30)
+    _prime_latencies(gateway, PRIMARY, 0.02)
+    hedges_before = llm_metrics.hedges[(PRIMARY, "hedge")]
+
+    async def run():
+        text = await gateway.generate("Make a counter app")
+        await asyncio.sleep(0)  # Let the cancelled first request finish its span.
+        return text
+
+    assert asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert fake.calls_by_model == {PRIMARY: 2}
+    assert llm_metrics.hedges[(PRIMARY, "hedge")] == hedges_before + 1
+
+
+def test_does_not_hedge_without_enough_latency_samples():
+    fake = FakeLLMClient(default_latency=0.05)
+    gateway = _gateway(fake, hedge_percentile=0.9)
+    asyncio.run(gateway.generate("Make a counter app"))
+    assert fake.calls_by_model == {PRIMARY: 1}
+
+
+@pytest.mark.parametrize("cancel_after", [0.05, 0.3])
+def test_cancelling_the_caller_cancels_its_requests(cancel_after):
+    # Cancelled while waiting to hedge, and while waiting for either request after hedging.
+    fake = FakeLLMClient(failures={PRIMARY: ["hang", "hang"]})
+    gateway = _gateway(fake, hedge_percentile=0.9, timeout=30)
+    _prime_latencies(gateway, PRIMARY, 0.2)
+
+    async def run():
+        call = asyncio.create_task(gateway.generate("Make a counter app"))
+        await asyncio.sleep(cancel_after)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0.01)
+        return asyncio.all_tasks() - {asyncio.current_task()}
+
+    assert asyncio.run(run()) == set()
+
+
+def test_routes_need_a_model_and_models_an_attempt():
+    with pytest.raises(ValueError, match="at least one model"):
+        Route(())
+    with pytest.raises(ValueError, match="at least one attempt"):
+        ModelConfig(PRIMARY, 1.0, max_attempts=0)
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import pytest
+
+from core.loop_monitor import MAX_STALLS, LoopLagMonitor, LoopStall
+from tests.helpers import client_for, local_web_app
+
+
+def _app_with_monitor(monkeypatch):
+    monkeypatch.setenv("LOOP_LAG_THRESHOLD_MS", "100")
+    web_app, _ = local_web_app()
+
+    @web_app.get("/test/blocking")
+    async def blocking():
+        time.sleep(0.3)  # A synchronous call inside an async handler.
+        return {"ok": True}
+
+    @web_app.get("/test/awaiting")
+    async def awaiting():
+        await asyncio.sleep(0.3)
+        return {"ok": True}
+
+    return web_app
+
+
+def test_blocking_handler_is_flagged(monkeypatch):
+    web_app = _app_with_monitor(monkeypatch)
+    monitor = web_app.state.loop_monitor
+
+    async def run():
+        async with client_for(web_app) as client, monitor:
+            response = await client.get("/test/blocking")
+        assert response.status_code == 200
+
+    asyncio.run(run())
+    assert monitor.stall_count >= 1
+    assert any("GET /test/blocking" in stall.in_flight for stall in monitor.stalls)
+    with pytest.raises(AssertionError, match="GET /test/blocking"):
+        monitor.assert_no_stalls()
+
+
+def test_awaiting_handler_is_not_flagged(monkeypatch):
+    web_app = _app_with_monitor(monkeypatch)
+    monitor = web_app.state.loop_monitor
+
+    async def run():
+        async with client_for(web_app) as client, monitor:
+            response = await client.get("/test/awaiting")
+        assert response.status_code == 200
+
+    asyncio.run(run())
+    assert not any("GET /test/awaiting" in stall.in_flight for stall in monitor.stalls)
+
+
+def test_stalls_are_capped():
+    monitor = LoopLagMonitor()
+    for _ in range(MAX_STALLS + 10):
+        monitor.stalls.append(LoopStall(lag_ms=60.0))
+        monitor.stall_count += 1
+    assert len(monitor.stalls) == MAX_STALLS
+    with pytest.raises(AssertionError, match=f"{MAX_STALLS + 10} time"):
+        monitor.assert_no_stalls()
@@ -0,0 +1,110 @@
+import asyncio
+import re
+
+from core.create_job import save_spans, submit_job
+from core.models import JobStatus
+from core.tracing import OTLPHttpExporter, StageMetrics, tracer
+from local.fakes import FakeDict
+from tests.helpers import client_for, local_web_app
+
+
+def _samples(text: str, metric: str, stage: str) -> dict[str, float]:
+    samples = {}
+    for name, labels, value in re.findall(r"^(\w+)\{([^}]*)\} (\S+)$", text, re.MULTILINE):
+        if name.startswith(metric) and f'stage="{stage}"' in labels:
+            le = re.search(r'le="([^"]+)"', labels)
+            samples[name[len(metric):] + (f"[{le.group(1)}]" if le else "")] = float(value)
+    return samples
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = StageMetrics(buckets_ms=(10, 100))
+    for duration_ms in (5, 50, 50, 500):
+        metrics.observe_value("render", duration_ms)
+    samples = _samples(metrics.render_prometheus(), "modal_vibe_stage_duration_ms", "render")
+    assert samples == {
+        "_bucket[10]": 1,
+        "_bucket[100]": 3,
+        "_bucket[+Inf]": 4,
+        "_sum": 605,
+        "_count": 4,
+    }
+
+
+def test_metrics_endpoint_reports_traced_stages():
+    web_app, _ = local_web_app()
+
+    async def run():
+        for _ in range(3):
+            with tracer.span("test.metrics_stage"):
+                pass
+        try:
+            with tracer.span("test.metrics_stage"):
+                raise ValueError("boom")
+        except ValueError:
+            pass
+        async with client_for(web_app) as client:
+            return await client.get("/metrics")
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert "# TYPE modal_vibe_stage_duration_ms histogram" in text
+    samples = _samples(text, "modal_vibe_stage_duration_ms", "test.metrics_stage")
+    # Spans this fast all land in the first bucket, and the buckets count up to the total.
+    assert samples["_bucket[5]"] == samples["_bucket[+Inf]"] == samples["_count"] == 4
+    assert 'modal_vibe_stage_errors_total{stage="test.metrics_stage"} 1' in text
+
+
+def test_metrics_endpoint_reports_startup_phases_without_observing_spans():
+    from core.startup import startup
+
+    web_app, _ = local_web_app()
+    with startup.phase("test_phase"):
+        pass
+
+    async def run():
+        async with client_for(web_app) as client:
+            return await client.get("/metrics")
+
+    assert startup in tracer.renderers and startup not in tracer.observers
+    assert re.search(r'^modal_vibe_startup_phase_ms\{phase="test_phase"\} [0-9.]+$', asyncio.run(run()).text, re.MULTILINE)
+
+
+def test_worker_spans_are_counted_once_when_replicas_poll_together():
+    fake_dict = FakeDict(latency=0.01)
+    replicas = [local_web_app(fake_dict)[0] for _ in range(2)]
+
+    async def run():
+        job = await submit_job(fake_dict, "job-1", "A tiny app")
+        job.status = JobStatus.SUCCEEDED
+        await fake_dict.put.aio("create_job_job-1", job.model_dump())
+        with tracer.capture() as captured, tracer.span("test.worker_stage"):
+            pass
+        tracer.metrics._counts.pop("test.worker_stage")  # As if it had been recorded by the worker.
+        await save_spans(fake_dict, "job-1", [span.to_dict() for span in captured.spans])
+
+        clients = [client_for(web_app) for web_app in replicas]
+        responses = await asyncio.gather(*[client.get("/api/create/job-1") for client in clients for _ in range(3)])
+        for client in clients:
+            await client.aclose()
+        return responses
+
+    responses = asyncio.run(run())
+    assert {response.status_code for response in responses} == {200}
+    assert sum(tracer.metrics._counts["test.worker_stage"]) == 1
+
+
+def test_otlp_exporter_keeps_its_posts_until_they_finish():
+    exporter = OTLPHttpExporter("http://127.0.0.1:9", service_name="test", batch_size=2)
+
+    async def run():
+        with tracer.span("test.otlp_stage") as span:
+            pass
+        exporter.export([span, span])
+        assert len(exporter._posts) == 1
+        await exporter.flush()
+        assert not exporter._posts
+
+    asyncio.run(run())
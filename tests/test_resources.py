@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from core.models import AppResources
+from core.resources import RESOURCES_PREFIX, ResourceStore, accumulate, heaviest_idle, parse_prometheus
+from core.sandbox import AppDirectory
+from local.fakes import FakeDict, FakeSandboxes, FakeSandboxTransport
+from tests.helpers import sandbox_app
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+def _sample(rss_bytes: float = 200e6, cpu_seconds: float = 10.0, **kwargs) -> dict[str, float]:
+    return {"sandbox_resident_memory_bytes": rss_bytes, "sandbox_cpu_seconds_total": cpu_seconds, **kwargs}
+
+
+def test_parse_prometheus_reads_labels_and_skips_comments_and_junk():
+    text = (
+        "# TYPE sandbox_resident_memory_bytes gauge\n"
+        'sandbox_resident_memory_bytes{process="vite"} 1200\n'
+        'sandbox_requests_total{path="/edit", method = "POST"} 3\n'
+        "\n"
+        "sandbox_open_connections 2\n"
+        "sandbox_uptime_seconds not-a-number\n"
+    )
+    assert parse_prometheus(text) == [
+        ("sandbox_resident_memory_bytes", {"process": "vite"}, 1200.0),
+        ("sandbox_requests_total", {"path": "/edit", "method": "POST"}, 3.0),
+        ("sandbox_open_connections", {}, 2.0),
+    ]
+
+
+def test_accumulate_starts_from_the_first_scrape():
+    resources = accumulate(None, "sb-1", _sample(sandbox_vite_compiles_total=4, sandbox_vite_compile_ms_sum=200), NOW)
+    assert resources.samples == 1
+    assert resources.rss_bytes == resources.rss_bytes_avg == resources.rss_bytes_max == 200e6
+    assert resources.cpu_cores_avg == 0.0
+    assert resources.compile_ms_avg == 50.0
+    assert resources.last_active_at is None
+
+
+def test_accumulate_averages_memory_and_cpu_between_scrapes():
+    first = accumulate(None, "sb-1", _sample(rss_bytes=100e6, cpu_seconds=10), NOW)
+    second = accumulate(first, "sb-1", _sample(rss_bytes=200e6, cpu_seconds=40), NOW + timedelta(seconds=60), alpha=0.5)
+    assert second.samples == 2
+    assert second.rss_bytes_avg == 150e6
+    assert second.rss_bytes_max == 200e6
+    assert second.cpu_cores_avg == 0.5  # The first interval is taken as is.
+    third = accumulate(second, "sb-1", _sample(rss_bytes=50e6, cpu_seconds=40), NOW + timedelta(seconds=120), alpha=0.5)
+    assert third.rss_bytes_max == 200e6
+    assert third.cpu_cores_avg == 0.25
+
+
+def test_accumulate_skips_cpu_that_went_backwards_and_keeps_the_latest_activity():
+    active_at = NOW - timedelta(minutes=5)
+    first = accumulate(None, "sb-1", _sample(cpu_seconds=10, sandbox_last_activity_timestamp_seconds=active_at.timestamp()), NOW)
+    second = accumulate(first, "sb-1", _sample(cpu_seconds=40), NOW + timedelta(seconds=60))
+    restarted = accumulate(second, "sb-1", _sample(cpu_seconds=1), NOW + timedelta(seconds=120))
+    assert restarted.cpu_cores_avg == second.cpu_cores_avg == 0.5
+    assert restarted.last_active_at == active_at
+
+
+def test_heaviest_idle_leaves_out_viewed_and_recently_active_apps():
+    def app(app_id: str, rss_bytes_avg: float, viewers: int = 0, active_minutes_ago=None) -> AppResources:
+        last_active_at = NOW - timedelta(minutes=active_minutes_ago) if active_minutes_ago is not None else None
+        return AppResources(app_id=app_id, scraped_at=NOW, rss_bytes_avg=rss_bytes_avg, viewers=viewers, last_active_at=last_active_at)
+
+    resources = [
+        app("light", 100e6),
+        app("heavy", 400e6, active_minutes_ago=60),
+        app("viewed", 900e6, viewers=1),
+        app("recent", 800e6, active_minutes_ago=5),
+        app("medium", 250e6),
+    ]
+    idle = heaviest_idle(resources, timedelta(minutes=30), now=NOW)
+    assert [entry.app_id for entry in idle] == ["heavy", "medium", "light"]
+    assert [entry.app_id for entry in heaviest_idle(resources, timedelta(minutes=30), now=NOW, limit=1)] == ["heavy"]
+
+
+def test_record_reads_and_writes_only_the_apps_scraped():
+    async def run():
+        fake_dict = FakeDict()
+        store = ResourceStore(fake_dict)
+        await store.record({"sb-1": _sample(rss_bytes=100e6), "sb-2": _sample()})
+        reads, writes = fake_dict.reads, fake_dict.writes
+        recorded = await store.record({"sb-1": _sample(rss_bytes=300e6)})
+        assert fake_dict.reads - reads == 1
+        assert fake_dict.writes - writes == 1
+        assert recorded["sb-1"].samples == 2
+        loaded = await store.load(["sb-1", "sb-2", "sb-3"])
+        assert sorted(loaded) == ["sb-1", "sb-2"]
+        assert loaded["sb-1"].rss_bytes_max == 300e6
+        assert loaded["sb-2"].samples == 1
+
+    asyncio.run(run())
+
+
+def test_cleanup_scrapes_sandboxes_concurrently_and_drops_dead_apps():
+    class SlowTransport(FakeSandboxTransport):
+        def __init__(self, sandboxes: FakeSandboxes):
+            super().__init__(sandboxes)
+            self.scraping = 0
+            self.most_at_once = 0
+
+        async def metrics(self, data):
+            self.scraping += 1
+            self.most_at_once = max(self.most_at_once, self.scraping)
+            await asyncio.sleep(0.01)
+            self.scraping -= 1
+            return await super().metrics(data)
+
+    async def run():
+        fake_dict = FakeDict()
+        sandboxes = FakeSandboxes()
+        transport = SlowTransport(sandboxes)
+        app_directory = AppDirectory(fake_dict, None, None, transport=transport)
+        await app_directory.load()
+        await app_directory.set_apps([sandbox_app(f"sb-{i}") for i in range(6)])
+        await ResourceStore(fake_dict).record({"sb-0": _sample()})
+        await sandboxes.terminate_sandbox("sb-0")
+
+        await app_directory.cleanup(resources=ResourceStore(fake_dict), concurrency=3)
+        assert transport.most_at_once == 3
+        assert "sb-0" not in app_directory.apps
+        assert f"{RESOURCES_PREFIX}sb-0" not in fake_dict.data
+        assert sorted(await ResourceStore(fake_dict).load(app_directory.apps)) == [f"sb-{i}" for i in range(1, 6)]
+
+    asyncio.run(run())
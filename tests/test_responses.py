@@ -0,0 +1,153 @@
+import asyncio
+import gzip
+import json
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from core.assets import IMMUTABLE, REVALIDATE, StaticAssets
+from core.responses import CompressionMiddleware, EncodedBody, RenderedPages, encoded_response, response_metrics
+from core.tracing import tracer
+
+ITEMS = [{"id": i, "title": f"App number {i}"} for i in range(100)]
+
+
+def _get(app, path: str, **headers) -> httpx.Response:
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://controller") as client:
+            return await client.get(path, headers=headers)
+
+    return asyncio.run(run())
+
+
+def _compressing_app() -> Starlette:
+    async def large(request):
+        return JSONResponse(ITEMS)
+
+    async def small(request):
+        return JSONResponse({"status": "ok"})
+
+    async def image(request):
+        return Response(b"\x89PNG" + bytes(4096), media_type="image/png")
+
+    async def encoded(request):
+        return Response(gzip.compress(json.dumps(ITEMS).encode()), media_type="application/json", headers={"Content-Encoding": "gzip"})
+
+    routes = [Route("/large", large), Route("/small", small), Route("/image", image), Route("/encoded", encoded)]
+    app = Starlette(routes=routes)
+    app.add_middleware(CompressionMiddleware)
+    return app
+
+
+def test_compression_middleware_compresses_large_text_responses():
+    app = _compressing_app()
+    response = _get(app, "/large", **{"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(json.dumps(ITEMS))
+    assert response.json() == ITEMS  # httpx decodes the body.
+
+    identity = _get(app, "/large", **{"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+    assert identity.json() == ITEMS
+
+
+def test_compression_middleware_leaves_small_binary_and_encoded_responses_alone():
+    app = _compressing_app()
+    small = _get(app, "/small", **{"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert small.json() == {"status": "ok"}
+    image = _get(app, "/image", **{"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in image.headers
+    assert len(image.content) == 4100
+    encoded = _get(app, "/encoded", **{"Accept-Encoding": "gzip"})
+    assert encoded.headers["content-encoding"] == "gzip"
+    assert encoded.json() == ITEMS  # Compressed once, not twice.
+
+
+def test_encoded_response_answers_a_matching_etag_with_a_304():
+    body = EncodedBody(json.dumps(ITEMS).encode(), "application/json")
+
+    async def endpoint(request: Request):
+        return encoded_response(request, body, {"Cache-Control": "no-cache"})
+
+    app = Starlette(routes=[Route("/apps", endpoint)])
+    first = _get(app, "/apps", **{"Accept-Encoding": "gzip"})
+    assert first.status_code == 200
+    assert first.headers["etag"] == body.etag
+    assert first.headers["content-encoding"] == "gzip"
+    assert first.headers["cache-control"] == "no-cache"
+    assert first.json() == ITEMS
+
+    cached = _get(app, "/apps", **{"Accept-Encoding": "gzip", "If-None-Match": body.etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == body.etag
+    stale = _get(app, "/apps", **{"Accept-Encoding": "identity", "If-None-Match": '"something-else"'})
+    assert stale.status_code == 200
+    assert "content-encoding" not in stale.headers
+
+
+def test_response_bytes_reach_the_metrics_without_observing_spans():
+    app = _compressing_app()
+    sent = response_metrics.sent_bytes["gzip"]
+    _get(app, "/large", **{"Accept-Encoding": "gzip"})
+    assert response_metrics.sent_bytes["gzip"] > sent
+    assert response_metrics in tracer.renderers and response_metrics not in tracer.observers
+    assert "modal_vibe_response_bytes_total" in tracer.render_prometheus()
+
+
+def test_rendered_pages_are_reused_until_their_version_changes():
+    pages = RenderedPages("test", max_entries=2)
+    body = EncodedBody(b"<html>sb-1</html>", "text/html")
+    misses = response_metrics.page_cache[("test", "miss")]
+    assert pages.get("sb-1", 1) is None
+    pages.put("sb-1", 1, body)
+    assert pages.get("sb-1", 1) is body
+    assert pages.get("sb-1", 2) is None
+    assert response_metrics.page_cache[("test", "hit")] == 1
+    assert response_metrics.page_cache[("test", "miss")] == misses + 2
+
+
+def test_rendered_pages_evict_the_least_recently_used():
+    pages = RenderedPages("test-lru", max_entries=2)
+    for app_id in ("sb-1", "sb-2"):
+        pages.put(app_id, 1, EncodedBody(app_id.encode(), "text/html"))
+    assert pages.get("sb-1", 1) is not None  # sb-2 is now the least recently used.
+    pages.put("sb-3", 1, EncodedBody(b"sb-3", "text/html"))
+    assert pages.get("sb-2", 1) is None
+    assert pages.get("sb-1", 1) is not None
+    assert pages.get("sb-3", 1) is not None
+
+
+def test_static_assets_are_served_under_fingerprinted_urls(tmp_path):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "style.css").write_text("body { color: black; }" * 50)
+    assets = StaticAssets(str(tmp_path))
+
+    async def static(request: Request):
+        return assets.response(request, request.path_params["path"])
+
+    app = Starlette(routes=[Route("/static/{path:path}", static)])
+    url = assets.url("css/style.css")
+    assert url.startswith("/static/css/style.") and url.endswith(".css") and url != "/static/css/style.css"
+    assert assets.url("missing.js") == "/static/missing.js"
+
+    fingerprinted = _get(app, url, **{"Accept-Encoding": "gzip"})
+    assert fingerprinted.status_code == 200
+    assert fingerprinted.headers["cache-control"] == IMMUTABLE
+    assert fingerprinted.headers["content-type"].startswith("text/css")
+    assert fingerprinted.headers["content-encoding"] == "gzip"
+    assert fingerprinted.text == "body { color: black; }" * 50
+    plain = _get(app, "/static/css/style.css")
+    assert plain.headers["cache-control"] == REVALIDATE
+    assert plain.headers["etag"] == fingerprinted.headers["etag"]
+    assert _get(app, "/static/css/style.css", **{"If-None-Match": plain.headers["etag"]}).status_code == 304
+    assert _get(app, "/static/css/missing.css").status_code == 404
+
+    (tmp_path / "css" / "style.css").write_text("body { color: white; }")
+    assert StaticAssets(str(tmp_path)).url("css/style.css") != url
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from core.llm import LLMGateway
+from core.models import AppStatus, MessageType
+from core.resources import scrape
+from core.thumbnails import component_hash
+from core.transport import ExecTransport, HttpTransport, SandboxTransport
+from local.fakes import FakeLLMClient, FakeSandboxes, FakeSandboxTransport
+from sandbox.control import component_version
+from tests.helpers import sandbox_app
+
+
+def _app(sandboxes: FakeSandboxes):
+    return sandbox_app("sb-1", "A tip calculator", client=LLMGateway(FakeLLMClient()), transport=FakeSandboxTransport(sandboxes))
+
+
+def test_edit_pushes_the_generated_component():
+    sandboxes = FakeSandboxes()
+    app = _app(sandboxes)
+
+    result = asyncio.run(app.edit("Split the bill between friends"))
+    assert result["status"] == "ok"
+    assert result["hmr"]["outcome"] == "ok"
+    assert sandboxes.components["sb-1"] == app.data.current_component
+    assert app.metadata.component_hash == component_hash(app.data.current_component)
+    assert app.metadata.status == AppStatus.ACTIVE
+    assert [message.type for message in app.data.message_history[-2:]] == [MessageType.USER, MessageType.ASSISTANT]
+    assert app.data.message_history[-2].content == "Split the bill between friends"
+
+
+def test_edit_with_a_speculated_component_skips_generation():
+    sandboxes = FakeSandboxes()
+    app = _app(sandboxes)
+    component = "export default function App() { return <p>Speculated</p>; }"
+    asyncio.run(app.edit("Say it was speculated", component=component))
+    assert sandboxes.components["sb-1"] == component
+
+
+def test_edit_reports_a_component_the_sandbox_rejects():
+    sandboxes = FakeSandboxes()
+    app = _app(sandboxes)
+    result = asyncio.run(app.edit("Break it", component="not a component"))
+    assert result["status"] == "error"
+    assert "sb-1" not in sandboxes.components
+
+
+def test_is_alive_follows_the_sandbox():
+    sandboxes = FakeSandboxes()
+    app = _app(sandboxes)
+    assert asyncio.run(app.is_alive())
+    asyncio.run(sandboxes.terminate_sandbox("sb-1"))
+    assert not asyncio.run(app.is_alive())
+
+
+def test_terminated_apps_are_not_alive_without_asking_the_sandbox():
+    app = _app(FakeSandboxes())
+    app.metadata.status = AppStatus.TERMINATED
+    assert not asyncio.run(app.is_alive())
+
+
+def test_metrics_are_scraped_through_the_transport():
+    sandboxes = FakeSandboxes()
+    app = _app(sandboxes)
+    asyncio.run(app.edit("Round up the tip"))
+    sample = asyncio.run(scrape(app.transport, app.data))
+    assert sample["sandbox_resident_memory_bytes"] == 180_000_000 + len(app.data.current_component) * 1000
+    assert sample["sandbox_open_connections"] == 1
+
+
+def test_transports_must_implement_every_operation():
+    class PushOnly(SandboxTransport):
+        async def push_component(self, data, component):
+            return {"status": "ok"}
+
+    with pytest.raises(TypeError, match="is_alive"):
+        PushOnly()
+    for transport in (HttpTransport, ExecTransport, FakeSandboxTransport):
+        assert not transport.__abstractmethods__
+
+
+def test_component_version_is_fnv1a_over_utf16_code_units():
+    # Standard 32-bit FNV-1a vectors, which ASCII text shares with the byte-wise hash.
+    assert component_version("") == "811c9dc5"
+    assert component_version("a") == "e40c292c"
+    assert component_version("foobar") == "bf9cf968"
+    # As `componentVersion` in web/vite-app/vite.config.ts computes it: no zero padding, and the
+    # emoji is two code units.
+    assert component_version("héllo wörld 😀") == "8006747"
@@ -0,0 +1,138 @@
+import asyncio
+
+from core.sandbox import AppDirectory
+from core.search import SEARCH_DOC_PREFIX, SEARCH_INDEX_KEY, SearchIndex
+from core.tracing import tracer
+from local.fakes import FakeDict, FakeSandboxes, FakeSandboxTransport
+from tests.helpers import edit, sandbox_app
+
+
+def _hits(app_directory: AppDirectory, query: str) -> list[str]:
+    return [hit.app_id for hit in app_directory.search_apps(query)]
+
+
+def test_saving_an_edit_writes_only_that_apps_document():
+    async def run():
+        fake_dict = FakeDict()
+        writer = AppDirectory(fake_dict, None, None)
+        await writer.load()
+        apps = [sandbox_app(f"sb-{i}", f"A recipe planner number {i}") for i in range(20)]
+        await writer.set_apps(apps)
+        reader = AppDirectory(fake_dict, None, None)
+        await reader.load()
+
+        edit(apps[3], "Add a section for kale smoothies")
+        await writer.set_app(apps[3])
+        assert SEARCH_INDEX_KEY not in fake_dict.data
+        assert "kale" in fake_dict._get(f"{SEARCH_DOC_PREFIX}sb-3")
+
+        reads = fake_dict.reads
+        await reader.refresh(max_age=0)
+        # The catalogue, and the one changed app's document.
+        assert fake_dict.reads - reads == 2
+        assert _hits(reader, "kale smoothies") == ["sb-3"]
+
+    asyncio.run(run())
+
+
+def test_load_reads_documents_saved_since_the_last_compaction():
+    async def run():
+        fake_dict = FakeDict()
+        writer = AppDirectory(fake_dict, None, None)
+        await writer.load()
+        apps = [sandbox_app(f"sb-{i}", f"A budget tracker number {i}") for i in range(5)]
+        await writer.set_apps(apps)
+        await writer.compact_search_index()
+        edit(apps[1], "Show the totals as a pie chart")
+        await writer.set_app(apps[1])
+
+        reads = fake_dict.reads
+        loaded = AppDirectory(fake_dict, None, None)
+        await loaded.load()
+        # The catalogue, the compacted index and the one app saved since.
+        assert fake_dict.reads - reads == 3
+        assert _hits(loaded, "pie chart") == ["sb-1"]
+        assert len(loaded.search) == 5
+
+        await loaded.compact_search_index()
+        reads = fake_dict.reads
+        await AppDirectory(fake_dict, None, None).load()
+        assert fake_dict.reads - reads == 2
+
+    asyncio.run(run())
+
+
+def test_removed_apps_leave_the_index():
+    async def run():
+        fake_dict = FakeDict()
+        app_directory = AppDirectory(fake_dict, None, None)
+        await app_directory.load()
+        await app_directory.set_apps([sandbox_app("sb-1", "A weather dashboard"), sandbox_app("sb-2", "A weather quiz")])
+        await app_directory.compact_search_index()
+        await app_directory.remove_app("sb-1")
+        assert f"{SEARCH_DOC_PREFIX}sb-1" not in fake_dict.data
+        assert _hits(app_directory, "weather") == ["sb-2"]
+
+        # The compacted index still has it until the next compaction, but it isn't in the catalogue.
+        loaded = AppDirectory(fake_dict, None, None)
+        await loaded.load()
+        assert _hits(loaded, "weather") == ["sb-2"]
+
+    asyncio.run(run())
+
+
+def test_apps_without_documents_are_searchable_by_title():
+    async def run():
+        fake_dict = FakeDict()
+        app_directory = AppDirectory(fake_dict, None, None)
+        await app_directory.load()
+        await app_directory.set_app(sandbox_app("sb-1", "A chess clock", ["Make the buttons huge"]))
+        # As saved before apps had their own documents.
+        fake_dict._pop(f"{SEARCH_DOC_PREFIX}sb-1")
+        loaded = AppDirectory(fake_dict, None, None)
+        await loaded.load()
+        assert _hits(loaded, "chess") == ["sb-1"]
+        assert _hits(loaded, "buttons") == []
+
+    asyncio.run(run())
+
+
+def test_compacted_index_round_trips_documents_and_versions():
+    index = SearchIndex()
+    index.upsert("sb-1", "A pomodoro timer", version="2026-01-01T00:00:00")
+    index.upsert("sb-2", "A habit tracker")
+    loaded = SearchIndex.loads(index.dumps())
+    assert loaded.tokens("sb-1") == "pomodoro timer"
+    assert loaded.version("sb-1") == "2026-01-01T00:00:00"
+    assert loaded.version("sb-2") is None
+    assert [hit.app_id for hit in loaded.search("habit")] == ["sb-2"]
+
+
+def test_cleanup_compacts_the_index_only_after_it_changed():
+    async def run():
+        fake_dict = FakeDict()
+        transport = FakeSandboxTransport(FakeSandboxes())
+        writer = AppDirectory(fake_dict, None, None, transport=transport)
+        await writer.load()
+        apps = [sandbox_app(f"sb-{i}", f"A flashcard app number {i}") for i in range(3)]
+        await writer.set_apps(apps)
+
+        async def compactions() -> int:
+            # What the cleanup cron does every minute.
+            with tracer.capture() as captured:
+                app_directory = AppDirectory(fake_dict, None, None, transport=transport)
+                await app_directory.load()
+                await app_directory.cleanup()
+            return len(captured.get_finished_spans("dict.save_search_index"))
+
+        assert await compactions() == 1  # Never compacted before.
+        assert await compactions() == 0
+        edit(apps[2], "Shuffle the deck")
+        await writer.set_app(apps[2])
+        assert await compactions() == 1
+        assert await compactions() == 0
+        await writer.remove_app("sb-0")
+        assert await compactions() == 1
+        assert await compactions() == 0
+
+    asyncio.run(run())
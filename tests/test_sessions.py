@@ -0,0 +1,56 @@
+import asyncio
+
+from core.sandbox import AppDirectory
+from core.sessions import EditSessions
+from local.fakes import FakeDict
+from tests.helpers import edit, sandbox_app
+
+
+async def _warm_session(latency: float = 0.01) -> tuple[AppDirectory, EditSessions]:
+    app_directory = AppDirectory(FakeDict(latency=latency), None, None)
+    await app_directory.load()
+    app = sandbox_app("sb-1")
+    await app_directory.set_app(app)
+    sessions = EditSessions(app_directory)
+    sessions.checkin(app, saved=True)
+    return app_directory, sessions
+
+
+def test_concurrent_checkouts_get_the_warm_app_once():
+    async def run():
+        _, sessions = await _warm_session()
+        (first, first_outcome), (second, second_outcome) = await asyncio.gather(
+            sessions.checkout("sb-1"), sessions.checkout("sb-1")
+        )
+        assert sorted([first_outcome, second_outcome]) == ["busy", "warm"]
+        assert first is not second
+
+        # The busy edit's copy doesn't replace the warm one while the warm edit still has it.
+        busy, warm = (first, second) if first_outcome == "busy" else (second, first)
+        sessions.checkin(busy, saved=True)
+        sessions.checkin(warm, saved=True)
+        app, outcome = await sessions.checkout("sb-1")
+        assert outcome == "warm" and app is warm
+
+    asyncio.run(run())
+
+
+def test_stale_session_is_dropped():
+    async def run():
+        app_directory, sessions = await _warm_session()
+        # Another controller saves the app.
+        other = AppDirectory(app_directory.apps_dict, None, None)
+        await other.load()
+        saved_elsewhere = await other.get_app("sb-1")
+        edit(saved_elsewhere, "Make it blue")
+        await other.set_app(saved_elsewhere)
+
+        (first, first_outcome), (second, second_outcome) = await asyncio.gather(
+            sessions.checkout("sb-1"), sessions.checkout("sb-1")
+        )
+        assert sorted([first_outcome, second_outcome]) == ["busy", "stale"]
+        assert len(sessions) == 0
+        assert len(first.data.message_history) == len(second.data.message_history) == 4
+        assert (await sessions.checkout("sb-1"))[1] == "cold"
+
+    asyncio.run(run())
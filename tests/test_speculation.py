@@ -0,0 +1,135 @@
+import asyncio
+
+from core.llm import LLMGateway
+from core.models import Message, MessageType
+from core.prompt import _generate_followup_edit
+from core.speculation import SESSION_HEADER, SpeculativeEdits
+from local.fakes import FakeDict, FakeLLMClient
+from tests.helpers import client_for, local_web_app, sandbox_app
+
+DRAFT = "Add a dark mode toggle"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _app(fake: FakeLLMClient = None):
+    return sandbox_app("sb-1", "A tip calculator", client=LLMGateway(fake or FakeLLMClient()))
+
+
+def test_submitting_the_speculated_draft_uses_its_component():
+    async def run():
+        fake = FakeLLMClient()
+        app = _app(fake)
+        speculations = SpeculativeEdits()
+        used = speculations.metrics.speculations["used"]
+        assert speculations.speculate("session-1", app, DRAFT) == "started"
+        assert speculations.speculate("session-1", app, DRAFT) == "running"
+        # The same edit after the user hit submit, spelled a little differently.
+        component = await speculations.take(app, "  add a DARK mode   toggle ")
+        history = app.data.message_history + [Message(content=DRAFT, type=MessageType.USER)]
+        expected = await _generate_followup_edit(app.client, DRAFT, app.data.current_component, history)
+        return component, expected, fake.calls, speculations.metrics.speculations["used"] - used
+
+    component, expected, calls, used = asyncio.run(run())
+    assert component == expected
+    assert calls == 2  # The speculation, and generating `expected` for comparison.
+    assert used == 1
+
+
+def test_another_instruction_misses_and_cancels_the_speculation():
+    async def run():
+        app = _app(FakeLLMClient(default_latency=10))
+        speculations = SpeculativeEdits()
+        speculations.speculate("session-1", app, DRAFT)
+        task = speculations._speculations[next(iter(speculations._speculations))].task
+        component = await speculations.take(app, "Add a light mode toggle")
+        await asyncio.sleep(0)
+        return component, task, speculations._speculations
+
+    component, task, left = asyncio.run(run())
+    assert component is None
+    assert task.cancelled()
+    assert left == {}
+
+
+def test_a_changed_app_misses():
+    async def run():
+        app = _app()
+        speculations = SpeculativeEdits()
+        speculations.speculate("session-1", app, DRAFT)
+        # Another edit landed first, so the speculation was made from an older history.
+        app.data.message_history += [Message(content="Round up", type=MessageType.USER), Message(content="Done!", type=MessageType.ASSISTANT)]
+        return await speculations.take(app, DRAFT)
+
+    assert asyncio.run(run()) is None
+
+
+def test_finished_speculations_expire():
+    async def run():
+        clock = Clock()
+        app = _app()
+        speculations = SpeculativeEdits(ttl_seconds=120, clock=clock)
+        speculations.speculate("session-1", app, DRAFT)
+        speculations.speculate("session-2", app, "Show the tip per person")
+        await asyncio.sleep(0.05)  # Both finish generating.
+        clock.now += 60
+        kept = await speculations.take(app, DRAFT)
+        speculations.speculate("session-1", app, "Add a tip presets row")
+        await asyncio.sleep(0.05)
+        expired = speculations.metrics.speculations["expired"]
+        clock.now += 121
+        missed = await speculations.take(app, "Add a tip presets row")
+        return kept, missed, speculations.metrics.speculations["expired"] - expired
+
+    kept, missed, expired = asyncio.run(run())
+    assert kept is not None
+    assert missed is None
+    assert expired == 1
+
+
+def test_each_session_has_a_budget_per_minute():
+    async def run():
+        clock = Clock()
+        app = _app(FakeLLMClient(default_latency=10))
+        speculations = SpeculativeEdits(per_minute=2, clock=clock)
+        outcomes = [speculations.speculate("session-1", app, f"{DRAFT} number {i}") for i in range(3)]
+        outcomes.append(speculations.speculate("session-2", app, DRAFT))
+        clock.now += 61
+        outcomes.append(speculations.speculate("session-1", app, f"{DRAFT} number 4"))
+        outcomes.append(speculations.speculate("session-1", app, "Tiny"))
+        outcomes.append(SpeculativeEdits(per_minute=0).speculate("session-1", app, DRAFT))
+        await speculations.take(app, "Something else entirely")  # Cancel what is still running.
+        return outcomes
+
+    assert asyncio.run(run()) == ["started", "started", "over_budget", "started", "started", "too_short", "disabled"]
+
+
+def test_speculating_over_budget_is_a_429(monkeypatch):
+    monkeypatch.setenv("SPECULATION_PER_MINUTE", "1")
+    fake_dict = FakeDict()
+    web_app, app_directory = local_web_app(fake_dict)
+    app_directory.client = LLMGateway(FakeLLMClient())
+
+    async def run():
+        await app_directory.load()
+        await app_directory.set_app(_app())
+        async with client_for(web_app) as client:
+            headers = {SESSION_HEADER: "session-1"}
+            first = await client.post("/api/app/sb-1/speculate", json={"text": DRAFT}, headers=headers)
+            second = await client.post("/api/app/sb-1/speculate", json={"text": f"{DRAFT} please"}, headers=headers)
+            other = await client.post("/api/app/sb-1/speculate", json={"text": DRAFT}, headers={SESSION_HEADER: "session-2"})
+            missing = await client.post("/api/app/sb-2/speculate", json={"text": DRAFT}, headers=headers)
+        return first, second, other, missing
+
+    first, second, other, missing = asyncio.run(run())
+    assert (first.status_code, first.json()["status"]) == (202, "started")
+    assert (second.status_code, second.json()["status"]) == (429, "over_budget")
+    # Another session has a budget of its own.
+    assert (other.status_code, other.json()["status"]) == (202, "started")
+    assert missing.status_code == 404
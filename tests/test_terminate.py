@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime
+
+from core.models import JobStatus, TerminateAllJob
+from core.sandbox import AppDirectory
+from core.terminate import MAX_FAILED_IDS, load_job, save_job, terminate_all
+from local.fakes import FakeDict, FakeSandboxes, FakeSandboxTransport
+from tests.helpers import client_for, local_web_app, sandbox_app
+
+
+def _job(job_id: str = "job-1") -> TerminateAllJob:
+    return TerminateAllJob(id=job_id, status=JobStatus.PENDING, created_at=datetime.now(), updated_at=datetime.now())
+
+
+def test_terminate_all_stops_every_sandbox_and_keeps_failures_catalogued():
+    async def run():
+        fake_dict = FakeDict()
+        sandboxes = FakeSandboxes()
+        transport = FakeSandboxTransport(sandboxes)
+        app_directory = AppDirectory(fake_dict, None, None, transport=transport)
+        await app_directory.load()
+        apps = [sandbox_app(f"sb-{i}", transport=transport) for i in range(5)]
+        await app_directory.set_apps(apps)
+
+        async def stop_sandbox(object_id: str) -> bool:
+            if object_id == "sb-3":
+                return False
+            return await sandboxes.terminate_sandbox(object_id)
+
+        async def list_sandboxes(modal_app_id: str):
+            for object_id in ("sb-0", "sb-stray"):
+                yield object_id
+
+        job = _job()
+        await save_job(fake_dict, job)
+        job = await terminate_all(
+            fake_dict, app_directory, "ap-1", job, concurrency=2, stop_sandbox=stop_sandbox, list_sandboxes=list_sandboxes,
+        )
+        assert job.status == JobStatus.FAILED
+        assert (job.total, job.terminated, job.failed, job.failed_ids) == (6, 5, 1, ["sb-3"])
+        assert (await load_job(fake_dict, "job-1")).model_dump() == job.model_dump()
+        assert sandboxes.terminated == {"sb-0", "sb-1", "sb-2", "sb-4", "sb-stray"}
+        assert [await app.is_alive() for app in apps] == [False, False, False, True, False]
+
+        check = AppDirectory(fake_dict, None, None)
+        await check.load()
+        assert list(check.apps) == ["sb-3"]
+
+    asyncio.run(run())
+
+
+def test_failed_ids_are_capped():
+    async def run():
+        fake_dict = FakeDict()
+        app_directory = AppDirectory(fake_dict, None, None)
+        await app_directory.load()
+        await app_directory.set_apps([sandbox_app(f"sb-{i}") for i in range(MAX_FAILED_IDS + 20)])
+
+        async def stop_sandbox(object_id: str) -> bool:
+            return False
+
+        async def list_sandboxes(modal_app_id: str):
+            return
+            yield
+
+        job = await terminate_all(fake_dict, app_directory, "ap-1", _job(), stop_sandbox=stop_sandbox, list_sandboxes=list_sandboxes)
+        assert job.failed == MAX_FAILED_IDS + 20
+        assert len(job.failed_ids) == MAX_FAILED_IDS
+
+    asyncio.run(run())
+
+
+def test_status_is_a_get_with_the_admin_secret_in_a_header(monkeypatch):
+    monkeypatch.setenv("ADMIN_SECRET", "hunter2")
+    fake_dict = FakeDict()
+    web_app, _ = local_web_app(fake_dict)
+
+    async def run():
+        await save_job(fake_dict, _job())
+        async with client_for(web_app) as client:
+            ok = await client.get("/api/admin/terminate-all/job-1/status", headers={"X-Admin-Secret": "hunter2"})
+            wrong = await client.get("/api/admin/terminate-all/job-1/status", headers={"X-Admin-Secret": "nope"})
+            missing = await client.get("/api/admin/terminate-all/job-2/status", headers={"X-Admin-Secret": "hunter2"})
+        return ok, wrong, missing
+
+    ok, wrong, missing = asyncio.run(run())
+    assert ok.status_code == 200 and ok.json()["status"] == "pending"
+    assert wrong.status_code == 403
+    assert missing.status_code == 404
@@ -0,0 +1,40 @@
+import asyncio
+
+from core.thumbnails import Thumbnail, ThumbnailStore
+from local.fakes import FakeDict
+from tests.helpers import client_for, local_web_app
+
+
+def _get(web_app, path: str):
+    async def run():
+        async with client_for(web_app) as client:
+            return await client.get(path)
+
+    return asyncio.run(run())
+
+
+def test_missing_thumbnail_is_a_404_that_is_not_cached():
+    web_app, _ = local_web_app(thumbnail_store=ThumbnailStore(FakeDict()))
+    response = _get(web_app, "/thumbnails/0123456789abcdef01234567")
+    assert response.status_code == 404
+    # The thumbnail may be rendered any moment, so neither browsers nor CDNs may keep the 404.
+    assert response.headers["cache-control"] == "no-store"
+
+
+def test_missing_thumbnail_without_a_store_is_a_404():
+    web_app, _ = local_web_app()
+    response = _get(web_app, "/thumbnails/0123456789abcdef01234567")
+    assert response.status_code == 404
+    assert response.headers["cache-control"] == "no-store"
+
+
+def test_thumbnail_is_cached_forever():
+    store = ThumbnailStore(FakeDict())
+    asyncio.run(store.put("0123456789abcdef01234567", Thumbnail("image/jpeg", b"\xff\xd8jpeg")))
+    web_app, _ = local_web_app(thumbnail_store=store)
+    response = _get(web_app, "/thumbnails/0123456789abcdef01234567")
+    assert response.status_code == 200
+    assert response.content == b"\xff\xd8jpeg"
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert response.headers["etag"] == '"0123456789abcdef01234567"'
@@ -0,0 +1,209 @@
+"""Crash consistency of app saves and removals, with and without the write-behind buffer.
+
+`CheckedDict` checks after every write that each catalogue entry has its app's data and version,
+i.e. that a container dying at any point leaves nothing the catalogue points to missing.
+"""
+
+import asyncio
+import pickle
+
+import pytest
+
+from core.sandbox import AppDirectory
+from core.write_behind import write_behind_metrics
+from local.fakes import FakeDict
+from tests.helpers import edit, sandbox_app
+
+
+class CheckedDict(FakeDict):
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency)
+        self.fail_updates = 0
+        self.checks = 0
+
+    def _put(self, key, value, skip_if_exists: bool = False) -> bool:
+        written = super()._put(key, value, skip_if_exists)
+        self.check()
+        return written
+
+    def _update(self, other=None, **kwargs) -> None:
+        if self.fail_updates:
+            self.fail_updates -= 1
+            raise ConnectionError("Dict unavailable")
+        super()._update(other, **kwargs)
+        self.check()
+
+    def _pop(self, key):
+        value = super()._pop(key)
+        self.check()
+        return value
+
+    def catalogue(self) -> dict:
+        return pickle.loads(self.data["catalogue"]) if "catalogue" in self.data else {}
+
+    def check(self) -> None:
+        self.checks += 1
+        for app_id in self.catalogue():
+            assert f"app_{app_id}" in self.data, f"{app_id} is in the catalogue without its data"
+            assert f"app_version_{app_id}" in self.data, f"{app_id} is in the catalogue without its version"
+
+
+async def _directory(fake_dict: FakeDict, flush_interval: float = 3600) -> AppDirectory:
+    app_directory = AppDirectory(fake_dict, None, None)
+    await app_directory.load()
+    app_directory.start_write_behind(flush_interval)
+    return app_directory
+
+
+def test_remove_app_keeps_buffered_saves_and_other_apps():
+    async def run():
+        fake_dict = CheckedDict()
+        other = AppDirectory(fake_dict, None, None)
+        await other.load()
+        await other.set_app(sandbox_app("sb-b"))
+        await other.set_app(sandbox_app("sb-c"))
+
+        app_directory = await _directory(fake_dict)
+        # Saved by another container after this one loaded.
+        await other.set_app(sandbox_app("sb-d"))
+        await app_directory.set_app(sandbox_app("sb-a"))
+        await app_directory.remove_app("sb-b")
+        # The buffered save of sb-a isn't in the Dict yet, and sb-d wasn't lost.
+        assert sorted(fake_dict.catalogue()) == ["sb-c", "sb-d"]
+        assert "app_sb-b" not in fake_dict.data and "app_version_sb-b" not in fake_dict.data
+
+        await app_directory.stop_write_behind()
+        assert sorted(fake_dict.catalogue()) == ["sb-a", "sb-c", "sb-d"]
+
+    asyncio.run(run())
+
+
+def test_removing_an_app_with_a_pending_save_drops_the_save():
+    async def run():
+        fake_dict = CheckedDict()
+        app_directory = await _directory(fake_dict)
+        await app_directory.set_app(sandbox_app("sb-a"))
+        await app_directory.set_app(sandbox_app("sb-b"))
+        await app_directory.remove_app("sb-a")
+        await app_directory.stop_write_behind()
+        assert sorted(fake_dict.catalogue()) == ["sb-b"]
+        assert "app_sb-a" not in fake_dict.data
+
+    asyncio.run(run())
+
+
+def test_removing_an_app_while_its_save_is_being_flushed():
+    async def run():
+        fake_dict = CheckedDict(latency=0.01)
+        app_directory = await _directory(fake_dict)
+        await app_directory.set_app(sandbox_app("sb-a"))
+        flush = asyncio.create_task(app_directory.write_behind.flush())
+        await asyncio.sleep(0.005)  # The flush is writing sb-a now.
+        await app_directory.remove_app("sb-a")
+        assert await flush == 1
+        await app_directory.stop_write_behind()
+        assert fake_dict.catalogue() == {}
+        assert "app_sb-a" not in fake_dict.data
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("stop_after_writes", [1, 4, 11, 30])
+def test_dying_mid_interval_leaves_a_consistent_catalogue(stop_after_writes):
+    async def run():
+        fake_dict = CheckedDict(latency=0.002)
+        app_directory = await _directory(fake_dict, flush_interval=0.01)
+        apps = [sandbox_app(f"sb-{i}", f"App number {i}") for i in range(8)]
+
+        async def keep_editing():
+            for step in range(100):
+                app = apps[step % len(apps)]
+                edit(app, f"Edit number {step}")
+                await app_directory.set_app(app)
+                if step % 7 == 6:
+                    await app_directory.remove_app(apps[(step // 7) % len(apps)].id)
+                await asyncio.sleep(0.001)
+
+        editing = asyncio.create_task(keep_editing())
+        while fake_dict.checks < stop_after_writes and not editing.done():
+            await asyncio.sleep(0.001)
+        # The container dies: nothing runs any more, whatever was half written stays so.
+        editing.cancel()
+        app_directory.write_behind._task.cancel()
+        await asyncio.gather(editing, app_directory.write_behind._task, return_exceptions=True)
+
+        fake_dict.check()
+        # Whatever the catalogue has, a fresh container can load.
+        loaded = AppDirectory(fake_dict, None, None)
+        await loaded.load()
+        for app_id in fake_dict.catalogue():
+            assert await loaded.get_app(app_id) is not None
+
+    asyncio.run(run())
+
+
+def test_failed_flush_is_retried():
+    async def run():
+        fake_dict = CheckedDict()
+        app_directory = await _directory(fake_dict)
+        buffer = app_directory.write_behind
+        await app_directory.set_app(sandbox_app("sb-a", "A kanban board"))
+        fake_dict.fail_updates = 1
+        failures = write_behind_metrics.failures
+
+        assert await buffer.flush() == 0
+        assert write_behind_metrics.failures == failures + 1
+        assert "sb-a" in buffer and fake_dict.catalogue() == {}
+
+        assert await buffer.flush() == 1
+        assert "sb-a" not in buffer and list(fake_dict.catalogue()) == ["sb-a"]
+        assert "kanban" in fake_dict._get("search_doc_sb-a")
+        await app_directory.stop_write_behind()
+
+    asyncio.run(run())
+
+
+def test_failed_flush_keeps_newer_saves_and_their_search_text():
+    async def run():
+        fake_dict = CheckedDict(latency=0.01)
+        app_directory = await _directory(fake_dict)
+        buffer = app_directory.write_behind
+        app = sandbox_app("sb-a", "A kanban board")
+        await app_directory.set_app(app)
+        fake_dict.fail_updates = 1
+        flush = asyncio.create_task(buffer.flush())
+        await asyncio.sleep(0.005)
+        # A save that doesn't change the search text, while the first one fails to write.
+        app.metadata.is_featured = True
+        edit_version = app.metadata.updated_at
+        await app_directory.set_app(app)
+        assert await flush == 0
+
+        snapshot = buffer.get("sb-a")
+        assert snapshot.metadata["is_featured"] is True
+        assert snapshot.search_text is not None  # Still owed from the failed save.
+        await app_directory.stop_write_behind()
+        assert fake_dict.catalogue()["sb-a"]["is_featured"] is True
+        assert fake_dict._get("app_version_sb-a") == edit_version.isoformat()
+        assert "kanban" in fake_dict._get("search_doc_sb-a")
+
+    asyncio.run(run())
+
+
+def test_cancelled_flush_is_put_back():
+    async def run():
+        fake_dict = CheckedDict(latency=0.01)
+        app_directory = await _directory(fake_dict)
+        buffer = app_directory.write_behind
+        await app_directory.set_app(sandbox_app("sb-a"))
+        flush = asyncio.create_task(buffer.flush())
+        await asyncio.sleep(0.005)
+        flush.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await flush
+        assert "sb-a" in buffer
+
+        await app_directory.stop_write_behind()
+        assert list(fake_dict.catalogue()) == ["sb-a"]
+
+    asyncio.run(run())
@@ -1,7 +1,75 @@
-import { defineConfig } from 'vite'
+import { defineConfig, type Plugin } from 'vite'
 import react from '@vitejs/plugin-react'
 import tailwindcss from '@tailwindcss/vite'
 
+const COMPONENT = '/src/LLMComponent.tsx'
+
+// FNV-1a over UTF-16 code units; sandbox/server.py computes the same version for what it wrote.
+function componentVersion(source: string): string {
+  let hash = 0x811c9dc5
+  for (let i = 0; i < source.length; i++) {
+    hash ^= source.charCodeAt(i)
+    hash = Math.imul(hash, 0x01000193) >>> 0
+  }
+  return hash.toString(16)
+}
+
+// Reports on /__hmr_ack whether the latest LLMComponent.tsx compiled and was fetched by a browser,
+// so the sandbox's /edit can wait for the UI to update instead of returning as soon as it writes.
+// Also counts page traffic, which the sandbox's /metrics reports as activity.
+function hmrAck(): Plugin {
+  const traffic = { requests: 0, lastRequestAt: 0 }
+  let state = {
+    version: '',
+    outcome: 'pending' as 'pending' | 'ok' | 'error',
+    error: null as string | null,
+    durationMs: 0,
+    served: false,
+    clients: 0,
+  }
+  return {
+    name: 'hmr-ack',
+    apply: 'serve',
+    configureServer(server) {
+      server.middlewares.use((req, res, next) => {
+        if (req.url?.startsWith(COMPONENT)) {
+          // The browser fetching the module after an update, i.e. HMR reached the page.
+          state.served = true
+        }
+        if (req.url !== '/__hmr_ack') {
+          traffic.requests++
+          traffic.lastRequestAt = Date.now()
+          return next()
+        }
+        res.setHeader('Content-Type', 'application/json')
+        res.end(JSON.stringify({ ...state, ...traffic, clients: server.ws.clients.size }))
+      })
+    },
+    async handleHotUpdate({ file, read, server }) {
+      if (!file.endsWith(COMPONENT)) {
+        return
+      }
+      const started = Date.now()
+      const version = componentVersion(await read())
+      state = { version, outcome: 'pending', error: null, durationMs: 0, served: false, clients: 0 }
+      // Compile now rather than when the browser asks, so a broken component is reported even with
+      // no page open. Not awaited, so the HMR update goes out without waiting for it.
+      server.transformRequest(COMPONENT).then(
+        () => {
+          if (state.version === version) {
+            state = { ...state, outcome: 'ok', durationMs: Date.now() - started }
+          }
+        },
+        (error) => {
+          if (state.version === version) {
+            state = { ...state, outcome: 'error', error: String(error?.message ?? error), durationMs: Date.now() - started }
+          }
+        },
+      )
+    },
+  }
+}
+
 // https://vite.dev/config/
 export default defineConfig({
   server: {
@@ -10,5 +78,10 @@ export default defineConfig({
       'X-Frame-Options': 'ALLOWALL',
     },
   },
-  plugins: [react(), tailwindcss()],
+  // Declared up front so the build-time pre-bundle (sandbox/prebundle.sh) covers them
+  // and Vite never has to re-optimize and reload the page on first visit.
+  optimizeDeps: {
+    include: ['react', 'react-dom', 'react-dom/client', 'react/jsx-dev-runtime'],
+  },
+  plugins: [react(), tailwindcss(), hmrAck()],
 })